@@ -12,6 +12,7 @@ logging.basicConfig(level=logging.INFO, format='[%(name)s] %(levelname)s: %(mess
 
 
 CONFIG_PATH = Path(__file__).parent / 'config' / 'workdir.json'  # 工作目录配置文件位置
+WORKDIR_ENV = 'INFRA_WORKDIR'  # 环境变量优先于配置文件（worker 容器等不便写包内文件的场景）
 
 
 def create_workdir_config():
@@ -19,9 +20,12 @@ def create_workdir_config():
     尝试从 CONFIG_PATH 读取持久化配置，将 'workdir' 加载到全局 WORKDIR
     - 若文件不存在或解析失败，则保持 WORKDIR=None
     - 在包导入时调用，仅作“最佳努力”初始化，不抛出异常
+    - 设置了环境变量 INFRA_WORKDIR 时直接使用
     """
     global WORKDIR
-    if not CONFIG_PATH.exists():
+    if os.environ.get(WORKDIR_ENV):
+        WORKDIR = os.environ[WORKDIR_ENV]
+    elif not CONFIG_PATH.exists():
         os.makedirs(CONFIG_PATH.parent, exist_ok=True)
         with open(CONFIG_PATH, 'w', encoding='utf-8') as f:
             json.dump({'workdir': None}, f, ensure_ascii=False)
@@ -47,7 +51,10 @@ def get_workdir():
     从持久化文件读取并返回当前工作目录
     - 读取磁盘中的 config.json，保证与持久化状态一致
     - 若文件缺失或内容异常，上层应做好异常处理（例如首次初始化时使用 set_workdir）
+    - 设置了环境变量 INFRA_WORKDIR 时直接返回该目录
     """
+    if os.environ.get(WORKDIR_ENV):
+        return Path(os.environ[WORKDIR_ENV])
     with CONFIG_PATH.open('r', encoding='utf-8') as f:
         data = json.load(f)
         return Path(data.get('workdir'))
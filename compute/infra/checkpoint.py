@@ -0,0 +1,328 @@
+"""
+检查点（Checkpoint）管理
+目标：
+- 抢占式节点上的长任务可从最近的检查点继续，而不是从头开始
+- 训练线程只负责把模型/优化器张量复制一份（内存拷贝），序列化与落盘在后台线程完成
+- 每个检查点独立成文件、原子替换，索引 latest.json 追加记录，旧检查点不被改写
+- 保留最近 keep_last 个检查点 + 按 monitor 指标最优的一个
+
+目录结构（实验目录下）：
+- ckpts/step-<global_step>.pt：检查点文件
+- ckpts/latest.json：索引 {"entries": [{"file", "epoch", "skip_batches", "global_step", "metric", "time", "plan"}...], "best": 文件名}
+
+检查点内容（torch.save，可用 weights_only=True 加载）：
+- model / optimizer：state_dict（张量已复制）
+- training：engine.training_state()（下一个 epoch、已完成批次数、全局步数、历史）
+- rng：torch / numpy / python 随机数状态
+  数据顺序由 (seed, epoch) 决定，恢复 epoch 与已完成批次数即可复现数据加载位置
+- plan：实验计划指纹（plan_fingerprint），决定检查点能否用于当前计划
+
+续训校验：
+- 指纹覆盖模型、训练、数据、词表、嵌入、划分、归一化配置与 seed；不含 train.epochs（sweep halving 在同一目录中逐轮增加 epochs）
+  以及只影响取数/线程的 num_threads / num_workers / prefetch_factor / pin_memory
+- 复用 experiment_id 但修改了计划时，不续训：记录 warning，旧检查点从索引中移除并删除，从头训练
+- 恢复出的进度已达到目标 epochs 时记录 warning（训练循环不会再执行，直接进入评估）
+
+配置（exp_plan["checkpoint"]，均可省略）：
+    "checkpoint": {
+        "enabled": true,
+        "every_epochs": 1,          # 每 N 个 epoch 结束保存
+        "every_steps": null,        # 每 N 个优化步保存（epoch 内）
+        "keep_last": 3,
+        "monitor": "valid_loss",    # 选择最优检查点的指标（epoch 记录中的键）
+        "mode": "min",              # min | max
+        "resume": true              # 启动时自动从最新有效检查点恢复
+    }
+"""
+import os
+import json
+import time
+import hashlib
+import random
+import logging
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Any, Optional, List
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FORMAT_VERSION = 1
+CHECKPOINT_DEFAULTS: Dict[str, Any] = {
+    "enabled": True,
+    "every_epochs": 1,
+    "every_steps": None,
+    "keep_last": 3,
+    "monitor": "valid_loss",
+    "mode": "min",
+    "resume": True,
+}
+
+
+# 参与计划指纹的实验计划键，以及 train 中不参与的键
+PLAN_FINGERPRINT_KEYS = ("model", "train", "data", "vocab", "embeddings", "division", "normalization", "seed")
+PLAN_FINGERPRINT_IGNORED_TRAIN = ("epochs", "num_threads", "num_workers", "prefetch_factor", "pin_memory")
+
+
+def checkpoint_config(exp_plan: Dict[str, Any]) -> Dict[str, Any]:
+    cfg = dict(CHECKPOINT_DEFAULTS)
+    cfg.update(exp_plan.get("checkpoint") or {})
+    return cfg
+
+
+def plan_fingerprint(exp_plan: Dict[str, Any]) -> str:
+    """
+    检查点对应的实验计划指纹（规范化 JSON 的 sha1 前 16 位）
+    """
+    doc = {k: exp_plan.get(k) for k in PLAN_FINGERPRINT_KEYS}
+    if isinstance(doc.get("train"), dict):
+        doc["train"] = {k: v for k, v in doc["train"].items() if k not in PLAN_FINGERPRINT_IGNORED_TRAIN}
+    raw = json.dumps(doc, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _clone(obj: Any) -> Any:
+    """
+    递归复制 state_dict 中的张量（搬到 CPU），使后台写盘期间训练可以继续修改原张量
+    """
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: _clone(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_clone(v) for v in obj]
+    if isinstance(obj, tuple):
+        return tuple(_clone(v) for v in obj)
+    return obj
+
+
+def capture_rng_state() -> Dict[str, Any]:
+    # numpy / python 状态转为张量与基础类型，保证 weights_only 加载可用
+    np_state = np.random.get_state()
+    py_state = random.getstate()
+    return {
+        "torch": torch.get_rng_state(),
+        "numpy": {
+            "keys": torch.from_numpy(np.asarray(np_state[1], dtype=np.int64)),
+            "pos": int(np_state[2]),
+            "has_gauss": int(np_state[3]),
+            "cached_gaussian": float(np_state[4]),
+        },
+        "python": {"version": py_state[0], "state": list(py_state[1]), "gauss": py_state[2]},
+    }
+
+
+def restore_rng_state(state: Dict[str, Any]) -> None:
+    if "torch" in state:
+        torch.set_rng_state(state["torch"])
+    npst = state.get("numpy")
+    if npst:
+        np.random.set_state(("MT19937", npst["keys"].numpy().astype(np.uint32), npst["pos"], npst["has_gauss"], npst["cached_gaussian"]))
+    pyst = state.get("python")
+    if pyst:
+        random.setstate((pyst["version"], tuple(pyst["state"]), pyst["gauss"]))
+
+
+class CheckpointManager:
+    """
+    - save(engine, metric=None, skip_batches=None)：同步复制张量，异步写盘；同一时刻最多一个写盘任务，新的保存会等待上一个完成
+    - on_train_event(engine, info)：可直接作为 TrainEngine 的回调（按 every_steps / every_epochs 触发）
+    - resume(engine)：从最新有效检查点恢复模型、优化器、训练进度与随机数状态，返回是否恢复；
+      检查点的计划指纹与 fingerprint 不符时不恢复
+    - close()：等待未完成的写盘任务
+    """
+    def __init__(self, directory: Path, keep_last: int = 3, monitor: Optional[str] = "valid_loss", mode: str = "min",
+                 every_epochs: Optional[int] = 1, every_steps: Optional[int] = None, fingerprint: Optional[str] = None):
+        self.dir = Path(directory)
+        self.fingerprint = fingerprint
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.dir / "latest.json"
+        self.keep_last = max(1, int(keep_last))
+        self.monitor = monitor
+        self.mode = str(mode).lower()
+        self.every_epochs = int(every_epochs) if every_epochs else None
+        self.every_steps = int(every_steps) if every_steps else None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="infra-ckpt")
+        self._pending: Optional[Future] = None
+        self._lock = threading.Lock()
+        self.index = self._read_index()
+
+    @classmethod
+    def from_exp_plan(cls, exp_plan: Dict[str, Any], base: Path) -> Optional["CheckpointManager"]:
+        cfg = checkpoint_config(exp_plan)
+        if not cfg.get("enabled"):
+            return None
+        return cls(Path(base) / "ckpts", keep_last=cfg["keep_last"], monitor=cfg.get("monitor"), mode=cfg.get("mode", "min"),
+                   every_epochs=cfg.get("every_epochs"), every_steps=cfg.get("every_steps"),
+                   fingerprint=plan_fingerprint(exp_plan))
+
+    # 索引
+    def _read_index(self) -> Dict[str, Any]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict) and isinstance(data.get("entries"), list):
+                return data
+        except (OSError, ValueError):
+            pass
+        # 索引缺失或损坏：按文件名扫描目录重建（不含指标）
+        entries = []
+        for p in sorted(self.dir.glob("step-*.pt"), key=lambda p: p.stat().st_mtime):
+            entries.append({"file": p.name, "metric": None, "time": p.stat().st_mtime})
+        return {"entries": entries, "best": None}
+
+    def _write_index(self) -> None:
+        tmp = self.index_path.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.index_path)
+
+    def _better(self, metric: Optional[float], best: Optional[float]) -> bool:
+        if metric is None:
+            return False
+        if best is None:
+            return True
+        return metric < best if self.mode == "min" else metric > best
+
+    def _best_metric(self) -> Optional[float]:
+        best = self.index.get("best")
+        for e in self.index["entries"]:
+            if e["file"] == best:
+                return e.get("metric")
+        return None
+
+    # 保存
+    def _write(self, snapshot: Dict[str, Any], entry: Dict[str, Any]) -> None:
+        path = self.dir / entry["file"]
+        tmp = path.with_suffix(".pt.tmp")
+        with open(tmp, "wb") as f:
+            torch.save(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        with self._lock:
+            entries = [e for e in self.index["entries"] if e["file"] != entry["file"]]
+            entries.append(entry)
+            if self._better(entry.get("metric"), self._best_metric()):
+                self.index["best"] = entry["file"]
+            best = self.index.get("best")
+            keep = set(e["file"] for e in entries[-self.keep_last:])
+            if best:
+                keep.add(best)
+            removed = [e for e in entries if e["file"] not in keep]
+            self.index["entries"] = [e for e in entries if e["file"] in keep]
+            self._write_index()
+        for e in removed:
+            try:
+                (self.dir / e["file"]).unlink()
+            except OSError:
+                pass
+        logger.info(f"checkpoint:saved file={entry['file']} epoch={entry['epoch']} step={entry['global_step']} metric={entry.get('metric')}")
+
+    def _done(self, fut: Future) -> None:
+        err = fut.exception()
+        if err is not None:
+            logger.warning(f"checkpoint:write_failed error={err}")
+
+    def save(self, engine, metric: Optional[float] = None, skip_batches: Optional[int] = None) -> None:
+        self.wait()
+        state = engine.training_state()
+        if skip_batches is not None:
+            state["skip_batches"] = int(skip_batches)
+        snapshot = {
+            "format": CHECKPOINT_FORMAT_VERSION,
+            "model": _clone(engine.model.state_dict()),
+            "optimizer": _clone(engine.optimizer.state_dict()),
+            "training": state,
+            "rng": capture_rng_state(),
+            "plan": self.fingerprint,
+        }
+        entry = {
+            "file": f"step-{state['global_step']:09d}.pt",
+            "epoch": state["epoch"],
+            "skip_batches": state["skip_batches"],
+            "global_step": state["global_step"],
+            "metric": metric,
+            "time": time.time(),
+            "plan": self.fingerprint,
+        }
+        self._pending = self._executor.submit(self._write, snapshot, entry)
+        self._pending.add_done_callback(self._done)
+
+    def wait(self) -> None:
+        if self._pending is not None:
+            try:
+                self._pending.result()
+            except Exception:
+                pass
+            self._pending = None
+
+    def on_train_event(self, engine, info: Dict[str, Any]) -> None:
+        event = info.get("event")
+        if event == "step" and self.every_steps and info.get("step", 0) % self.every_steps == 0:
+            # 训练进度只在优化步边界一致：记录本 epoch 已完成的批次数
+            self.save(engine, skip_batches=int(info.get("batch", 0)))
+        elif event == "epoch" and self.every_epochs and engine.epoch % self.every_epochs == 0:
+            metric = info.get(self.monitor) if self.monitor else None
+            self.save(engine, float(metric) if isinstance(metric, (int, float)) else None)
+
+    # 恢复
+    def latest_valid(self) -> Optional[Dict[str, Any]]:
+        """
+        从新到旧尝试加载索引中的检查点，返回第一个可用的快照；损坏或不完整的文件跳过
+        """
+        for entry in reversed(self.index["entries"]):
+            path = self.dir / entry["file"]
+            try:
+                snapshot = torch.load(path, map_location="cpu", weights_only=True)
+            except Exception as e:
+                logger.warning(f"checkpoint:invalid file={entry['file']} error={e}")
+                continue
+            if isinstance(snapshot, dict) and snapshot.get("format") == CHECKPOINT_FORMAT_VERSION:
+                return snapshot
+        return None
+
+    def _discard(self) -> None:
+        """
+        移除索引中的全部检查点（属于其他实验计划），之后的保存重新建立索引
+        """
+        self.wait()
+        with self._lock:
+            stale, self.index = self.index["entries"], {"entries": [], "best": None}
+            self._write_index()
+        for e in stale:
+            try:
+                (self.dir / e["file"]).unlink()
+            except OSError:
+                pass
+
+    def resume(self, engine) -> bool:
+        snapshot = self.latest_valid()
+        if snapshot is None:
+            return False
+        saved = snapshot.get("plan")
+        if self.fingerprint and saved and saved != self.fingerprint:
+            logger.warning(f"checkpoint:plan_mismatch dir={self.dir} saved={saved} current={self.fingerprint} "
+                           f"action=discard_and_train_from_scratch")
+            self._discard()
+            return False
+        engine.model.load_state_dict(snapshot["model"])
+        engine.optimizer.load_state_dict(snapshot["optimizer"])
+        engine.load_training_state(snapshot["training"])
+        restore_rng_state(snapshot.get("rng") or {})
+        logger.info(f"checkpoint:resumed epoch={engine.epoch} skip_batches={engine.skip_batches} step={engine.global_step}")
+        epochs = int(engine.cfg.get("epochs") or 0)
+        if engine.epoch >= epochs:
+            logger.warning(f"checkpoint:already_complete epoch={engine.epoch} epochs={epochs} dir={self.dir} "
+                           f"(训练将被跳过；需要重新训练时更换 experiment_id 或设置 checkpoint.resume=false)")
+        return True
+
+    def best_path(self) -> Optional[Path]:
+        best = self.index.get("best")
+        return self.dir / best if best else None
+
+    def close(self) -> None:
+        self.wait()
+        self._executor.shutdown(wait=True)
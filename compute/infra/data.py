@@ -1,4 +1,5 @@
 import sqlite3
+import json
 import logging
 from pathlib import Path
 from typing import Dict, List, Any, Set, Optional, Tuple
@@ -89,7 +90,102 @@ def query_records(exp_plan: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
         conn.close()
 
 
+def parse_mutations(mutants) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    向量化解析突变描述（形如 A673E:A692E，WT/空串表示无突变）
+    返回四个等长数组（每个有效突变一项）：
+    - rows：所在行号（int64）
+    - pos：0 起始的位点（int64）
+    - wt / mt：原/新残基的 ASCII 码（uint8，已转大写）
+    实现：所有突变串以换行拼接为一个字节缓冲区，在 uint8 数组上定位片段边界并校验
+    “字母 + 数字 + 字母”格式，位点数字按位 Horner 累加；无法解析的片段被忽略
+    """
+    joined = "\n".join("" if m is None else str(m) for m in mutants)
+    buf = np.frombuffer(joined.encode("ascii", errors="replace"), dtype=np.uint8).copy()
+    lower = (buf >= 97) & (buf <= 122)
+    buf[lower] -= 32
+    newline = buf == 10
+    sep = newline | (buf == 58) | (buf == 32) | (buf == 9) | (buf == 13)
+    prev_sep = np.concatenate([[True], sep[:-1]])
+    next_sep = np.concatenate([sep[1:], [True]])
+    starts = np.flatnonzero(~sep & prev_sep)
+    ends = np.flatnonzero(~sep & next_sep) + 1
+    length = ends - starts
+    is_alpha = (buf >= 65) & (buf <= 90)
+    is_digit = (buf >= 48) & (buf <= 57)
+    digit_cum = np.concatenate([[0], np.cumsum(is_digit)])
+    ok = (length >= 3) & is_alpha[starts] & is_alpha[np.maximum(ends - 1, 0)]
+    ok &= (digit_cum[ends - 1] - digit_cum[starts + 1]) == (length - 2)
+    starts, ends, length = starts[ok], ends[ok], length[ok]
+    rows = np.concatenate([[0], np.cumsum(newline)])[starts].astype(np.int64)
+    n_digits = length - 2
+    pos = np.zeros(starts.size, dtype=np.int64)
+    last = max(buf.size - 1, 0)
+    for j in range(int(n_digits.max()) if n_digits.size else 0):
+        has = j < n_digits
+        d = buf[np.minimum(starts + 1 + j, last)].astype(np.int64) - 48
+        pos = np.where(has, pos * 10 + d, pos)
+    pos -= 1
+    keep = pos >= 0
+    return rows[keep], pos[keep], buf[starts][keep], buf[ends - 1][keep]
+
+def _export_tokens_compatible(npz, proc) -> bool:
+    """
+    判断导出文件中的 token 矩阵能否被当前词表直接复用：
+    词表 id 映射、特殊标记与定长规则均一致时才复用，否则回退为按 sequence_text 重新编码
+    """
+    p = proc.policy()
+    id_map: Dict[str, int] = p["id_map"]
+    meta = json.loads(str(npz["meta"]))
+    vocab = [str(t) for t in npz["vocab"]]
+    if any(id_map.get(tok) != i for i, tok in enumerate(vocab)):
+        return False
+    if (p["pad_id"], p["head_id"], p["tail_id"]) != (meta.get("pad_id"), meta.get("head_id"), meta.get("tail_id")):
+        return False
+    fixed_len_fn = p.get("fixed_len_fn") or (lambda ml: ml + 2)
+    max_len = int(npz["lengths"].max()) if len(npz["lengths"]) else 0
+    return int(fixed_len_fn(max_len)) == int(meta.get("fixed_len", -1))
+
+def load_exported_dataset(path: Path, vocab_name: Optional[str] = None) -> pd.DataFrame:
+    """
+    读取 Master 导出的数据集文件（GET /api/projects/{pid}/datasets/{did}/export 生成的 .npz）
+    - 输出列与 build_dataframe 一致，下游嵌入/划分无需区分数据来源
+    - 词表兼容时直接复用预编码的 token 矩阵，跳过逐字符编码
+    """
+    proc = get_vocab_processor(vocab_name or "IUPAC")
+    with np.load(str(path), allow_pickle=False) as npz:
+        n = int(npz["id"].shape[0])
+        src_ids = npz["source_ids"]
+        src_texts = npz["source_texts"]
+        source = npz["source"]
+        # 行的 source id 映射为 source_text：source_ids 已排序，直接二分定位
+        src_pos = np.searchsorted(src_ids, source) if len(src_ids) else np.zeros(n, dtype=np.int64)
+        source_text = src_texts[src_pos].tolist() if len(src_ids) else [None] * n
+        seq_text = [b.decode("ascii") for b in npz["sequence_text"].tolist()]
+        if _export_tokens_compatible(npz, proc):
+            seq_ids: List[np.ndarray] = list(npz["tokens"].astype(np.int32))
+        else:
+            seq_ids = proc.encode_batch(seq_text)
+        score = npz["DMS_score"]
+        bins = npz["DMS_score_bin"].tolist()
+        df = pd.DataFrame({
+            "id": list(npz["id"].astype(np.int32).reshape(n, 1)),
+            "mutant": npz["mutant"].tolist(),
+            "DMS_score": list(np.nan_to_num(score, nan=0.0).astype(np.float32).reshape(n, 1)),
+            "DMS_score_bin": [b if b != "" else None for b in bins],
+            "mut_num": npz["mut_num"].astype(int).tolist(),
+            "source": list(source.astype(np.int32).reshape(n, 1)),
+            "source_text": source_text,
+            "sequence": seq_ids,
+            "sequence_text": seq_text,
+        })
+    logger.info(f"dataframe:export_loaded path={path} rows {df.shape[0]}")
+    return df
+
 def build_dataframe(exp_plan: Dict[str, Any]) -> pd.DataFrame:
+    data_cfg = exp_plan.get("data", {})
+    if data_cfg.get("format") == "npz" or str(data_cfg.get("path", "")).endswith(".npz"):
+        return load_exported_dataset(Path(data_cfg.get("path")), exp_plan.get("vocab"))
     rows_by_table = query_records(exp_plan)
     log_rows_preview(rows_by_table)
     if not rows_by_table:
@@ -98,7 +194,8 @@ def build_dataframe(exp_plan: Dict[str, Any]) -> pd.DataFrame:
     rows = rows_by_table[real_table]
     vocab_name = exp_plan.get("vocab") or "IUPAC"
     proc = get_vocab_processor(vocab_name)
-    mut_re = re.compile(r"^([A-Z])(\d+)([A-Z])$")
+    # 与主控端 config.MUTATION_REGEX、parse_mutations 一致：残基字母不区分大小写，写入序列时转为大写
+    mut_re = re.compile(r"^([A-Za-z])(\d+)([A-Za-z])$")
     seq_text: List[Optional[str]] = []
     for r in rows:
         template = r.get("template")
@@ -123,7 +220,7 @@ def build_dataframe(exp_plan: Dict[str, Any]) -> pd.DataFrame:
             pos = int(pos_str) - 1
             if pos < 0 or pos >= len(s):
                 continue
-            s[pos] = new_aa
+            s[pos] = new_aa.upper()
         seq_text.append("".join(s))
     seq_ids: List[np.ndarray] = proc.encode_batch(seq_text)
     df = pd.DataFrame({
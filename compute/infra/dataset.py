@@ -0,0 +1,333 @@
+"""
+训练数据（Dataset / DataLoader）模块
+目标：
+- 将 DataFrame 中逐行存放的对象（每行一个 numpy 数组）一次性堆叠为连续矩阵（TensorData）
+- Dataset 的取数单位是“一个批次的行号数组”，对连续矩阵做一次花式索引，避免逐行构造对象
+- DataLoader 由批采样器驱动（batch_size=None），支持多进程预取、pin_memory
+- 长度分桶（LengthBucketSampler）：按真实长度分桶组批，以 token 预算代替固定行数，
+  取数时仅填充到批内最大长度，减少 <pad> 计算浪费
+
+数据布局（TensorData）：
+- tokens：int32 [N, L]，词表编码后的定长序列（df["sequence"]）
+- lengths：int32 [N]，真实序列长度（df["sequence_text"] 的长度）
+- features：float32 [N, ...]，嵌入结果（df["feature"]，可选）
+- label：float32 [N]，回归目标（默认 df["DMS_score"]）
+- mut_num：int32 [N]，突变数（默认的分组评估列）
+- row_id：int64 [N]，原始记录 id
+- extras：其它按行数组；exp_plan["metrics"]["group_by"] 指定 mut_num 以外的分组列时，该列以原列名存于此处
+"""
+import os
+import logging
+from pathlib import Path
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, Iterator, List
+import numpy as np
+import torch
+from torch.utils.data import Dataset, DataLoader, Sampler
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TensorData:
+    tokens: np.ndarray
+    lengths: np.ndarray
+    label: np.ndarray
+    mut_num: np.ndarray
+    row_id: np.ndarray
+    features: Optional[np.ndarray] = None
+    extras: Dict[str, np.ndarray] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return int(self.label.shape[0])
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        out = {
+            "tokens": self.tokens,
+            "lengths": self.lengths,
+            "label": self.label,
+            "mut_num": self.mut_num,
+            "row_id": self.row_id,
+        }
+        if self.features is not None:
+            out["features"] = self.features
+        out.update(self.extras)
+        return out
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        按列名取按行数组（分组评估用）：mut_num 或 extras 中的列
+        """
+        if name in self.extras:
+            return self.extras[name]
+        if name == "mut_num":
+            return self.mut_num
+        raise RuntimeError(f"dataset:column_not_found {name}")
+
+    def take(self, index: np.ndarray) -> "TensorData":
+        """
+        按行号取子集，结果为新的连续矩阵（数据并行分片、子集评估用）
+        """
+        index = np.asarray(index, dtype=np.int64)
+        return TensorData.from_arrays({k: np.ascontiguousarray(v[index]) for k, v in self.arrays().items()})
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "TensorData":
+        known = {"tokens", "lengths", "label", "mut_num", "row_id", "features"}
+        return cls(
+            tokens=arrays["tokens"],
+            lengths=arrays["lengths"],
+            label=arrays["label"],
+            mut_num=arrays["mut_num"],
+            row_id=arrays["row_id"],
+            features=arrays.get("features"),
+            extras={k: v for k, v in arrays.items() if k not in known},
+        )
+
+
+def save_tensor_data(data: TensorData, directory: Path) -> None:
+    """
+    每个数组写成一个 .npy 文件，供其它进程以 mmap 只读方式共享（见 load_tensor_data）
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for name, arr in data.arrays().items():
+        tmp = directory / f"{name}.npy.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, np.ascontiguousarray(arr))
+        os.replace(tmp, directory / f"{name}.npy")
+
+
+def load_tensor_data(directory: Path, mmap: bool = True) -> TensorData:
+    """
+    读取 save_tensor_data 写出的数组；mmap=True 时以只读内存映射打开，多个进程共享同一份页缓存
+    """
+    directory = Path(directory)
+    arrays = {p.stem: np.load(p, mmap_mode="r" if mmap else None) for p in sorted(directory.glob("*.npy"))}
+    return TensorData.from_arrays(arrays)
+
+
+def _stack_scalar(col) -> np.ndarray:
+    values = col.tolist()
+    if values and isinstance(values[0], np.ndarray):
+        return np.concatenate([np.asarray(v).reshape(-1)[:1] for v in values])
+    return np.asarray(values)
+
+
+def tensor_data_from_frame(df, label_column: str = "DMS_score", group_by: Optional[str] = None) -> TensorData:
+    """
+    将 build_dataframe / apply_embeddings / apply_division 产出的 DataFrame 转为连续矩阵
+    - group_by：分组评估列；mut_num 以外的列复制到 extras（缺失值与非数值列按字符串处理）
+    """
+    n = len(df)
+    if n == 0:
+        raise RuntimeError("dataset:empty_frame")
+    tokens = np.ascontiguousarray(np.stack(df["sequence"].tolist()).astype(np.int32, copy=False))
+    if "sequence_text" in df.columns:
+        lengths = np.fromiter((len(s) if s else 0 for s in df["sequence_text"]), dtype=np.int32, count=n)
+    else:
+        lengths = np.full(n, tokens.shape[1] - 2, dtype=np.int32)
+    features = None
+    if "feature" in df.columns:
+        try:
+            features = np.ascontiguousarray(np.stack(df["feature"].tolist()).astype(np.float32, copy=False))
+        except ValueError:
+            raise RuntimeError("dataset:feature_shape_mismatch")
+    label = np.nan_to_num(_stack_scalar(df[label_column]).astype(np.float32), nan=0.0)
+    mut_num = _stack_scalar(df["mut_num"]).astype(np.int32) if "mut_num" in df.columns else np.zeros(n, dtype=np.int32)
+    row_id = _stack_scalar(df["id"]).astype(np.int64) if "id" in df.columns else np.arange(n, dtype=np.int64)
+    extras: Dict[str, np.ndarray] = {}
+    if group_by and group_by != "mut_num":
+        if group_by not in df.columns:
+            raise RuntimeError(f"dataset:group_column_not_found {group_by}")
+        values = _stack_scalar(df[group_by])
+        extras[group_by] = values.astype(str) if values.dtype == object else values
+    return TensorData(tokens=tokens, lengths=lengths, label=label, mut_num=mut_num, row_id=row_id, features=features,
+                      extras=extras)
+
+
+def padded_width(lengths: np.ndarray, full_width: int, pad_to_multiple: int = 1) -> int:
+    """
+    批内填充宽度：批内最大真实长度 + 首尾标记，按 pad_to_multiple 向上取整，且不超过原始定长
+    """
+    width = int(lengths.max()) + 2 if lengths.size else 2
+    m = max(1, int(pad_to_multiple))
+    width = ((width + m - 1) // m) * m
+    return min(width, int(full_width))
+
+
+def trim_tokens(tokens: np.ndarray, width: int) -> np.ndarray:
+    """
+    将 [head, ids..., pad..., tail] 布局的定长 token 矩阵裁剪为 width 列：
+    保留前 width-1 列（head + ids + 部分 pad），末列补回 tail
+    """
+    full = tokens.shape[1]
+    if width >= full:
+        return tokens
+    out = np.empty((tokens.shape[0], width), dtype=tokens.dtype)
+    out[:, :width - 1] = tokens[:, :width - 1]
+    out[:, width - 1] = tokens[:, full - 1]
+    return out
+
+
+class ProteinDataset(Dataset):
+    """
+    以“批次行号数组”为键的数据集：__getitem__(idx_array) 返回一个批次的张量字典
+    - trim=True 时 tokens 仅填充到批内最大长度（配合 LengthBucketSampler 使用）
+    """
+    def __init__(self, data: TensorData, trim: bool = False, pad_to_multiple: int = 1):
+        self.data = data
+        self.arrays = data.arrays()
+        self.trim = trim
+        self.pad_to_multiple = max(1, int(pad_to_multiple))
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, idx) -> Dict[str, torch.Tensor]:
+        idx = np.asarray(idx, dtype=np.int64)
+        tokens = self.data.tokens[idx]
+        if self.trim:
+            width = padded_width(self.data.lengths[idx], tokens.shape[1], self.pad_to_multiple)
+            tokens = trim_tokens(tokens, width)
+        batch = {
+            "tokens": torch.from_numpy(tokens.astype(np.int64)),
+            "lengths": torch.from_numpy(self.data.lengths[idx].astype(np.int64)),
+            "label": torch.from_numpy(self.data.label[idx]),
+            "mut_num": torch.from_numpy(self.data.mut_num[idx]),
+            "index": torch.from_numpy(idx),
+        }
+        if self.data.features is not None:
+            batch["features"] = torch.from_numpy(self.data.features[idx])
+        return batch
+
+
+class EpochBatchSampler(Sampler):
+    """
+    按 epoch 重新打乱的批采样器，产出行号数组
+    - 打乱序列由 (seed, epoch) 唯一确定，可复现
+    - skip_batches：从本 epoch 的第几个批次开始（断点续训时跳过已完成的批次）
+    """
+    def __init__(self, n: int, batch_size: int, shuffle: bool = True, seed: int = 0, drop_last: bool = False):
+        self.n = int(n)
+        self.batch_size = max(1, int(batch_size))
+        self.shuffle = shuffle
+        self.seed = int(seed)
+        self.drop_last = drop_last
+        self.epoch = 0
+        self.skip_batches = 0
+
+    def set_epoch(self, epoch: int, skip_batches: int = 0) -> None:
+        self.epoch = int(epoch)
+        self.skip_batches = int(skip_batches)
+
+    def _order(self) -> np.ndarray:
+        if not self.shuffle:
+            return np.arange(self.n, dtype=np.int64)
+        return np.random.default_rng([self.seed, self.epoch]).permutation(self.n)
+
+    def batches(self) -> List[np.ndarray]:
+        order = self._order()
+        stop = (self.n // self.batch_size) * self.batch_size if self.drop_last else self.n
+        return [order[i:i + self.batch_size] for i in range(0, stop, self.batch_size)]
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        return iter(self.batches()[self.skip_batches:])
+
+    def __len__(self) -> int:
+        full = self.n // self.batch_size if self.drop_last else (self.n + self.batch_size - 1) // self.batch_size
+        return max(full - self.skip_batches, 0)
+
+
+class LengthBucketSampler(Sampler):
+    """
+    按真实长度分桶的动态批采样器，产出行号数组
+    - 每个 epoch 先按 (seed, epoch) 打乱，再按 window 行为一个窗口、窗口内按长度排序
+    - 窗口内贪心组批：批内行数 × (批内最大长度 + 2) 不超过 max_tokens，行数不超过 max_batch_size
+    - 批次顺序再整体打乱，避免长短批次按窗口成片出现
+    - shuffle=False 时全量按长度排序（评估用，填充最少）
+    - skip_batches 语义与 EpochBatchSampler 相同
+    """
+    def __init__(self, lengths: np.ndarray, max_tokens: int, max_batch_size: Optional[int] = None,
+                 window: int = 65536, pad_to_multiple: int = 1, shuffle: bool = True, seed: int = 0):
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.n = int(self.lengths.shape[0])
+        self.max_tokens = max(1, int(max_tokens))
+        self.max_batch_size = int(max_batch_size) if max_batch_size else self.n
+        self.window = max(1, int(window))
+        self.pad_to_multiple = max(1, int(pad_to_multiple))
+        self.shuffle = shuffle
+        self.seed = int(seed)
+        self.epoch = 0
+        self.skip_batches = 0
+        self._cache: Optional[List[np.ndarray]] = None
+
+    def set_epoch(self, epoch: int, skip_batches: int = 0) -> None:
+        if int(epoch) != self.epoch:
+            self._cache = None
+        self.epoch = int(epoch)
+        self.skip_batches = int(skip_batches)
+
+    def _widths(self, sorted_lengths: np.ndarray) -> np.ndarray:
+        m = self.pad_to_multiple
+        return ((sorted_lengths + 2 + m - 1) // m) * m
+
+    def _pack(self, order: np.ndarray) -> List[np.ndarray]:
+        """
+        order 已按长度升序：批内最大宽度即批末行宽度，成本随批长单调递增，可二分确定批尾
+        """
+        widths = self._widths(self.lengths[order])
+        out: List[np.ndarray] = []
+        i = 0
+        n = order.shape[0]
+        while i < n:
+            cap = min(n - i, self.max_batch_size, max(1, self.max_tokens // int(widths[i])))
+            cost = np.arange(1, cap + 1, dtype=np.int64) * widths[i:i + cap]
+            k = max(1, int(np.searchsorted(cost, self.max_tokens, side="right")))
+            out.append(order[i:i + k])
+            i += k
+        return out
+
+    def batches(self) -> List[np.ndarray]:
+        if self._cache is not None:
+            return self._cache
+        if not self.shuffle:
+            self._cache = self._pack(np.argsort(self.lengths, kind="stable"))
+            return self._cache
+        rng = np.random.default_rng([self.seed, self.epoch])
+        perm = rng.permutation(self.n)
+        out: List[np.ndarray] = []
+        for start in range(0, self.n, self.window):
+            chunk = perm[start:start + self.window]
+            out.extend(self._pack(chunk[np.argsort(self.lengths[chunk], kind="stable")]))
+        self._cache = [out[i] for i in rng.permutation(len(out))]
+        return self._cache
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        return iter(self.batches()[self.skip_batches:])
+
+    def __len__(self) -> int:
+        return max(len(self.batches()) - self.skip_batches, 0)
+
+
+def build_loader(data: TensorData, sampler: Sampler, cfg: Dict[str, Any], trim: bool = False,
+                 pad_to_multiple: int = 1) -> DataLoader:
+    """
+    构造多进程预取的 DataLoader：
+    - cfg["num_workers"]：取数子进程数（0 表示主进程取数）
+    - cfg["prefetch_factor"]：每个子进程预取的批次数
+    - cfg["pin_memory"]：是否使用锁页内存（默认仅在非 CPU 设备上开启）
+    - trim / pad_to_multiple：取数时将 tokens 裁剪到批内最大长度
+    """
+    num_workers = int(cfg.get("num_workers") or 0)
+    device = str(cfg.get("device") or "cpu")
+    kwargs: Dict[str, Any] = {
+        "sampler": sampler,
+        "batch_size": None,
+        "num_workers": num_workers,
+        "pin_memory": bool(cfg.get("pin_memory", not device.startswith("cpu"))),
+    }
+    if num_workers > 0:
+        kwargs["prefetch_factor"] = int(cfg.get("prefetch_factor") or 2)
+        kwargs["persistent_workers"] = True
+    return DataLoader(ProteinDataset(data, trim=trim, pad_to_multiple=pad_to_multiple), **kwargs)
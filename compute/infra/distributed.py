@@ -0,0 +1,538 @@
+"""
+数据并行训练（torch.distributed + gloo，CPU 多进程 / 多节点）
+目标：
+- 每个 rank 一个进程：训练集矩阵按 rank 分片为连续子矩阵（各 rank 行数相同），验证集同样分片后汇总损失
+- 模型由 DistributedDataParallel 包装：梯度按 bucket_cap_mb 分桶，反向传播中某个桶的梯度就绪即异步 all-reduce，
+  通信与剩余的反向计算重叠；梯度累积的中间微批次不同步（no_sync）
+- 汇合（rendezvous）：
+  * env：torchrun 兼容的 MASTER_ADDR / MASTER_PORT / RANK / WORLD_SIZE（本机启动器自动设置）
+  * redis：经 master 的 Redis 汇合，各进程 INCR <prefix>:<run_id>:rank 取得全局 rank，
+    rank 0 选一个空闲端口并发布 host:port，其余进程等待后以 tcp:// 初始化进程组；键在 timeout 秒后过期
+- 只有 rank 0 写产物（实验计划快照、归一化状态、history、检查点、遥测、上报、模型权重、测试集评估）
+- 检查点续训：rank 0 从检查点恢复后，训练进度与优化器状态广播给其余 rank，模型参数由 DDP 构造时从 rank 0 广播
+- 扩展效率：rank 0 每个 epoch 写 training/distributed.json（全局 / 各 rank 吞吐）；
+  配置 baseline_samples_per_sec 时给出 scaling_efficiency = 全局吞吐 / (world_size × 单进程吞吐)
+
+配置（exp_plan["distributed"]，均可省略）：
+    "distributed": {
+        "nprocs": 2,                      # 本机进程数（启动器按此拉起，CPU 亲和性在各进程间均分）
+        "world_size": null,               # 全局进程数，默认 = nprocs；多节点时为各节点 nprocs 之和
+        "backend": "gloo",
+        "rendezvous": null,               # env | redis，默认：world_size > nprocs 时 redis，否则 env
+        "redis_url": null,                # 默认取 report.redis_url，再取环境变量 REDIS_URL
+        "run_id": null,                   # 汇合键，默认为 experiment_id（多节点须相同）
+        "host": null,                     # rank 0 对外发布的地址，默认取 INFRA_DIST_HOST 或按主机名解析
+        "timeout": 300,                   # 汇合与集合通信超时（秒）
+        "bucket_cap_mb": 25,
+        "find_unused_parameters": false,
+        "baseline_samples_per_sec": null
+    }
+
+命令行：
+    python -m infra.distributed <exp_plan.json>                   # 按 nprocs 在本机拉起各 rank
+    python -m infra.distributed <exp_plan.json> --scaling 1,2,4   # 依次以 1/2/4 个进程训练，输出扩展效率
+多节点：在每个节点以相同的 run_id / world_size 执行第一条命令（redis 汇合）
+"""
+import os
+import sys
+import json
+import time
+import copy
+import shutil
+import socket
+import logging
+import argparse
+import tempfile
+import datetime
+import contextlib
+import subprocess
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Tuple
+import numpy as np
+import torch
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import Sampler
+from .dataset import TensorData
+from .engine import TrainEngine, build_model, train_config, install_stop_signal, ignore_stop_signal
+
+logger = logging.getLogger(__name__)
+
+DISTRIBUTED_DEFAULTS: Dict[str, Any] = {
+    "nprocs": 1,
+    "world_size": None,
+    "backend": "gloo",
+    "rendezvous": None,
+    "redis_url": None,
+    "run_id": None,
+    "host": None,
+    "timeout": 300.0,
+    "bucket_cap_mb": 25,
+    "find_unused_parameters": False,
+    "baseline_samples_per_sec": None,
+}
+REDIS_PREFIX = "dist"
+RANK_PROCESS_FLAG = "--rank-process"
+
+
+def distributed_config(exp_plan: Dict[str, Any]) -> Dict[str, Any]:
+    cfg = dict(DISTRIBUTED_DEFAULTS)
+    cfg.update(exp_plan.get("distributed") or {})
+    cfg["nprocs"] = max(1, int(cfg["nprocs"] or 1))
+    cfg["world_size"] = int(cfg["world_size"] or cfg["nprocs"])
+    if cfg["world_size"] < cfg["nprocs"]:
+        raise RuntimeError(f"distributed:invalid_world_size world_size={cfg['world_size']} nprocs={cfg['nprocs']}")
+    if not cfg["rendezvous"]:
+        cfg["rendezvous"] = "redis" if cfg["world_size"] > cfg["nprocs"] else "env"
+    if cfg["rendezvous"] not in ("env", "redis"):
+        raise RuntimeError(f"distributed:unknown_rendezvous rendezvous={cfg['rendezvous']}")
+    cfg["redis_url"] = cfg["redis_url"] or (exp_plan.get("report") or {}).get("redis_url") or os.environ.get("REDIS_URL")
+    cfg["run_id"] = str(cfg["run_id"] or exp_plan.get("experiment_id") or "default")
+    return cfg
+
+
+def is_distributed(exp_plan: Dict[str, Any]) -> bool:
+    cfg = exp_plan.get("distributed") or {}
+    return int(cfg.get("world_size") or cfg.get("nprocs") or 1) > 1
+
+
+# 汇合
+def _free_port(host: str = "") -> int:
+    with contextlib.closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
+        s.bind((host, 0))
+        return int(s.getsockname()[1])
+
+
+def _public_host(cfg: Dict[str, Any]) -> str:
+    host = cfg.get("host") or os.environ.get("INFRA_DIST_HOST")
+    if host:
+        return str(host)
+    try:
+        return socket.gethostbyname(socket.gethostname())
+    except OSError:
+        return "127.0.0.1"
+
+
+class RedisRendezvous:
+    """
+    经 Redis 汇合：join(host) -> (rank, master_addr, master_port)
+    - rank 按到达顺序分配（INCR），超过 world_size 的进程报错退出
+    - rank 0 发布 host:port，其余 rank 轮询等待，超时报错
+    - cleanup()：进程组建立后由 rank 0 删除汇合键，同一 run_id 可再次汇合
+    """
+    def __init__(self, redis_url: str, run_id: str, world_size: int, timeout: float = 300.0, prefix: str = REDIS_PREFIX):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("distributed:redis_not_installed")
+        if not redis_url:
+            raise RuntimeError("distributed:redis_url_required")
+        self.connection = redis.Redis.from_url(redis_url)
+        self.world_size = int(world_size)
+        self.timeout = float(timeout)
+        self.rank_key = f"{prefix}:{run_id}:rank"
+        self.master_key = f"{prefix}:{run_id}:master"
+
+    def join(self, host: str) -> Tuple[int, str, int]:
+        ttl = max(1, int(self.timeout))
+        rank = int(self.connection.incr(self.rank_key)) - 1
+        self.connection.expire(self.rank_key, ttl)
+        if rank >= self.world_size:
+            raise RuntimeError(f"distributed:rendezvous_full rank={rank} world_size={self.world_size}")
+        if rank == 0:
+            port = _free_port()
+            self.connection.set(self.master_key, f"{host}:{port}", ex=ttl)
+            logger.info(f"distributed:rendezvous_master key={self.master_key} endpoint={host}:{port}")
+            return 0, host, port
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            raw = self.connection.get(self.master_key)
+            if raw:
+                addr, port = (raw.decode() if isinstance(raw, bytes) else str(raw)).rsplit(":", 1)
+                return rank, addr, int(port)
+            time.sleep(0.2)
+        raise RuntimeError(f"distributed:rendezvous_timeout key={self.master_key} rank={rank}")
+
+    def cleanup(self) -> None:
+        self.connection.delete(self.rank_key, self.master_key)
+
+
+def init_process_group(cfg: Dict[str, Any]) -> Tuple[int, int]:
+    """
+    按汇合方式建立进程组，返回 (rank, world_size)
+    """
+    timeout = datetime.timedelta(seconds=float(cfg["timeout"]))
+    rendezvous = None
+    if cfg["rendezvous"] == "env":
+        for key in ("MASTER_ADDR", "MASTER_PORT", "RANK", "WORLD_SIZE"):
+            if key not in os.environ:
+                raise RuntimeError(f"distributed:missing_env key={key}")
+        rank, world_size = int(os.environ["RANK"]), int(os.environ["WORLD_SIZE"])
+        init_method = "env://"
+    else:
+        world_size = int(cfg["world_size"])
+        rendezvous = RedisRendezvous(cfg["redis_url"], cfg["run_id"], world_size, cfg["timeout"])
+        rank, addr, port = rendezvous.join(_public_host(cfg))
+        init_method = f"tcp://{addr}:{port}"
+    dist.init_process_group(cfg["backend"], init_method=init_method, rank=rank, world_size=world_size, timeout=timeout)
+    if rendezvous is not None and rank == 0:
+        rendezvous.cleanup()
+    logger.info(f"distributed:joined rank={rank} world_size={world_size} backend={cfg['backend']} "
+                f"rendezvous={cfg['rendezvous']}")
+    return rank, world_size
+
+
+# 数据分片
+def shard_tensor_data(data: TensorData, rank: int, world_size: int, seed: int = 0, equal: bool = True) -> TensorData:
+    """
+    按 (seed) 打乱后轮流分给各 rank，rank 内按原行序取出连续子矩阵
+    - equal=True：各 rank 行数相同（丢弃末尾不足 world_size 的余数行），保证各 rank 每个 epoch 批次数一致
+    - equal=False：保留全部行（验证集，损失按行数加权汇总）
+    """
+    n = len(data)
+    order = np.random.default_rng([int(seed), int(world_size)]).permutation(n)
+    if equal:
+        order = order[:(n // world_size) * world_size]
+    return data.take(np.sort(order[rank::world_size]))
+
+
+class BalancedSampler(Sampler):
+    """
+    包装批采样器：每个 epoch 各 rank 的批次数取全局最小值（长度分桶时各分片批次数可能不同，
+    不一致会使集合通信永久等待）
+    """
+    def __init__(self, inner):
+        self.inner = inner
+        self.limit = None
+        self.skip_batches = 0
+
+    def set_epoch(self, epoch: int, skip_batches: int = 0) -> None:
+        self.inner.set_epoch(epoch, 0)
+        self.skip_batches = int(skip_batches)
+        count = torch.tensor([len(self.inner.batches())], dtype=torch.int64)
+        dist.all_reduce(count, op=dist.ReduceOp.MIN)
+        self.limit = int(count.item())
+
+    def batches(self) -> List[np.ndarray]:
+        out = self.inner.batches()
+        return out[:self.limit] if self.limit is not None else out
+
+    def __iter__(self):
+        return iter(self.batches()[self.skip_batches:])
+
+    def __len__(self) -> int:
+        return max(len(self.batches()) - self.skip_batches, 0)
+
+
+class DistributedEngine(TrainEngine):
+    """
+    数据并行训练循环（在 TrainEngine 基础上）：
+    - fit() 开始时同步 rank 0 的训练进度与优化器状态，并以 DDP 包装模型
+    - 回调（上报、遥测、检查点）只在 rank 0 执行；任一 rank 请求停止时全体停止
+    - epoch 记录中的损失、样本数、吞吐为全局汇总值，另记各 rank 吞吐
+    """
+    def __init__(self, model: torch.nn.Module, exp_plan: Dict[str, Any], rank: int, world_size: int,
+                 history_path: Optional[Path] = None, callbacks=None, report_path: Optional[Path] = None):
+        super().__init__(model, exp_plan, history_path=history_path if rank == 0 else None,
+                         callbacks=callbacks if rank == 0 else None)
+        self.rank = int(rank)
+        self.world_size = int(world_size)
+        self.dist_cfg = distributed_config(exp_plan)
+        self.report_path = Path(report_path) if report_path and rank == 0 else None
+        self.ddp: Optional[DistributedDataParallel] = None
+
+    def _wrap(self) -> None:
+        state = [self.training_state(), self.optimizer.state_dict()] if self.rank == 0 else [None, None]
+        dist.broadcast_object_list(state, src=0)
+        if self.rank != 0:
+            self.load_training_state(state[0])
+            self.optimizer.load_state_dict(state[1])
+        self.ddp = DistributedDataParallel(self.model, bucket_cap_mb=float(self.dist_cfg["bucket_cap_mb"]),
+                                           find_unused_parameters=bool(self.dist_cfg["find_unused_parameters"]),
+                                           gradient_as_bucket_view=True)
+
+    def _forward(self, batch: Dict[str, torch.Tensor]) -> torch.Tensor:
+        return self.ddp(batch)
+
+    def _grad_sync(self, sync: bool):
+        return contextlib.nullcontext() if sync else self.ddp.no_sync()
+
+    def _sampler(self, data: TensorData, shuffle: bool):
+        inner = super()._sampler(data, shuffle)
+        return BalancedSampler(inner) if shuffle else inner
+
+    def _emit(self, event: str, info: Dict[str, Any]) -> None:
+        super()._emit(event, info)
+        flag = torch.tensor([1 if self.should_stop else 0], dtype=torch.int64)
+        dist.all_reduce(flag, op=dist.ReduceOp.MAX)
+        self.should_stop = bool(flag.item())
+
+    def train_epoch(self, loader, sampler) -> Dict[str, Any]:
+        record = super().train_epoch(loader, sampler)
+        local = torch.tensor([record["train_loss"] * record["samples"], record["samples"],
+                              record["tokens_per_sec"] * record["seconds"]], dtype=torch.float64)
+        dist.all_reduce(local)
+        seconds = torch.tensor([record["seconds"]], dtype=torch.float64)
+        dist.all_reduce(seconds, op=dist.ReduceOp.MAX)
+        rates = [torch.zeros(1, dtype=torch.float64) for _ in range(self.world_size)]
+        dist.all_gather(rates, torch.tensor([record["samples_per_sec"]], dtype=torch.float64))
+        total_loss, samples, tokens = (float(v) for v in local)
+        elapsed = float(seconds.item())
+        record.update({
+            "train_loss": total_loss / max(samples, 1.0),
+            "samples": int(samples),
+            "seconds": elapsed,
+            "samples_per_sec": samples / elapsed if elapsed > 0 else 0.0,
+            "tokens_per_sec": tokens / elapsed if elapsed > 0 else 0.0,
+            "world_size": self.world_size,
+            "rank_samples_per_sec": [float(r.item()) for r in rates],
+        })
+        baseline = self.dist_cfg.get("baseline_samples_per_sec")
+        if baseline:
+            record["scaling_efficiency"] = record["samples_per_sec"] / (self.world_size * float(baseline))
+        return record
+
+    def evaluate_loss(self, data: TensorData) -> float:
+        n = len(data)
+        local = super().evaluate_loss(data) * n if n else 0.0
+        total = torch.tensor([local, float(n)], dtype=torch.float64)
+        dist.all_reduce(total)
+        return float(total[0] / max(float(total[1]), 1.0))
+
+    def fit(self, train_data: TensorData, valid_data: Optional[TensorData] = None) -> List[Dict[str, Any]]:
+        self._wrap()
+        return super().fit(train_data, valid_data)
+
+    def _write_history(self) -> None:
+        super()._write_history()
+        if self.report_path is not None:
+            write_scaling_report(self.report_path, self.history, self.dist_cfg, self.world_size)
+
+
+def write_scaling_report(path: Path, history: List[Dict[str, Any]], cfg: Dict[str, Any], world_size: int) -> Dict[str, Any]:
+    """
+    写出扩展效率报告：各 epoch 的全局 / 各 rank 吞吐；多于一个 epoch 时整体吞吐不计首个 epoch（预热）
+    """
+    epochs = [{k: r.get(k) for k in ("epoch", "seconds", "samples", "samples_per_sec", "rank_samples_per_sec",
+                                     "scaling_efficiency") if r.get(k) is not None} for r in history]
+    steady = history[1:] if len(history) > 1 else history
+    seconds = sum(float(r.get("seconds") or 0.0) for r in steady)
+    samples = sum(int(r.get("samples") or 0) for r in steady)
+    report = {
+        "world_size": world_size,
+        "backend": cfg["backend"],
+        "bucket_cap_mb": cfg["bucket_cap_mb"],
+        "samples_per_sec": samples / seconds if seconds > 0 else 0.0,
+        "epochs": epochs,
+    }
+    baseline = cfg.get("baseline_samples_per_sec")
+    if baseline:
+        report["baseline_samples_per_sec"] = float(baseline)
+        report["scaling_efficiency"] = report["samples_per_sec"] / (world_size * float(baseline))
+    path = Path(path)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp.replace(path)
+    return report
+
+
+# 单个 rank 的训练流程
+def run_rank(exp_plan: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    与 training.run_train 相同的流程，按 rank 分工：数据各自准备后分片，产物只由 rank 0 写出
+    """
+    from . import get_workdir
+    from .recoder import ExperimentRecorder, experiment_id_of
+    from .training import prepare_data
+    from .evaluator import Evaluator
+    from .reporter import Reporter
+    from .checkpoint import CheckpointManager, checkpoint_config
+    from .telemetry import TelemetryWriter
+
+    cfg = distributed_config(exp_plan)
+    rank, world_size = init_process_group(cfg)
+    primary = rank == 0
+    reporter = telemetry = ckpt = None
+    try:
+        recorder = ExperimentRecorder()
+        recorder.create_dirs(str(get_workdir()), experiment_id_of(exp_plan))
+        if primary:
+            recorder.save_exp_plan(exp_plan)
+        train_data, valid_data, test_data = prepare_data(exp_plan, recorder.normalization if primary else None)
+        seed = int(train_config(exp_plan)["seed"])
+        train_shard = shard_tensor_data(train_data, rank, world_size, seed, equal=True)
+        valid_shard = shard_tensor_data(valid_data, rank, world_size, seed, equal=False)
+        logger.info(f"distributed:sharded rank={rank} train_rows={len(train_shard)}/{len(train_data)} "
+                    f"valid_rows={len(valid_shard)}/{len(valid_data)}")
+        del train_data
+        model = build_model(exp_plan)
+        callbacks = []
+        if primary:
+            reporter = Reporter.from_exp_plan(exp_plan)
+            if reporter:
+                callbacks.append(reporter.on_train_event)
+            telemetry = TelemetryWriter.from_exp_plan(exp_plan, recorder.training)
+            if telemetry:
+                callbacks.append(telemetry.on_train_event)
+        engine = DistributedEngine(model, exp_plan, rank, world_size, history_path=recorder.training / "history.json",
+                                   callbacks=callbacks, report_path=recorder.training / "distributed.json")
+        if primary:
+            ckpt = CheckpointManager.from_exp_plan(exp_plan, recorder.base)
+            if ckpt:
+                if checkpoint_config(exp_plan).get("resume"):
+                    ckpt.resume(engine)
+                engine.callbacks.append(ckpt.on_train_event)
+        try:
+            engine.fit(train_shard, valid_shard)
+        finally:
+            if ckpt:
+                ckpt.close()
+            if telemetry:
+                telemetry.close()
+        metrics = None
+        if primary:
+            torch.save(model.state_dict(), recorder.pth)
+            if test_data is not None:
+                metrics = Evaluator(engine, exp_plan).evaluate(test_data, recorder.labels)
+                recorder.write_metrics(metrics)
+                if reporter:
+                    reporter.report_result({"experiment": recorder.base.name, "metrics": metrics.get("overall")})
+        return {"rank": rank, "history": engine.history, "metrics": metrics}
+    finally:
+        if reporter:
+            reporter.close()
+        dist.destroy_process_group()
+
+
+# 本机启动器
+def _cpu_slices(nprocs: int) -> List[List[int]]:
+    """
+    把本进程可用的核心均分给各 rank；核心数少于进程数时各 rank 共享全部核心
+    """
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    if len(cores) < nprocs:
+        return [cores] * nprocs
+    return [list(map(int, part)) for part in np.array_split(np.array(cores), nprocs)]
+
+
+def launch(exp_plan: Dict[str, Any], poll_interval: float = 0.5) -> int:
+    """
+    在本机拉起 nprocs 个 rank 进程（python -m infra.distributed --rank-process），任一进程失败即终止其余进程，
+    返回退出码（全部成功为 0）
+    """
+    cfg = distributed_config(exp_plan)
+    nprocs = cfg["nprocs"]
+    fd, plan_path = tempfile.mkstemp(prefix="exp_plan-", suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(exp_plan, f, ensure_ascii=False)
+    base_env = dict(os.environ)
+    base_env["PYTHONPATH"] = os.pathsep.join(p for p in [str(Path(__file__).resolve().parent.parent),
+                                                         base_env.get("PYTHONPATH")] if p)
+    if cfg["rendezvous"] == "env":
+        base_env.update({"MASTER_ADDR": "127.0.0.1", "MASTER_PORT": str(_free_port("127.0.0.1")),
+                         "WORLD_SIZE": str(nprocs)})
+    procs: List[subprocess.Popen] = []
+    try:
+        for local_rank, cores in enumerate(_cpu_slices(nprocs)):
+            env = dict(base_env, LOCAL_RANK=str(local_rank), LOCAL_WORLD_SIZE=str(nprocs),
+                       INFRA_DIST_CPUS=",".join(map(str, cores)))
+            if cfg["rendezvous"] == "env":
+                env["RANK"] = str(local_rank)
+            procs.append(subprocess.Popen([sys.executable, "-m", "infra.distributed", RANK_PROCESS_FLAG, plan_path], env=env,
+                                          preexec_fn=ignore_stop_signal))
+        logger.info(f"distributed:launched nprocs={nprocs} world_size={cfg['world_size']} rendezvous={cfg['rendezvous']}")
+        code = 0
+        while procs:
+            for p in list(procs):
+                rc = p.poll()
+                if rc is None:
+                    continue
+                procs.remove(p)
+                if rc != 0:
+                    code = code or rc
+                    logger.error(f"distributed:rank_failed pid={p.pid} code={rc}")
+                    for other in procs:
+                        other.terminate()
+            time.sleep(poll_interval)
+        return code
+    finally:
+        for p in procs:
+            p.kill()
+        os.unlink(plan_path)
+
+
+def scaling_benchmark(exp_plan: Dict[str, Any], world_sizes: List[int]) -> Dict[str, Any]:
+    """
+    依次以不同进程数在本机训练同一计划，输出 {world_size: 吞吐与扩展效率}（基准为列表中的第一个进程数）；
+    各次运行写入 <experiment_id>-w<N> 实验目录（运行前清空，不续训），报告写入 <experiment_id>-scaling.json
+    """
+    from . import get_workdir
+    from .recoder import experiment_id_of
+    experiment_id = experiment_id_of(exp_plan)
+    runs: Dict[int, Dict[str, Any]] = {}
+    base = None
+    for n in world_sizes:
+        plan = copy.deepcopy(exp_plan)
+        plan["experiment_id"] = f"{experiment_id}-w{n}"
+        plan["distributed"] = dict(plan.get("distributed") or {}, nprocs=n, world_size=n, rendezvous="env",
+                                   run_id=plan["experiment_id"])
+        plan.pop("report", None)
+        # 每次都从头训练：关闭续训（缺省为开启）并清除上一次基准运行的实验目录，避免读到旧的检查点与 distributed.json
+        plan["checkpoint"] = dict(plan.get("checkpoint") or {}, resume=False)
+        shutil.rmtree(Path(get_workdir()) / "experiments" / plan["experiment_id"], ignore_errors=True)
+        code = launch(plan)
+        if code != 0:
+            raise RuntimeError(f"distributed:scaling_run_failed world_size={n} code={code}")
+        path = Path(get_workdir()) / "experiments" / plan["experiment_id"] / "training" / "distributed.json"
+        sps = float(json.loads(path.read_text(encoding="utf-8"))["samples_per_sec"])
+        base = base or (sps, n)
+        runs[n] = {"samples_per_sec": sps, "speedup": sps / base[0],
+                   "scaling_efficiency": (sps / n) / (base[0] / base[1])}
+        logger.info(f"distributed:scaling world_size={n} samples_per_sec={sps:.1f} "
+                    f"efficiency={runs[n]['scaling_efficiency']:.3f}")
+    report = {"experiment_id": experiment_id, "runs": {str(k): v for k, v in runs.items()}}
+    out = Path(get_workdir()) / "experiments" / f"{experiment_id}-scaling.json"
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    return report
+
+
+def _rank_process(plan_path: str) -> int:
+    cpus = os.environ.get("INFRA_DIST_CPUS")
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {int(c) for c in cpus.split(",") if c != ""})
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    from . import require_workdir
+    install_stop_signal()
+    require_workdir()
+    with open(plan_path, "r", encoding="utf-8") as f:
+        exp_plan = json.load(f)
+    try:
+        run_rank(exp_plan)
+    finally:
+        ignore_stop_signal()
+    return 0
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == RANK_PROCESS_FLAG:
+        return _rank_process(argv[1])
+    parser = argparse.ArgumentParser(prog="python -m infra.distributed")
+    parser.add_argument("plan", help="exp_plan JSON 文件")
+    parser.add_argument("--nprocs", type=int, default=None, help="本机进程数（覆盖 distributed.nprocs）")
+    parser.add_argument("--scaling", default=None, help="逗号分隔的进程数列表，依次训练并输出扩展效率")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    with open(args.plan, "r", encoding="utf-8") as f:
+        exp_plan = json.load(f)
+    if args.nprocs:
+        exp_plan["distributed"] = dict(exp_plan.get("distributed") or {}, nprocs=args.nprocs)
+    if args.scaling:
+        report = scaling_benchmark(exp_plan, [int(x) for x in args.scaling.split(",") if x.strip()])
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+    return launch(exp_plan)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
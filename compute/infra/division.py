@@ -1,6 +1,9 @@
-from typing import Dict, Any
+from typing import Dict, Any, Callable, List, Optional, Tuple
+import re
 import logging
+import numpy as np
 from .registry import registry
+from .data import parse_mutations
 
 """
 数据划分（Division）使用说明
@@ -24,8 +27,8 @@ from .registry import registry
   }
 - 约束：
   - 比例和必须等于 1
-  - 强制随机（不提供关闭随机的开关）
-  - 划分基于打乱后的行索引按比例切片
+  - 强制随机（不提供关闭随机的开关）；可选 seed（或 exp_plan['seed']）固定随机序列以便复现
+  - 划分基于打乱后的行索引按比例切片（一次 permutation，O(n)）
 
 三、mutnum 方法
 - df['mut_num'] 的唯一有序值定义为 uniq_mutnum = sorted(unique(df['mut_num']))
@@ -40,12 +43,334 @@ from .registry import registry
 - 冲突与覆盖：
   - 若 train/valid/test 的 mut_num 集合发生交叠，不抛错，记录 warning
   - 三者并集可不等于 uniq_mutnum；记录 info：被选择样本数 / 总样本数
+
+四、分组划分（ratio / mutnum 通用）
+- 配置 "group": "source"（或其他列名）后，以组为单位抽样：同一组（同一模板）的样本只会落入一个集合
+  - ratio：打乱组顺序后按累计行数比例切分，各集合行数比例近似等于配置比例
+  - mutnum：test 为浮点数时，从 valid 中按组抽取 test
+- 选择表达式编译为 mut_num 数组上的 numpy 布尔掩码，抽样全部向量化，无逐行 Python 循环
+
+五、cluster 方法（按序列相似度聚类后整簇划分）
+- 配置：
+  {
+    "division": {
+      "method": "cluster",
+      "train": 0.8, "valid": 0.1, "test": 0.1,
+      "radius": 1,                      # 聚类半径（Hamming 距离），支持 0 或 1
+      "stratify": "DMS_score_bin",      # 可选：按簇内众数分层
+      "seed": 42
+    }
+  }
+- 距离：同一模板（source）下，两个变体在相对模板发生突变的位点上的 Hamming 距离；不同模板互不相连
+- 聚类：单连接（距离 ≤ radius 的变体连边，取连通分量）
+  - 野生型（WT / 空突变）与所有单点突变的距离均为 1，不参与连边（否则所有单点突变经 WT 连成一簇），
+    同一模板的 WT 行彼此合并为一簇后与其它簇一样按比例分配
+  - radius=1 时最大簇的行数超过最小划分比例对应的行数（双突变把单点突变串成大簇）时记录 warning，回退为 radius=0
+- 近邻搜索：以 (位点, 残基) 集合的可加哈希构造倒排键，避免 O(n²) 两两比较：
+  - 自身键 H(A)，删除键 H(A) - h(e)：A 比 B 多一个突变时，A 的删除键等于 B 的自身键
+  - 通配键 H(A) - h(e) + g(pos(e))：同一位点替换为不同残基时两者相等
+  - 每个变体只产生 1 + 2·mut_num 个键，整体线性，可扩展到百万级
+- 连通分量采用向量化的“挂接 + 指针跳跃”迭代，整簇按比例分配到 train/valid/test
 """
 
 class BaseDivision:
     def split(self, df, exp_plan: Dict[str, Any]) -> Dict[str, Any]:
         raise NotImplementedError
 
+_SEL_HEAD = re.compile(r"^\[\s*:\s*(-?\d+)\s*\]$")
+_SEL_TAIL = re.compile(r"^\[\s*(-?\d+)\s*:\s*\]$")
+_SEL_SET = re.compile(r"^\[\s*(-?\d+(?:\s*,\s*-?\d+)*)?\s*\]$")
+
+
+def compile_selector(expr: Any) -> Callable[[np.ndarray], np.ndarray]:
+    """
+    将 mut_num 选择表达式编译为掩码函数 f(mut_num_array) -> bool 数组
+    - "[a,b,c]" / [a, b, c]：mut_num ∈ {a,b,c}
+    - "[:k]"：mut_num < k
+    - "[k:]"：mut_num ≥ k
+    """
+    if isinstance(expr, (list, tuple)):
+        values = np.asarray([int(v) for v in expr], dtype=np.int64)
+        return lambda m: np.isin(m, values)
+    text = str(expr or "").strip()
+    m = _SEL_HEAD.match(text)
+    if m:
+        k = int(m.group(1))
+        return lambda arr: arr < k
+    m = _SEL_TAIL.match(text)
+    if m:
+        k = int(m.group(1))
+        return lambda arr: arr >= k
+    m = _SEL_SET.match(text)
+    if m:
+        values = np.asarray([int(v) for v in (m.group(1) or "").split(",") if v.strip()], dtype=np.int64)
+        return lambda arr: np.isin(arr, values)
+    raise RuntimeError(f"division:invalid_selector {expr}")
+
+
+def _column_1d(df, column: str) -> np.ndarray:
+    """
+    取出一列为一维数组；兼容 build_dataframe 中“每行一个长度为 1 的数组”的存储方式（如 source）
+    """
+    col = df[column]
+    if col.dtype == object and len(col) > 0 and isinstance(col.iloc[0], np.ndarray):
+        return np.concatenate([np.asarray(v).reshape(-1)[:1] for v in col])
+    return col.to_numpy()
+
+
+def _division_rng(cfg: Dict[str, Any], exp_plan: Dict[str, Any]) -> np.random.Generator:
+    seed = cfg.get("seed", exp_plan.get("seed"))
+    return np.random.default_rng(None if seed is None else int(seed))
+
+
+def _ratios(cfg: Dict[str, Any], keys=("train", "valid", "test")) -> np.ndarray:
+    try:
+        r = np.asarray([float(cfg[k]) for k in keys], dtype=np.float64)
+    except (KeyError, TypeError, ValueError):
+        raise RuntimeError("division:ratio_required")
+    if (r < 0).any() or not np.isclose(r.sum(), 1.0):
+        raise RuntimeError(f"division:ratio_sum_not_one {r.tolist()}")
+    return r
+
+
+def _group_codes(df, group: str) -> Tuple[np.ndarray, int]:
+    """组列 -> (每行组编号, 组数)"""
+    if group not in df.columns:
+        raise RuntimeError(f"division:group_column_not_found {group}")
+    _, inverse = np.unique(_column_1d(df, group), return_inverse=True)
+    inverse = inverse.reshape(-1)
+    return inverse, int(inverse.max()) + 1 if inverse.size else 0
+
+
+def ratio_assign(n: int, ratios: np.ndarray, rng: np.random.Generator, groups: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    返回每行所属集合编号（0..len(ratios)-1）
+    - 无分组：一次 permutation 后按比例切片
+    - 分组：打乱组顺序，按组的累计行数中点落入的比例区间分配整组
+    """
+    bounds = np.cumsum(ratios)[:-1]
+    out = np.empty(n, dtype=np.int64)
+    if groups is None:
+        perm = rng.permutation(n)
+        cuts = np.floor(bounds * n + 0.5).astype(np.int64)
+        out[perm] = np.searchsorted(cuts, np.arange(n), side="right")
+        return out
+    n_groups = int(groups.max()) + 1 if groups.size else 0
+    sizes = np.bincount(groups, minlength=n_groups)
+    order = rng.permutation(n_groups)
+    cum = np.cumsum(sizes[order])
+    mid = (cum - sizes[order] / 2.0) / max(n, 1)
+    group_split = np.empty(n_groups, dtype=np.int64)
+    group_split[order] = np.searchsorted(bounds, mid, side="right")
+    return group_split[groups]
+
+
+def _take(df, mask: np.ndarray):
+    return df.iloc[np.flatnonzero(mask)]
+
+
+@registry.register_division("ratio", capabilities={"process_safe": True}, builtin=True)
+class RatioDivision(BaseDivision):
+    """按比例随机划分；可选 group 以组为单位划分"""
+    def split(self, df, exp_plan: Dict[str, Any]) -> Dict[str, Any]:
+        cfg = exp_plan.get("division") or {}
+        ratios = _ratios(cfg)
+        rng = _division_rng(cfg, exp_plan)
+        group = cfg.get("group")
+        groups = _group_codes(df, group)[0] if group else None
+        assign = ratio_assign(len(df), ratios, rng, groups)
+        return {name: _take(df, assign == i) for i, name in enumerate(("train", "valid", "test"))}
+
+
+@registry.register_division("mutnum", capabilities={"process_safe": True}, builtin=True)
+class MutnumDivision(BaseDivision):
+    """按 mut_num 选择表达式划分；test 可为浮点数，从 valid 中随机抽取"""
+    def split(self, df, exp_plan: Dict[str, Any]) -> Dict[str, Any]:
+        logger = logging.getLogger(__name__)
+        cfg = exp_plan.get("division") or {}
+        if "mut_num" not in df.columns:
+            raise RuntimeError("division:mut_num_required")
+        mut_num = _column_1d(df, "mut_num").astype(np.int64)
+        train_mask = compile_selector(cfg.get("train"))(mut_num)
+        valid_mask = compile_selector(cfg.get("valid"))(mut_num)
+        test_cfg = cfg.get("test")
+        if isinstance(test_cfg, (int, float)) and not isinstance(test_cfg, bool):
+            frac = float(test_cfg)
+            if not 0.0 <= frac <= 1.0:
+                raise RuntimeError(f"division:invalid_test_fraction {test_cfg}")
+            # 约定：在 valid 样本中随机选择 (1 - test) 作为 test，其余仍为 valid
+            take = 1.0 - frac
+            rng = _division_rng(cfg, exp_plan)
+            idx = np.flatnonzero(valid_mask)
+            group = cfg.get("group")
+            if group:
+                groups = _group_codes(df, group)[0][idx]
+                _, sub = np.unique(groups, return_inverse=True)
+                assign = ratio_assign(idx.size, np.asarray([take, 1.0 - take]), rng, sub.reshape(-1))
+            else:
+                assign = ratio_assign(idx.size, np.asarray([take, 1.0 - take]), rng)
+            test_mask = np.zeros(len(df), dtype=bool)
+            test_mask[idx[assign == 0]] = True
+            valid_mask = valid_mask & ~test_mask
+        else:
+            test_mask = compile_selector(test_cfg)(mut_num)
+        overlap = (train_mask & valid_mask) | (train_mask & test_mask) | (valid_mask & test_mask)
+        if overlap.any():
+            logger.warning(f"division:mutnum_overlap rows={int(overlap.sum())}")
+        used = int((train_mask | valid_mask | test_mask).sum())
+        logger.info(f"division:mutnum_selected {used}/{len(df)}")
+        return {"train": _take(df, train_mask), "valid": _take(df, valid_mask), "test": _take(df, test_mask)}
+
+
+_U64 = np.uint64
+
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    """splitmix64 终混函数：将整数编码映射为近似均匀的 64 位哈希（溢出按 2^64 回绕）"""
+    z = x.astype(_U64) + _U64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> _U64(30))) * _U64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> _U64(27))) * _U64(0x94D049BB133111EB)
+    return z ^ (z >> _U64(31))
+
+
+def _star_edges(keys: np.ndarray, members: np.ndarray, eligible: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    将键相同的成员两两连通：组内每个成员连到组内第一个成员（星形边）
+    - eligible：按组过滤的布尔数组（与 keys 等长），组内任一元素为 True 时该组才生效
+    """
+    if keys.size == 0:
+        return members[:0], members[:0]
+    order = np.argsort(keys, kind="stable")
+    k = keys[order]
+    m = members[order]
+    starts = np.concatenate([[True], k[1:] != k[:-1]])
+    group = np.cumsum(starts) - 1
+    head = m[np.flatnonzero(starts)][group]
+    keep = m != head
+    if eligible is not None:
+        ok = np.zeros(int(group[-1]) + 1, dtype=bool)
+        np.logical_or.at(ok, group, eligible[order])
+        keep &= ok[group]
+    return m[keep], head[keep]
+
+
+def _connected_components(n: int, u: np.ndarray, v: np.ndarray) -> np.ndarray:
+    """
+    向量化连通分量：每轮把较大根挂到较小根上，再做指针跳跃压缩，直到不再变化
+    返回每个节点的根编号
+    """
+    labels = np.arange(n, dtype=np.int64)
+    if u.size == 0:
+        return labels
+    while True:
+        lu = labels[u]
+        lv = labels[v]
+        diff = lu != lv
+        if not diff.any():
+            return labels
+        lo = np.minimum(lu[diff], lv[diff])
+        hi = np.maximum(lu[diff], lv[diff])
+        np.minimum.at(labels, hi, lo)
+        while True:
+            nxt = labels[labels]
+            if np.array_equal(nxt, labels):
+                break
+            labels = nxt
+
+
+def cluster_variants(mutants, sources: np.ndarray, radius: int = 1) -> np.ndarray:
+    """
+    按相对模板的突变位点 Hamming 距离对变体做单连接聚类，返回每行的簇编号（0..k-1）
+    - radius=0：仅合并完全相同的变体
+    - radius=1：合并相差一个位点（新增/删除/替换一个突变）的变体；野生型行只与同模板的野生型行合并
+    """
+    if radius not in (0, 1):
+        raise RuntimeError(f"division:cluster_radius_unsupported {radius}")
+    n = int(len(sources))
+    rows, pos, _, mt = parse_mutations(mutants)
+    # 同一行同一位点重复出现时只保留一次，保证集合语义
+    code = (pos << 8) | mt.astype(np.int64)
+    packed = np.unique((rows << 32) | code)
+    rows, code = packed >> 32, packed & 0xFFFFFFFF
+    pos = code >> 8
+    _, src_codes = np.unique(sources, return_inverse=True)
+    elem_hash = _mix64(code)
+    full = _mix64(src_codes.reshape(-1).astype(np.int64) + (1 << 40))
+    if rows.size:
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(rows)) + 1])
+        with np.errstate(over="ignore"):
+            full[rows[starts]] += np.add.reduceat(elem_hash, starts)
+    members = np.arange(n, dtype=np.int64)
+    if radius == 0 or rows.size == 0:
+        u, v = _star_edges(full, members)
+        return np.unique(_connected_components(n, u, v), return_inverse=True)[1].reshape(-1)
+    with np.errstate(over="ignore"):
+        removed = full[rows] - elem_hash
+        wildcard = removed + _mix64(pos + (1 << 48))
+    # 自身键 + 删除键：仅当组内存在自身键时才连通（A 与 A\e 同时存在）
+    keys = np.concatenate([full, removed])
+    owners = np.concatenate([members, rows])
+    is_self = np.concatenate([np.ones(n, dtype=bool), np.zeros(rows.size, dtype=bool)])
+    u1, v1 = _star_edges(keys, owners, is_self)
+    # 通配键：同一位点不同残基
+    u2, v2 = _star_edges(wildcard, rows)
+    u, v = np.concatenate([u1, u2]), np.concatenate([v1, v2])
+    # 野生型与非野生型之间的边（WT 与单点突变经删除键相连）不参与聚类
+    wild = np.bincount(rows, minlength=n) == 0
+    keep = wild[u] == wild[v]
+    labels = _connected_components(n, u[keep], v[keep])
+    return np.unique(labels, return_inverse=True)[1].reshape(-1)
+
+
+@registry.register_division("cluster", capabilities={"process_safe": True}, builtin=True)
+class ClusterDivision(BaseDivision):
+    """按序列相似度聚类后整簇划分，可选按 DMS_score_bin 分层"""
+    def split(self, df, exp_plan: Dict[str, Any]) -> Dict[str, Any]:
+        logger = logging.getLogger(__name__)
+        cfg = exp_plan.get("division") or {}
+        ratios = _ratios(cfg)
+        rng = _division_rng(cfg, exp_plan)
+        sources = _column_1d(df, "source") if "source" in df.columns else np.zeros(len(df), dtype=np.int64)
+        radius = int(cfg.get("radius", 1))
+        mutants = df["mutant"].tolist()
+        clusters = cluster_variants(mutants, sources, radius)
+        n_clusters = int(clusters.max()) + 1 if clusters.size else 0
+        sizes = np.bincount(clusters, minlength=n_clusters)
+        limit = float(ratios.min()) * len(df)
+        if radius > 0 and sizes.size and sizes.max() > limit:
+            # 最大簇放不进最小的划分，整簇分配会导致某个划分为空或严重偏离比例
+            logger.warning(f"division:cluster_too_large largest={int(sizes.max())} limit={limit:.0f} radius={radius} fallback_radius=0")
+            clusters = cluster_variants(mutants, sources, 0)
+            n_clusters = int(clusters.max()) + 1 if clusters.size else 0
+            sizes = np.bincount(clusters, minlength=n_clusters)
+        logger.info(f"division:cluster_count clusters={n_clusters} largest={int(sizes.max()) if sizes.size else 0} rows={len(df)}")
+        stratify = cfg.get("stratify")
+        if not stratify:
+            assign = ratio_assign(len(df), ratios, rng, clusters)
+        else:
+            if stratify not in df.columns:
+                raise RuntimeError(f"division:stratify_column_not_found {stratify}")
+            _, strata = np.unique(df[stratify].astype(str).to_numpy(), return_inverse=True)
+            strata = strata.reshape(-1)
+            n_strata = int(strata.max()) + 1 if strata.size else 0
+            # 簇的层 = 簇内出现次数最多的层
+            pair, counts = np.unique(clusters * n_strata + strata, return_counts=True)
+            pc, ps = pair // n_strata, pair % n_strata
+            order = np.lexsort((-counts, pc))
+            first = np.concatenate([[True], pc[order][1:] != pc[order][:-1]])
+            cluster_stratum = np.empty(n_clusters, dtype=np.int64)
+            cluster_stratum[pc[order][first]] = ps[order][first]
+            row_stratum = cluster_stratum[clusters]
+            assign = np.empty(len(df), dtype=np.int64)
+            for s in range(n_strata):
+                idx = np.flatnonzero(row_stratum == s)
+                if idx.size == 0:
+                    continue
+                _, sub = np.unique(clusters[idx], return_inverse=True)
+                assign[idx] = ratio_assign(idx.size, ratios, rng, sub.reshape(-1))
+        return {name: _take(df, assign == i) for i, name in enumerate(("train", "valid", "test"))}
+
+
 def apply_division(df, exp_plan: Dict[str, Any]):
     logger = logging.getLogger(__name__)
     cfg = exp_plan.get("division") or {}
@@ -0,0 +1,351 @@
+"""
+训练引擎（TrainEngine）
+目标：
+- CPU 优先的训练循环，运行任意已注册的 ProteinModel
+- 数据由连续矩阵 + 批采样器提供（见 dataset.py），支持多进程预取
+- 支持梯度累积、bf16 autocast（CPU）、线程数调优，并按 epoch 统计吞吐
+
+配置（exp_plan["train"]，均可省略）：
+    "train": {
+        "epochs": 10,
+        "batch_size": 256,
+        "lr": 1e-3,
+        "weight_decay": 0.0,
+        "grad_accum": 1,            # 梯度累积步数
+        "clip_grad_norm": null,     # 梯度裁剪阈值
+        "num_workers": 0,           # DataLoader 子进程数
+        "prefetch_factor": 2,
+        "num_threads": null,        # torch 计算线程数，默认 = CPU 核数 - num_workers
+        "precision": "fp32",        # fp32 | bf16
+        "device": "cpu",
+        "seed": 0,
+        "bucketing": {              # 长度分桶动态组批（可选）
+            "enabled": false,
+            "max_tokens": 65536,    # 每批 token 预算（行数 × 批内填充宽度）
+            "max_batch_size": null, # 每批行数上限
+            "window": 65536,        # 排序窗口行数，越大填充越少、随机性越弱
+            "pad_to_multiple": 8    # 批内宽度按此倍数向上取整
+        }
+    }
+
+提前停止：request_stop()（或 install_stop_signal() 注册的信号，worker 收到早停决策时向训练进程组发送 SIGUSR1）
+置位进程内停止标志，训练在下一个优化步后结束本 epoch 并照常保存模型、评估
+
+产物：
+- <experiment>/training/history.json：每个 epoch 的 loss、耗时、samples/s、tokens/s、填充效率、数据等待时间
+"""
+import os
+import json
+import time
+import signal
+import threading
+import contextlib
+import logging
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Callable, Iterator, Tuple
+import numpy as np
+import torch
+from .registry import registry
+from .dataset import TensorData, EpochBatchSampler, LengthBucketSampler, build_loader
+
+logger = logging.getLogger(__name__)
+
+TRAIN_DEFAULTS: Dict[str, Any] = {
+    "epochs": 10,
+    "batch_size": 256,
+    "lr": 1e-3,
+    "weight_decay": 0.0,
+    "grad_accum": 1,
+    "clip_grad_norm": None,
+    "num_workers": 0,
+    "prefetch_factor": 2,
+    "num_threads": None,
+    "precision": "fp32",
+    "device": "cpu",
+    "seed": 0,
+    "bucketing": None,
+}
+
+BUCKETING_DEFAULTS: Dict[str, Any] = {
+    "enabled": False,
+    "max_tokens": 65536,
+    "max_batch_size": None,
+    "window": 65536,
+    "pad_to_multiple": 8,
+}
+
+
+STOP_EVENT = threading.Event()
+
+
+def request_stop(*_) -> None:
+    """
+    请求当前进程内的训练提前停止（可直接作为信号处理函数）
+    """
+    STOP_EVENT.set()
+
+
+def install_stop_signal(signum: int = signal.SIGUSR1) -> None:
+    signal.signal(signum, request_stop)
+
+
+def ignore_stop_signal(signum: int = signal.SIGUSR1) -> None:
+    """
+    训练结束后忽略该信号：解释器退出时会把 Python 处理函数恢复为默认动作（终止进程），此时收到重发的信号会使正常结束的进程异常退出
+    """
+    signal.signal(signum, signal.SIG_IGN)
+
+
+def train_config(exp_plan: Dict[str, Any]) -> Dict[str, Any]:
+    cfg = dict(TRAIN_DEFAULTS)
+    cfg.update(exp_plan.get("train") or {})
+    bucketing = dict(BUCKETING_DEFAULTS)
+    bucketing.update(cfg.get("bucketing") or {})
+    cfg["bucketing"] = bucketing
+    return cfg
+
+
+def configure_threads(cfg: Dict[str, Any]) -> int:
+    """
+    设置 torch 计算线程数：默认为 CPU 核数减去取数子进程数，避免计算线程与取数进程争抢核心
+    CPU 核数按进程亲和性统计（worker 为任务绑定核心时只计入分到的核心）
+    """
+    n = cfg.get("num_threads")
+    if not n:
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+        n = max(1, cores - int(cfg.get("num_workers") or 0))
+    torch.set_num_threads(int(n))
+    return int(n)
+
+
+def build_model(exp_plan: Dict[str, Any]) -> torch.nn.Module:
+    """
+    按 exp_plan["model"] 实例化已注册模型：
+    - "model": "mlp" 或 {"name": "mlp", "params": {...}}
+    """
+    model_cfg = exp_plan.get("model")
+    if isinstance(model_cfg, str):
+        model_cfg = {"name": model_cfg}
+    name = (model_cfg or {}).get("name")
+    if not name:
+        raise RuntimeError("train:model_name_required")
+    cls = registry.get_model(name)
+    # 参数初始化在 TrainEngine 之前发生：先按 train.seed 设定随机数，保证同一计划初始化一致（检查点续训依赖于此）
+    torch.manual_seed(int(train_config(exp_plan)["seed"]))
+    return cls(**(model_cfg.get("params") or {}))
+
+
+def move_batch(batch: Dict[str, torch.Tensor], device: torch.device) -> Dict[str, torch.Tensor]:
+    non_blocking = device.type != "cpu"
+    return {k: v.to(device, non_blocking=non_blocking) for k, v in batch.items()}
+
+
+class TrainEngine:
+    """
+    训练循环：
+    - fit(train_data, valid_data)：逐 epoch 训练并验证，返回 history
+    - evaluate_loss(data)：计算平均损失
+    - callbacks：每个优化步后调用 cb(engine, step_info)，每个 epoch 结束调用 cb(engine, epoch_info)
+      （epoch 回调触发时 engine.epoch 已指向下一个 epoch，此时保存的进度可直接用于续训）
+    - training_state() / load_training_state()：训练进度的导出与恢复（供 checkpoint.py 使用）
+    """
+    def __init__(self, model: torch.nn.Module, exp_plan: Dict[str, Any], history_path: Optional[Path] = None,
+                 callbacks: Optional[List[Callable[["TrainEngine", Dict[str, Any]], None]]] = None):
+        self.exp_plan = exp_plan
+        self.cfg = train_config(exp_plan)
+        self.device = torch.device(self.cfg["device"])
+        self.model = model.to(self.device)
+        self.optimizer = torch.optim.AdamW(self.model.parameters(), lr=float(self.cfg["lr"]),
+                                           weight_decay=float(self.cfg["weight_decay"]))
+        self.history_path = Path(history_path) if history_path else None
+        self.callbacks = callbacks or []
+        self.history: List[Dict[str, Any]] = []
+        self.epoch = 0
+        # 当前 epoch 内已完成的批次数（断点续训时由检查点恢复）
+        self.skip_batches = 0
+        self.global_step = 0
+        self.should_stop = False
+        self.threads = configure_threads(self.cfg)
+        torch.manual_seed(int(self.cfg["seed"]))
+
+    def _autocast(self):
+        enabled = str(self.cfg.get("precision")).lower() == "bf16"
+        return torch.autocast(device_type=self.device.type, dtype=torch.bfloat16, enabled=enabled)
+
+    def _forward(self, batch: Dict[str, torch.Tensor]) -> torch.Tensor:
+        """
+        训练前向；数据并行时由子类改为经 DistributedDataParallel 包装的模型
+        """
+        return self.model(batch)
+
+    def _grad_sync(self, sync: bool):
+        """
+        本微批次反向传播是否同步梯度的上下文；单进程训练无需同步
+        """
+        return contextlib.nullcontext()
+
+    def _sampler(self, data: TensorData, shuffle: bool):
+        bucketing = self.cfg["bucketing"]
+        if bucketing.get("enabled"):
+            return LengthBucketSampler(data.lengths, int(bucketing["max_tokens"]), bucketing.get("max_batch_size"),
+                                       window=int(bucketing["window"]), pad_to_multiple=int(bucketing["pad_to_multiple"]),
+                                       shuffle=shuffle, seed=int(self.cfg["seed"]))
+        return EpochBatchSampler(len(data), int(self.cfg["batch_size"]), shuffle=shuffle, seed=int(self.cfg["seed"]))
+
+    def _loader(self, data: TensorData, sampler, cfg: Dict[str, Any]):
+        bucketing = self.cfg["bucketing"]
+        enabled = bool(bucketing.get("enabled"))
+        return build_loader(data, sampler, cfg, trim=enabled, pad_to_multiple=int(bucketing["pad_to_multiple"]) if enabled else 1)
+
+    def _emit(self, event: str, info: Dict[str, Any]) -> None:
+        info = dict(info, event=event)
+        for cb in self.callbacks:
+            cb(self, info)
+        if STOP_EVENT.is_set() and not self.should_stop:
+            self.should_stop = True
+            logger.info(f"train:stop_requested epoch={self.epoch} step={self.global_step}")
+
+    def _optimizer_step(self) -> None:
+        clip = self.cfg.get("clip_grad_norm")
+        if clip:
+            torch.nn.utils.clip_grad_norm_(self.model.parameters(), float(clip))
+        self.optimizer.step()
+        self.optimizer.zero_grad(set_to_none=True)
+        self.global_step += 1
+
+    def train_epoch(self, loader, sampler) -> Dict[str, Any]:
+        self.model.train()
+        accum = max(1, int(self.cfg["grad_accum"]))
+        total_loss = 0.0
+        samples = 0
+        real_tokens = 0
+        padded_tokens = 0
+        micro = 0
+        wait = 0.0
+        t0 = time.perf_counter()
+        t_fetch = t0
+        t_step = t0
+        total = len(loader)
+        self.optimizer.zero_grad(set_to_none=True)
+        for batch in loader:
+            wait += time.perf_counter() - t_fetch
+            batch = move_batch(batch, self.device)
+            # 梯度累积的中间微批次不做梯度同步（数据并行时由子类跳过 all-reduce），优化步前的最后一个微批次同步
+            with self._grad_sync((micro + 1) % accum == 0 or micro + 1 == total):
+                with self._autocast():
+                    pred = self._forward(batch)
+                loss = self.model.compute_loss(pred.float(), batch)
+                (loss / accum).backward()
+            micro += 1
+            bs = int(batch["label"].shape[0])
+            samples += bs
+            padded_tokens += int(batch["tokens"].numel())
+            real_tokens += int(batch["lengths"].sum()) + 2 * bs
+            total_loss += float(loss.detach()) * bs
+            if micro % accum == 0:
+                self._optimizer_step()
+                now = time.perf_counter()
+                self._emit("step", {"epoch": self.epoch, "step": self.global_step, "batch": self.skip_batches + micro,
+                                    "loss": float(loss.detach()), "samples": bs,
+                                    "lr": float(self.optimizer.param_groups[0]["lr"]), "step_time": now - t_step})
+                t_step = now
+                if self.should_stop:
+                    break
+            t_fetch = time.perf_counter()
+        if micro % accum != 0:
+            self._optimizer_step()
+        elapsed = time.perf_counter() - t0
+        return {
+            "train_loss": total_loss / max(samples, 1),
+            "samples": samples,
+            "seconds": elapsed,
+            "samples_per_sec": samples / elapsed if elapsed > 0 else 0.0,
+            "tokens_per_sec": real_tokens / elapsed if elapsed > 0 else 0.0,
+            "padding_efficiency": real_tokens / padded_tokens if padded_tokens else 1.0,
+            "data_wait_seconds": wait,
+        }
+
+    @torch.inference_mode()
+    def evaluate_loss(self, data: TensorData) -> float:
+        self.model.eval()
+        loader = self._loader(data, self._sampler(data, shuffle=False), dict(self.cfg, num_workers=0))
+        total = 0.0
+        n = 0
+        for batch in loader:
+            batch = move_batch(batch, self.device)
+            with self._autocast():
+                pred = self.model(batch)
+            loss = self.model.compute_loss(pred.float(), batch)
+            bs = int(batch["label"].shape[0])
+            total += float(loss) * bs
+            n += bs
+        return total / max(n, 1)
+
+    def iter_predictions(self, data: TensorData) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        逐批推理，产出 (行号数组, 预测值数组)；批次顺序由采样器决定，调用方按行号回填
+        """
+        self.model.eval()
+        loader = self._loader(data, self._sampler(data, shuffle=False), dict(self.cfg, num_workers=0))
+        with torch.inference_mode():
+            for batch in loader:
+                index = batch["index"].numpy()
+                batch = move_batch(batch, self.device)
+                with self._autocast():
+                    pred = self.model(batch)
+                yield index, pred.float().reshape(-1).cpu().numpy()
+
+    def predict(self, data: TensorData) -> np.ndarray:
+        """
+        按原始行序返回预测值（小数据量便捷接口；大测试集请使用 evaluator.Evaluator）
+        """
+        out = np.full(len(data), np.nan, dtype=np.float32)
+        for index, pred in self.iter_predictions(data):
+            out[index] = pred
+        return out
+
+    def fit(self, train_data: TensorData, valid_data: Optional[TensorData] = None) -> List[Dict[str, Any]]:
+        sampler = self._sampler(train_data, shuffle=True)
+        loader = self._loader(train_data, sampler, self.cfg)
+        epochs = int(self.cfg["epochs"])
+        logger.info(f"train:start rows={len(train_data)} epochs={epochs} batch_size={self.cfg['batch_size']} "
+                    f"grad_accum={self.cfg['grad_accum']} threads={self.threads} workers={self.cfg['num_workers']} "
+                    f"precision={self.cfg['precision']} bucketing={bool(self.cfg['bucketing'].get('enabled'))}")
+        while self.epoch < epochs and not self.should_stop:
+            sampler.set_epoch(self.epoch, self.skip_batches)
+            record = {"epoch": self.epoch}
+            record.update(self.train_epoch(loader, sampler))
+            if valid_data is not None and len(valid_data) > 0:
+                record["valid_loss"] = self.evaluate_loss(valid_data)
+            self.history.append(record)
+            logger.info(f"train:epoch={self.epoch} loss={record['train_loss']:.6f} valid_loss={record.get('valid_loss', float('nan')):.6f} "
+                        f"samples_per_sec={record['samples_per_sec']:.1f} padding_eff={record['padding_efficiency']:.3f} data_wait={record['data_wait_seconds']:.2f}s")
+            self._write_history()
+            self.epoch += 1
+            self.skip_batches = 0
+            self._emit("epoch", record)
+        return self.history
+
+    def training_state(self) -> Dict[str, Any]:
+        """
+        训练进度（不含模型/优化器张量）：下一个要训练的 epoch、该 epoch 内已完成批次数、全局步数、历史记录
+        """
+        return {
+            "epoch": self.epoch,
+            "skip_batches": self.skip_batches,
+            "global_step": self.global_step,
+            "history": list(self.history),
+        }
+
+    def load_training_state(self, state: Dict[str, Any]) -> None:
+        self.epoch = int(state.get("epoch", 0))
+        self.skip_batches = int(state.get("skip_batches", 0))
+        self.global_step = int(state.get("global_step", 0))
+        self.history = list(state.get("history") or [])
+
+    def _write_history(self) -> None:
+        if self.history_path is None:
+            return
+        tmp = self.history_path.with_suffix(self.history_path.suffix + ".tmp")
+        tmp.write_text(json.dumps(self.history, ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp.replace(self.history_path)
@@ -0,0 +1,296 @@
+"""
+流式评估（Evaluator）
+目标：
+- 在 torch.inference_mode() 下逐批推理，预测值直接写入预分配的内存映射数组（.npy），不在 Python 列表中累积
+- 推理过程中同步喂给流式指标累加器，评估数千万条变体时内存占用与数据量无关
+- 结束后将内存映射数组分块打包为实验目录下的 labels.npz（ZIP_STORED，不整体读入内存）
+
+指标计算策略：
+- 行数不超过 exact_max_rows：从内存映射数组读取，交给 MetricsEngine 精确计算（支持 bootstrap、自定义指标）
+- 超过阈值：使用 StreamingMetrics
+  - mse / mae / pearson：按组合并的一阶/二阶（协）矩，精确
+  - spearman：以每组 t-digest 估计的 CDF 作为近似秩，再对近似秩求 Pearson（第二遍分块读取内存映射数组）
+  - topk_recall：由 t-digest 分位数确定预测/标签的 top-k 阈值后计数，近似
+  - ndcg 及自定义指标需要全量排序，流式模式下不计算，记录在 unsupported 中
+
+配置（exp_plan["evaluation"]，均可省略）：
+    "evaluation": {
+        "exact_max_rows": 2000000,  # 精确计算的行数上限
+        "chunk_size": 1048576,      # 第二遍读取与打包时的分块行数
+        "compression": 200          # t-digest 压缩参数
+    }
+
+labels.npz 内容：
+- pred：float32 预测值（与训练目标同一尺度）
+- label：float32 标签
+- row_id：int64 原始记录 id
+- mut_num：int32 突变数
+"""
+import os
+import math
+import shutil
+import zipfile
+import logging
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Union
+import numpy as np
+from .dataset import TensorData
+from .metrics import MetricsEngine, DEFAULT_METRICS, metrics_config, metrics_group_by
+from .normalize import _TDigest
+
+logger = logging.getLogger(__name__)
+
+EVALUATION_DEFAULTS: Dict[str, Any] = {
+    "exact_max_rows": 2_000_000,
+    "chunk_size": 1 << 20,
+    "compression": 200,
+}
+STREAMING_METRICS = ("spearman", "pearson", "mse", "mae", "topk_recall")
+
+
+def evaluation_config(exp_plan: Dict[str, Any]) -> Dict[str, Any]:
+    cfg = dict(EVALUATION_DEFAULTS)
+    cfg.update(exp_plan.get("evaluation") or {})
+    return cfg
+
+
+class _GroupMoments:
+    """
+    按组合并的二元矩累加器（Chan 合并公式）：
+    - 每组维护 n、均值、二阶中心矩、协矩以及绝对误差/平方误差之和
+    - 每批先用 bincount 得到批内各组统计量，再与历史状态向量化合并
+    """
+    def __init__(self):
+        self.slots: Dict[Any, int] = {}
+        self.n = np.zeros(0, dtype=np.float64)
+        self.mx = np.zeros(0, dtype=np.float64)
+        self.my = np.zeros(0, dtype=np.float64)
+        self.m2x = np.zeros(0, dtype=np.float64)
+        self.m2y = np.zeros(0, dtype=np.float64)
+        self.cxy = np.zeros(0, dtype=np.float64)
+        self.sae = np.zeros(0, dtype=np.float64)
+        self.sse = np.zeros(0, dtype=np.float64)
+
+    def _slots_for(self, keys: np.ndarray) -> np.ndarray:
+        out = np.empty(keys.shape[0], dtype=np.int64)
+        for i, key in enumerate(keys.tolist()):
+            slot = self.slots.get(key)
+            if slot is None:
+                slot = self.slots[key] = len(self.slots)
+            out[i] = slot
+        grow = len(self.slots) - self.n.shape[0]
+        if grow > 0:
+            for name in ("n", "mx", "my", "m2x", "m2y", "cxy", "sae", "sse"):
+                setattr(self, name, np.concatenate([getattr(self, name), np.zeros(grow, dtype=np.float64)]))
+        return out
+
+    def update(self, x: np.ndarray, y: np.ndarray, groups: np.ndarray) -> None:
+        if x.size == 0:
+            return
+        keys, codes = np.unique(groups, return_inverse=True)
+        slots = self._slots_for(keys)
+        k = keys.shape[0]
+        nb = np.bincount(codes, minlength=k).astype(np.float64)
+        mxb = np.bincount(codes, x, minlength=k) / nb
+        myb = np.bincount(codes, y, minlength=k) / nb
+        dx = x - mxb[codes]
+        dy = y - myb[codes]
+        m2xb = np.bincount(codes, dx * dx, minlength=k)
+        m2yb = np.bincount(codes, dy * dy, minlength=k)
+        cxyb = np.bincount(codes, dx * dy, minlength=k)
+        err = x - y
+        na = self.n[slots]
+        n = na + nb
+        ddx = mxb - self.mx[slots]
+        ddy = myb - self.my[slots]
+        f = na * nb / n
+        self.m2x[slots] += m2xb + ddx * ddx * f
+        self.m2y[slots] += m2yb + ddy * ddy * f
+        self.cxy[slots] += cxyb + ddx * ddy * f
+        self.mx[slots] += ddx * nb / n
+        self.my[slots] += ddy * nb / n
+        self.n[slots] = n
+        self.sae[slots] += np.bincount(codes, np.abs(err), minlength=k)
+        self.sse[slots] += np.bincount(codes, err * err, minlength=k)
+
+    def pearson(self, slot: int) -> float:
+        den = math.sqrt(self.m2x[slot] * self.m2y[slot])
+        return float(self.cxy[slot] / den) if den > 0 and self.n[slot] >= 2 else math.nan
+
+    def mse(self, slot: int) -> float:
+        return float(self.sse[slot] / self.n[slot]) if self.n[slot] else math.nan
+
+    def mae(self, slot: int) -> float:
+        return float(self.sae[slot] / self.n[slot]) if self.n[slot] else math.nan
+
+
+class StreamingMetrics:
+    """
+    流式指标累加器：
+    - update(pred, label, groups)：第一遍，累加矩并更新 t-digest
+    - update_ranks(pred, label, groups)：第二遍，以 CDF 近似秩累加 spearman、按阈值累加 top-k 命中
+    - result()：返回与 MetricsEngine.compute 相同结构的结果字典（附 approximate / unsupported 标记）
+    分组键 "__all__" 对应整体指标
+    """
+    ALL = "__all__"
+
+    def __init__(self, names: Optional[List[Union[str, Dict[str, Any]]]] = None, top: float = 0.1,
+                 compression: float = 200.0, group_by: Optional[str] = "mut_num"):
+        self.names: List[str] = []
+        self.unsupported: List[str] = []
+        self.top = float(top)
+        for item in names or DEFAULT_METRICS:
+            name = (item if isinstance(item, str) else item.get("name") or "").strip().lower()
+            if not isinstance(item, str) and "top" in item:
+                self.top = float(item["top"])
+            (self.names if name in STREAMING_METRICS else self.unsupported).append(name)
+        self.compression = float(compression)
+        self.group_by = group_by
+        self.moments = _GroupMoments()
+        self.rank_moments = _GroupMoments()
+        self.pred_digest: Dict[Any, _TDigest] = {}
+        self.label_digest: Dict[Any, _TDigest] = {}
+        self.topk_hits: Dict[Any, float] = {}
+        self.topk_true: Dict[Any, float] = {}
+        self.dropped = 0
+
+    def _groups(self, groups: Optional[np.ndarray], n: int) -> np.ndarray:
+        if groups is None or not self.group_by:
+            return np.zeros(n, dtype=np.int64)
+        return np.asarray(groups).reshape(-1)
+
+    def _split(self, groups: np.ndarray):
+        # 整体 + 每组的行号；组数很少（分组列取值有限），逐组循环开销可忽略
+        yield self.ALL, slice(None)
+        if self.group_by:
+            for key in np.unique(groups).tolist():
+                yield key, groups == key
+
+    def _finite(self, pred, label, groups):
+        pred = np.asarray(pred, dtype=np.float64).reshape(-1)
+        label = np.asarray(label, dtype=np.float64).reshape(-1)
+        keep = np.isfinite(pred) & np.isfinite(label)
+        return pred[keep], label[keep], groups[keep], int(keep.size - keep.sum())
+
+    def update(self, pred: np.ndarray, label: np.ndarray, groups: Optional[np.ndarray] = None) -> None:
+        pred, label, groups, dropped = self._finite(pred, label, self._groups(groups, np.size(pred)))
+        self.dropped += dropped
+        self.moments.update(pred, label, np.full(pred.shape[0], -1, dtype=np.int64))
+        if self.group_by:
+            self.moments.update(pred, label, groups)
+        for key, mask in self._split(groups):
+            self.pred_digest.setdefault(key, _TDigest(self.compression)).update(pred[mask])
+            self.label_digest.setdefault(key, _TDigest(self.compression)).update(label[mask])
+
+    def update_ranks(self, pred: np.ndarray, label: np.ndarray, groups: Optional[np.ndarray] = None) -> None:
+        pred, label, groups, _ = self._finite(pred, label, self._groups(groups, np.size(pred)))
+        for key, mask in self._split(groups):
+            p, y = pred[mask], label[mask]
+            if p.size == 0:
+                continue
+            pd_, ld = self.pred_digest[key], self.label_digest[key]
+            slot_key = np.full(p.shape[0], -1 if key == self.ALL else key)
+            self.rank_moments.update(pd_.cdf(p), ld.cdf(y), slot_key)
+            tp = float(pd_.quantile(1.0 - self.top))
+            ty = float(ld.quantile(1.0 - self.top))
+            true_top = y >= ty
+            self.topk_hits[key] = self.topk_hits.get(key, 0.0) + float(np.count_nonzero(true_top & (p >= tp)))
+            self.topk_true[key] = self.topk_true.get(key, 0.0) + float(np.count_nonzero(true_top))
+
+    def _values(self, key, slot_key) -> Dict[str, Optional[float]]:
+        m, r = self.moments, self.rank_moments
+        slot = m.slots.get(slot_key)
+        rslot = r.slots.get(slot_key)
+        values = {
+            "spearman": r.pearson(rslot) if rslot is not None else math.nan,
+            "pearson": m.pearson(slot),
+            "mse": m.mse(slot),
+            "mae": m.mae(slot),
+            "topk_recall": self.topk_hits.get(key, 0.0) / self.topk_true[key] if self.topk_true.get(key) else math.nan,
+        }
+        return {name: (float(values[name]) if math.isfinite(values[name]) else None) for name in self.names}
+
+    def result(self) -> Dict[str, Any]:
+        total_slot = self.moments.slots.get(-1)
+        n = int(self.moments.n[total_slot]) if total_slot is not None else 0
+        result: Dict[str, Any] = {"n": n, "dropped": self.dropped, "approximate": True}
+        result["overall"] = self._values(self.ALL, -1) if n else {name: None for name in self.names}
+        if self.unsupported:
+            result["unsupported"] = self.unsupported
+        if self.group_by:
+            values = {}
+            for key in sorted(k for k in self.pred_digest if k != self.ALL):
+                row = {"n": int(self.moments.n[self.moments.slots[key]])}
+                row.update(self._values(key, key))
+                values[str(key)] = row
+            result["groups"] = {"key": self.group_by, "values": values}
+        return result
+
+
+def _write_stored_npz(path: Path, members: Dict[str, Union[Path, np.ndarray]], chunk_size: int) -> None:
+    """
+    分块写出未压缩的 .npz：.npy 文件逐块拷贝进 zip 成员，内存数组直接写入成员，峰值内存为单个块
+    """
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for name, src in members.items():
+            with zf.open(f"{name}.npy", "w", force_zip64=True) as dst:
+                if isinstance(src, np.ndarray):
+                    np.lib.format.write_array(dst, np.ascontiguousarray(src), allow_pickle=False)
+                else:
+                    with open(src, "rb") as f:
+                        shutil.copyfileobj(f, dst, chunk_size)
+    os.replace(tmp, path)
+
+
+class Evaluator:
+    """
+    - evaluate(data, labels_path)：推理 -> 内存映射 -> 指标 -> labels.npz，返回指标结果字典
+    - engine 需提供 iter_predictions(data)（见 engine.TrainEngine）
+    """
+    def __init__(self, engine, exp_plan: Dict[str, Any]):
+        self.engine = engine
+        self.exp_plan = exp_plan
+        self.cfg = evaluation_config(exp_plan)
+
+    def _streaming(self) -> StreamingMetrics:
+        return StreamingMetrics(metrics_config(self.exp_plan).get("names"), compression=float(self.cfg["compression"]),
+                                group_by=metrics_group_by(self.exp_plan))
+
+    def evaluate(self, data: TensorData, labels_path: Path) -> Dict[str, Any]:
+        labels_path = Path(labels_path)
+        n = len(data)
+        chunk = max(1, int(self.cfg["chunk_size"]))
+        exact = n <= int(self.cfg["exact_max_rows"])
+        staging = labels_path.parent / f".{labels_path.stem}.pred.npy"
+        pred_mm = np.lib.format.open_memmap(staging, mode="w+", dtype=np.float32, shape=(n,))
+        pred_mm[:] = np.nan
+        streaming = None if exact else self._streaming()
+        group_by = metrics_group_by(self.exp_plan)
+        groups = data.column(group_by) if group_by else None
+        try:
+            for index, pred in self.engine.iter_predictions(data):
+                pred_mm[index] = pred
+                if streaming is not None:
+                    streaming.update(pred, data.label[index], groups[index] if groups is not None else None)
+            pred_mm.flush()
+            if exact:
+                result = MetricsEngine.from_exp_plan(self.exp_plan).compute(pred_mm, data.label, groups=groups)
+            else:
+                for start in range(0, n, chunk):
+                    stop = min(start + chunk, n)
+                    streaming.update_ranks(pred_mm[start:stop], data.label[start:stop],
+                                           groups[start:stop] if groups is not None else None)
+                result = streaming.result()
+            del pred_mm
+            _write_stored_npz(labels_path, {
+                "pred": staging,
+                "label": data.label,
+                "row_id": data.row_id,
+                "mut_num": data.mut_num,
+            }, chunk * 4)
+        finally:
+            if staging.exists():
+                staging.unlink()
+        logger.info(f"evaluate:done rows={n} mode={'exact' if exact else 'streaming'} labels={labels_path}")
+        return result
@@ -1,10 +1,11 @@
 import typing
 import os
 import logging
-from .parser import TrainParser, WorkdirParser
+from .parser import TrainParser, WorkdirParser, SweepParser, PredictParser
 import argparse
 import inspect
 from .training import run_train
+from .distributed import is_distributed, launch
 from . import set_workdir, get_workdir, require_workdir
 logger = logging.getLogger(__name__)
 
@@ -39,9 +40,58 @@ def train(args: typing.Optional[argparse.Namespace] = None)->None:
     if missing:
         raise RuntimeError(f"Missing arguments: {missing}")
     train_args = {name: arg_dict[name] for name in arg_names}
+    if is_distributed(train_args["exp_plan"]):
+        # 数据并行：在本机按 distributed.nprocs 拉起各 rank
+        code = launch(train_args["exp_plan"])
+        if code != 0:
+            raise RuntimeError(f"distributed:launch_failed code={code}")
+        return
     run_train(**train_args)
     
 
+def sweep(args: typing.Optional[argparse.Namespace] = None) -> None:
+    if args is None:
+        parser = SweepParser()
+        args = parser.args
+        arg_dict = parser.arg_dict
+
+    if arg_dict.get('debug', False):
+        logging.getLogger().setLevel(logging.DEBUG)
+    else:
+        logging.getLogger().setLevel(logging.INFO)
+
+    require_workdir()
+    from .sweep import run_sweep
+    result = run_sweep(arg_dict['sweep'], get_workdir())
+    logger.info(f"搜索完成: {result['sweep_id']}，最优试验: {result['best']}")
+    
+
+def predict(args: typing.Optional[argparse.Namespace] = None) -> None:
+    if args is None:
+        parser = PredictParser()
+        args = parser.args
+        arg_dict = parser.arg_dict
+
+    if arg_dict.get('debug', False):
+        logging.getLogger().setLevel(logging.DEBUG)
+    else:
+        logging.getLogger().setLevel(logging.INFO)
+
+    from .predict import run_predict
+    # 实验既可以是目录也可以是实验 id：工作目录已设置时按 id 在 experiments/ 下查找
+    try:
+        wd = get_workdir()
+    except (TypeError, OSError, ValueError):
+        wd = None
+    overrides = {k: arg_dict.get(k) for k in ('batch_size', 'max_latency_ms', 'workers', 'num_threads', 'chunk_size')}
+    out = run_predict(arg_dict['experiment'], arg_dict.get('input'), arg_dict.get('output'), arg_dict.get('template'),
+                      serve=arg_dict.get('serve', False), host=arg_dict['host'], port=arg_dict['port'],
+                      overrides=overrides, width=arg_dict.get('width'),
+                      workdir=wd, library=arg_dict.get('library'))
+    if out is not None:
+        logger.info(f"推理完成: {out}")
+
+
 def workdir(args: typing.Optional[argparse.Namespace] = None) -> None:
     if args is None:
         parser = WorkdirParser()
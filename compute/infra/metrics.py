@@ -0,0 +1,382 @@
+import math
+import logging
+from typing import Dict, Any, Optional, List, Union, Callable
+import numpy as np
+from .registry import registry
+
+logger = logging.getLogger(__name__)
+
+"""
+指标（Metrics）模块
+目标：
+- 对预测/标签数组一次性计算所有请求的指标，并按 group_by 列（默认 mut_num）分组输出
+- 采用统一注册中心 + 装饰器注册的方式加载指标实现；内置 spearman / pearson / mse / mae / ndcg / topk_recall
+
+计算模型（分段归约）：
+- 所有数据按分组键稳定排序后视为若干连续“段”（segment），每个内置指标一次返回所有段的取值
+- 段内求和/最值统一使用 np.add.reduceat / np.minimum.reduceat，不在 Python 中逐组循环
+- 每个数组只做一次段内排序，段内秩（平均秩处理并列）与降序名次均由其导出，缓存在 MetricContext 中供各指标共享
+- 整体指标 = 只有一个段的情形；按分组列分组 = 每个取值一段
+- bootstrap：把 B 次重采样拼接为 B 个段，复用同一套分段实现一次算完（按 max_elements 分块控制内存）
+
+配置示例（加入到 exp_plan 中，均可省略）：
+    "metrics": {
+        "names": ["spearman", "pearson", "mse", "mae", {"name": "ndcg", "top": 0.1}, {"name": "topk_recall", "top": 0.1}],
+        "group_by": "mut_num",      # 分组列（数据表中的任一列，如 source）；null 表示不分组
+        "bootstrap": 1000,          # 重采样次数；0 表示不计算置信区间
+        "ci": 0.95,
+        "seed": 0
+    }
+说明：
+- names 也可直接写成列表：“metrics”: ["spearman", "mse"]
+- top：小于 1 时按段内行数的比例取 top-k（向上取整），否则为固定 k
+
+自定义指标：
+- 简单形式：@registry.register_metric("name") def fn(pred, label) -> float，按段逐个调用
+- 分段形式：声明 capabilities={"segmented": True}，签名 fn(ctx: MetricContext, **params) -> np.ndarray（每段一个值）
+
+产物：
+- 结果通过 ExperimentRecorder.write_metrics 写入实验目录下的 metrics.json
+"""
+
+DEFAULT_METRICS = ["spearman", "pearson", "mse", "mae", "ndcg", "topk_recall"]
+# bootstrap 时单块最多拼接的元素数（B_chunk × n），控制内存峰值
+BOOTSTRAP_MAX_ELEMENTS = 4_000_000
+_SEGMENTED_CAPS = {"batchable": True, "thread_safe": True, "process_safe": True, "stateless": True, "segmented": True}
+
+
+class MetricContext:
+    """
+    一次指标计算的共享上下文：
+    - pred / label：按段排序后的 float64 数组
+    - seg：每行所属段号（非降序），starts / counts：每段起点与行数
+    - 段内秩、段内降序排列按需计算并缓存
+    """
+    def __init__(self, pred: np.ndarray, label: np.ndarray, seg: Optional[np.ndarray] = None):
+        pred = np.asarray(pred, dtype=np.float64).reshape(-1)
+        label = np.asarray(label, dtype=np.float64).reshape(-1)
+        n = pred.shape[0]
+        if seg is None:
+            seg = np.zeros(n, dtype=np.int64)
+        seg = np.asarray(seg, dtype=np.int64).reshape(-1)
+        if n and np.any(seg[1:] < seg[:-1]):
+            order = np.argsort(seg, kind="stable")
+            pred, label, seg = pred[order], label[order], seg[order]
+        self.pred = pred
+        self.label = label
+        self.n = n
+        # 段号重新编码为 0..S-1，starts 为每段起点
+        if n:
+            boundary = np.empty(n, dtype=bool)
+            boundary[0] = True
+            boundary[1:] = seg[1:] != seg[:-1]
+            self.starts = np.flatnonzero(boundary)
+            self.seg = np.cumsum(boundary) - 1
+        else:
+            self.starts = np.zeros(0, dtype=np.int64)
+            self.seg = seg
+        self.counts = np.diff(np.append(self.starts, n))
+        self._cache: Dict[str, Any] = {}
+
+    @property
+    def num_segments(self) -> int:
+        return int(self.starts.shape[0])
+
+    def segment_sum(self, values: np.ndarray) -> np.ndarray:
+        if self.n == 0:
+            return np.zeros(0, dtype=np.float64)
+        return np.add.reduceat(values, self.starts)
+
+    def segment_mean(self, values: np.ndarray) -> np.ndarray:
+        return self.segment_sum(values) / np.maximum(self.counts, 1)
+
+    def _ascending(self, key: str, values: np.ndarray) -> np.ndarray:
+        """
+        段内升序排列（行号序列），每个数组只排序一次：
+        - 各段等长（整体指标、bootstrap）时按 [S, m] 矩阵逐行 argsort，比 lexsort 快一个数量级
+        - 否则按 (段号, 值) lexsort
+        """
+        if key not in self._cache:
+            if self.n == 0:
+                order = np.zeros(0, dtype=np.int64)
+            elif np.all(self.counts == self.counts[0]):
+                m = int(self.counts[0])
+                order = (np.argsort(values.reshape(-1, m), axis=1) + self.starts[:, None]).reshape(-1)
+            else:
+                order = np.lexsort((values, self.seg))
+            self._cache[key] = order
+        return self._cache[key]
+
+    def _ranks(self, order: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """
+        段内平均秩（1 起），并列值取平均秩
+        """
+        n = self.n
+        if n == 0:
+            return np.zeros(0, dtype=np.float64)
+        v = values[order]
+        new_run = np.empty(n, dtype=bool)
+        new_run[0] = True
+        new_run[1:] = (v[1:] != v[:-1]) | (self.seg[1:] != self.seg[:-1])
+        run_start = np.flatnonzero(new_run)
+        run_end = np.append(run_start[1:], n)
+        mid = (run_start + run_end - 1) / 2.0 - self.starts[self.seg[run_start]] + 1.0
+        ranks = np.empty(n, dtype=np.float64)
+        ranks[order] = np.repeat(mid, run_end - run_start)
+        return ranks
+
+    @property
+    def pred_rank(self) -> np.ndarray:
+        if "pred_rank" not in self._cache:
+            self._cache["pred_rank"] = self._ranks(self._ascending("pred_asc", self.pred), self.pred)
+        return self._cache["pred_rank"]
+
+    @property
+    def label_rank(self) -> np.ndarray:
+        if "label_rank" not in self._cache:
+            self._cache["label_rank"] = self._ranks(self._ascending("label_asc", self.label), self.label)
+        return self._cache["label_rank"]
+
+    def _descending(self, key: str, values: np.ndarray):
+        """
+        段内降序排列：由升序排列按段翻转得到（不再额外排序），返回行号序列与段内名次（0 起）
+        """
+        if key not in self._cache:
+            asc = self._ascending(key.replace("desc", "asc"), values)
+            pos = np.arange(self.n, dtype=np.int64) - self.starts[self.seg]
+            order = asc[self.starts[self.seg] + self.counts[self.seg] - 1 - pos]
+            self._cache[key] = (order, pos)
+        return self._cache[key]
+
+    def pred_desc(self):
+        return self._descending("pred_desc", self.pred)
+
+    def label_desc(self):
+        return self._descending("label_desc", self.label)
+
+    def topk_sizes(self, top: Union[int, float]) -> np.ndarray:
+        top = float(top)
+        if top < 1:
+            k = np.ceil(self.counts * top)
+        else:
+            k = np.full(self.counts.shape, top)
+        return np.clip(k, 1, np.maximum(self.counts, 1)).astype(np.int64)
+
+
+def _safe_div(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    out = np.full(num.shape, np.nan, dtype=np.float64)
+    ok = den > 0
+    out[ok] = num[ok] / den[ok]
+    return out
+
+
+def segment_pearson(ctx: MetricContext, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    if ctx.n == 0:
+        return np.zeros(0, dtype=np.float64)
+    dx = x - ctx.segment_mean(x)[ctx.seg]
+    dy = y - ctx.segment_mean(y)[ctx.seg]
+    sxy = ctx.segment_sum(dx * dy)
+    sxx = ctx.segment_sum(dx * dx)
+    syy = ctx.segment_sum(dy * dy)
+    r = _safe_div(sxy, np.sqrt(sxx * syy))
+    r[ctx.counts < 2] = np.nan
+    return r
+
+
+@registry.register_metric("pearson", capabilities=_SEGMENTED_CAPS, builtin=True)
+def pearson(ctx: MetricContext, **params) -> np.ndarray:
+    return segment_pearson(ctx, ctx.pred, ctx.label)
+
+
+@registry.register_metric("spearman", capabilities=dict(_SEGMENTED_CAPS, ranks=True), builtin=True)
+def spearman(ctx: MetricContext, **params) -> np.ndarray:
+    return segment_pearson(ctx, ctx.pred_rank, ctx.label_rank)
+
+
+@registry.register_metric("mse", capabilities=_SEGMENTED_CAPS, builtin=True)
+def mse(ctx: MetricContext, **params) -> np.ndarray:
+    d = ctx.pred - ctx.label
+    return ctx.segment_mean(d * d)
+
+
+@registry.register_metric("mae", capabilities=_SEGMENTED_CAPS, builtin=True)
+def mae(ctx: MetricContext, **params) -> np.ndarray:
+    return ctx.segment_mean(np.abs(ctx.pred - ctx.label))
+
+
+@registry.register_metric("ndcg", capabilities=_SEGMENTED_CAPS, builtin=True)
+def ndcg(ctx: MetricContext, top: Union[int, float] = 0.1, **params) -> np.ndarray:
+    """
+    NDCG@k：增益为段内标签减去段内最小值（非负），按预测降序取前 k 个计算 DCG，再除以理想排序的 DCG
+    """
+    if ctx.n == 0:
+        return np.zeros(0, dtype=np.float64)
+    gain = ctx.label - np.minimum.reduceat(ctx.label, ctx.starts)[ctx.seg]
+    k = ctx.topk_sizes(top)
+    def dcg(order: np.ndarray, pos: np.ndarray) -> np.ndarray:
+        w = np.where(pos < k[ctx.seg], 1.0 / np.log2(pos + 2.0), 0.0)
+        return np.add.reduceat(gain[order] * w, ctx.starts)
+    return _safe_div(dcg(*ctx.pred_desc()), dcg(*ctx.label_desc()))
+
+
+@registry.register_metric("topk_recall", capabilities=_SEGMENTED_CAPS, builtin=True)
+def topk_recall(ctx: MetricContext, top: Union[int, float] = 0.1, **params) -> np.ndarray:
+    """
+    Top-k 召回：真实标签前 k 名中被预测前 k 名覆盖的比例
+    """
+    if ctx.n == 0:
+        return np.zeros(0, dtype=np.float64)
+    k = ctx.topk_sizes(top)
+    def in_top(order: np.ndarray, pos: np.ndarray) -> np.ndarray:
+        mask = np.zeros(ctx.n, dtype=bool)
+        mask[order] = pos < k[ctx.seg]
+        return mask
+    hit = in_top(*ctx.pred_desc()) & in_top(*ctx.label_desc())
+    return ctx.segment_sum(hit.astype(np.float64)) / k
+
+
+def _metric_specs(names: List[Union[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    specs = []
+    for item in names:
+        if isinstance(item, str):
+            item = {"name": item}
+        name = (item.get("name") or "").strip()
+        if not name:
+            raise RuntimeError("metrics:name_required")
+        params = {k: v for k, v in item.items() if k not in ("name", "key")}
+        specs.append({"name": name, "key": item.get("key") or name.lower(), "params": params})
+    return specs
+
+
+class MetricsEngine:
+    """
+    指标引擎：
+    - compute(pred, label, groups=None) -> 结果字典
+      {
+        "n": 行数, "dropped": 非有限值行数,
+        "overall": {指标: 值},
+        "ci": {指标: [下界, 上界]},          # 仅 bootstrap > 0 时存在
+        "groups": {"key": "mut_num", "values": {"1": {"n": ..., 指标: 值}, ...}}  # 仅传入 groups 时存在
+      }
+    """
+    def __init__(self, names: Optional[List[Union[str, Dict[str, Any]]]] = None, bootstrap: int = 0, ci: float = 0.95,
+                 seed: int = 0, group_by: Optional[str] = "mut_num", max_elements: int = BOOTSTRAP_MAX_ELEMENTS):
+        self.specs = _metric_specs(names or DEFAULT_METRICS)
+        self.bootstrap = max(0, int(bootstrap or 0))
+        self.ci = float(ci)
+        self.seed = int(seed)
+        self.group_by = group_by
+        self.max_elements = max(1, int(max_elements))
+        self.fns: List[Callable] = [registry.get_metric(s["name"]) for s in self.specs]
+        self.caps = [registry.get_capabilities("metric", s["name"]) for s in self.specs]
+
+    @classmethod
+    def from_exp_plan(cls, exp_plan: Dict[str, Any]) -> "MetricsEngine":
+        cfg = metrics_config(exp_plan)
+        return cls(
+            names=cfg.get("names"),
+            bootstrap=cfg.get("bootstrap", 0),
+            ci=cfg.get("ci", 0.95),
+            seed=cfg.get("seed", exp_plan.get("seed", 0)),
+            group_by=metrics_group_by(exp_plan),
+        )
+
+    def _evaluate(self, ctx: MetricContext) -> Dict[str, np.ndarray]:
+        out: Dict[str, np.ndarray] = {}
+        for spec, fn, caps in zip(self.specs, self.fns, self.caps):
+            if caps.get("segmented"):
+                values = fn(ctx, **spec["params"])
+            else:
+                bounds = np.append(ctx.starts, ctx.n)
+                values = np.asarray([
+                    fn(ctx.pred[a:b], ctx.label[a:b], **spec["params"]) for a, b in zip(bounds[:-1], bounds[1:])
+                ], dtype=np.float64)
+            out[spec["key"]] = np.asarray(values, dtype=np.float64)
+        return out
+
+    def _bootstrap(self, pred: np.ndarray, label: np.ndarray) -> Dict[str, List[Optional[float]]]:
+        """
+        重采样下标矩阵 [B, n] 拼接为 B 个段后一次性求值；按 max_elements 分块
+        """
+        n = pred.shape[0]
+        rng = np.random.default_rng(self.seed)
+        per_chunk = max(1, self.max_elements // max(n, 1))
+        samples: Dict[str, List[np.ndarray]] = {s["key"]: [] for s in self.specs}
+        done = 0
+        while done < self.bootstrap:
+            b = min(per_chunk, self.bootstrap - done)
+            idx = rng.integers(0, n, size=(b, n)).reshape(-1)
+            seg = np.repeat(np.arange(b, dtype=np.int64), n)
+            values = self._evaluate(MetricContext(pred[idx], label[idx], seg))
+            for key, v in values.items():
+                samples[key].append(v)
+            done += b
+        alpha = (1.0 - self.ci) / 2.0
+        out: Dict[str, List[Optional[float]]] = {}
+        for key, parts in samples.items():
+            v = np.concatenate(parts)
+            v = v[np.isfinite(v)]
+            if v.size == 0:
+                out[key] = [None, None]
+            else:
+                lo, hi = np.quantile(v, [alpha, 1.0 - alpha])
+                out[key] = [float(lo), float(hi)]
+        return out
+
+    def compute(self, pred: np.ndarray, label: np.ndarray, groups: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        pred = np.asarray(pred, dtype=np.float64).reshape(-1)
+        label = np.asarray(label, dtype=np.float64).reshape(-1)
+        if pred.shape != label.shape:
+            raise RuntimeError("metrics:shape_mismatch")
+        keep = np.isfinite(pred) & np.isfinite(label)
+        dropped = int(pred.shape[0] - keep.sum())
+        pred, label = pred[keep], label[keep]
+        result: Dict[str, Any] = {"n": int(pred.shape[0]), "dropped": dropped}
+        overall = self._evaluate(MetricContext(pred, label))
+        result["overall"] = {k: _to_json(v[0]) if v.size else None for k, v in overall.items()}
+        if self.bootstrap and pred.shape[0] > 1:
+            result["ci"] = self._bootstrap(pred, label)
+            result["bootstrap"] = {"resamples": self.bootstrap, "ci": self.ci, "seed": self.seed}
+        if groups is not None and self.group_by:
+            g = np.asarray(groups).reshape(-1)[keep]
+            keys, codes = np.unique(g, return_inverse=True)
+            ctx = MetricContext(pred, label, codes)
+            per = self._evaluate(ctx)
+            values = {}
+            for i, key in enumerate(keys.tolist()):
+                row = {"n": int(ctx.counts[i])}
+                row.update({k: _to_json(v[i]) for k, v in per.items()})
+                values[str(key)] = row
+            result["groups"] = {"key": self.group_by, "values": values}
+        return result
+
+
+def metrics_config(exp_plan: Dict[str, Any]) -> Dict[str, Any]:
+    cfg = exp_plan.get("metrics")
+    if isinstance(cfg, list):
+        cfg = {"names": cfg}
+    return cfg or {}
+
+
+def metrics_group_by(exp_plan: Dict[str, Any]) -> Optional[str]:
+    """
+    分组评估使用的列名；未配置时为 mut_num，null / 空串表示不分组
+    """
+    return metrics_config(exp_plan).get("group_by", "mut_num") or None
+
+
+def _to_json(value: float) -> Optional[float]:
+    value = float(value)
+    return value if math.isfinite(value) else None
+
+
+def compute_metrics(pred: np.ndarray, label: np.ndarray, exp_plan: Dict[str, Any],
+                    groups: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """
+    按 exp_plan["metrics"] 计算指标；未配置时使用默认指标集合、按 mut_num 分组、不做 bootstrap
+    - groups：分组列的取值（见 TensorData.column）
+    """
+    engine = MetricsEngine.from_exp_plan(exp_plan)
+    result = engine.compute(pred, label, groups)
+    logger.info("metrics:computed " + " ".join(f"{k}={v:.4f}" for k, v in result["overall"].items() if v is not None))
+    return result
@@ -1,8 +1,28 @@
+
+from typing import Dict, Any
+import torch
 import torch.nn as nn
 
+"""
+模型基类（ProteinModel）
+约定：
+- 在工作目录 model/ 下继承 ProteinModel 并使用 registry.register_model("name") 注册
+- 构造参数来自 exp_plan["model"]["params"]，即 cls(**params)
+- forward(batch)：batch 为张量字典
+  - "tokens"：LongTensor [B, L]，词表编码后的序列
+  - "lengths"：LongTensor [B]，真实序列长度（不含首尾标记）
+  - "features"：FloatTensor [B, ...]，嵌入结果（仅在配置了 embeddings 时存在）
+  - "label"：FloatTensor [B]，回归目标
+  返回预测值 [B] 或 [B, 1]
+- compute_loss(pred, batch)：默认对 label 做 MSE，可按需覆盖
+"""
+
 class ProteinModel(nn.Module):
     def __init__(self):
         super().__init__()
 
     def forward(self, *args, **kwargs):
         raise NotImplementedError()
+
+    def compute_loss(self, pred: torch.Tensor, batch: Dict[str, Any]) -> torch.Tensor:
+        return nn.functional.mse_loss(pred.float().reshape(-1), batch["label"].float().reshape(-1))
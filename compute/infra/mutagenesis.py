@@ -0,0 +1,368 @@
+"""
+饱和突变（Saturation Mutagenesis）生成器
+目标：
+- 直接以 (位点, 残基) 矩阵枚举变体，不生成突变描述字符串，也不经过 build_dataframe 解析
+- 按块惰性产出：每块只计算一段扁平下标对应的变体，内存与库大小无关
+- 通过有序键索引（MutationIndex）排除 mutations 表中已有的变体
+- 产出的块经模板编码器直接写入 token 矩阵，交给 predict 的推理路径（MicroBatcher）
+
+变体表示（VariantChunk）：
+- pos：int32 [N, K]，0 起始位点，按升序排列，不足 K 个突变时以 -1 填充
+- aa：uint8 [N, K]，新残基 ASCII 码（大写），填充位为 0
+- mut_num：int32 [N]，突变个数
+
+枚举方式（mode）：
+- singles：每个位点（或 positions 子集）替换为字母表中除野生型外的每个残基
+- doubles：位点对（pairs 显式指定；否则取 positions 两两组合，未指定时取全部位点两两组合）上的全部双突变
+- combinatorial：sites 指定每个位点的候选残基，枚举其全部组合（野生型也是一个选项），
+  只保留突变数在 [min_order, max_order] 内的组合
+
+库配置（infra-predict --library spec.json）：
+    {
+        "mode": "singles",                  # singles | doubles | combinatorial
+        "template": "MKT...",               # 可省略：由 --template 或 exclude_existing.source 对应的 sources.template 提供
+        "alphabet": "ACDEFGHIKLMNPQRSTVWY",
+        "positions": [1, 2, 3],             # 1 起始位点子集（singles / doubles）
+        "pairs": [[10, 25], [10, 40]],      # doubles 的显式位点对（1 起始）
+        "sites": {"12": "ACD", "45": "KR"}, # combinatorial 的位点与候选残基（1 起始）
+        "min_order": 1,
+        "max_order": null,
+        "exclude_existing": {"db": "metadata/database.db", "source": 3, "table": "mutations"}
+    }
+"""
+import sqlite3
+import logging
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, List, Iterator, Sequence, Tuple, Iterable
+import numpy as np
+from .data import parse_mutations
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ALPHABET = "ACDEFGHIKLMNPQRSTVWY"
+_CODE_RADIX = 128
+_INT64_MAX = np.iinfo(np.int64).max
+
+
+@dataclass
+class VariantChunk:
+    pos: np.ndarray
+    aa: np.ndarray
+    mut_num: np.ndarray
+
+    def __len__(self) -> int:
+        return int(self.pos.shape[0])
+
+    def take(self, mask: np.ndarray) -> "VariantChunk":
+        return VariantChunk(self.pos[mask], self.aa[mask], self.mut_num[mask])
+
+    def substitutions(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        展开为 (行号, 位点, 新残基 ASCII) 三个等长数组，供 MutantEncoder.encode_substitutions 使用
+        """
+        filled = self.pos >= 0
+        rows = np.broadcast_to(np.arange(len(self), dtype=np.int64)[:, None], self.pos.shape)[filled]
+        return rows, self.pos[filled].astype(np.int64), self.aa[filled]
+
+
+class VariantKeys:
+    """
+    变体 -> int64 键：每个突变编码为 (pos * 128 + ascii + 1)，按位点升序以混合进制拼接
+    位点数 × 阶数超出 int64 范围时回退为逐行字节键（仅影响去重速度）
+    """
+    def __init__(self, length: int, order: int):
+        self.radix = int(length) * _CODE_RADIX + 1
+        self.order = max(1, int(order))
+        self.packed = self.order * np.log2(self.radix) < 62
+
+    def keys(self, pos: np.ndarray, aa: np.ndarray):
+        codes = np.where(pos >= 0, pos.astype(np.int64) * _CODE_RADIX + aa.astype(np.int64) + 1, 0)
+        if not self.packed:
+            return [row.tobytes() for row in np.ascontiguousarray(codes)]
+        out = np.zeros(codes.shape[0], dtype=np.int64)
+        for j in range(codes.shape[1]):
+            out = out * self.radix + codes[:, j]
+        return out
+
+
+def source_template(db_path: Path, source: int) -> str:
+    """
+    读取 sources 表中指定 id 的模板序列
+    """
+    conn = sqlite3.connect(str(db_path))
+    try:
+        row = conn.execute("SELECT template FROM sources WHERE id = ?", [int(source)]).fetchone()
+    finally:
+        conn.close()
+    if row is None or not row[0]:
+        raise RuntimeError(f"mutagenesis:source_not_found {source}")
+    return str(row[0])
+
+
+class MutationIndex:
+    """
+    已有变体索引：有序 int64 键数组 + 二分查找（回退模式下为集合）
+    - from_mutants(mutants, template)：由突变描述构建（向量化解析）
+    - from_db(db_path, template / source)：由 mutations 表构建，只取模板一致的记录
+    - contains(chunk)：返回块内每个变体是否已存在
+    """
+    def __init__(self, keys: VariantKeys, values):
+        self.keys = keys
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    @classmethod
+    def from_mutants(cls, mutants: Iterable[Optional[str]], template: str, order: int, chunk_size: int = 1 << 20) -> "MutationIndex":
+        keys = VariantKeys(len(template), order)
+        tbytes = np.frombuffer(str(template).upper().encode("ascii"), dtype=np.uint8)
+        parts: List[Any] = []
+        batch: List[Optional[str]] = []
+        for m in mutants:
+            batch.append(m)
+            if len(batch) >= chunk_size:
+                parts.append(cls._parse(batch, tbytes, keys))
+                batch = []
+        if batch:
+            parts.append(cls._parse(batch, tbytes, keys))
+        if keys.packed:
+            values = np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+        else:
+            values = set()
+            for p in parts:
+                values.update(p)
+        return cls(keys, values)
+
+    @staticmethod
+    def _parse(mutants: List[Optional[str]], tbytes: np.ndarray, keys: VariantKeys):
+        n = len(mutants)
+        rows, pos, wt, mt = parse_mutations(mutants)
+        # 与模板不一致（越界 / 原残基不符）的记录不会与生成的变体重合，直接剔除整行
+        ok = pos < tbytes.shape[0]
+        ok[ok] &= tbytes[pos[ok]] == wt[ok]
+        bad = np.zeros(n, dtype=bool)
+        bad[rows[~ok]] = True
+        counts = np.bincount(rows, minlength=n)
+        keep_row = ~bad & (counts >= 1) & (counts <= keys.order)
+        sel = keep_row[rows]
+        rows, pos, mt = rows[sel], pos[sel], mt[sel]
+        order = np.lexsort((pos, rows))
+        rows, pos, mt = rows[order], pos[order], mt[order]
+        # 行内序号：位点升序后依次填入第 0..k-1 列
+        starts = np.searchsorted(rows, rows, side="left")
+        col = np.arange(rows.shape[0]) - starts
+        uniq, inverse = np.unique(rows, return_inverse=True)
+        pmat = np.full((uniq.shape[0], keys.order), -1, dtype=np.int64)
+        amat = np.zeros((uniq.shape[0], keys.order), dtype=np.uint8)
+        pmat[inverse, col] = pos
+        amat[inverse, col] = mt
+        return keys.keys(pmat, amat)
+
+    @classmethod
+    def from_db(cls, db_path: Path, template: Optional[str] = None, source: Optional[int] = None, order: int = 2,
+                table: str = "mutations") -> Tuple["MutationIndex", str]:
+        """
+        返回 (索引, 模板)；按 source 查询时模板取自 sources.template
+        """
+        conn = sqlite3.connect(str(db_path))
+        try:
+            if source is not None:
+                db_template = source_template(db_path, source)
+                if template and template.strip().upper() != db_template.strip().upper():
+                    raise RuntimeError("mutagenesis:template_mismatch")
+                template = db_template
+                cur = conn.execute(f'SELECT m.mutant FROM "{table}" m WHERE m.source = ?', [int(source)])
+            elif template:
+                cur = conn.execute(f'SELECT m.mutant FROM "{table}" m JOIN sources s ON m.source = s.id WHERE s.template = ?', [template])
+            else:
+                raise RuntimeError("mutagenesis:template_required")
+
+            def rows() -> Iterator[Optional[str]]:
+                while True:
+                    batch = cur.fetchmany(65536)
+                    if not batch:
+                        return
+                    for r in batch:
+                        yield r[0]
+
+            index = cls.from_mutants(rows(), template, order)
+        finally:
+            conn.close()
+        logger.info(f"mutagenesis:index_built rows={len(index)} order={order}")
+        return index, template
+
+    def contains(self, chunk: VariantChunk) -> np.ndarray:
+        k = self.keys.keys(chunk.pos, chunk.aa)
+        if not self.keys.packed:
+            return np.fromiter((x in self.values for x in k), dtype=bool, count=len(k))
+        if len(self.values) == 0:
+            return np.zeros(len(chunk), dtype=bool)
+        at = np.minimum(np.searchsorted(self.values, k), len(self.values) - 1)
+        return self.values[at] == k
+
+
+def _candidates(template_bytes: np.ndarray, sites: np.ndarray, alphabet: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    每个位点的候选残基（字母表去掉野生型），返回 (候选矩阵 [S, A]，候选数 [S])
+    """
+    wt = template_bytes[sites]
+    cand = np.broadcast_to(alphabet[None, :], (sites.shape[0], alphabet.shape[0]))
+    keep = cand != wt[:, None]
+    count = keep.sum(axis=1)
+    # 稳定排序把非野生型残基移到每行前部
+    order = np.argsort(~keep, axis=1, kind="stable")
+    return np.take_along_axis(cand, order, axis=1), count
+
+
+class VariantLibrary:
+    """
+    - total：变体数上限（去重前）
+    - order：单个变体的最大突变数 K
+    - chunks(chunk_size, index=None)：按扁平下标分块惰性产出 VariantChunk；给定 index 时剔除已有变体
+    """
+    def __init__(self, template: str, mode: str = "singles", positions: Optional[Sequence[int]] = None,
+                 pairs: Optional[Sequence[Sequence[int]]] = None, sites: Optional[Dict[Any, str]] = None,
+                 alphabet: str = DEFAULT_ALPHABET, min_order: int = 1, max_order: Optional[int] = None):
+        self.template = str(template).strip().upper()
+        if not self.template:
+            raise RuntimeError("mutagenesis:template_required")
+        self.mode = str(mode).lower()
+        self.length = len(self.template)
+        self.tbytes = np.frombuffer(self.template.encode("ascii"), dtype=np.uint8)
+        self.alphabet = np.unique(np.frombuffer(str(alphabet).upper().encode("ascii"), dtype=np.uint8))
+        sites_idx = self._sites(positions) if positions else np.arange(self.length)
+        if self.mode == "singles":
+            self.sites = sites_idx
+            self.cand, self.count = _candidates(self.tbytes, self.sites, self.alphabet)
+            self.offsets = np.concatenate([[0], np.cumsum(self.count)]).astype(np.int64)
+            self.order = 1
+        elif self.mode == "doubles":
+            if pairs:
+                p = np.sort(np.asarray([self._sites(pr, unique=False) for pr in pairs], dtype=np.int64).reshape(-1, 2), axis=1)
+                p = np.unique(p[p[:, 0] != p[:, 1]], axis=0)
+            else:
+                i, j = np.triu_indices(sites_idx.shape[0], k=1)
+                p = np.stack([sites_idx[i], sites_idx[j]], axis=1)
+            self.pairs = p
+            self.sites = np.unique(p) if p.size else np.zeros(0, dtype=np.int64)
+            self.cand, self.count = _candidates(self.tbytes, self.sites, self.alphabet)
+            self._slot = np.searchsorted(self.sites, p) if p.size else np.zeros((0, 2), dtype=np.int64)
+            sizes = self.count[self._slot[:, 0]] * self.count[self._slot[:, 1]] if p.size else np.zeros(0, dtype=np.int64)
+            self.offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+            self.order = 2
+        elif self.mode == "combinatorial":
+            if not sites:
+                raise RuntimeError("mutagenesis:sites_required")
+            items = sorted((int(self._sites([k])[0]), str(v).upper()) for k, v in sites.items())
+            self.sites = np.asarray([s for s, _ in items], dtype=np.int64)
+            if np.unique(self.sites).shape[0] != self.sites.shape[0]:
+                raise RuntimeError("mutagenesis:duplicate_sites")
+            # 每个位点的选项：0 = 野生型，1.. = 候选残基（去掉野生型与重复）
+            opts = []
+            for s, letters in items:
+                aa = np.unique(np.frombuffer(letters.encode("ascii"), dtype=np.uint8))
+                opts.append(aa[aa != self.tbytes[s]])
+            width = max((o.shape[0] for o in opts), default=0)
+            self.cand = np.zeros((len(opts), width), dtype=np.uint8)
+            for i, o in enumerate(opts):
+                self.cand[i, :o.shape[0]] = o
+            self.radix = np.asarray([o.shape[0] + 1 for o in opts], dtype=np.int64)
+            total = int(np.prod(self.radix.astype(object)))
+            if total > _INT64_MAX:
+                raise RuntimeError("mutagenesis:library_too_large")
+            self.offsets = np.asarray([0, total - 1], dtype=np.int64)
+            self.order = len(opts)
+        else:
+            raise RuntimeError(f"mutagenesis:unknown_mode {self.mode}")
+        self.min_order = max(1, int(min_order))
+        self.max_order = min(self.order, int(max_order)) if max_order else self.order
+        if self.min_order > self.max_order:
+            # 阶数范围为空：空库
+            self.offsets = np.zeros(1, dtype=np.int64)
+        self.order = max(1, self.max_order)
+
+    def _sites(self, positions: Sequence[int], unique: bool = True) -> np.ndarray:
+        """
+        1 起始位点 -> 0 起始下标（默认去重排序）
+        """
+        p = np.asarray([int(x) for x in positions], dtype=np.int64) - 1
+        if p.size and (p.min() < 0 or p.max() >= self.length):
+            raise RuntimeError("mutagenesis:position_out_of_range")
+        return np.unique(p) if unique else p
+
+    @property
+    def total(self) -> int:
+        return int(self.offsets[-1])
+
+    def _singles(self, idx: np.ndarray) -> VariantChunk:
+        slot = np.searchsorted(self.offsets, idx, side="right") - 1
+        r = idx - self.offsets[slot]
+        pos = self.sites[slot][:, None].astype(np.int32)
+        aa = self.cand[slot, r][:, None]
+        return VariantChunk(pos, aa, np.ones(idx.shape[0], dtype=np.int32))
+
+    def _doubles(self, idx: np.ndarray) -> VariantChunk:
+        pair = np.searchsorted(self.offsets, idx, side="right") - 1
+        r = idx - self.offsets[pair]
+        s1, s2 = self._slot[pair, 0], self._slot[pair, 1]
+        c2 = self.count[s2]
+        a1 = self.cand[s1, r // c2]
+        a2 = self.cand[s2, r % c2]
+        pos = np.stack([self.sites[s1], self.sites[s2]], axis=1).astype(np.int32)
+        return VariantChunk(pos, np.stack([a1, a2], axis=1), np.full(idx.shape[0], 2, dtype=np.int32))
+
+    def _combinatorial(self, idx: np.ndarray) -> VariantChunk:
+        # 扁平下标 1..total-1 按混合进制分解为每个位点的选项（0 = 野生型）
+        rest = idx + 1
+        digits = np.empty((idx.shape[0], self.radix.shape[0]), dtype=np.int64)
+        for j in range(self.radix.shape[0] - 1, -1, -1):
+            digits[:, j] = rest % self.radix[j]
+            rest //= self.radix[j]
+        mutated = digits > 0
+        mut_num = mutated.sum(axis=1)
+        keep = (mut_num >= self.min_order) & (mut_num <= self.max_order)
+        digits, mutated, mut_num = digits[keep], mutated[keep], mut_num[keep]
+        # 突变位点左移紧凑排列到前 K 列
+        order = np.argsort(~mutated, axis=1, kind="stable")[:, :self.order]
+        d = np.take_along_axis(digits, order, axis=1)
+        filled = np.take_along_axis(mutated, order, axis=1)
+        pos = np.where(filled, self.sites[order], -1).astype(np.int32)
+        aa = np.where(filled, self.cand[order, np.maximum(d - 1, 0)], 0).astype(np.uint8)
+        return VariantChunk(pos, aa, mut_num.astype(np.int32))
+
+    def chunks(self, chunk_size: int = 65536, index: Optional[MutationIndex] = None) -> Iterator[VariantChunk]:
+        make = {"singles": self._singles, "doubles": self._doubles, "combinatorial": self._combinatorial}[self.mode]
+        total = self.total
+        skipped = 0
+        produced = 0
+        for start in range(0, total, chunk_size):
+            chunk = make(np.arange(start, min(start + chunk_size, total), dtype=np.int64))
+            if index is not None and len(chunk):
+                exists = index.contains(chunk)
+                skipped += int(exists.sum())
+                chunk = chunk.take(~exists)
+            if len(chunk):
+                produced += len(chunk)
+                yield chunk
+        logger.info(f"mutagenesis:enumerated mode={self.mode} produced={produced} skipped_existing={skipped}")
+
+
+def library_from_spec(spec: Dict[str, Any], template: str) -> VariantLibrary:
+    return VariantLibrary(template, mode=spec.get("mode", "singles"), positions=spec.get("positions"),
+                          pairs=spec.get("pairs"), sites=spec.get("sites"),
+                          alphabet=spec.get("alphabet") or DEFAULT_ALPHABET,
+                          min_order=spec.get("min_order", 1), max_order=spec.get("max_order"))
+
+
+def format_variants(chunk: VariantChunk, template: str, limit: Optional[int] = None) -> List[str]:
+    """
+    仅用于展示 / 导出少量结果：把变体还原为 A12C:D40E 形式的描述
+    """
+    n = len(chunk) if limit is None else min(len(chunk), int(limit))
+    out = []
+    for i in range(n):
+        parts = [f"{template[p]}{p + 1}{chr(a)}" for p, a in zip(chunk.pos[i].tolist(), chunk.aa[i].tolist()) if p >= 0]
+        out.append(":".join(parts))
+    return out
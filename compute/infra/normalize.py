@@ -1,26 +1,44 @@
-from typing import Dict, Any
+import json
+import math
+import logging
+from pathlib import Path
+from typing import Dict, Any, Optional, Iterable, Tuple
+import numpy as np
 from .registry import registry
 
+logger = logging.getLogger(__name__)
+
 """
 归一化（Normalization）模块
 目标：
 - 在训练流水线中提供一个可插拔的归一化步骤
-- 接收并返回 DataFrame（df），保持与上游/下游一致的接口形态
+- 接收划分后的 (train_df, valid_df, test_df) 并返回同形态的三元组，保持与上游划分/下游张量化一致的接口形态
 - 采用统一注册中心 + 装饰器注册的方式加载具体归一化实现
 
 使用方式：
 - 在工作目录中定义归一化类，并使用 registry.register_normalization("name") 完成注册
 - 在 flags/exp_plan 中通过 normalization.method 或 normalization.type 指定名称进行路由
-- 当未配置归一化时，apply_normalization 直接返回原始 df
+- 当未配置归一化时，apply_normalization 原样返回 (train_df, valid_df, test_df)
 
 配置示例（加入到 exp_plan 中）：
     "normalization": {
         "method": "standard",
-        "scope": "global"
+        "column": "DMS_score",
+        "chunk_size": 65536
     }
 说明：
 - method/type：选择具体的归一化实现名称（大小写不敏感）
 - 其他键由具体归一化类自行解释，例如 scope/input/列名等
+
+内置实现（均只在训练集上单遍流式拟合，按 chunk_size 分块读取）：
+- standard：(x - mean) / std，均值方差使用 Welford/Chan 合并公式逐块更新
+- minmax：(x - min) / (max - min)
+- robust：(x - median) / IQR，分位数由可合并的 t-digest 估计
+- quantile：x -> 经验 CDF(x) ∈ [0, 1]，CDF 同样由 t-digest 估计
+
+状态持久化：
+- apply_normalization 只用 train 拟合，再对 train/valid/test 变换
+- 拟合后的状态写入实验目录下的 normalization.json，推理时通过 load_normalization 复用，无需重新拟合
 """
 
 class BaseNormalization:
@@ -35,22 +53,351 @@ class BaseNormalization:
         raise NotImplementedError
     def transform(self, df, exp_plan: Dict[str, Any]):
         raise NotImplementedError
+    def state_dict(self) -> Dict[str, Any]:
+        """导出可 JSON 序列化的拟合状态；不支持持久化的实现可不覆盖"""
+        raise NotImplementedError
+    def load_state_dict(self, state: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+
+class _Welford:
+    """
+    流式均值/方差/极值统计：块内用 numpy 求和，块间用 Chan 并行合并公式，数值稳定且单遍
+    """
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, x: np.ndarray) -> None:
+        x = x[np.isfinite(x)]
+        nb = int(x.size)
+        if nb == 0:
+            return
+        mb = float(x.mean())
+        m2b = float(((x - mb) ** 2).sum())
+        n = self.n + nb
+        delta = mb - self.mean
+        self.mean += delta * nb / n
+        self.m2 += m2b + delta * delta * self.n * nb / n
+        self.n = n
+        self.min = min(self.min, float(x.min()))
+        self.max = max(self.max, float(x.max()))
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / self.n) if self.n > 0 else 0.0
+
+    def state_dict(self) -> Dict[str, Any]:
+        return {"n": self.n, "mean": self.mean, "m2": self.m2, "min": self.min, "max": self.max}
+
+    def load_state_dict(self, state: Dict[str, Any]) -> None:
+        self.n = int(state["n"])
+        self.mean = float(state["mean"])
+        self.m2 = float(state["m2"])
+        self.min = float(state["min"])
+        self.max = float(state["max"])
+
+
+class _TDigest:
+    """
+    合并式 t-digest 分位数草图（向量化实现）：
+    - 每个数据块与已有质心一起排序，按 k1 尺度函数 k(q) = δ/(2π)·asin(2q-1) 的整数段合并相邻质心
+    - 尾部分辨率高、中部质心大，质心数量 O(δ) 与数据量无关
+    - 支持 quantile(q) 与 cdf(x) 查询，最小/最大值精确保留
+    """
+    def __init__(self, compression: float = 200.0):
+        self.compression = float(compression)
+        self.means = np.zeros(0, dtype=np.float64)
+        self.weights = np.zeros(0, dtype=np.float64)
+        self.min = math.inf
+        self.max = -math.inf
+
+    @property
+    def n(self) -> float:
+        return float(self.weights.sum())
+
+    def update(self, x: np.ndarray) -> None:
+        x = np.asarray(x, dtype=np.float64)
+        x = x[np.isfinite(x)]
+        if x.size == 0:
+            return
+        self.min = min(self.min, float(x.min()))
+        self.max = max(self.max, float(x.max()))
+        means = np.concatenate([self.means, x])
+        weights = np.concatenate([self.weights, np.ones(x.size, dtype=np.float64)])
+        order = np.argsort(means, kind="stable")
+        means = means[order]
+        weights = weights[order]
+        total = weights.sum()
+        q = (np.cumsum(weights) - weights / 2.0) / total
+        k = self.compression / (2.0 * math.pi) * np.arcsin(np.clip(2.0 * q - 1.0, -1.0, 1.0))
+        bucket = np.floor(k - k[0]).astype(np.int64)
+        starts = np.concatenate([[0], np.nonzero(np.diff(bucket))[0] + 1])
+        w = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / w
+        self.weights = w
+
+    def _knots(self) -> Tuple[np.ndarray, np.ndarray]:
+        total = self.weights.sum()
+        centres = (np.cumsum(self.weights) - self.weights / 2.0) / total
+        qs = np.concatenate([[0.0], centres, [1.0]])
+        vs = np.concatenate([[self.min], self.means, [self.max]])
+        return qs, vs
+
+    def quantile(self, q) -> np.ndarray:
+        if self.weights.size == 0:
+            raise RuntimeError("normalization:not_fitted")
+        qs, vs = self._knots()
+        return np.interp(q, qs, vs)
+
+    def cdf(self, x) -> np.ndarray:
+        if self.weights.size == 0:
+            raise RuntimeError("normalization:not_fitted")
+        qs, vs = self._knots()
+        return np.interp(x, vs, qs)
+
+    def state_dict(self) -> Dict[str, Any]:
+        return {
+            "compression": self.compression,
+            "means": self.means.tolist(),
+            "weights": self.weights.tolist(),
+            "min": self.min,
+            "max": self.max,
+        }
+
+    def load_state_dict(self, state: Dict[str, Any]) -> None:
+        self.compression = float(state["compression"])
+        self.means = np.asarray(state["means"], dtype=np.float64)
+        self.weights = np.asarray(state["weights"], dtype=np.float64)
+        self.min = float(state["min"])
+        self.max = float(state["max"])
+
 
-def apply_normalization(df, exp_plan: Dict[str, Any]):
+def _column_values(df, column: str) -> np.ndarray:
+    """
+    取出目标列为一维 float64 数组；兼容 build_dataframe 中“每行一个长度为 1 的数组”的存储方式
+    """
+    col = df[column]
+    if col.dtype == object:
+        return np.asarray([np.asarray(v, dtype=np.float64).reshape(-1)[0] if v is not None else np.nan for v in col], dtype=np.float64)
+    return col.to_numpy(dtype=np.float64)
+
+
+def _assign_column(df, column: str, values: np.ndarray):
+    """
+    写回目标列，保持原有存储方式（对象列写回为 float32 单元素数组）
+    """
+    out = df.copy()
+    if out[column].dtype == object:
+        out[column] = list(values.astype(np.float32).reshape(-1, 1))
+    else:
+        out[column] = values
+    return out
+
+
+def _iter_chunks(values: np.ndarray, chunk_size: int) -> Iterable[np.ndarray]:
+    for start in range(0, values.shape[0], chunk_size):
+        yield values[start:start + chunk_size]
+
+
+class StreamingNormalization(BaseNormalization):
+    """
+    内置归一化的公共骨架：
+    - fit：按 chunk_size 分块对目标列调用 partial_fit（也可由外部逐块调用 partial_fit 实现真正的流式输入）
+    - transform / inverse_transform：逐元素向量化变换
+    - state_dict：method + column + 统计量
+    """
+    method = ""
+
+    def __init__(self):
+        self.column = "DMS_score"
+
+    def _configure(self, exp_plan: Dict[str, Any]) -> Dict[str, Any]:
+        cfg = exp_plan.get("normalization") or {}
+        self.column = cfg.get("column") or self.column
+        return cfg
+
+    def partial_fit(self, values: np.ndarray) -> None:
+        raise NotImplementedError
+
+    def forward(self, values: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def inverse(self, values: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def fit(self, df, exp_plan: Dict[str, Any]) -> Any:
+        cfg = self._configure(exp_plan)
+        chunk_size = int(cfg.get("chunk_size") or 65536)
+        for chunk in _iter_chunks(_column_values(df, self.column), chunk_size):
+            self.partial_fit(chunk)
+        return self
+
+    def transform(self, df, exp_plan: Dict[str, Any]):
+        self._configure(exp_plan)
+        return _assign_column(df, self.column, self.forward(_column_values(df, self.column)))
+
+    def inverse_transform(self, values) -> np.ndarray:
+        """将模型输出（归一化空间）映射回原始标签空间，供推理使用"""
+        return self.inverse(np.asarray(values, dtype=np.float64))
+
+    def _stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def _load_stats(self, stats: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def state_dict(self) -> Dict[str, Any]:
+        return {"method": self.method, "column": self.column, "stats": self._stats()}
+
+    def load_state_dict(self, state: Dict[str, Any]) -> None:
+        self.column = state.get("column") or self.column
+        self._load_stats(state["stats"])
+
+
+@registry.register_normalization("standard", capabilities={"batchable": True, "process_safe": True}, builtin=True)
+class StandardNormalization(StreamingNormalization):
+    method = "standard"
+
+    def __init__(self):
+        super().__init__()
+        self.stats = _Welford()
+
+    def partial_fit(self, values: np.ndarray) -> None:
+        self.stats.update(values)
+
+    def _scale(self) -> float:
+        std = self.stats.std
+        return std if std > 0 else 1.0
+
+    def forward(self, values: np.ndarray) -> np.ndarray:
+        return (values - self.stats.mean) / self._scale()
+
+    def inverse(self, values: np.ndarray) -> np.ndarray:
+        return values * self._scale() + self.stats.mean
+
+    def _stats(self) -> Dict[str, Any]:
+        return self.stats.state_dict()
+
+    def _load_stats(self, stats: Dict[str, Any]) -> None:
+        self.stats.load_state_dict(stats)
+
+
+@registry.register_normalization("minmax", capabilities={"batchable": True, "process_safe": True}, builtin=True)
+class MinMaxNormalization(StandardNormalization):
+    method = "minmax"
+
+    def _range(self) -> float:
+        r = self.stats.max - self.stats.min
+        return r if r > 0 else 1.0
+
+    def forward(self, values: np.ndarray) -> np.ndarray:
+        return (values - self.stats.min) / self._range()
+
+    def inverse(self, values: np.ndarray) -> np.ndarray:
+        return values * self._range() + self.stats.min
+
+
+@registry.register_normalization("robust", capabilities={"batchable": True, "process_safe": True}, builtin=True)
+class RobustNormalization(StreamingNormalization):
+    method = "robust"
+
+    def __init__(self):
+        super().__init__()
+        self.digest = _TDigest()
+
+    def _configure(self, exp_plan: Dict[str, Any]) -> Dict[str, Any]:
+        cfg = super()._configure(exp_plan)
+        if cfg.get("compression") and self.digest.weights.size == 0:
+            self.digest.compression = float(cfg["compression"])
+        return cfg
+
+    def partial_fit(self, values: np.ndarray) -> None:
+        self.digest.update(values)
+
+    def _centre_scale(self) -> Tuple[float, float]:
+        q25, q50, q75 = self.digest.quantile([0.25, 0.5, 0.75])
+        iqr = float(q75 - q25)
+        return float(q50), (iqr if iqr > 0 else 1.0)
+
+    def forward(self, values: np.ndarray) -> np.ndarray:
+        centre, scale = self._centre_scale()
+        return (values - centre) / scale
+
+    def inverse(self, values: np.ndarray) -> np.ndarray:
+        centre, scale = self._centre_scale()
+        return values * scale + centre
+
+    def _stats(self) -> Dict[str, Any]:
+        return self.digest.state_dict()
+
+    def _load_stats(self, stats: Dict[str, Any]) -> None:
+        self.digest.load_state_dict(stats)
+
+
+@registry.register_normalization("quantile", capabilities={"batchable": True, "process_safe": True}, builtin=True)
+class QuantileNormalization(RobustNormalization):
+    method = "quantile"
+
+    def forward(self, values: np.ndarray) -> np.ndarray:
+        return self.digest.cdf(values)
+
+    def inverse(self, values: np.ndarray) -> np.ndarray:
+        return self.digest.quantile(np.clip(values, 0.0, 1.0))
+
+
+def _normalization_method(exp_plan: Dict[str, Any]) -> str:
+    cfg = exp_plan.get("normalization") or {}
+    return (cfg.get("method") or cfg.get("type") or "").strip()
+
+
+def apply_normalization(train_df, valid_df, test_df, exp_plan: Dict[str, Any], state_path: Optional[Path] = None):
     """
     归一化入口：
     - 读取 exp_plan["normalization"] 配置，解析 method/type
-    - 未配置或未指定名称时，直接返回原始 df
-    - 已配置时，从注册中心查询归一化类，执行 fit 与 transform 并返回结果
+    - 未配置或未指定名称时，直接返回原始 train/valid/test
+    - 已配置时，从注册中心查询归一化类，仅在 train 上 fit，再分别 transform 三个集合
+    - 指定 state_path 且实现支持 state_dict 时，将拟合状态写入该文件
     """
-    cfg = exp_plan.get("normalization") or {}
-    method = (cfg.get("method") or cfg.get("type") or "").strip()
+    method = _normalization_method(exp_plan)
     if not method:
         # 未指定归一化，原样透传
-        return df
+        return train_df, valid_df, test_df
     # 查询并实例化归一化类
     cls = registry.get_normalization(method)
     norm = cls()
-    # 先拟合，再变换
-    norm.fit(df, exp_plan)
-    return norm.transform(df, exp_plan)
+    # 仅用训练集拟合，避免验证/测试信息泄漏
+    norm.fit(train_df, exp_plan)
+    if state_path is not None:
+        try:
+            state = norm.state_dict()
+        except NotImplementedError:
+            state = None
+        if state is not None:
+            save_normalization_state(state_path, state)
+    return norm.transform(train_df, exp_plan), norm.transform(valid_df, exp_plan), norm.transform(test_df, exp_plan)
+
+
+def save_normalization_state(path: Path, state: Dict[str, Any]) -> None:
+    path = Path(path)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
+    tmp.replace(path)
+    logger.info(f"normalization:state_saved method={state.get('method')} path={path}")
+
+
+def load_normalization(path: Path) -> Optional[BaseNormalization]:
+    """
+    从实验目录读取拟合好的归一化状态并恢复实例；文件不存在时返回 None
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    state = json.loads(path.read_text(encoding="utf-8"))
+    cls = registry.get_normalization(state["method"])
+    norm = cls()
+    norm.load_state_dict(state)
+    return norm
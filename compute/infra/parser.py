@@ -51,6 +51,65 @@ class TrainParser:
         return args
         
     
+class SweepParser:
+    def __init__(self):
+        self.parser = argparse.ArgumentParser(description='Infra 超参搜索参数', add_help=False)
+        self._init_parser()
+        args = self.parser.parse_args()
+        with open(args.sweep_path, 'r', encoding='utf-8') as f:
+            args.sweep = json.load(f)
+        self.args = self._check_parser(args)
+        self.arg_dict = vars(self.args)
+
+    def _init_parser(self):
+        self.parser.add_argument('sweep_path', type=str, help='搜索配置路径（基础实验计划 + 搜索空间）')
+        self.parser.add_argument('--workers', type=int, default=None, help='并行试验进程数，覆盖配置中的 workers')
+        self.parser.add_argument('--debug', action='store_true', default=False, help='是否开启debug模式')
+
+    def _check_parser(self, args: argparse.Namespace):
+        sweep = args.sweep
+        if not isinstance(sweep, dict):
+            raise ValueError("sweep config must be an object")
+        if sweep.get('base') is None and sweep.get('base_path') is None:
+            raise ValueError("base or base_path is required")
+        if not sweep.get('space'):
+            raise ValueError("space is required")
+        if args.workers is not None:
+            sweep['workers'] = args.workers
+        return args
+
+
+class PredictParser:
+    def __init__(self):
+        self.parser = argparse.ArgumentParser(description='Infra 批量推理 / 打分服务参数', add_help=False)
+        self._init_parser()
+        args = self.parser.parse_args()
+        self.args = self._check_parser(args)
+        self.arg_dict = vars(self.args)
+
+    def _init_parser(self):
+        self.parser.add_argument('experiment', type=str, help='实验目录或 experiments/ 下的实验 id')
+        self.parser.add_argument('--input', type=str, default=None, help='突变体列表文件（每行一个，或含 mutant 列的 csv/tsv）')
+        self.parser.add_argument('--output', type=str, default=None, help='输出 csv 路径，默认 <实验目录>/predictions/<输入文件名>.csv')
+        self.parser.add_argument('--template', type=str, default=None, help='模板序列或序列文件（FASTA/纯文本）')
+        self.parser.add_argument('--library', type=str, default=None, help='饱和突变库配置（json），枚举变体并打分')
+        self.parser.add_argument('--serve', action='store_true', default=False, help='启动本地 HTTP 打分服务')
+        self.parser.add_argument('--host', type=str, default='127.0.0.1', help='服务监听地址')
+        self.parser.add_argument('--port', type=int, default=8700, help='服务监听端口')
+        self.parser.add_argument('--batch-size', dest='batch_size', type=int, default=None, help='单个前向批次的最大行数')
+        self.parser.add_argument('--max-latency-ms', dest='max_latency_ms', type=float, default=None, help='微批等待上限（毫秒）')
+        self.parser.add_argument('--workers', type=int, default=None, help='推理线程数')
+        self.parser.add_argument('--threads', dest='num_threads', type=int, default=None, help='torch 计算线程总数')
+        self.parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=None, help='输入按块读取的行数')
+        self.parser.add_argument('--width', type=int, default=None, help='token 定长宽度（默认按模板长度 + 首尾标记）')
+        self.parser.add_argument('--debug', action='store_true', default=False, help='是否开启debug模式')
+
+    def _check_parser(self, args: argparse.Namespace):
+        if not args.serve and not args.library and (not args.input or not args.template):
+            raise ValueError("--input and --template are required unless --serve or --library is given")
+        return args
+
+
 class WorkdirParser:
     def __init__(self):
         self.parser = argparse.ArgumentParser(description='Infra 工作目录参数', add_help=False)
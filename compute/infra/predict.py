@@ -0,0 +1,644 @@
+"""
+批量推理 / 打分（Predict）
+目标：
+- 模型只加载一次（exp_plan.json + model.pth + normalization.json），对大规模突变体库打分
+- 突变描述按模板向量化编码：模板编码一次，突变体在 token 矩阵上做花式索引替换，不逐条拼接字符串
+- 嵌入复用训练侧的 build_embedder，预测值经归一化状态逆变换回原始标签空间
+- 微批（MicroBatcher）：并发请求的小批次合并为一个前向批次，首个请求等待不超过 max_latency_ms
+- workers 个推理线程并行前向（torch 计算期间释放 GIL），每个线程分到 num_threads / workers 个计算线程
+- 结果按块流式产出：命令行逐块写出，HTTP 服务以 NDJSON 分块响应
+
+命令行（infra-predict）：
+    infra-predict <experiment> --input mutants.txt --template <序列> [--output out.csv]
+    infra-predict <experiment> --library spec.json [--template <序列>] [--output out.npz]   # 饱和突变库，见 mutagenesis.py
+    infra-predict <experiment> --serve --port 8700 [--template <默认序列>]
+<experiment> 可以是实验目录，也可以是工作目录 experiments/ 下的实验 id
+
+HTTP 服务：
+- GET /health：{"status": "ok", "experiment": ...}
+- POST /predict：请求体 {"mutants": ["A1C", "A1C:D5E", ...], "template": 可选（缺省用启动时的模板）}
+  响应 application/x-ndjson，每个块一行 {"offset": 起始下标, "scores": [...]}（无法编码的突变体为 null），
+  最后一行 {"done": true, "count": 总数, "invalid": 无效条数}
+
+配置（exp_plan["predict"]，命令行参数优先，均可省略）：
+    "predict": {
+        "batch_size": 4096,       # 单个前向批次的最大行数
+        "max_latency_ms": 10,     # 微批等待上限
+        "workers": 1,             # 推理线程数
+        "num_threads": null,      # torch 计算线程总数，默认 = CPU 核数
+        "chunk_size": 65536       # 输入按块读取 / 编码的行数
+    }
+"""
+import io
+import os
+import csv
+import json
+import time
+import queue
+import logging
+import threading
+from pathlib import Path
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional, List, Iterable, Iterator, Tuple
+import numpy as np
+import torch
+from .vocab import get_vocab_processor
+from .embed import build_embedder
+from .data import parse_mutations
+from .normalize import load_normalization
+from .engine import build_model, train_config
+
+logger = logging.getLogger(__name__)
+
+PREDICT_DEFAULTS: Dict[str, Any] = {
+    "batch_size": 4096,
+    "max_latency_ms": 10.0,
+    "workers": 1,
+    "num_threads": None,
+    "chunk_size": 65536,
+}
+
+
+def predict_config(exp_plan: Dict[str, Any], overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    cfg = dict(PREDICT_DEFAULTS)
+    cfg.update(exp_plan.get("predict") or {})
+    cfg.update({k: v for k, v in (overrides or {}).items() if v is not None})
+    return cfg
+
+
+def _fragment_count(mutant: Optional[str]) -> int:
+    """
+    突变描述中的片段数（':' 与空白分隔）；None 返回 -1（缺失值，不可能与解析结果相符），空串 / WT 返回 0
+    """
+    if mutant is None:
+        return -1
+    text = str(mutant).strip()
+    if not text or text.upper() == "WT":
+        return 0
+    return len(text.replace(":", " ").split())
+
+
+class MutantEncoder:
+    """
+    以模板为基准的向量化编码器：
+    - encode(mutants)：突变描述 -> (tokens [N, W], mut_num [N], valid [N])
+    - encode_substitutions(rows, pos, ids, n)：已解析的 (行号, 0 起始位点, 新残基 id) -> tokens，供突变体生成器直接调用
+    无效突变体保留模板序列并在 valid 中标记为 False：
+    - 位点越界 / 原残基与模板不符
+    - 存在无法解析的片段（解析出的突变数与 ':' 分隔的片段数不符，如 'A1C:xx'；非 WT 的非空串解析出 0 个突变亦然）
+    - 同一位点出现多次（如 'A1C:A1D'）
+    - 缺失值（None）；空串与 WT 表示野生型，有效
+    """
+    def __init__(self, template: str, vocab_name: Optional[str], width: Optional[int] = None):
+        self.template = str(template).strip().upper()
+        if not self.template:
+            raise RuntimeError("predict:template_required")
+        proc = get_vocab_processor(vocab_name or "IUPAC")
+        p = proc.policy()
+        self.pad_id, self.unk_id = int(p["pad_id"]), int(p["unk_id"])
+        base = proc.encode_batch([self.template])[0]
+        if width is not None and int(width) != base.shape[0]:
+            if int(width) < len(self.template) + 2:
+                raise RuntimeError("predict:width_too_small")
+            # 与训练时的定长规则一致：首标记 + 序列 + <pad>... + 尾标记
+            wide = np.full(int(width), self.pad_id, dtype=np.int32)
+            wide[:len(self.template) + 1] = base[:len(self.template) + 1]
+            wide[-1] = base[-1]
+            base = wide
+        self.base = base
+        self.width = int(base.shape[0])
+        self.length = len(self.template)
+        self.template_bytes = np.frombuffer(self.template.encode("ascii"), dtype=np.uint8)
+        # ASCII -> 词表 id 查找表（大小写均映射到同一 id）
+        self.lut = np.full(256, self.unk_id, dtype=np.int32)
+        top = max(list(p["id_map"].values()) + [self.pad_id, self.unk_id, int(p["head_id"]), int(p["tail_id"])])
+        self.id_to_char = np.full(top + 1, ord("X"), dtype=np.uint8)
+        for tok, i in p["id_map"].items():
+            if len(tok) == 1 and ord(tok) < 128:
+                self.lut[ord(tok.upper())] = int(i)
+                self.lut[ord(tok.lower())] = int(i)
+                self.id_to_char[int(i)] = ord(tok.upper())
+
+    def encode_substitutions(self, rows: np.ndarray, pos: np.ndarray, ids: np.ndarray, n: int) -> np.ndarray:
+        tokens = np.repeat(self.base[None, :], n, axis=0)
+        tokens[rows, pos + 1] = ids
+        return tokens
+
+    def encode(self, mutants: List[Optional[str]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        n = len(mutants)
+        rows, pos, wt, mt = parse_mutations(mutants)
+        ok = pos < self.length
+        ok[ok] &= self.template_bytes[pos[ok]] == wt[ok]
+        mut_num = np.bincount(rows, minlength=n).astype(np.int32)
+        # parse_mutations 静默忽略无法解析的片段：片段数与解析出的突变数不一致即为无效
+        valid = mut_num == np.fromiter((_fragment_count(m) for m in mutants), dtype=np.int64, count=n)
+        valid[rows[~ok]] = False
+        if rows.size:
+            order = np.lexsort((pos, rows))
+            r, p = rows[order], pos[order]
+            dup = (r[1:] == r[:-1]) & (p[1:] == p[:-1])
+            valid[r[1:][dup]] = False
+        keep = ok & valid[rows]
+        tokens = self.encode_substitutions(rows[keep], pos[keep], self.lut[mt[keep]], n)
+        return tokens, mut_num, valid
+
+    def texts(self, tokens: np.ndarray) -> List[str]:
+        """
+        token 矩阵还原为序列字符串（仅在嵌入实现只支持文本输入时使用）
+        """
+        chars = np.ascontiguousarray(self.id_to_char[tokens[:, 1:1 + self.length]])
+        return [b.decode("ascii") for b in chars.view(f"S{self.length}").reshape(-1)]
+
+
+class Predictor:
+    """
+    已训练模型的推理封装：
+    - encoder(template)：按模板缓存编码器
+    - predict_tokens(tokens, encoder)：一个批次前向，返回原始标签空间的预测值（float32）
+    - score(mutants, template)：小批量便捷接口，返回 (预测值, valid)
+    线程安全：前向只读模型参数，可被多个推理线程同时调用
+    """
+    def __init__(self, experiment_dir: Path, weights: Optional[Path] = None, width: Optional[int] = None):
+        self.dir = Path(experiment_dir)
+        plan_path = self.dir / "exp_plan.json"
+        if not plan_path.exists():
+            raise RuntimeError(f"predict:experiment_not_found {self.dir}")
+        with open(plan_path, "r", encoding="utf-8") as f:
+            self.exp_plan: Dict[str, Any] = json.load(f)
+        weights = Path(weights) if weights else self.dir / "model.pth"
+        if not weights.exists():
+            raise RuntimeError(f"predict:weights_not_found {weights}")
+        self.model = build_model(self.exp_plan)
+        self.model.load_state_dict(torch.load(weights, map_location="cpu", weights_only=True))
+        self.model.eval()
+        self.train_cfg = train_config(self.exp_plan)
+        self.bf16 = str(self.train_cfg.get("precision")).lower() == "bf16"
+        self.norm = load_normalization(self.dir / "normalization.json")
+        self.embedding = build_embedder(self.exp_plan)
+        self.vocab = self.exp_plan.get("vocab")
+        self.width = width
+        self._encoders: "OrderedDict[str, MutantEncoder]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_ref(cls, ref: str, workdir: Optional[Path] = None, **kwargs) -> "Predictor":
+        """
+        ref 为实验目录或实验 id（在 <workdir>/experiments/ 下查找）
+        """
+        path = Path(ref)
+        if not (path / "exp_plan.json").exists() and workdir is not None:
+            path = Path(workdir) / "experiments" / ref
+        return cls(path, **kwargs)
+
+    def encoder(self, template: str) -> MutantEncoder:
+        key = str(template).strip().upper()
+        with self._lock:
+            enc = self._encoders.get(key)
+            if enc is not None:
+                self._encoders.move_to_end(key)
+                return enc
+        enc = MutantEncoder(key, self.vocab, self.width)
+        with self._lock:
+            self._encoders[key] = enc
+            while len(self._encoders) > 16:
+                self._encoders.popitem(last=False)
+        return enc
+
+    def _features(self, tokens: np.ndarray, encoder: MutantEncoder) -> Optional[np.ndarray]:
+        if self.embedding is None:
+            return None
+        embedder, caps, cfg = self.embedding
+        if caps.get("ids", False):
+            feats = embedder.embed_sequence_ids_batch(list(tokens), cfg)
+        elif caps.get("text", False):
+            feats = embedder.embed_sequence_text_batch(encoder.texts(tokens), cfg)
+        else:
+            return None
+        return np.ascontiguousarray(np.stack(feats).astype(np.float32, copy=False))
+
+    def predict_tokens(self, tokens: np.ndarray, encoder: MutantEncoder, mut_num: Optional[np.ndarray] = None) -> np.ndarray:
+        n = tokens.shape[0]
+        batch = {
+            "tokens": torch.from_numpy(np.ascontiguousarray(tokens, dtype=np.int64)),
+            "lengths": torch.full((n,), encoder.length, dtype=torch.int64),
+            "label": torch.zeros(n, dtype=torch.float32),
+            "mut_num": torch.from_numpy(mut_num if mut_num is not None else np.zeros(n, dtype=np.int32)),
+            "index": torch.arange(n, dtype=torch.int64),
+        }
+        features = self._features(tokens, encoder)
+        if features is not None:
+            batch["features"] = torch.from_numpy(features)
+        with torch.inference_mode(), torch.autocast(device_type="cpu", dtype=torch.bfloat16, enabled=self.bf16):
+            pred = self.model(batch)
+        pred = pred.float().reshape(-1).numpy()
+        if self.norm is not None:
+            pred = self.norm.inverse_transform(pred)
+        return np.asarray(pred, dtype=np.float32)
+
+    def score(self, mutants: List[Optional[str]], template: str) -> Tuple[np.ndarray, np.ndarray]:
+        enc = self.encoder(template)
+        tokens, mut_num, valid = enc.encode(mutants)
+        pred = self.predict_tokens(tokens, enc, mut_num)
+        pred[~valid] = np.nan
+        return pred, valid
+
+
+class _Piece:
+    __slots__ = ("tokens", "mut_num", "encoder", "future", "arrived")
+
+    def __init__(self, tokens: np.ndarray, mut_num: np.ndarray, encoder: MutantEncoder):
+        self.tokens = tokens
+        self.mut_num = mut_num
+        self.encoder = encoder
+        self.future: Future = Future()
+        self.arrived = time.monotonic()
+
+
+class MicroBatcher:
+    """
+    动态微批：
+    - submit(tokens, mut_num, encoder) -> Future[np.ndarray]：提交不超过 batch_size 行的块
+    - 推理线程取到第一个块后继续收集，直到行数达到 batch_size 或等待超过 max_latency_ms
+    - 同一批次内只合并相同模板（编码器）的块，其余块留给下一批次
+    """
+    def __init__(self, predictor: Predictor, batch_size: int = 4096, max_latency_ms: float = 10.0,
+                 workers: int = 1, num_threads: Optional[int] = None):
+        self.predictor = predictor
+        self.batch_size = max(1, int(batch_size))
+        self.max_latency = max(0.0, float(max_latency_ms)) / 1000.0
+        self.workers = max(1, int(workers))
+        total = int(num_threads) if num_threads else (os.cpu_count() or 1)
+        torch.set_num_threads(max(1, total // self.workers))
+        self._queue: "queue.Queue[Optional[_Piece]]" = queue.Queue()
+        self._carry: List[_Piece] = []
+        self._carry_lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._run, name=f"infra-predict-{i}", daemon=True) for i in range(self.workers)]
+        for t in self._threads:
+            t.start()
+        self.batches = 0
+        self.rows = 0
+
+    def submit(self, tokens: np.ndarray, mut_num: np.ndarray, encoder: MutantEncoder) -> Future:
+        piece = _Piece(tokens, mut_num, encoder)
+        self._queue.put(piece)
+        return piece.future
+
+    def _next(self, timeout: Optional[float]) -> Optional[_Piece]:
+        with self._carry_lock:
+            if self._carry:
+                return self._carry.pop(0)
+        return self._queue.get(timeout=timeout) if timeout is None or timeout > 0 else self._queue.get_nowait()
+
+    def _collect(self) -> Optional[List[_Piece]]:
+        first = self._next(None)
+        if first is None:
+            return None
+        pieces = [first]
+        rows = first.tokens.shape[0]
+        deadline = first.arrived + self.max_latency
+        while rows < self.batch_size:
+            try:
+                piece = self._next(deadline - time.monotonic())
+            except queue.Empty:
+                break
+            if piece is None:
+                # 停止信号放回，交给其它线程
+                self._queue.put(None)
+                break
+            if piece.encoder is not first.encoder or rows + piece.tokens.shape[0] > self.batch_size:
+                with self._carry_lock:
+                    self._carry.append(piece)
+                break
+            pieces.append(piece)
+            rows += piece.tokens.shape[0]
+        return pieces
+
+    def _run(self) -> None:
+        while True:
+            pieces = self._collect()
+            if pieces is None:
+                return
+            try:
+                tokens = pieces[0].tokens if len(pieces) == 1 else np.concatenate([p.tokens for p in pieces])
+                mut_num = pieces[0].mut_num if len(pieces) == 1 else np.concatenate([p.mut_num for p in pieces])
+                pred = self.predictor.predict_tokens(tokens, pieces[0].encoder, mut_num)
+            except Exception as e:
+                for p in pieces:
+                    p.future.set_exception(e)
+                continue
+            self.batches += 1
+            self.rows += tokens.shape[0]
+            start = 0
+            for p in pieces:
+                end = start + p.tokens.shape[0]
+                p.future.set_result(pred[start:end])
+                start = end
+
+    def close(self) -> None:
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+
+
+def _chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    chunk: List[Any] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_tokens(batcher: MicroBatcher, blocks: Iterable[Tuple[np.ndarray, np.ndarray, np.ndarray, MutantEncoder]],
+                  max_inflight: int = 8) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    按输入顺序流式产出 (预测值, valid)：blocks 为 (tokens, mut_num, valid, encoder) 的迭代器
+    每个块按 batch_size 切片提交，最多 max_inflight 个切片在途，先提交的先产出
+    """
+    inflight: deque = deque()
+    size = batcher.batch_size
+    for tokens, mut_num, valid, enc in blocks:
+        for s in range(0, tokens.shape[0], size):
+            inflight.append((batcher.submit(tokens[s:s + size], mut_num[s:s + size], enc), valid[s:s + size]))
+            while len(inflight) > max_inflight:
+                fut, v = inflight.popleft()
+                yield _masked(fut.result(), v), v
+    while inflight:
+        fut, v = inflight.popleft()
+        yield _masked(fut.result(), v), v
+
+
+def _masked(pred: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    if valid.all():
+        return pred
+    pred = pred.copy()
+    pred[~valid] = np.nan
+    return pred
+
+
+def _score_items(batcher: MicroBatcher, items: Iterable[Any], encode, encoder: MutantEncoder) -> Iterator[Tuple[Any, np.ndarray, np.ndarray]]:
+    """
+    逐项编码（encode(item) -> (tokens, mut_num, valid)）并流式打分，按输入顺序产出 (item, 预测值, valid)
+    """
+    pending: deque = deque()
+
+    def blocks():
+        for item in items:
+            tokens, mut_num, valid = encode(item)
+            pending.append((item, tokens.shape[0]))
+            yield tokens, mut_num, valid, encoder
+
+    preds: List[np.ndarray] = []
+    valids: List[np.ndarray] = []
+    count = 0
+    for pred, valid in stream_tokens(batcher, blocks()):
+        preds.append(pred)
+        valids.append(valid)
+        count += pred.shape[0]
+        # 切片不跨块：累计行数恰好等于队首块行数时该块完成
+        while pending and count >= pending[0][1]:
+            item, n = pending.popleft()
+            p, v = np.concatenate(preds), np.concatenate(valids)
+            yield item, p[:n], v[:n]
+            preds, valids, count = [p[n:]], [v[n:]], count - n
+
+
+def score_stream(batcher: MicroBatcher, mutants: Iterable[Optional[str]], template: str,
+                 chunk_size: int = 65536) -> Iterator[Tuple[List[Optional[str]], np.ndarray, np.ndarray]]:
+    """
+    对突变描述流逐块编码并打分，产出 (突变描述块, 预测值, valid)
+    """
+    enc = batcher.predictor.encoder(template)
+    yield from _score_items(batcher, _chunks(mutants, chunk_size), enc.encode, enc)
+
+
+def score_library(batcher: MicroBatcher, chunks: Iterable[Any], template: str) -> Iterator[Tuple[Any, np.ndarray]]:
+    """
+    对突变体生成器（mutagenesis.VariantLibrary.chunks）产出的变体块打分，产出 (变体块, 预测值)
+    变体以 (位点, 残基) 矩阵直接写入 token 矩阵，不经过字符串
+    """
+    enc = batcher.predictor.encoder(template)
+
+    def encode(chunk):
+        rows, pos, aa = chunk.substitutions()
+        tokens = enc.encode_substitutions(rows, pos, enc.lut[aa], len(chunk))
+        return tokens, chunk.mut_num, np.ones(len(chunk), dtype=bool)
+
+    for chunk, pred, _ in _score_items(batcher, chunks, encode, enc):
+        yield chunk, pred
+
+
+# HTTP 服务
+def _json_line(obj: Dict[str, Any]) -> bytes:
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _scores(pred: np.ndarray) -> List[Optional[float]]:
+    return [None if np.isnan(x) else float(x) for x in pred.tolist()]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "PredictServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug(f"predict:http {format % args}")
+
+    def _send_json(self, status: int, obj: Dict[str, Any]) -> None:
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] == "/health":
+            self._send_json(200, {"status": "ok", "experiment": str(self.server.predictor.dir),
+                                  "batches": self.server.batcher.batches, "rows": self.server.batcher.rows})
+        else:
+            self._send_json(404, {"detail": "Not found"})
+
+    def do_POST(self) -> None:
+        if self.path.split("?")[0] != "/predict":
+            self._send_json(404, {"detail": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            mutants = body.get("mutants")
+            template = body.get("template") or self.server.template
+            if not isinstance(mutants, list):
+                raise ValueError("mutants must be a list")
+            if not template:
+                raise ValueError("template is required")
+            enc = self.server.predictor.encoder(template)
+        except Exception as e:
+            self._send_json(400, {"detail": str(e)})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        offset = 0
+        invalid = 0
+        try:
+            for chunk, pred, valid in score_stream(self.server.batcher, mutants, enc.template, self.server.batcher.batch_size):
+                self._chunk(_json_line({"offset": offset, "scores": _scores(pred)}))
+                offset += len(chunk)
+                invalid += int((~valid).sum())
+            self._chunk(_json_line({"done": True, "count": offset, "invalid": invalid}))
+        except Exception as e:
+            logger.warning(f"predict:request_failed error={e}")
+            self._chunk(_json_line({"done": False, "error": str(e), "count": offset}))
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class PredictServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], batcher: MicroBatcher, template: Optional[str] = None):
+        super().__init__(address, _Handler)
+        self.batcher = batcher
+        self.predictor = batcher.predictor
+        self.template = template
+
+
+# 命令行
+def _read_mutants(path: Path) -> Iterator[str]:
+    """
+    逐行读取突变描述：.csv / .tsv 取 mutant 列（无该列时取第一列），其它文本文件每行一个
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.suffix.lower() in (".csv", ".tsv"):
+            reader = csv.reader(f, delimiter="\t" if path.suffix.lower() == ".tsv" else ",")
+            header = next(reader, None) or []
+            col = header.index("mutant") if "mutant" in header else 0
+            if "mutant" not in header and header:
+                yield header[col]
+            for row in reader:
+                if row:
+                    yield row[col]
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+
+
+def _read_template(template: Optional[str]) -> Optional[str]:
+    """
+    模板可以直接是序列，也可以是文件路径（FASTA 或纯文本，忽略 '>' 开头的行）
+    """
+    if not template:
+        return None
+    p = Path(template)
+    if p.exists():
+        lines = p.read_text(encoding="utf-8").splitlines()
+        return "".join(l.strip() for l in lines if l.strip() and not l.startswith(">"))
+    return template
+
+
+def run_library(batcher: MicroBatcher, spec: Dict[str, Any], template: Optional[str], output: Path,
+                chunk_size: int = 65536) -> Path:
+    """
+    按库配置枚举变体（可排除数据库中已有的变体）并打分，结果写为列式 npz：
+    pos [N, K]（1 起始，-1 填充）、aa [N, K]（新残基 ASCII）、mut_num [N]、score [N]、template
+    """
+    from .mutagenesis import MutationIndex, library_from_spec, source_template
+    existing = spec.get("exclude_existing") or {}
+    template = template or spec.get("template")
+    if not template and existing.get("db") and existing.get("source") is not None:
+        template = source_template(Path(existing["db"]), existing["source"])
+    if not template:
+        raise RuntimeError("predict:template_required")
+    library = library_from_spec(spec, template)
+    index = None
+    if existing.get("db"):
+        index, _ = MutationIndex.from_db(Path(existing["db"]), template, existing.get("source"), order=library.order,
+                                         table=existing.get("table") or "mutations")
+    logger.info(f"predict:library mode={library.mode} total={library.total} order={library.order} existing={len(index) if index else 0}")
+    pos: List[np.ndarray] = []
+    aa: List[np.ndarray] = []
+    mut_num: List[np.ndarray] = []
+    scores: List[np.ndarray] = []
+    t0 = time.perf_counter()
+    for chunk, pred in score_library(batcher, library.chunks(chunk_size, index), template):
+        pos.append(np.where(chunk.pos >= 0, chunk.pos + 1, -1).astype(np.int32))
+        aa.append(chunk.aa)
+        mut_num.append(chunk.mut_num)
+        scores.append(pred)
+    k = library.order
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp = output.with_name(output.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(f,
+                 pos=np.concatenate(pos) if pos else np.zeros((0, k), dtype=np.int32),
+                 aa=np.concatenate(aa) if aa else np.zeros((0, k), dtype=np.uint8),
+                 mut_num=np.concatenate(mut_num) if mut_num else np.zeros(0, dtype=np.int32),
+                 score=np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32),
+                 template=np.asarray(template))
+    os.replace(tmp, output)
+    rows = sum(len(x) for x in scores)
+    elapsed = time.perf_counter() - t0
+    logger.info(f"predict:library_done rows={rows} seconds={elapsed:.2f} rows_per_sec={rows / elapsed if elapsed > 0 else 0:.0f} output={output}")
+    return output
+
+
+def run_predict(experiment: str, input_path: Optional[str] = None, output_path: Optional[str] = None,
+                template: Optional[str] = None, serve: bool = False, host: str = "127.0.0.1", port: int = 8700,
+                overrides: Optional[Dict[str, Any]] = None, width: Optional[int] = None,
+                workdir: Optional[Path] = None, library: Optional[str] = None) -> Optional[Path]:
+    predictor = Predictor.from_ref(experiment, workdir, width=width)
+    cfg = predict_config(predictor.exp_plan, overrides)
+    batcher = MicroBatcher(predictor, cfg["batch_size"], cfg["max_latency_ms"], cfg["workers"], cfg.get("num_threads"))
+    template = _read_template(template)
+    try:
+        if library:
+            with open(library, "r", encoding="utf-8") as f:
+                spec = json.load(f)
+            out = Path(output_path) if output_path else predictor.dir / "predictions" / f"{Path(library).stem}.npz"
+            return run_library(batcher, spec, template, out, int(cfg["chunk_size"]))
+        if serve:
+            server = PredictServer((host, int(port)), batcher, template)
+            logger.info(f"predict:serving host={host} port={port} workers={batcher.workers} batch_size={batcher.batch_size}")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+            return None
+        if not input_path or not template:
+            raise RuntimeError("predict:input_and_template_required")
+        src = Path(input_path)
+        out = Path(output_path) if output_path else predictor.dir / "predictions" / f"{src.stem}.csv"
+        out.parent.mkdir(parents=True, exist_ok=True)
+        tmp = out.with_name(out.name + ".tmp")
+        total = 0
+        invalid = 0
+        t0 = time.perf_counter()
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            f.write("mutant,score\n")
+            for chunk, pred, valid in score_stream(batcher, _read_mutants(src), template, int(cfg["chunk_size"])):
+                buf = io.StringIO()
+                for m, s in zip(chunk, pred.tolist()):
+                    buf.write(f"{'' if m is None else m},{'' if s != s else repr(s)}\n")
+                f.write(buf.getvalue())
+                total += len(chunk)
+                invalid += int((~valid).sum())
+        os.replace(tmp, out)
+        elapsed = time.perf_counter() - t0
+        logger.info(f"predict:done rows={total} invalid={invalid} seconds={elapsed:.2f} "
+                    f"rows_per_sec={total / elapsed if elapsed > 0 else 0:.0f} output={out}")
+        return out
+    finally:
+        batcher.close()
@@ -3,6 +3,7 @@
 - 负责创建标准化的实验目录结构，并写入快照与元信息
 """
 import json
+import hashlib
 from typing import Any, Dict
 import datetime
 from pathlib import Path
@@ -21,6 +22,7 @@ class ExperimentRecorder:
         self.pth = self.base / "model.pth"  #记录实验训练好的模型权重
         self.labels = self.base / "labels.npz"  #记录实验数据的标签
         self.metrics = self.base / "metrics.json"  #记录实验结果指标
+        self.normalization = self.base / "normalization.json"  #记录归一化拟合状态，推理时复用
         self.visualization = self.base / "visualization"  #记录实验可视化结果的图片
 
         # 确保所有子目录存在
@@ -30,4 +32,28 @@ class ExperimentRecorder:
             self.visualization,
         ]:d.mkdir(parents=True, exist_ok=True)
 
+    def save_exp_plan(self, exp_plan: Dict[str, Any]):
+        """写出本次实验计划快照"""
+        with open(self.exp_plan_config, "w", encoding="utf-8") as f:
+            json.dump(exp_plan, f, ensure_ascii=False, indent=2)
+
+    def write_metrics(self, metrics: Dict[str, Any]):
+        """写出实验结果指标（先写临时文件再替换，避免读到半截文件）"""
+        tmp = self.metrics.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(metrics, f, ensure_ascii=False, indent=2)
+        tmp.replace(self.metrics)
+
+
+def experiment_id_of(exp_plan: Dict[str, Any]) -> str:
+    """
+    实验标识：优先使用 exp_plan["experiment_id"]；
+    否则取实验计划规范化 JSON 的摘要，保证同一计划重复执行落到同一目录
+    """
+    eid = exp_plan.get("experiment_id")
+    if eid:
+        return str(eid)
+    raw = json.dumps(exp_plan, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return "exp-" + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
 
@@ -1,5 +1,6 @@
 
-from typing import Dict, Type, Callable, Optional, Any
+import threading
+from typing import Dict, Type, Callable, Optional, Any, List
 from .model import ProteinModel
 
 """
@@ -7,15 +8,23 @@ from .model import ProteinModel
 作用：
 - 在包内部提供一个全局的注册与查询对象 registry
 - 管理以下类型的对象：模型（models）、词表（vocabs）、嵌入（embeds）、指标（metrics）、数据划分（divisions）、归一化（normalizations）
-- 仅支持“装饰器式注册”，被注册对象均为“类或函数”，查询返回类/可调用（不返回实例）
+- 仅支持“装饰器式注册”，被注册对象均为“类或函数”，查询返回类/可调用
 - 键大小写不敏感，统一归一化为小写
-- 重复注册同名键时抛 KeyError
+- 重复注册同名键时抛 KeyError；包内置实现（builtin=True）例外：与工作目录插件同名时由插件生效
+- 六类对象共用同一套插件表（_PluginTable），注册/查询逻辑只实现一次
+- 无状态插件（词表、指标）可通过 get_instance 获取进程内单例，避免每次调用都重新实例化
 
 设计要点：
 - 与 TAPE 的注册体验保持一致（装饰器/查询），但不引入“任务”概念
 - 工作目录插件通过 import 加载模块，模块内使用装饰器完成注册
-- 嵌入（embed）注册时允许声明 capabilities（例如 ids/text 接口支持情况）
-- division/normalization 不需要能力声明，采用约定的接口方法完成路由
+- 所有插件注册时均可声明 capabilities（能力声明），供调度方决定并行方式：
+  - batchable：是否支持批量接口
+  - thread_safe：同一实例能否被多线程并发调用
+  - process_safe：能否在子进程中独立运行（可 pickle、无全局副作用）
+  - batch_size：推荐批大小（None 表示不限）
+  - memory_mb：单实例的估计内存占用（MB，None 表示未知）
+  - stateless：是否无状态；无状态插件由 get_instance 缓存为单例
+- 嵌入（embed）额外声明 ids/text 接口支持情况
 
 使用示例：
     from infra.registry import registry
@@ -51,34 +60,102 @@ from .model import ProteinModel
     metric_fn = registry.get_metric("mse")
     division_cls = registry.get_division("ratio")
     normalization_cls = registry.get_normalization("standard")
+    proc = registry.get_instance("vocab", "iupac")    # 无状态插件：返回缓存的单例
+    caps = registry.get_capabilities("metric", "mse") # 能力声明（含默认值）
 
 异常语义：
 - 未注册键：KeyError("registry:<type>_not_found <name>")
 - 重复注册：KeyError("registry:<type>_already_exists <name>")
 """
 
+# 能力声明的默认值；未声明的键按保守策略处理（不可并发、不可跨进程）
+DEFAULT_CAPABILITIES: Dict[str, Any] = {
+    "batchable": False,
+    "thread_safe": False,
+    "process_safe": False,
+    "batch_size": None,
+    "memory_mb": None,
+    "stateless": False,
+}
+
+# 默认视为无状态、可缓存单例的插件类型
+STATELESS_KINDS = ("vocab", "metric")
+
+
+class _PluginTable:
+    """
+    单一类型插件的注册表
+    - entries：name -> 类或函数
+    - caps：name -> 能力声明（已合并默认值）
+    - instances：name -> 缓存的单例（仅无状态插件）
+    - builtins：包内置实现的键；工作目录插件可覆盖同名内置实现，内置实现也不会覆盖已加载的插件
+    """
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.entries: Dict[str, Any] = {}
+        self.caps: Dict[str, Dict[str, Any]] = {}
+        self.instances: Dict[str, Any] = {}
+        self.builtins: set = set()
+        self.lock = threading.Lock()
+
+    def register(self, key: str, name: str, obj: Any, capabilities: Optional[Dict[str, Any]], builtin: bool = False) -> Any:
+        if key in self.entries:
+            if builtin:
+                return obj
+            if key not in self.builtins:
+                raise KeyError(f"registry:{self.kind}_already_exists {name}")
+            self.builtins.discard(key)
+            self.instances.pop(key, None)
+        elif builtin:
+            self.builtins.add(key)
+        caps = dict(DEFAULT_CAPABILITIES)
+        caps["stateless"] = self.kind in STATELESS_KINDS
+        caps.update(capabilities or {})
+        self.entries[key] = obj
+        self.caps[key] = caps
+        return obj
+
+    def get(self, key: str, name: str) -> Any:
+        obj = self.entries.get(key)
+        if obj is None:
+            raise KeyError(f"registry:{self.kind}_not_found {name}")
+        return obj
+
+    def instance(self, key: str, name: str) -> Any:
+        """
+        返回插件实例：
+        - 无状态插件：首次调用时实例化并缓存，后续直接返回同一对象
+        - 有状态插件：每次返回新实例
+        - 函数类插件（如指标）：返回函数本身
+        """
+        inst = self.instances.get(key)
+        if inst is not None:
+            return inst
+        obj = self.get(key, name)
+        if not isinstance(obj, type):
+            return obj
+        if not self.caps[key].get("stateless"):
+            return obj()
+        with self.lock:
+            inst = self.instances.get(key)
+            if inst is None:
+                inst = obj()
+                self.instances[key] = inst
+        return inst
+
+
 class Registry:
     """
     统一注册与查询的核心类
-    - 提供装饰器注册：register_model / register_vocab / register_embed / register_metric
-    - 提供查询：get_model / get_vocab / get_embed / get_metric / get_embed_capabilities
-    - 内部维护四类映射，均以规范化后的键（小写、去空格）存储
+    - 通用接口：register(kind, name, capabilities) / get(kind, name) / get_instance(kind, name) / get_capabilities(kind, name)
+    - 兼容接口：register_model / register_vocab / register_embed / register_metric / register_division / register_normalization
+      以及对应的 get_* 查询，均委托给通用接口
+    - 内部按类型维护 _PluginTable，均以规范化后的键（小写、去空格）存储
     """
+    KINDS = ("model", "vocab", "embed", "metric", "division", "normalization")
+
     def __init__(self):
-        # 模型类映射：name -> class
-        self._models: Dict[str, Type[Any]] = {}
-        # 词表类映射：name -> class
-        self._vocabs: Dict[str, Type[Any]] = {}
-        # 嵌入类映射：name -> class
-        self._embeds: Dict[str, Type[Any]] = {}
-        # 嵌入能力映射：name -> {"ids": bool, "text": bool}
-        self._embed_caps: Dict[str, Dict[str, bool]] = {}
-        # 指标函数映射：name -> callable
-        self._metrics: Dict[str, Callable] = {}
-        # 数据划分类映射：name -> class
-        self._divisions: Dict[str, Type[Any]] = {}
-        # 归一化类映射：name -> class
-        self._normalizations: Dict[str, Type[Any]] = {}
+        self._tables: Dict[str, _PluginTable] = {kind: _PluginTable(kind) for kind in self.KINDS}
 
     @staticmethod
     def _norm(name: str) -> str:
@@ -89,84 +166,133 @@ class Registry:
         """
         return (name or "").strip().lower()
 
+    def _table(self, kind: str) -> _PluginTable:
+        table = self._tables.get(kind)
+        if table is None:
+            raise KeyError(f"registry:unknown_kind {kind}")
+        return table
+
+    # 通用接口
+    def register(self, kind: str, name: str, capabilities: Optional[Dict[str, Any]] = None, builtin: bool = False) -> Callable[[Any], Any]:
+        """
+        通用注册装饰器
+        - builtin=True 仅供包内置实现使用：与工作目录插件同名时让位于插件
+        用法：
+            @registry.register("metric", "spearman", capabilities={"batchable": True, "thread_safe": True})
+            def spearman(...): ...
+        """
+        table = self._table(kind)
+        key = self._norm(name)
+        def wrap(obj: Any) -> Any:
+            table.register(key, name, obj, capabilities, builtin)
+            if isinstance(obj, type) and table.entries.get(key) is obj:
+                setattr(obj, "__plugin_capabilities__", table.caps[key])
+            return obj
+        return wrap
+
+    def get(self, kind: str, name: str) -> Any:
+        """
+        查询已注册的类或函数（使用者负责实例化）
+        """
+        table = self._table(kind)
+        obj = table.entries.get(name)
+        if obj is not None:
+            return obj
+        return table.get(self._norm(name), name)
+
+    def get_instance(self, kind: str, name: str) -> Any:
+        """
+        查询插件实例；无状态插件返回进程内缓存的单例
+        """
+        return self._table(kind).instance(self._norm(name), name)
+
+    def get_capabilities(self, kind: str, name: str) -> Dict[str, Any]:
+        """
+        查询插件能力声明（已合并默认值）
+        """
+        table = self._table(kind)
+        key = self._norm(name)
+        if key not in table.caps:
+            raise KeyError(f"registry:{kind}_not_found {name}")
+        return table.caps[key]
+
+    def names(self, kind: str) -> List[str]:
+        """
+        列出某类插件的全部已注册键名
+        """
+        return sorted(self._table(kind).entries.keys())
+
+    def describe(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """
+        返回全部插件的能力声明：{kind: {name: caps}}，供调度方或前端展示
+        """
+        return {kind: {k: dict(v) for k, v in t.caps.items()} for kind, t in self._tables.items()}
+
+    def clear_instances(self, kind: Optional[str] = None) -> None:
+        """
+        清空单例缓存（插件重新加载后调用）
+        """
+        for k, t in self._tables.items():
+            if kind is None or k == kind:
+                with t.lock:
+                    t.instances.clear()
+
     # 模型
-    def register_model(self, name: str) -> Callable[[Type[Any]], Type[Any]]:
+    def register_model(self, name: str, capabilities: Optional[Dict[str, Any]] = None) -> Callable[[Type[Any]], Type[Any]]:
         """
         注册模型类的装饰器
         用法：
             @registry.register_model("mlp")
             class MLP(...): ...
         """
-        key = self._norm(name)
-        def wrap(cls: Type[Any]) -> Type[Any]:
-            if key in self._models:
-                raise KeyError(f"registry:model_already_exists {name}")
-            self._models[key] = cls
-            return cls
-        return wrap
+        return self.register("model", name, capabilities)
 
     def get_model(self, name: str) -> Type[Any]:
         """
         查询模型类
         返回：模型类（使用者负责实例化）
         """
-        key = self._norm(name)
-        if key not in self._models:
-            raise KeyError(f"registry:model_not_found {name}")
-        return self._models[key]
+        return self.get("model", name)
 
     # 词表
-    def register_vocab(self, name: str) -> Callable[[Type[Any]], Type[Any]]:
+    def register_vocab(self, name: str, capabilities: Optional[Dict[str, Any]] = None) -> Callable[[Type[Any]], Type[Any]]:
         """
         注册词表处理类的装饰器
         用法：
             @registry.register_vocab("IUPAC")
             class IUPACProcessor(...): ...
         """
-        key = self._norm(name)
-        def wrap(cls: Type[Any]) -> Type[Any]:
-            if key in self._vocabs:
-                raise KeyError(f"registry:vocab_already_exists {name}")
-            self._vocabs[key] = cls
-            return cls
-        return wrap
+        return self.register("vocab", name, capabilities)
 
     def get_vocab(self, name: str) -> Type[Any]:
         """
         查询词表处理类
         返回：词表类（使用者负责实例化）
         """
-        key = self._norm(name)
-        if key not in self._vocabs:
-            raise KeyError(f"registry:vocab_not_found {name}")
-        return self._vocabs[key]
+        return self.get("vocab", name)
 
     # 嵌入
-    def register_embed(self, name: str, capabilities: Optional[Dict[str, bool]] = None) -> Callable[[Type[Any]], Type[Any]]:
+    def register_embed(self, name: str, capabilities: Optional[Dict[str, Any]] = None) -> Callable[[Type[Any]], Type[Any]]:
         """
         注册嵌入处理类的装饰器
         参数：
             name: 嵌入方法名称
-            capabilities: 能力声明字典（可选），目前使用键：
+            capabilities: 能力声明字典（可选），除通用能力外使用键：
                 - "ids": 是否支持基于 ID 序列的接口（df["sequence"]）
                 - "text": 是否支持基于文本序列的接口（df["sequence_text"]）
         用法：
             @registry.register_embed("onehot", capabilities={"ids": True, "text": False})
             class OneHotEmbed(...): ...
         """
-        key = self._norm(name)
-        caps = capabilities or {}
+        caps = dict(capabilities or {})
+        # 记录接口能力；缺省为 False
+        caps["ids"] = bool(caps.get("ids", False))
+        caps["text"] = bool(caps.get("text", False))
+        inner = self.register("embed", name, caps)
         def wrap(cls: Type[Any]) -> Type[Any]:
-            if key in self._embeds:
-                raise KeyError(f"registry:embed_already_exists {name}")
-            self._embeds[key] = cls
-            # 记录能力；缺省为 False
-            self._embed_caps[key] = {
-                "ids": bool(caps.get("ids", False)),
-                "text": bool(caps.get("text", False)),
-            }
-            # 将能力也写入类属性，便于外部读取
-            setattr(cls, "__embed_capabilities__", self._embed_caps[key])
+            inner(cls)
+            # 将接口能力也写入类属性，便于外部读取
+            setattr(cls, "__embed_capabilities__", {"ids": caps["ids"], "text": caps["text"]})
             return cls
         return wrap
 
@@ -175,10 +301,7 @@ class Registry:
         查询嵌入处理类
         返回：嵌入类（使用者负责实例化）
         """
-        key = self._norm(name)
-        if key not in self._embeds:
-            raise KeyError(f"registry:embed_not_found {name}")
-        return self._embeds[key]
+        return self.get("embed", name)
 
     def get_embed_capabilities(self, name: str) -> Dict[str, bool]:
         """
@@ -186,67 +309,41 @@ class Registry:
         返回：{"ids": bool, "text": bool}
         """
         key = self._norm(name)
-        if key not in self._embed_caps:
+        caps = self._table("embed").caps.get(key)
+        if caps is None:
             raise KeyError(f"registry:embed_caps_not_found {name}")
-        return self._embed_caps[key]
+        return {"ids": caps["ids"], "text": caps["text"]}
 
     # 指标
-    def register_metric(self, name: str) -> Callable[[Callable], Callable]:
+    def register_metric(self, name: str, capabilities: Optional[Dict[str, Any]] = None, builtin: bool = False) -> Callable[[Callable], Callable]:
         """
         注册指标函数的装饰器
         用法：
             @registry.register_metric("mse")
             def mean_squared_error(...): ...
         """
-        key = self._norm(name)
-        def wrap(fn: Callable) -> Callable:
-            if key in self._metrics:
-                raise KeyError(f"registry:metric_already_exists {name}")
-            self._metrics[key] = fn
-            return fn
-        return wrap
+        return self.register("metric", name, capabilities, builtin)
 
     def get_metric(self, name: str) -> Callable:
         """
         查询指标函数
         返回：可调用函数
         """
-        key = self._norm(name)
-        if key not in self._metrics:
-            raise KeyError(f"registry:metric_not_found {name}")
-        return self._metrics[key]
+        return self.get("metric", name)
 
     # 数据划分
-    def register_division(self, name: str) -> Callable[[Type[Any]], Type[Any]]:
-        key = self._norm(name)
-        def wrap(cls: Type[Any]) -> Type[Any]:
-            if key in self._divisions:
-                raise KeyError(f"registry:division_already_exists {name}")
-            self._divisions[key] = cls
-            return cls
-        return wrap
+    def register_division(self, name: str, capabilities: Optional[Dict[str, Any]] = None, builtin: bool = False) -> Callable[[Type[Any]], Type[Any]]:
+        return self.register("division", name, capabilities, builtin)
 
     def get_division(self, name: str) -> Type[Any]:
-        key = self._norm(name)
-        if key not in self._divisions:
-            raise KeyError(f"registry:division_not_found {name}")
-        return self._divisions[key]
+        return self.get("division", name)
 
     # 归一化
-    def register_normalization(self, name: str) -> Callable[[Type[Any]], Type[Any]]:
-        key = self._norm(name)
-        def wrap(cls: Type[Any]) -> Type[Any]:
-            if key in self._normalizations:
-                raise KeyError(f"registry:normalization_already_exists {name}")
-            self._normalizations[key] = cls
-            return cls
-        return wrap
+    def register_normalization(self, name: str, capabilities: Optional[Dict[str, Any]] = None, builtin: bool = False) -> Callable[[Type[Any]], Type[Any]]:
+        return self.register("normalization", name, capabilities, builtin)
 
     def get_normalization(self, name: str) -> Type[Any]:
-        key = self._norm(name)
-        if key not in self._normalizations:
-            raise KeyError(f"registry:normalization_not_found {name}")
-        return self._normalizations[key]
+        return self.get("normalization", name)
 
 # 全局唯一注册对象；包内与工作目录插件统一使用该对象进行注册与查询
 registry = Registry()
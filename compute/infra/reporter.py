@@ -0,0 +1,305 @@
+"""
+训练状态上报（Reporter）
+目标：
+- 训练循环只做非阻塞的入队操作，Redis 往返全部放在后台线程
+- 步级指标（step）在后台线程中合并为周期性摘要（count / mean / min / max / last），不逐步上报
+- 每次 flush 用一个 pipeline 发送：每个队列一次 RPUSH（携带多条载荷），一次网络往返
+- Redis 变慢或不可用时不阻塞训练：
+  - 入队使用有界队列，满时丢弃步级事件，只计数（摘要中带 dropped）
+  - 发送失败的载荷暂存并在下次 flush 重试；暂存超过上限时丢弃最旧的状态载荷，结果载荷始终保留
+- 背压：每次 flush 在同一个 pipeline 中读取 master 监控写入的 QUEUE_HEALTH_KEY，并取 RPUSH 返回的状态队列长度；
+  master 判为背压或状态队列长度超过 backlog_threshold 时，步级摘要改为每 coalesce_factor 个 flush 周期才上报一次
+  （期间继续在内存中合并），epoch 记录与结果载荷不受影响
+
+载荷格式（与 master 侧 saver 约定：必须带 pid / jid）：
+- 状态队列（STATE_QUEUE_NAME）：
+  {"pid", "jid", "type": "step_summary", "time", "epoch", "step", "count", "dropped", "metrics": {名称: {mean, min, max, last}}}
+  {"pid", "jid", "type": "epoch", "time", "progress", ...epoch 记录}
+- 结果队列（RESULT_QUEUE_NAME）：{"pid", "jid", "type": "result", "time", ...}
+
+配置（exp_plan["report"]，缺少 pid / jid 时不上报）：
+    "report": {
+        "pid": "p1",
+        "jid": "job_id1700000000",
+        "redis_url": null,          # 默认读取环境变量 REDIS_URL
+        "interval": 2.0,            # flush 周期（秒）
+        "queue_size": 4096,         # 训练线程 -> 后台线程的有界队列长度
+        "max_pending": 1000,        # 发送失败时暂存的状态载荷上限
+        "backlog_threshold": 10000, # 状态队列积压超过该条数时视为背压，默认读取环境变量 STATE_BACKLOG_THRESHOLD
+        "coalesce_factor": 5        # 背压期间步级摘要的上报周期（flush 周期的倍数）
+    }
+"""
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from typing import Dict, Any, Optional, List
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis-queue:6379/0")
+STATE_QUEUE_NAME = os.environ.get("STATE_QUEUE_NAME", "state-queue")
+RESULT_QUEUE_NAME = os.environ.get("RESULTS_QUEUE_NAME", os.environ.get("RESULT_QUEUE_NAME", "results-queue"))
+REPORT_SOCKET_TIMEOUT = float(os.environ.get("REPORT_SOCKET_TIMEOUT", "2"))
+QUEUE_HEALTH_KEY = os.environ.get("QUEUE_HEALTH_KEY", "queue:health")
+STATE_BACKLOG_THRESHOLD = int(os.environ.get("STATE_BACKLOG_THRESHOLD", "10000"))
+
+_STEP = "step"
+_STATE = "state"
+_RESULT = "result"
+_STOP = "stop"
+
+
+class _StepSummary:
+    """
+    步级指标合并：数值字段按名称累计 count / sum / min / max / last
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.count = 0
+        self.epoch = None
+        self.step = None
+        self.stats: Dict[str, List[float]] = {}
+
+    def add(self, info: Dict[str, Any]) -> None:
+        self.count += 1
+        self.epoch = info.get("epoch", self.epoch)
+        self.step = info.get("step", self.step)
+        for k, v in info.items():
+            if k in ("epoch", "step", "event") or isinstance(v, bool) or not isinstance(v, (int, float)):
+                continue
+            v = float(v)
+            s = self.stats.get(k)
+            if s is None:
+                self.stats[k] = [1.0, v, v, v, v]
+            else:
+                s[0] += 1.0
+                s[1] += v
+                s[2] = min(s[2], v)
+                s[3] = max(s[3], v)
+                s[4] = v
+
+    def payload(self) -> Dict[str, Any]:
+        return {
+            "type": "step_summary",
+            "epoch": self.epoch,
+            "step": self.step,
+            "count": self.count,
+            "metrics": {k: {"mean": s[1] / s[0], "min": s[2], "max": s[3], "last": s[4]} for k, s in self.stats.items()},
+        }
+
+
+class Reporter:
+    """
+    - report_step(info)：步级指标（合并后上报，队列满时丢弃）
+    - report_state(obj)：状态载荷（不合并，例如每个 epoch 的记录）
+    - report_result(obj)：结果载荷（不丢弃）
+    - on_train_event(engine, info)：可直接作为 TrainEngine 的回调
+    - close(timeout)：停止后台线程并做最后一次 flush
+    - backpressure：最近一次 flush 观察到的背压状态；coalesced：因背压推迟上报步级摘要的次数
+    client 可注入（需提供 pipeline(transaction=False)），便于替换连接实现
+    """
+    def __init__(self, pid: str, jid: str, redis_url: Optional[str] = None, interval: float = 2.0,
+                 queue_size: int = 4096, max_pending: int = 1000, client=None,
+                 state_key: Optional[str] = None, result_key: Optional[str] = None,
+                 backlog_threshold: Optional[int] = None, coalesce_factor: int = 5,
+                 health_key: Optional[str] = None):
+        self.pid = str(pid)
+        self.jid = str(jid)
+        self.interval = max(0.05, float(interval))
+        self.max_pending = max(1, int(max_pending))
+        self.state_key = state_key or STATE_QUEUE_NAME
+        self.result_key = result_key or RESULT_QUEUE_NAME
+        self.health_key = health_key or QUEUE_HEALTH_KEY
+        self.backlog_threshold = int(backlog_threshold if backlog_threshold is not None else STATE_BACKLOG_THRESHOLD)
+        self.coalesce_factor = max(1, int(coalesce_factor))
+        if client is None:
+            from redis import Redis
+            client = Redis.from_url(redis_url or REDIS_URL, socket_timeout=REPORT_SOCKET_TIMEOUT,
+                                    socket_connect_timeout=REPORT_SOCKET_TIMEOUT)
+        self.client = client
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, int(queue_size)))
+        # 结果载荷不经过有界队列，避免被丢弃；_results_lock 同时保护 dropped 计数（训练线程与后台线程都会累加）
+        self._results: List[Dict[str, Any]] = []
+        self._results_lock = threading.Lock()
+        self._summary = _StepSummary()
+        self._pending_state: List[str] = []
+        self._pending_result: List[str] = []
+        self.dropped = 0
+        self._dropped_reported = 0
+        self.sent = 0
+        self.failures = 0
+        self.backpressure = False
+        self.coalesced = 0
+        self._last_summary = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="infra-reporter", daemon=True)
+        self._started = False
+
+    @classmethod
+    def from_exp_plan(cls, exp_plan: Dict[str, Any]) -> Optional["Reporter"]:
+        """
+        按 exp_plan["report"] 构造并启动上报器；未配置 pid / jid 或未安装 redis 时返回 None
+        """
+        cfg = exp_plan.get("report") or {}
+        pid, jid = cfg.get("pid"), cfg.get("jid")
+        if not pid or not jid:
+            return None
+        try:
+            reporter = cls(pid, jid, redis_url=cfg.get("redis_url"), interval=cfg.get("interval", 2.0),
+                           queue_size=cfg.get("queue_size", 4096), max_pending=cfg.get("max_pending", 1000),
+                           backlog_threshold=cfg.get("backlog_threshold"), coalesce_factor=cfg.get("coalesce_factor", 5))
+        except ImportError:
+            logger.warning("report:disabled reason=redis_not_installed")
+            return None
+        return reporter.start()
+
+    def start(self) -> "Reporter":
+        if not self._started:
+            self._started = True
+            self._thread.start()
+        return self
+
+    # 训练线程侧：只做非阻塞入队
+    def _put(self, kind: str, obj: Dict[str, Any]) -> None:
+        try:
+            self._queue.put_nowait((kind, obj))
+        except queue.Full:
+            with self._results_lock:
+                self.dropped += 1
+
+    def report_step(self, info: Dict[str, Any]) -> None:
+        self._put(_STEP, info)
+
+    def report_state(self, obj: Dict[str, Any]) -> None:
+        self._put(_STATE, obj)
+
+    def report_result(self, obj: Dict[str, Any]) -> None:
+        with self._results_lock:
+            self._results.append(obj)
+
+    def on_train_event(self, engine, info: Dict[str, Any]) -> None:
+        event = info.get("event")
+        if event == "step":
+            self.report_step(info)
+        elif event == "epoch":
+            epochs = max(1, int(engine.cfg.get("epochs") or 1))
+            self.report_state(dict(info, type="epoch", progress=min(1.0, (int(info.get("epoch", 0)) + 1) / epochs)))
+
+    # 后台线程侧
+    def _envelope(self, obj: Dict[str, Any], kind: str) -> str:
+        payload = {"pid": self.pid, "jid": self.jid, "type": kind, "time": time.time()}
+        payload.update(obj)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+    def _drain(self, deadline: float) -> bool:
+        """
+        从有界队列取事件直到 deadline；收到停止信号返回 True
+        """
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                kind, obj = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                return False
+            if kind == _STOP:
+                return True
+            if kind == _STEP:
+                self._summary.add(obj)
+            else:
+                self._pending_state.append(self._envelope(obj, obj.get("type") or _STATE))
+
+    def _collect(self, final: bool = False) -> None:
+        now = time.monotonic()
+        if not final and self.backpressure and self._summary.count and now - self._last_summary < self.interval * self.coalesce_factor:
+            # 背压：推迟步级摘要，继续在内存中合并
+            self.coalesced += 1
+        else:
+            with self._results_lock:
+                dropped = self.dropped - self._dropped_reported
+                self._dropped_reported = self.dropped
+            if self._summary.count or dropped:
+                self._last_summary = now
+                payload = self._summary.payload()
+                payload["dropped"] = dropped
+                self._pending_state.append(self._envelope(payload, "step_summary"))
+                self._summary.reset()
+        with self._results_lock:
+            results, self._results = self._results, []
+        self._pending_result.extend(self._envelope(r, r.get("type") or _RESULT) for r in results)
+        # 暂存上限：丢弃最旧的状态载荷（结果载荷保留）
+        overflow = len(self._pending_state) - self.max_pending
+        if overflow > 0:
+            del self._pending_state[:overflow]
+            with self._results_lock:
+                self.dropped += overflow
+                self._dropped_reported += overflow
+
+    def _flush(self, final: bool = False) -> bool:
+        """
+        一次网络往返发送全部暂存载荷；失败时保留暂存，下次重试
+        """
+        self._collect(final)
+        if not self._pending_state and not self._pending_result:
+            return True
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            if self._pending_state:
+                pipe.rpush(self.state_key, *self._pending_state)
+            if self._pending_result:
+                pipe.rpush(self.result_key, *self._pending_result)
+            pipe.get(self.health_key)
+            replies = pipe.execute()
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"report:flush_failed pending_state={len(self._pending_state)} pending_result={len(self._pending_result)} error={e}")
+            return False
+        self._observe(replies[0] if self._pending_state else None, replies[-1])
+        self.sent += len(self._pending_state) + len(self._pending_result)
+        self._pending_state = []
+        self._pending_result = []
+        return True
+
+    def _observe(self, state_length, health) -> None:
+        """
+        更新背压状态：master 监控的健康信号，或本次 RPUSH 后的状态队列长度超过阈值
+        """
+        signal = False
+        if health:
+            try:
+                signal = bool(json.loads(health).get("backpressure"))
+            except (TypeError, ValueError, AttributeError):
+                signal = False
+        backlog = int(state_length or 0)
+        pressure = signal or backlog > self.backlog_threshold
+        if pressure != self.backpressure:
+            logger.info(f"report:backpressure_{'on' if pressure else 'off'} state_backlog={backlog} signal={signal}")
+        self.backpressure = pressure
+
+    def _run(self) -> None:
+        backoff = self.interval
+        while True:
+            stop = self._drain(time.monotonic() + backoff)
+            ok = self._flush(final=stop)
+            # 连续失败时指数退避（上限 30 秒），期间事件继续在内存中合并
+            backoff = self.interval if ok else min(backoff * 2, 30.0)
+            if stop:
+                return
+
+    def close(self, timeout: float = 5.0) -> None:
+        if not self._started:
+            return
+        try:
+            self._queue.put((_STOP, None), timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"report:close_timeout pending_state={len(self._pending_state)} pending_result={len(self._pending_result)}")
+        else:
+            logger.info(f"report:closed sent={self.sent} dropped={self.dropped} failures={self.failures} coalesced={self.coalesced}")
@@ -0,0 +1,375 @@
+"""
+超参搜索（Sweep）
+目标：
+- 搜索只改模型/训练超参时，查询、序列重建、编码、嵌入、划分、归一化只做一次
+- 预处理结果按阶段指纹缓存为 .npy，试验进程以只读 mmap 共享（同一份页缓存，不重复占用内存）
+- 试验在进程池中并行执行，支持 grid / random / halving（successive halving 早停）
+
+阶段指纹（逐级累积，上游变化使下游全部失效）：
+- data：exp_plan["data"] + vocab + 数据文件的修改时间与大小（+ mut_num 以外的分组评估列）
+- embeddings：data 指纹 + exp_plan["embeddings"]
+- division：embeddings 指纹 + exp_plan["division"] + seed
+- normalization：division 指纹 + exp_plan["normalization"]
+缓存目录：<workdir>/sweeps/cache/<normalization 指纹>/{train,valid,test}/*.npy + normalization.json
+同一嵌入指纹的多组试验在进程内复用嵌入后的 DataFrame，只重做划分与归一化
+
+搜索配置（infra-sweep <sweep.json>）：
+    {
+        "base": {...},                      # 基础实验计划（或 "base_path": "plan.json"）
+        "space": {                          # 点号路径 -> 取值
+            "train.lr": {"type": "loguniform", "low": 1e-4, "high": 1e-2},
+            "train.batch_size": [64, 128],  # 列表 = 离散候选
+            "model.params.dim": {"type": "int", "low": 8, "high": 64}
+        },
+        "strategy": "random",               # grid | random | halving
+        "trials": 8,                        # random / halving 的候选数（grid 忽略）
+        "seed": 0,
+        "workers": 2,                       # 进程池大小
+        "start_method": "spawn",            # 子进程启动方式；spawn 时插件由工作目录自动加载
+        "metric": "valid_loss",             # 试验排序指标（epoch 记录中的键）
+        "mode": "min",
+        "halving": {"min_epochs": 1, "max_epochs": 9, "eta": 3}
+    }
+说明：
+- 取值类型：列表 / {"type": "choice", "values": [...]} / uniform / loguniform / int
+- grid 只接受离散取值，笛卡尔积展开
+- halving：所有候选先训练 min_epochs，按 metric 保留前 1/eta 进入下一轮，轮次预算乘以 eta，直到 max_epochs；
+  每个试验有固定的实验目录，下一轮从该目录的检查点继续训练，不从头开始
+- 每个试验在最终一轮结束后在测试集上评估并写出 metrics.json
+
+产物：
+- <workdir>/experiments/<sweep_id>-t<编号>/：每个试验的标准实验目录
+- <workdir>/sweeps/<sweep_id>/results.json：所有试验的参数、状态、指标与最优试验
+"""
+import os
+import copy
+import json
+import math
+import shutil
+import hashlib
+import itertools
+import logging
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SWEEP_DEFAULTS: Dict[str, Any] = {
+    "strategy": "random",
+    "trials": 8,
+    "seed": 0,
+    "workers": 1,
+    "start_method": "spawn",
+    "metric": "valid_loss",
+    "mode": "min",
+    "halving": {"min_epochs": 1, "max_epochs": 9, "eta": 3},
+}
+# 预处理各阶段依赖的实验计划键（按阶段顺序）
+STAGE_KEYS: List[Tuple[str, Tuple[str, ...]]] = [
+    ("data", ("data", "vocab")),
+    ("embeddings", ("embeddings",)),
+    ("division", ("division", "seed")),
+    ("normalization", ("normalization",)),
+]
+_COMPLETE_MARKER = "COMPLETE"
+
+
+def _canonical(obj: Any) -> str:
+    return json.dumps(obj, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def stage_fingerprints(exp_plan: Dict[str, Any]) -> Dict[str, str]:
+    """
+    逐级累积的阶段指纹：每一级 = sha1(上一级指纹 + 本阶段相关配置)
+    """
+    from .metrics import metrics_group_by
+
+    out: Dict[str, str] = {}
+    prev = ""
+    for stage, keys in STAGE_KEYS:
+        key = {k: exp_plan.get(k) for k in keys}
+        if stage == "data":
+            # 数据文件变化（修改时间/大小）同样使缓存失效
+            path = (exp_plan.get("data") or {}).get("path")
+            try:
+                st = os.stat(path) if path else None
+                key["_file"] = [st.st_mtime, st.st_size] if st else None
+            except OSError:
+                key["_file"] = None
+            group_by = metrics_group_by(exp_plan)
+            if group_by and group_by != "mut_num":
+                # mut_num 以外的分组列随连续矩阵一起缓存
+                key["_group_by"] = group_by
+        raw = prev + _canonical(key)
+        prev = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+        out[stage] = prev
+    return out
+
+
+def set_path(plan: Dict[str, Any], path: str, value: Any) -> None:
+    node = plan
+    parts = path.split(".")
+    for key in parts[:-1]:
+        if not isinstance(node.get(key), dict):
+            node[key] = {}
+        node = node[key]
+    node[parts[-1]] = value
+
+
+# 搜索空间
+def _discrete(spec: Any) -> Optional[List[Any]]:
+    if isinstance(spec, list):
+        return spec
+    if isinstance(spec, dict) and spec.get("type") == "choice":
+        return list(spec.get("values") or [])
+    return None
+
+
+def _sample(spec: Any, rng: np.random.Generator) -> Any:
+    values = _discrete(spec)
+    if values is not None:
+        if not values:
+            raise RuntimeError("sweep:empty_choice")
+        return values[int(rng.integers(len(values)))]
+    if not isinstance(spec, dict):
+        return spec
+    kind = spec.get("type")
+    low, high = float(spec["low"]), float(spec["high"])
+    if kind == "uniform":
+        return float(rng.uniform(low, high))
+    if kind == "loguniform":
+        return float(math.exp(rng.uniform(math.log(low), math.log(high))))
+    if kind == "int":
+        return int(rng.integers(int(low), int(high) + 1))
+    raise RuntimeError(f"sweep:unknown_space_type {kind}")
+
+
+def expand_space(space: Dict[str, Any], strategy: str, trials: int, seed: int) -> List[Dict[str, Any]]:
+    """
+    展开搜索空间为参数组合列表（点号路径 -> 取值）
+    """
+    keys = sorted(space)
+    if strategy == "grid":
+        grids = []
+        for k in keys:
+            values = _discrete(space[k])
+            if values is None:
+                raise RuntimeError(f"sweep:grid_requires_discrete {k}")
+            grids.append(values)
+        return [dict(zip(keys, combo)) for combo in itertools.product(*grids)]
+    rng = np.random.default_rng(seed)
+    return [{k: _sample(space[k], rng) for k in keys} for _ in range(max(1, int(trials)))]
+
+
+# 预处理缓存
+def _split_dirs(cache_dir: Path) -> Dict[str, Path]:
+    return {name: cache_dir / name for name in ("train", "valid", "test")}
+
+
+def prepare_cache(exp_plan: Dict[str, Any], cache_root: Path, memo: Dict[str, Any]) -> Path:
+    """
+    确保该计划的预处理结果已缓存，返回缓存目录
+    - memo：进程内缓存 {"embeddings": (指纹, df)}，同一嵌入指纹只做一次查询与嵌入
+    """
+    from .data import build_dataframe
+    from .embed import apply_embeddings
+    from .division import apply_division
+    from .normalize import apply_normalization
+    from .dataset import tensor_data_from_frame, save_tensor_data
+    from .metrics import metrics_group_by
+
+    fps = stage_fingerprints(exp_plan)
+    cache_dir = Path(cache_root) / fps["normalization"]
+    if (cache_dir / _COMPLETE_MARKER).exists():
+        logger.debug(f"sweep:cache_hit fingerprint={fps['normalization']}")
+        return cache_dir
+    cached = memo.get("embeddings")
+    if cached and cached[0] == fps["embeddings"]:
+        df = cached[1]
+    else:
+        df = apply_embeddings(build_dataframe(exp_plan), exp_plan)
+        memo["embeddings"] = (fps["embeddings"], df)
+    if cache_dir.exists():
+        shutil.rmtree(cache_dir)
+    cache_dir.mkdir(parents=True)
+    train_df, valid_df, test_df = apply_division(df, exp_plan)
+    train_df, valid_df, test_df = apply_normalization(train_df, valid_df, test_df, exp_plan, cache_dir / "normalization.json")
+    dirs = _split_dirs(cache_dir)
+    group_by = metrics_group_by(exp_plan)
+    for name, frame in (("train", train_df), ("valid", valid_df), ("test", test_df)):
+        save_tensor_data(tensor_data_from_frame(frame, group_by=group_by), dirs[name])
+    with open(cache_dir / "stages.json", "w", encoding="utf-8") as f:
+        json.dump(fps, f, indent=2)
+    (cache_dir / _COMPLETE_MARKER).touch()
+    logger.info(f"sweep:cache_written fingerprint={fps['normalization']} rows={len(train_df)}/{len(valid_df)}/{len(test_df)}")
+    return cache_dir
+
+
+# 试验执行（子进程入口，需为模块级函数以便 pickle）
+def _run_trial(payload: Dict[str, Any]) -> Dict[str, Any]:
+    from .recoder import ExperimentRecorder
+    from .dataset import load_tensor_data
+    from .training import train_and_evaluate
+
+    exp_plan = payload["exp_plan"]
+    cache_dir = Path(payload["cache_dir"])
+    recorder = ExperimentRecorder()
+    recorder.create_dirs(payload["workdir"], exp_plan["experiment_id"])
+    recorder.save_exp_plan(exp_plan)
+    norm = cache_dir / "normalization.json"
+    if norm.exists():
+        shutil.copyfile(norm, recorder.normalization)
+    dirs = _split_dirs(cache_dir)
+    train_data = load_tensor_data(dirs["train"])
+    valid_data = load_tensor_data(dirs["valid"])
+    test_data = load_tensor_data(dirs["test"]) if payload.get("evaluate") else None
+    out = train_and_evaluate(exp_plan, recorder, train_data, valid_data, test_data)
+    return {
+        "history": out["history"],
+        "metrics": (out["metrics"] or {}).get("overall"),
+    }
+
+
+class SweepRunner:
+    """
+    - run()：预处理（按指纹去重）-> 按策略分轮提交试验 -> 写出 results.json，返回结果字典
+    """
+    def __init__(self, spec: Dict[str, Any], workdir: Path):
+        cfg = dict(SWEEP_DEFAULTS)
+        cfg.update(spec)
+        cfg["halving"] = dict(SWEEP_DEFAULTS["halving"], **(spec.get("halving") or {}))
+        base = cfg.get("base")
+        if base is None and cfg.get("base_path"):
+            with open(cfg["base_path"], "r", encoding="utf-8") as f:
+                base = json.load(f)
+        if not isinstance(base, dict):
+            raise RuntimeError("sweep:base_required")
+        self.cfg = cfg
+        self.base = base
+        self.workdir = Path(workdir)
+        self.strategy = str(cfg["strategy"]).lower()
+        if self.strategy not in ("grid", "random", "halving"):
+            raise RuntimeError(f"sweep:unknown_strategy {self.strategy}")
+        self.sweep_id = cfg.get("sweep_id") or "sweep-" + hashlib.sha1(
+            _canonical({k: v for k, v in spec.items() if k != "workers"}).encode("utf-8")).hexdigest()[:12]
+        self.dir = self.workdir / "sweeps" / self.sweep_id
+        self.cache_root = self.workdir / "sweeps" / "cache"
+        self.metric = cfg["metric"]
+        self.mode = str(cfg["mode"]).lower()
+        self.workers = max(1, int(cfg["workers"]))
+
+    def _trial_plans(self) -> List[Dict[str, Any]]:
+        params_list = expand_space(self.cfg.get("space") or {}, "grid" if self.strategy == "grid" else "random",
+                                   int(self.cfg["trials"]), int(self.cfg["seed"]))
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        trials = []
+        for i, params in enumerate(params_list):
+            plan = copy.deepcopy(self.base)
+            for path, value in params.items():
+                set_path(plan, path, value)
+            plan["experiment_id"] = f"{self.sweep_id}-t{i:03d}"
+            plan.pop("report", None)
+            # 进程池内每个试验分得 CPU 核数 / workers 个计算线程，避免线程超额订阅
+            train = plan.setdefault("train", {})
+            train.setdefault("num_threads", threads)
+            train.setdefault("num_workers", 0)
+            trials.append({"trial": i, "params": params, "exp_plan": plan, "status": "pending"})
+        return trials
+
+    def _score(self, history: List[Dict[str, Any]]) -> Optional[float]:
+        for record in reversed(history or []):
+            v = record.get(self.metric)
+            if isinstance(v, (int, float)) and math.isfinite(v):
+                return float(v)
+        return None
+
+    def _rank(self, trials: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        ok = [t for t in trials if t.get("score") is not None]
+        return sorted(ok, key=lambda t: t["score"], reverse=(self.mode == "max"))
+
+    def _submit(self, pool: ProcessPoolExecutor, trials: List[Dict[str, Any]], epochs: Optional[int], evaluate: bool) -> None:
+        futures = {}
+        for t in trials:
+            plan = copy.deepcopy(t["exp_plan"])
+            if epochs is not None:
+                plan.setdefault("train", {})["epochs"] = int(epochs)
+            payload = {"exp_plan": plan, "cache_dir": str(t["cache_dir"]), "workdir": str(self.workdir), "evaluate": evaluate}
+            futures[pool.submit(_run_trial, payload)] = t
+        for fut in as_completed(futures):
+            t = futures[fut]
+            try:
+                out = fut.result()
+            except Exception as e:
+                t["status"] = "failed"
+                t["error"] = f"{type(e).__name__}: {e}"
+                logger.warning(f"sweep:trial_failed trial={t['trial']} error={t['error']}")
+                continue
+            t["status"] = "completed"
+            t["epochs"] = len(out["history"])
+            t["score"] = self._score(out["history"])
+            if out.get("metrics") is not None:
+                t["metrics"] = out["metrics"]
+            logger.info(f"sweep:trial_done trial={t['trial']} epochs={t['epochs']} {self.metric}={t['score']}")
+
+    def _write_results(self, trials: List[Dict[str, Any]], rungs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        ranked = self._rank([t for t in trials if t["status"] == "completed"])
+        result = {
+            "sweep_id": self.sweep_id,
+            "strategy": self.strategy,
+            "metric": self.metric,
+            "mode": self.mode,
+            "rungs": rungs,
+            "trials": [{k: v for k, v in t.items() if k not in ("exp_plan", "cache_dir")} | {"experiment_id": t["exp_plan"]["experiment_id"]} for t in trials],
+            "best": ranked[0]["trial"] if ranked else None,
+        }
+        self.dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.dir / "results.json.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2, default=str)
+        os.replace(tmp, self.dir / "results.json")
+        return result
+
+    def run(self) -> Dict[str, Any]:
+        trials = self._trial_plans()
+        # 预处理：按指纹去重，同一嵌入指纹相邻处理以复用进程内 DataFrame
+        memo: Dict[str, Any] = {}
+        for t in sorted(trials, key=lambda t: tuple(stage_fingerprints(t["exp_plan"]).values())):
+            t["cache_dir"] = prepare_cache(t["exp_plan"], self.cache_root, memo)
+        memo.clear()
+        groups = len(set(str(t["cache_dir"]) for t in trials))
+        logger.info(f"sweep:start id={self.sweep_id} strategy={self.strategy} trials={len(trials)} preprocess_groups={groups} workers={self.workers}")
+        ctx = multiprocessing.get_context(self.cfg.get("start_method") or "spawn")
+        rungs: List[Dict[str, Any]] = []
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx) as pool:
+            if self.strategy != "halving":
+                self._submit(pool, trials, None, evaluate=True)
+            else:
+                h = self.cfg["halving"]
+                eta = max(2, int(h["eta"]))
+                budget = max(1, int(h["min_epochs"]))
+                max_epochs = max(budget, int(h["max_epochs"]))
+                alive = list(trials)
+                while alive:
+                    if len(alive) <= 1:
+                        budget = max_epochs
+                    final = budget >= max_epochs
+                    self._submit(pool, alive, budget, evaluate=final)
+                    for t in alive:
+                        t["rung"] = len(rungs)
+                    rungs.append({"epochs": budget, "trials": [t["trial"] for t in alive]})
+                    self._write_results(trials, rungs)
+                    if final:
+                        break
+                    keep = max(1, len(alive) // eta)
+                    alive = self._rank(alive)[:keep]
+                    budget = min(budget * eta, max_epochs)
+        result = self._write_results(trials, rungs)
+        logger.info(f"sweep:done id={self.sweep_id} best={result['best']}")
+        return result
+
+
+def run_sweep(spec: Dict[str, Any], workdir: Path) -> Dict[str, Any]:
+    return SweepRunner(spec, workdir).run()
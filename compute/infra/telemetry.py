@@ -0,0 +1,279 @@
+"""
+训练遥测（Telemetry）
+目标：
+- 逐步记录标量（loss / lr / 吞吐 / 耗时等），单次记录只做一次内存映射数组的行赋值（微秒级）
+- 记录为定长行（float64），写入 training/telemetry.ring 环形文件；进程崩溃后未刷盘的尾部仍可从环形文件读回
+- 每 flush_every 条（或 flush_seconds 秒）把新增记录按列写成压缩分片 training/telemetry/part-<n>.npz
+- close() 时把全部分片合并为 training/telemetry.npz（列式，master 侧据此下采样出曲线）
+
+文件结构（实验目录 training/ 下）：
+- telemetry.ring：64 字节头（int64[8]：magic, version, capacity, columns, count, flushed, 0, 0）+ capacity 行定长记录
+- telemetry.json：列名 {"columns": ["step", "epoch", "time", "kind", ...字段]}
+- telemetry/part-<n>.npz：已刷盘的分片（每列一个数组）
+- telemetry.npz：合并结果（每列一个数组，按 (kind, step) 去重保留最后一次，续训重复的步不会出现两次）
+
+kind：0 = 优化步记录，1 = epoch 记录；缺失的字段记为 NaN
+
+配置（exp_plan["telemetry"]，均可省略）：
+    "telemetry": {
+        "enabled": true,
+        "fields": ["loss", "lr", "samples", "step_time", "valid_loss"],
+        "capacity": 65536,        # 环形文件行数（须不小于 flush_every）
+        "flush_every": 4096,
+        "flush_seconds": 30.0
+    }
+"""
+import os
+import json
+import time
+import logging
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Sequence
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TELEMETRY_MAGIC = 0x54454C45  # "TELE"
+TELEMETRY_VERSION = 1
+HEADER_SLOTS = 8
+HEADER_BYTES = HEADER_SLOTS * 8
+# 文件格式约定：主控端 app/utils/curves.py 中的 BASE_COLUMNS / KINDS / _dedupe 为本模块的副本
+# （两端分别部署，主控端不安装 infra），修改列名、kind 取值或去重规则时需同步修改
+BASE_COLUMNS = ("step", "epoch", "time", "kind")
+KIND_STEP = 0
+KIND_EPOCH = 1
+
+TELEMETRY_DEFAULTS: Dict[str, Any] = {
+    "enabled": True,
+    "fields": ["loss", "lr", "samples", "step_time", "valid_loss"],
+    "capacity": 65536,
+    "flush_every": 4096,
+    "flush_seconds": 30.0,
+}
+
+# 头部槽位
+_H_MAGIC, _H_VERSION, _H_CAPACITY, _H_COLUMNS, _H_COUNT, _H_FLUSHED = range(6)
+
+
+def telemetry_config(exp_plan: Dict[str, Any]) -> Dict[str, Any]:
+    cfg = dict(TELEMETRY_DEFAULTS)
+    cfg.update(exp_plan.get("telemetry") or {})
+    return cfg
+
+
+def _write_npz(path: Path, columns: Dict[str, np.ndarray]) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez_compressed(f, **columns)
+    os.replace(tmp, path)
+
+
+def _dedupe(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    按 (kind, step) 去重，保留最后写入的记录，并按 (kind, step) 排序（与主控端 app/utils/curves._dedupe 保持一致）
+    """
+    n = len(columns["step"])
+    if n == 0:
+        return columns
+    kind = columns["kind"]
+    step = columns["step"]
+    # 同一 (kind, step) 内按写入顺序倒序，取每组第一条即最后写入的记录
+    order = np.lexsort((-np.arange(n), step, kind))
+    k = kind[order]
+    s = step[order]
+    keep = np.ones(n, dtype=bool)
+    keep[1:] = (k[1:] != k[:-1]) | (s[1:] != s[:-1])
+    index = order[keep]
+    return {name: col[index] for name, col in columns.items()}
+
+
+def _concat(chunks: List[Dict[str, np.ndarray]], names: Sequence[str]) -> Dict[str, np.ndarray]:
+    out = {}
+    for name in names:
+        parts = [c[name] if name in c else np.full(len(c["step"]), np.nan) for c in chunks]
+        out[name] = np.concatenate(parts) if parts else np.zeros(0, dtype=np.float64)
+    return out
+
+
+def _load_npz(path: Path) -> Dict[str, np.ndarray]:
+    with np.load(path) as z:
+        return {k: z[k] for k in z.files}
+
+
+class TelemetryWriter:
+    """
+    - log(step, epoch, kind=0, **scalars)：追加一条记录（训练线程内调用，只写内存映射）
+    - on_train_event(engine, info)：可直接作为 TrainEngine 的回调（step / epoch 事件）
+    - flush()：把新增记录写成分片
+    - close()：刷盘并合并为 telemetry.npz
+    同一目录再次打开时（续训）会先把环形文件中未刷盘的尾部补写成分片
+    """
+    def __init__(self, directory: Path, fields: Sequence[str] = TELEMETRY_DEFAULTS["fields"], capacity: int = 65536,
+                 flush_every: int = 4096, flush_seconds: Optional[float] = 30.0):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.parts_dir = self.dir / "telemetry"
+        self.parts_dir.mkdir(exist_ok=True)
+        self.ring_path = self.dir / "telemetry.ring"
+        self.schema_path = self.dir / "telemetry.json"
+        self.output = self.dir / "telemetry.npz"
+        self.fields = [str(f) for f in fields if str(f) not in BASE_COLUMNS]
+        self.columns = list(BASE_COLUMNS) + self.fields
+        self._slot = {name: j for j, name in enumerate(self.columns)}
+        self.capacity = max(1, int(capacity))
+        self.flush_every = max(1, min(int(flush_every), self.capacity))
+        self.flush_seconds = float(flush_seconds) if flush_seconds else None
+        self._open_ring()
+        self._row = np.full(len(self.columns), np.nan)
+        self._last_flush = time.monotonic()
+        self._closed = False
+
+    @classmethod
+    def from_exp_plan(cls, exp_plan: Dict[str, Any], directory: Path) -> Optional["TelemetryWriter"]:
+        cfg = telemetry_config(exp_plan)
+        if not cfg.get("enabled"):
+            return None
+        return cls(directory, fields=cfg["fields"], capacity=cfg["capacity"], flush_every=cfg["flush_every"],
+                   flush_seconds=cfg.get("flush_seconds"))
+
+    # 环形文件
+    def _open_ring(self) -> None:
+        ncols = len(self.columns)
+        size = HEADER_BYTES + self.capacity * ncols * 8
+        previous = None
+        if self.ring_path.exists():
+            previous = self._read_previous()
+        with open(self.ring_path, "wb") as f:
+            f.truncate(size)
+        self._header = np.memmap(self.ring_path, dtype=np.int64, mode="r+", shape=(HEADER_SLOTS,))
+        self._ring = np.memmap(self.ring_path, dtype=np.float64, mode="r+", offset=HEADER_BYTES, shape=(self.capacity, ncols))
+        self._header[:] = 0
+        self._header[_H_MAGIC] = TELEMETRY_MAGIC
+        self._header[_H_VERSION] = TELEMETRY_VERSION
+        self._header[_H_CAPACITY] = self.capacity
+        self._header[_H_COLUMNS] = ncols
+        with open(self.schema_path, "w", encoding="utf-8") as f:
+            json.dump({"columns": self.columns}, f, ensure_ascii=False)
+        self.count = 0
+        self.flushed = 0
+        self._part = len(list(self.parts_dir.glob("part-*.npz")))
+        if previous:
+            self._write_part(previous)
+            logger.info(f"telemetry:recovered rows={len(previous['step'])}")
+
+    def _read_previous(self) -> Optional[Dict[str, np.ndarray]]:
+        """
+        读取上次运行环形文件中尚未刷盘的记录（进程异常退出时）
+        """
+        try:
+            columns = read_ring(self.ring_path, self.schema_path, unflushed_only=True)
+        except Exception as e:
+            logger.warning(f"telemetry:ring_unreadable error={e}")
+            return None
+        return columns if columns and len(columns["step"]) else None
+
+    # 训练线程侧
+    def log(self, step: int, epoch: int, kind: int = KIND_STEP, **scalars: Any) -> None:
+        row = self._row
+        row.fill(np.nan)
+        row[0] = step
+        row[1] = epoch
+        row[2] = time.time()
+        row[3] = kind
+        slot = self._slot
+        for name, value in scalars.items():
+            j = slot.get(name)
+            if j is not None and value is not None:
+                row[j] = value
+        self._ring[self.count % self.capacity] = row
+        self.count += 1
+        self._header[_H_COUNT] = self.count
+        pending = self.count - self.flushed
+        if pending >= self.flush_every or (self.flush_seconds and time.monotonic() - self._last_flush >= self.flush_seconds):
+            self.flush()
+
+    def on_train_event(self, engine, info: Dict[str, Any]) -> None:
+        event = info.get("event")
+        if event not in ("step", "epoch"):
+            return
+        scalars = {k: v for k, v in info.items() if k not in BASE_COLUMNS and isinstance(v, (int, float))}
+        if event == "step":
+            self.log(info.get("step", 0), info.get("epoch", 0), KIND_STEP, **scalars)
+        else:
+            scalars.setdefault("loss", info.get("train_loss"))
+            self.log(engine.global_step, info.get("epoch", 0), KIND_EPOCH, **scalars)
+
+    # 刷盘
+    def _write_part(self, columns: Dict[str, np.ndarray]) -> None:
+        _write_npz(self.parts_dir / f"part-{self._part:05d}.npz", columns)
+        self._part += 1
+
+    def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        start, end = self.flushed, self.count
+        if end <= start:
+            return
+        index = np.arange(start, end) % self.capacity
+        block = np.asarray(self._ring[index])
+        self._write_part({name: block[:, j] for j, name in enumerate(self.columns)})
+        self.flushed = end
+        self._header[_H_FLUSHED] = end
+
+    def close(self) -> Optional[Path]:
+        if self._closed:
+            return self.output
+        self._closed = True
+        self.flush()
+        self._ring.flush()
+        columns = read_telemetry(self.dir)
+        if columns is None:
+            return None
+        _write_npz(self.output, columns)
+        # 分片已并入 telemetry.npz
+        for p in self.parts_dir.glob("part-*.npz"):
+            try:
+                p.unlink()
+            except OSError:
+                pass
+        self._part = 0
+        logger.info(f"telemetry:closed rows={len(columns['step'])} path={self.output}")
+        return self.output
+
+
+def read_ring(ring_path: Path, schema_path: Path, unflushed_only: bool = False) -> Optional[Dict[str, np.ndarray]]:
+    """
+    读取环形文件中仍保留的记录（unflushed_only 时只读未刷盘部分），返回列字典
+    """
+    with open(schema_path, "r", encoding="utf-8") as f:
+        names = json.load(f)["columns"]
+    header = np.fromfile(ring_path, dtype=np.int64, count=HEADER_SLOTS)
+    if len(header) < HEADER_SLOTS or header[_H_MAGIC] != TELEMETRY_MAGIC or header[_H_COLUMNS] != len(names):
+        return None
+    capacity, count, flushed = int(header[_H_CAPACITY]), int(header[_H_COUNT]), int(header[_H_FLUSHED])
+    start = flushed if unflushed_only else max(0, count - capacity)
+    ring = np.memmap(ring_path, dtype=np.float64, mode="r", offset=HEADER_BYTES, shape=(capacity, len(names)))
+    block = np.asarray(ring[np.arange(start, count) % capacity]) if count > start else np.zeros((0, len(names)))
+    return {name: block[:, j].copy() for j, name in enumerate(names)}
+
+
+def read_telemetry(directory: Path, include_ring: bool = True) -> Optional[Dict[str, np.ndarray]]:
+    """
+    读取实验的全部遥测记录：telemetry.npz + 分片 + 环形文件未刷盘的尾部（训练进行中也可读取），按 (kind, step) 去重
+    """
+    directory = Path(directory)
+    chunks: List[Dict[str, np.ndarray]] = []
+    if (directory / "telemetry.npz").exists():
+        chunks.append(_load_npz(directory / "telemetry.npz"))
+    for p in sorted((directory / "telemetry").glob("part-*.npz")):
+        chunks.append(_load_npz(p))
+    ring, schema = directory / "telemetry.ring", directory / "telemetry.json"
+    if include_ring and ring.exists() and schema.exists():
+        tail = read_ring(ring, schema, unflushed_only=True)
+        if tail and len(tail["step"]):
+            chunks.append(tail)
+    if not chunks:
+        return None
+    names = list(BASE_COLUMNS)
+    for c in chunks:
+        names.extend(k for k in c if k not in names)
+    return _dedupe(_concat(chunks, names))
@@ -2,40 +2,111 @@ from . import get_workdir
 import sqlite3
 import logging
 from pathlib import Path
-from typing import Dict, List, Any, Set, Optional
+from typing import Dict, List, Any, Set, Optional, Tuple
 from .data import build_dataframe
 from .embed import apply_embeddings
 from .division import apply_division
 from .normalize import apply_normalization
+from .recoder import ExperimentRecorder, experiment_id_of
+from .dataset import TensorData, tensor_data_from_frame
+from .engine import TrainEngine, build_model
+from .evaluator import Evaluator
+from .metrics import metrics_group_by
+from .reporter import Reporter
+from .checkpoint import CheckpointManager, checkpoint_config
+from .telemetry import TelemetryWriter
+import torch
 
 logger = logging.getLogger(__name__)
 
 
-def run_train(
-    exp_plan: dict,
-    debug: bool = False,
-):
+def prepare_data(exp_plan: Dict[str, Any], normalization_path: Optional[Path] = None) -> Tuple[TensorData, TensorData, TensorData]:
     """
-    训练主流程
+    预处理：查询 -> 嵌入 -> 划分 -> 归一化 -> 连续矩阵，返回 (train, valid, test)
     """
     #从实验计划中获取基本数据
     df = build_dataframe(exp_plan)
 
-    # 归一化（如有配置）
-    # df = apply_normalization(df, exp_plan)
-
     # 对数据进行嵌入
     df = apply_embeddings(df, exp_plan)
     
     # 数据划分
     train_df, valid_df, test_df = apply_division(df, exp_plan)
 
-    
-    #3 模型训练
+    # 归一化（如有配置）：仅用训练集拟合，状态写入实验目录供推理复用
+    train_df, valid_df, test_df = apply_normalization(train_df, valid_df, test_df, exp_plan, normalization_path)
+
+    # DataFrame 一次性转为连续矩阵，训练时按批花式索引取数
+    group_by = metrics_group_by(exp_plan)
+    return (tensor_data_from_frame(train_df, group_by=group_by), tensor_data_from_frame(valid_df, group_by=group_by),
+            tensor_data_from_frame(test_df, group_by=group_by))
+
 
+def train_and_evaluate(
+    exp_plan: Dict[str, Any],
+    recorder: ExperimentRecorder,
+    train_data: TensorData,
+    valid_data: TensorData,
+    test_data: Optional[TensorData] = None,
+) -> Dict[str, Any]:
+    """
+    模型训练与评估：返回 {"history": 每个 epoch 的记录, "metrics": 测试集指标（未传 test_data 时为 None）}
+    """
+    model = build_model(exp_plan)
+    metrics = None
+    # 状态上报（如有配置）：后台线程合并步级指标并批量推送到 master 队列，不阻塞训练循环
+    reporter = Reporter.from_exp_plan(exp_plan)
+    callbacks = [reporter.on_train_event] if reporter else []
+    # 训练遥测：逐步标量写入 training/ 下的内存映射环形文件，定期落为列式分片
+    telemetry = TelemetryWriter.from_exp_plan(exp_plan, recorder.training)
+    if telemetry:
+        callbacks.append(telemetry.on_train_event)
+    try:
+        engine = TrainEngine(model, exp_plan, history_path=recorder.training / "history.json", callbacks=callbacks)
+        # 检查点：同一实验计划落到同一实验目录，重启后自动从最新有效检查点续训
+        ckpt = CheckpointManager.from_exp_plan(exp_plan, recorder.base)
+        if ckpt:
+            if checkpoint_config(exp_plan).get("resume"):
+                ckpt.resume(engine)
+            engine.callbacks.append(ckpt.on_train_event)
+        try:
+            engine.fit(train_data, valid_data)
+        finally:
+            if ckpt:
+                ckpt.close()
+            if telemetry:
+                telemetry.close()
+        torch.save(model.state_dict(), recorder.pth)
+
+        # 模型评估：逐批推理写入内存映射数组并流式计算指标，产出 labels.npz 与 metrics.json
+        if test_data is not None:
+            metrics = Evaluator(engine, exp_plan).evaluate(test_data, recorder.labels)
+            recorder.write_metrics(metrics)
+            if reporter:
+                reporter.report_result({"experiment": recorder.base.name, "metrics": metrics.get("overall")})
+    finally:
+        if reporter:
+            reporter.close()
+    return {"history": engine.history, "metrics": metrics}
+
+
+def run_train(
+    exp_plan: dict,
+    debug: bool = False,
+):
+    """
+    训练主流程
+    """
+    # 实验目录与计划快照
+    recorder = ExperimentRecorder()
+    recorder.create_dirs(str(get_workdir()), experiment_id_of(exp_plan))
+    recorder.save_exp_plan(exp_plan)
 
-    #4 模型评估
+    #1-2 数据准备
+    train_data, valid_data, test_data = prepare_data(exp_plan, recorder.normalization)
 
+    #3-4 模型训练与评估
+    train_and_evaluate(exp_plan, recorder, train_data, valid_data, test_data)
 
     
     #5 训练日志生成
@@ -27,6 +27,6 @@ class BaseVocabProcessor:
         return out
 
 def get_vocab_processor(name: Optional[str]) -> BaseVocabProcessor:
+    # 词表处理器默认无状态：返回注册中心缓存的单例，build_dataframe / apply_embeddings 共用同一实例
     key = (name or "").strip()
-    cls = registry.get_vocab(key)
-    return cls()
+    return registry.get_instance("vocab", key)
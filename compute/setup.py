@@ -12,6 +12,10 @@ setup(
         'console_scripts': [
             'infra-train = infra.main:train',  # 训练模型
             'infra-wkdir = infra.main:workdir',  # 工作目录管理
+            'infra-sweep = infra.main:sweep',  # 超参搜索
+            'infra-predict = infra.main:predict',  # 批量推理 / 打分服务
+            'infra-worker = worker_app.agent:main',  # 训练任务 worker（消费 job_queue）
+            'infra-distributed = infra.distributed:main',  # 数据并行训练启动器 / 扩展效率测试
         ]
     },
 )
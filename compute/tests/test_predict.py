@@ -0,0 +1,29 @@
+"""
+infra.predict.MutantEncoder：突变描述的有效性判定
+"""
+import numpy as np
+from infra.registry import registry
+from infra.vocab import BaseVocabProcessor
+from infra.predict import MutantEncoder
+
+TEMPLATE = "ACDEFGHIK"
+
+
+@registry.register_vocab("test_aa")
+class _AminoVocab(BaseVocabProcessor):
+    # 词表插件来自工作目录，测试内注册一个最小词表：<pad>=0 <unk>=1 <cls>=2 <eos>=3，残基从 4 起
+    def policy(self):
+        id_map = {c: i + 4 for i, c in enumerate("ACDEFGHIKLMNPQRSTVWY")}
+        return {"id_map": id_map, "pad_id": 0, "unk_id": 1, "head_id": 2, "tail_id": 3}
+
+
+def test_encode_marks_malformed_mutants_invalid():
+    enc = MutantEncoder(TEMPLATE, "test_aa")
+    mutants = ["A1C", "A1C:D3E", "", "WT", None, "garbage", "A1C:xx", "A1C:A1D", "C1A", "A99C", "A0C"]
+    tokens, mut_num, valid = enc.encode(mutants)
+    assert valid.tolist() == [True, True, True, True, False, False, False, False, False, False, False]
+    assert mut_num[:4].tolist() == [1, 2, 0, 0]
+    # 无效行保留模板序列
+    for i in np.flatnonzero(~valid):
+        assert (tokens[i] == enc.base).all()
+    assert tokens[0][1] == enc.lut[ord("C")]
@@ -0,0 +1,10 @@
+"""
+worker_app：计算节点上的训练任务 worker
+- tasks.process_training：RQ 任务函数（master 按 "worker_app.process_training" 入队）
+- agent.WorkerAgent：按声明资源并发消费 job_queue（命令行 infra-worker）
+- plan.build_exp_plan：任务配置 -> 实验计划
+- runner：资源池与带 CPU / 内存限制的训练子进程
+"""
+from .tasks import process_training
+
+__all__ = ["process_training"]
@@ -0,0 +1,389 @@
+"""
+Worker 代理（WorkerAgent）：消费 RQ 的 job_queue，按节点资源并发执行训练任务
+
+取任务顺序：先取本节点队列 <job_queue>:<node_id>（master 调度器按资源放置），再取共享 job_queue
+
+调度规则：
+- 资源池按核心编号与内存记账（runner.ResourcePool），任务声明 config.resources = {"cpus", "memory_mb"}
+- 队首任务取出后若当前空闲资源不足则暂存（不再取后续任务，保持 FIFO），直到运行中的任务释放资源
+- 任务需求超过节点总量时立即判为 FAILED（worker:insufficient_resources），不占用队首
+- max_jobs > 0 时额外限制并发任务数
+- 每个任务在独立线程中运行 process_training（线程只负责等待训练子进程），结束后按 RQ 约定登记到 finished / failed 注册表
+
+心跳（每 HEARTBEAT_INTERVAL 秒写入 NODES_KEY）：节点信息 + resources {cpus, memory_mb, free_cpus, free_memory_mb,
+jobs: {运行中 jid: 开始时间戳}, done: [最近结束的 jid], datasets: [本地缓存的数据集指纹]}；停止时先标记 draining，退出后删除
+
+控制通道（订阅 CONTROL_CHANNEL）：master 发布的决策按 jid 作用于本节点运行中的任务
+- cancel：终止训练子进程，任务 CANCELLED
+- stop：提前停止（早停，如 ASHA / 中位数规则），训练在下一个优化步后结束并评估，任务 COMPLETED（early_stopped）
+任务开始前补查 <CONTROL_KEY_PREFIX>:<jid>：已有决策的任务不再执行，直接 CANCELLED
+
+RQ 连接可注入（例如 fakeredis.FakeStrictRedis()），便于在没有 Redis 服务的环境中运行
+"""
+import json
+import time
+import signal
+import socket
+import datetime
+import logging
+import argparse
+import threading
+import traceback
+from pathlib import Path
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+from .config import (REDIS_URL, JOB_QUEUE_NAME, WORKER_CPUS, WORKER_MEMORY_MB, WORKER_MAX_JOBS, POLL_INTERVAL,
+                     NODES_KEY, HEARTBEAT_INTERVAL, CONTROL_CHANNEL, CONTROL_KEY_PREFIX)
+from .plan import job_resources
+from .runner import ResourcePool, Allocation
+from .reporting import set_connection, push_state, push_result, FAILED, CANCELLED
+from .tasks import process_training, node_id
+from .cache import get_cache
+
+logger = logging.getLogger(__name__)
+
+TASK_NAME = "worker_app.process_training"
+DONE_WINDOW = 256
+
+
+class _Running:
+    def __init__(self, job, alloc: Allocation):
+        self.job = job
+        self.alloc = alloc
+        self.cancel = threading.Event()
+        self.stop = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.started_at = time.time()
+
+
+class WorkerAgent:
+    """
+    - run(burst=False)：主循环；burst=True 时队列取空且无运行中的任务后返回
+    - stop(cancel=False)：停止取新任务；cancel=True 时同时终止运行中的训练子进程
+    - running / pool.snapshot()：当前运行中的任务与资源占用
+    """
+    def __init__(self, connection, queue_name: str = JOB_QUEUE_NAME, pool: Optional[ResourcePool] = None,
+                 max_jobs: int = 0, poll_interval: float = POLL_INTERVAL, workdir: Optional[Path] = None,
+                 node: Optional[str] = None, heartbeat_interval: float = HEARTBEAT_INTERVAL):
+        from rq import Queue
+        self.connection = connection
+        self.node = node or node_id()
+        self.queue = Queue(queue_name, connection=connection)
+        self.node_queue = Queue(f"{queue_name}:{self.node}", connection=connection)
+        self.pool = pool or ResourcePool.from_config(WORKER_CPUS, WORKER_MEMORY_MB)
+        self.max_jobs = int(max_jobs)
+        self.poll_interval = float(poll_interval)
+        self.workdir = workdir
+        self.name = f"{self.node}:{id(self):x}"
+        self.heartbeat_interval = float(heartbeat_interval)
+        self.running: Dict[str, _Running] = {}
+        self.done: deque = deque(maxlen=DONE_WINDOW)
+        self._held: Optional[Tuple[Any, Dict[str, int]]] = None
+        self._changed = threading.Condition()
+        self._stopping = threading.Event()
+        # run() 退出后置位：控制通道在停止取新任务、等待运行中任务期间仍需生效
+        self._closed = threading.Event()
+        self.completed = 0
+        self.failed = 0
+        set_connection(connection)
+
+    # 取任务
+    def _payload(self, job) -> Dict[str, Any]:
+        if job.args:
+            return job.args[0]
+        return job.kwargs.get("payload") or {}
+
+    def _dequeue(self, timeout: Optional[float]):
+        from rq import Queue
+        from rq.exceptions import DequeueTimeout
+        try:
+            result = Queue.dequeue_any([self.node_queue, self.queue], int(max(1, timeout)) if timeout else None,
+                                       connection=self.connection)
+        except DequeueTimeout:
+            return None
+        return result[0] if result else None
+
+    def _reject(self, job, error: str, state: int = FAILED) -> None:
+        payload = self._payload(job)
+        pid, jid = str(payload.get("pid")), str(payload.get("jid") or job.id)
+        logger.error(f"worker:rejected jid={jid} state={state} error={error}")
+        push_state(pid, jid, state, self.connection, node=self.node, error=error)
+        push_result(pid, jid, state, self.connection, node=self.node, error=error)
+        self._finish_job(job, None, error)
+        self.done.append(job.id)
+
+    def _decision(self, jid: str) -> Optional[Dict[str, Any]]:
+        try:
+            raw = self.connection.get(f"{CONTROL_KEY_PREFIX}:{jid}")
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            logger.warning(f"worker:control_lookup_failed jid={jid} error={e}")
+            return None
+
+    def _next(self, timeout: Optional[float]) -> Optional[Tuple[Any, Dict[str, int]]]:
+        """
+        返回暂存的队首任务或新取出的任务及其资源需求
+        """
+        if self._held is not None:
+            return self._held
+        job = self._dequeue(timeout)
+        if job is None:
+            return None
+        if job.func_name != TASK_NAME:
+            return job, {"cpus": 1, "memory_mb": 0}
+        try:
+            req = job_resources(self._payload(job).get("config") or {})
+        except (RuntimeError, TypeError, ValueError) as e:
+            self._reject(job, str(e))
+            return None
+        decision = self._decision(job.id)
+        if decision:
+            self._reject(job, f"cancelled:{decision.get('action')} reason={decision.get('reason')}", CANCELLED)
+            return None
+        if not self.pool.fits(req):
+            snap = self.pool.snapshot()
+            self._reject(job, f"worker:insufficient_resources cpus={req['cpus']}/{snap['cpus']} "
+                              f"memory_mb={req['memory_mb']}/{snap['memory_mb']}")
+            return None
+        return job, req
+
+    # RQ 注册表登记
+    def _start_job(self, job) -> None:
+        from rq.registry import StartedJobRegistry
+        with self.connection.pipeline() as pipe:
+            job.prepare_for_execution(self.name, pipe)
+            StartedJobRegistry(queue=self.queue).add(job, -1, pipeline=pipe)
+            pipe.execute()
+
+    def _finish_job(self, job, result: Any, error: Optional[str]) -> None:
+        from rq.registry import StartedJobRegistry
+        from rq.job import JobStatus
+        from rq.utils import utcnow
+        job.ended_at = utcnow()
+        with self.connection.pipeline() as pipe:
+            if error is None:
+                job._result = result
+                job._handle_success(job.get_result_ttl(500), pipeline=pipe)
+            else:
+                job.set_status(JobStatus.FAILED, pipeline=pipe)
+                job._handle_failure(error, pipeline=pipe)
+            StartedJobRegistry(queue=self.queue).remove(job, pipeline=pipe)
+            pipe.execute()
+
+    # 执行
+    def _execute(self, entry: _Running) -> None:
+        job = entry.job
+        result, error = None, None
+        try:
+            if job.func_name == TASK_NAME:
+                result = process_training(self._payload(job), allocation=entry.alloc, connection=self.connection,
+                                          cancel=entry.cancel, workdir=self.workdir, node=self.node, stop=entry.stop)
+                if result.get("state") == FAILED:
+                    error = str(result.get("error") or "failed")
+            else:
+                result = job.perform()
+        except Exception:
+            error = traceback.format_exc()
+            logger.error(f"worker:job_crashed jid={job.id} error={error}")
+        finally:
+            self.pool.release(entry.alloc)
+            with self._changed:
+                self.running.pop(job.id, None)
+                self.done.append(job.id)
+                if error is None:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self._changed.notify_all()
+        try:
+            self._finish_job(job, result, error)
+        except Exception as e:
+            logger.warning(f"worker:registry_update_failed jid={job.id} error={e}")
+
+    def _launch(self, job, alloc: Allocation) -> None:
+        entry = _Running(job, alloc)
+        self._start_job(job)
+        with self._changed:
+            self.running[job.id] = entry
+        entry.thread = threading.Thread(target=self._execute, args=(entry,), name=f"job-{job.id}", daemon=True)
+        entry.thread.start()
+        logger.info(f"worker:started jid={job.id} alloc={alloc} running={len(self.running)}")
+
+    # 心跳
+    def heartbeat(self, status: str = "online") -> Dict[str, Any]:
+        snap = self.pool.snapshot()
+        with self._changed:
+            jobs = {jid: entry.started_at for jid, entry in self.running.items()}
+            done = list(self.done)
+        datasets = self._cached_datasets()
+        hostname = socket.gethostname()
+        try:
+            ip = socket.gethostbyname(hostname)
+        except OSError:
+            ip = ""
+        info = {
+            "id": self.node,
+            "ip": ip,
+            "hostname": hostname,
+            "status": status,
+            "last_heartbeat": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "ts": time.time(),
+            "resources": dict(snap, jobs=jobs, done=done, datasets=datasets),
+        }
+        self.connection.hset(NODES_KEY, self.node, json.dumps(info, ensure_ascii=False))
+        return info
+
+    def _cached_datasets(self) -> list:
+        try:
+            from .tasks import _workdir
+            return get_cache(self.workdir or _workdir()).fingerprints()
+        except Exception as e:
+            logger.debug(f"worker:cache_unavailable error={e}")
+            return []
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stopping.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.warning(f"worker:heartbeat_failed error={e}")
+
+    # 控制通道
+    def control(self, message: Dict[str, Any]) -> bool:
+        """
+        执行一条控制决策，返回是否作用于本节点的运行中任务
+        """
+        jid, action = str(message.get("jid")), message.get("action")
+        with self._changed:
+            entry = self.running.get(jid)
+        if entry is None:
+            return False
+        if action == "cancel":
+            entry.cancel.set()
+        elif action == "stop":
+            entry.stop.set()
+        else:
+            logger.warning(f"worker:control_unknown jid={jid} action={action}")
+            return False
+        logger.info(f"worker:control jid={jid} action={action} reason={message.get('reason')}")
+        return True
+
+    def _control_loop(self) -> None:
+        pubsub = None
+        while not self._closed.is_set():
+            try:
+                if pubsub is None:
+                    pubsub = self.connection.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(CONTROL_CHANNEL)
+                message = pubsub.get_message(timeout=self.poll_interval)
+                if message and message.get("type") == "message":
+                    self.control(json.loads(message["data"]))
+            except Exception as e:
+                logger.warning(f"worker:control_failed error={e}")
+                pubsub = None
+                self._closed.wait(self.poll_interval)
+        if pubsub is not None:
+            try:
+                pubsub.close()
+            except Exception:
+                pass
+
+    def _slots_full(self) -> bool:
+        return self.max_jobs > 0 and len(self.running) >= self.max_jobs
+
+    def _wait_change(self, timeout: float) -> None:
+        with self._changed:
+            self._changed.wait(timeout)
+
+    def step(self, timeout: Optional[float] = None) -> bool:
+        """
+        一次调度：尝试启动一个任务，返回是否启动
+        """
+        if self._slots_full():
+            self._wait_change(self.poll_interval)
+            return False
+        item = self._next(timeout)
+        if item is None:
+            return False
+        job, req = item
+        alloc = self.pool.allocate(req)
+        if alloc is None:
+            # 资源不足：保持队首，等待运行中的任务释放
+            self._held = item
+            self._wait_change(self.poll_interval)
+            return False
+        self._held = None
+        self._launch(job, alloc)
+        return True
+
+    def _queues_empty(self) -> bool:
+        return self.node_queue.count == 0 and self.queue.count == 0
+
+    def run(self, burst: bool = False) -> None:
+        logger.info(f"worker:agent_started name={self.name} queues={self.node_queue.name},{self.queue.name} "
+                    f"resources={self.pool.snapshot()}")
+        self.heartbeat()
+        beat = threading.Thread(target=self._heartbeat_loop, name="worker-heartbeat", daemon=True)
+        beat.start()
+        threading.Thread(target=self._control_loop, name="worker-control", daemon=True).start()
+        try:
+            while not self._stopping.is_set():
+                if self.step(None if burst else self.poll_interval):
+                    continue
+                if burst and self._held is None and self._queues_empty():
+                    if not self.running:
+                        break
+                    self._wait_change(self.poll_interval)
+            # 停止取新任务后标记 draining，调度器不再向本节点放置
+            self.heartbeat("draining")
+            self.join()
+        finally:
+            self._stopping.set()
+            self._closed.set()
+            self.connection.hdel(NODES_KEY, self.node)
+        logger.info(f"worker:agent_stopped completed={self.completed} failed={self.failed}")
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for entry in list(self.running.values()):
+            if entry.thread is not None:
+                entry.thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def stop(self, cancel: bool = False) -> None:
+        self._stopping.set()
+        if cancel:
+            for entry in list(self.running.values()):
+                entry.cancel.set()
+        with self._changed:
+            self._changed.notify_all()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="infra-worker", description="训练任务 worker：消费 job_queue 并按资源并发执行")
+    parser.add_argument("--redis-url", default=REDIS_URL)
+    parser.add_argument("--queue", default=JOB_QUEUE_NAME)
+    parser.add_argument("--cpus", type=int, default=WORKER_CPUS, help="可调度的核心数，0 = 全部")
+    parser.add_argument("--memory-mb", type=int, default=WORKER_MEMORY_MB, help="可调度的内存（MB），0 = 物理内存总量")
+    parser.add_argument("--max-jobs", type=int, default=WORKER_MAX_JOBS, help="并发任务上限，0 = 只受资源约束")
+    parser.add_argument("--node", default=None, help="节点标识，默认取 WORKER_NODE_ID 或主机名")
+    parser.add_argument("--burst", action="store_true", help="队列取空且任务全部结束后退出")
+    parser.add_argument("--debug", action="store_true")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    from redis import Redis
+    agent = WorkerAgent(Redis.from_url(args.redis_url), queue_name=args.queue,
+                        pool=ResourcePool.from_config(args.cpus, args.memory_mb), max_jobs=args.max_jobs,
+                        node=args.node)
+
+    def _graceful(signum, frame):
+        # 第一次信号：停止取新任务并等待运行中的任务；第二次：终止训练子进程
+        agent.stop(cancel=agent._stopping.is_set())
+
+    signal.signal(signal.SIGTERM, _graceful)
+    signal.signal(signal.SIGINT, _graceful)
+    agent.run(burst=args.burst)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+数据集缓存（内容寻址）：<cache_root>/<fingerprint>.npz
+
+- 键为数据集指纹（master 导出文件的 ETag = 数据库指纹 + 表名 + 筛选条件 + 格式版本），内容相同的数据集只下载一次
+- ensure(fingerprint, url)：命中直接返回；未命中则从 master 的导出接口下载到 <fingerprint>.npz.part，
+  中断后凭 Range + If-Range 续传，完成后按响应 ETag 原子改名（数据库已变化时以服务端返回的新指纹入库）
+- LRU：每次命中刷新文件 mtime；新条目写入后按 mtime 从旧到新淘汰，直到总大小不超过 max_bytes，
+  正在被任务使用（pin）的条目不淘汰
+- fingerprints()：当前缓存的指纹列表，随心跳上报给调度器做数据本地性放置
+"""
+import os
+import re
+import time
+import logging
+import threading
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_FINGERPRINT = re.compile(r"^[0-9a-f]{8,64}$")
+_CHUNK = 1 << 20
+SUFFIX = ".npz"
+PART_SUFFIX = ".npz.part"
+
+
+def _check(fingerprint: str) -> str:
+    fingerprint = str(fingerprint)
+    if not _FINGERPRINT.match(fingerprint):
+        raise RuntimeError(f"cache:invalid_fingerprint fingerprint={fingerprint!r}")
+    return fingerprint
+
+
+class DatasetCache:
+    """
+    - ensure(fingerprint, url) -> (实际指纹, 路径)：取得并 pin 一个数据集
+    - release(fingerprint)：解除 pin
+    - evict()：按 LRU 淘汰到容量以内，返回被删除的指纹
+    """
+    def __init__(self, root: Path, max_bytes: int, timeout: float = 60.0):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_bytes)
+        self.timeout = float(timeout)
+        self._pins: Dict[str, int] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, fingerprint: str) -> Path:
+        return self.root / f"{_check(fingerprint)}{SUFFIX}"
+
+    def fingerprints(self) -> List[str]:
+        return sorted(p.name[:-len(SUFFIX)] for p in self.root.glob(f"*{SUFFIX}") if _FINGERPRINT.match(p.name[:-len(SUFFIX)]))
+
+    def size(self) -> int:
+        return sum(p.stat().st_size for p in self.root.glob(f"*{SUFFIX}"))
+
+    def _lock(self, fingerprint: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(fingerprint, threading.Lock())
+
+    def _pin(self, fingerprint: str) -> None:
+        with self._guard:
+            self._pins[fingerprint] = self._pins.get(fingerprint, 0) + 1
+
+    def release(self, fingerprint: str) -> None:
+        with self._guard:
+            n = self._pins.get(fingerprint, 0) - 1
+            if n > 0:
+                self._pins[fingerprint] = n
+            else:
+                self._pins.pop(fingerprint, None)
+
+    def ensure(self, fingerprint: str, url: str) -> Tuple[str, Path]:
+        fingerprint = _check(fingerprint)
+        with self._lock(fingerprint):
+            path = self.path(fingerprint)
+            if path.exists():
+                os.utime(path)
+                self.hits += 1
+                self._pin(fingerprint)
+                logger.info(f"cache:hit fingerprint={fingerprint}")
+                return fingerprint, path
+            self.misses += 1
+            actual = self._download(fingerprint, url)
+            self._pin(actual)
+        self.evict()
+        return actual, self.path(actual)
+
+    def _download(self, fingerprint: str, url: str) -> str:
+        part = self.root / f"{fingerprint}{PART_SUFFIX}"
+        offset = part.stat().st_size if part.exists() else 0
+        headers = {}
+        if offset:
+            headers = {"Range": f"bytes={offset}-", "If-Range": f'"{fingerprint}"'}
+        start = time.monotonic()
+        req = urllib.request.Request(url, headers=headers)
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            etag = (resp.headers.get("ETag") or "").strip().strip('"')
+            if resp.status == 206:
+                mode = "ab"
+            else:
+                mode, offset = "wb", 0
+            with open(part, mode) as f:
+                while True:
+                    chunk = resp.read(_CHUNK)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+        actual = etag if etag and _FINGERPRINT.match(etag) else fingerprint
+        if actual != fingerprint:
+            logger.warning(f"cache:fingerprint_changed expected={fingerprint} actual={actual}")
+        os.replace(part, self.path(actual))
+        size = self.path(actual).stat().st_size
+        logger.info(f"cache:fetched fingerprint={actual} bytes={size} resumed_from={offset} "
+                    f"seconds={time.monotonic() - start:.2f}")
+        return actual
+
+    def evict(self) -> List[str]:
+        entries = []
+        for p in self.root.glob(f"*{SUFFIX}"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        total = sum(e[1] for e in entries)
+        removed = []
+        with self._guard:
+            pinned = set(self._pins)
+        for mtime, size, p in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            fingerprint = p.name[:-len(SUFFIX)]
+            if fingerprint in pinned:
+                continue
+            try:
+                p.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed.append(fingerprint)
+            logger.info(f"cache:evicted fingerprint={fingerprint} bytes={size}")
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self.fingerprints()), "bytes": self.size(), "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses}
+
+
+_cache: Optional[DatasetCache] = None
+_cache_guard = threading.Lock()
+
+
+def get_cache(workdir: Path) -> DatasetCache:
+    """
+    进程内共享的缓存实例：目录取 DATASET_CACHE_DIR，缺省为 <workdir>/cache/datasets
+    """
+    from .config import DATASET_CACHE_DIR, DATASET_CACHE_MAX_GB
+    global _cache
+    with _cache_guard:
+        if _cache is None:
+            root = Path(DATASET_CACHE_DIR) if DATASET_CACHE_DIR else Path(workdir) / "cache" / "datasets"
+            _cache = DatasetCache(root, int(DATASET_CACHE_MAX_GB * (1 << 30)))
+        return _cache
@@ -0,0 +1,52 @@
+"""
+训练子进程入口：python -m worker_app.child <exp_plan.json>
+资源限制在导入 torch 之前生效：
+- WORKER_CPU_SET（逗号分隔的核心编号）：绑定 CPU 亲和性
+- WORKER_MEMORY_LIMIT_MB：RLIMIT_DATA 上限（堆与私有可写映射，不含共享库与只读映射），超出时分配失败，子进程以非零码退出
+SIGUSR1：提前停止（master 早停决策），训练在下一个优化步后结束并照常保存、评估；runner 启动子进程时忽略该信号，
+导入完成、注册处理函数后才生效（启动期间收到的信号由 runner 重发），训练结束后恢复为忽略
+计划含 distributed（world_size / nprocs > 1）时改由 infra.distributed 在本进程组内拉起各 rank（分到的核心在 rank 间均分）
+"""
+import os
+import sys
+import json
+import logging
+
+
+def apply_limits() -> None:
+    cpu_set = os.environ.get("WORKER_CPU_SET")
+    if cpu_set and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {int(c) for c in cpu_set.split(",") if c != ""})
+    memory_mb = int(os.environ.get("WORKER_MEMORY_LIMIT_MB") or 0)
+    if memory_mb > 0:
+        import resource
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print("usage: python -m worker_app.child <exp_plan.json>", file=sys.stderr)
+        return 2
+    apply_limits()
+    with open(argv[0], "r", encoding="utf-8") as f:
+        exp_plan = json.load(f)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    from infra import require_workdir
+    from infra.training import run_train
+    from infra.distributed import is_distributed, launch
+    from infra.engine import install_stop_signal, ignore_stop_signal
+    install_stop_signal()
+    require_workdir()
+    try:
+        if is_distributed(exp_plan):
+            return launch(exp_plan)
+        run_train(exp_plan)
+        return 0
+    finally:
+        ignore_stop_signal()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
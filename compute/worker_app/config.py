@@ -0,0 +1,37 @@
+"""
+Worker 配置：环境变量（与 master/backend/app/config.py 的队列名约定一致）
+"""
+import os
+
+REDIS_URL = os.environ.get("REDIS_URL", "redis://redis-queue:6379/0")
+JOB_QUEUE_NAME = os.environ.get("JOB_QUEUE_NAME", "job_queue")
+STATE_QUEUE_NAME = os.environ.get("STATE_QUEUE_NAME", "state-queue")
+RESULT_QUEUE_NAME = os.environ.get("RESULTS_QUEUE_NAME", os.environ.get("RESULT_QUEUE_NAME", "results-queue"))
+
+# 节点标识与可调度资源（默认取整机）
+NODE_ID = os.environ.get("WORKER_NODE_ID", "")
+WORKER_CPUS = int(os.environ.get("WORKER_CPUS", "0"))            # 0 = 当前进程可用的全部核心
+WORKER_MEMORY_MB = int(os.environ.get("WORKER_MEMORY_MB", "0"))  # 0 = 物理内存总量
+WORKER_MAX_JOBS = int(os.environ.get("WORKER_MAX_JOBS", "0"))    # 0 = 只受资源约束
+
+# 任务未声明资源时的默认需求
+JOB_DEFAULT_CPUS = int(os.environ.get("JOB_DEFAULT_CPUS", "1"))
+JOB_DEFAULT_MEMORY_MB = int(os.environ.get("JOB_DEFAULT_MEMORY_MB", "0"))  # 0 = 不限内存
+JOB_TIMEOUT = float(os.environ.get("JOB_TIMEOUT", "0"))                   # 秒，0 = 不限时
+
+# master 地址（如 http://backend:8000）：下载项目数据集、训练结束后回传遥测文件；为空则不回传遥测
+MASTER_URL = os.environ.get("MASTER_URL", "")
+
+# 数据集缓存：按数据集指纹内容寻址，LRU 淘汰；目录缺省为 <workdir>/cache/datasets
+DATASET_CACHE_DIR = os.environ.get("DATASET_CACHE_DIR", "")
+DATASET_CACHE_MAX_GB = float(os.environ.get("DATASET_CACHE_MAX_GB", "50"))
+
+POLL_INTERVAL = float(os.environ.get("WORKER_POLL_INTERVAL", "1"))
+# 心跳：写入 Redis 哈希 NODES_KEY（field = 节点标识），master 调度器据此判断节点在线与空闲资源
+NODES_KEY = os.environ.get("NODES_KEY", "sched:nodes")
+HEARTBEAT_INTERVAL = float(os.environ.get("WORKER_HEARTBEAT_INTERVAL", "5"))
+# 控制通道：master 经 Redis pub/sub 频道 CONTROL_CHANNEL 发布 {"jid", "action": "stop" | "cancel", "reason"}，
+# 同时写入键 <CONTROL_KEY_PREFIX>:<jid>（带过期时间），错过广播的 worker 在任务开始前据此补查
+CONTROL_CHANNEL = os.environ.get("CONTROL_CHANNEL", "control")
+CONTROL_KEY_PREFIX = os.environ.get("CONTROL_KEY_PREFIX", "control:job")
+LOG_TAIL_BYTES = int(os.environ.get("WORKER_LOG_TAIL_BYTES", "4096"))
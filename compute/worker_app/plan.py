@@ -0,0 +1,94 @@
+"""
+任务配置 -> 实验计划（exp_plan）转换
+
+master 入队的载荷为 {"pid", "jid", "name", "config", "created_at", ...}，config 支持三种写法（可混用）：
+- 完整实验计划：{"data": {...}, "model": {...}, "train": {...}, ...}，原样使用
+- 点号分层键：{"train.lr": 1e-3, "model.name": "mlp"}，展开为嵌套字典
+- 前端表单扁平字段（JobConfig）：model_type / epochs / batch_size / learning_rate / dataset_path
+另外两个任务级字段不进入实验计划：
+- "resources": {"cpus": 4, "memory_mb": 8192}：调度与子进程资源限制
+- "timeout": 秒，超时终止训练子进程
+
+转换结果固定：experiment_id = jid（重试落到同一实验目录，可断点续训），report = {pid, jid}（子进程内上报进度）
+载荷带 dataset（master 解析的项目数据集引用）时，data.path 指向 worker 缓存中的导出文件（由调用方传入 data_path）
+"""
+import copy
+from typing import Any, Dict, Tuple
+from .config import JOB_DEFAULT_CPUS, JOB_DEFAULT_MEMORY_MB, JOB_TIMEOUT
+from .reporting import report_config
+
+# 前端扁平字段 -> 实验计划路径
+FLAT_FIELDS = {
+    "model_type": ("model", "name"),
+    "epochs": ("train", "epochs"),
+    "batch_size": ("train", "batch_size"),
+    "learning_rate": ("train", "lr"),
+    "dataset_path": ("data", "path"),
+}
+JOB_FIELDS = ("resources", "timeout")
+
+
+def _set_path(plan: Dict[str, Any], keys: Tuple[str, ...], value: Any) -> None:
+    node = plan
+    for k in keys[:-1]:
+        child = node.get(k)
+        if isinstance(child, str) and k == "model":
+            # "model": "mlp" 简写与 model.params 等子键同时出现时展开
+            child = {"name": child}
+        if not isinstance(child, dict):
+            child = {}
+        node[k] = child
+        node = child
+    node[keys[-1]] = value
+
+
+def job_resources(config: Dict[str, Any]) -> Dict[str, int]:
+    """
+    任务声明的资源需求，缺省取 JOB_DEFAULT_*；memory_mb = 0 表示不限
+    """
+    res = (config or {}).get("resources") or {}
+    cpus = int(res.get("cpus") or JOB_DEFAULT_CPUS)
+    memory_mb = int(res.get("memory_mb") or JOB_DEFAULT_MEMORY_MB)
+    if cpus < 1 or memory_mb < 0:
+        raise RuntimeError(f"worker:invalid_resources cpus={cpus} memory_mb={memory_mb}")
+    return {"cpus": cpus, "memory_mb": memory_mb}
+
+
+def job_timeout(config: Dict[str, Any]) -> float:
+    return float((config or {}).get("timeout") or JOB_TIMEOUT)
+
+
+def build_exp_plan(payload: Dict[str, Any], redis_url: str = None, data_path: str = None) -> Dict[str, Any]:
+    """
+    按任务载荷生成实验计划；data_path 为已取得的数据集文件（.npz）时覆盖 data.path
+    """
+    pid, jid = payload.get("pid"), payload.get("jid")
+    if not pid or not jid:
+        raise RuntimeError("worker:payload_missing_ids")
+    config = payload.get("config") or {}
+    if not isinstance(config, dict):
+        raise RuntimeError(f"worker:invalid_config type={type(config).__name__}")
+    plan: Dict[str, Any] = {}
+    for key, value in config.items():
+        if key in JOB_FIELDS:
+            continue
+        if key in FLAT_FIELDS:
+            _set_path(plan, FLAT_FIELDS[key], copy.deepcopy(value))
+        elif "." in key:
+            _set_path(plan, tuple(key.split(".")), copy.deepcopy(value))
+        elif isinstance(value, dict) and isinstance(plan.get(key), dict):
+            plan[key].update(copy.deepcopy(value))
+        else:
+            plan[key] = copy.deepcopy(value)
+    if data_path:
+        data = plan.get("data") if isinstance(plan.get("data"), dict) else {}
+        data.pop("dataset_id", None)
+        plan["data"] = dict(data, path=str(data_path), format="npz")
+    plan.pop("dataset_id", None)
+    if not (plan.get("data") or {}).get("path"):
+        raise RuntimeError(f"worker:missing_data_path jid={jid}")
+    if not plan.get("model"):
+        raise RuntimeError(f"worker:missing_model jid={jid}")
+    plan["experiment_id"] = str(jid)
+    plan["report"] = dict(plan.get("report") or {}, **report_config(str(pid), str(jid), redis_url))
+    return plan
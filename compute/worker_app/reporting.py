@@ -0,0 +1,51 @@
+"""
+任务生命周期上报：与 master 侧 app/utils/queue.py 的 push_state / push_result 约定一致（RPUSH JSON，必须带 pid / jid）
+连接可注入（set_connection），便于用 fakeredis 等本地替身运行
+"""
+import json
+import time
+from typing import Any, Dict, Optional
+from .config import REDIS_URL, STATE_QUEUE_NAME, RESULT_QUEUE_NAME
+
+# 与 master 侧任务状态码一致
+PENDING, RUNNING, COMPLETED, FAILED, CANCELLED = 0, 1, 2, 3, 4
+
+_redis = None
+
+
+def set_connection(connection) -> None:
+    global _redis
+    _redis = connection
+
+
+def get_connection():
+    global _redis
+    if _redis is None:
+        from redis import Redis
+        _redis = Redis.from_url(REDIS_URL)
+    return _redis
+
+
+def _envelope(pid: str, jid: str, obj: Dict[str, Any]) -> str:
+    payload = {"pid": pid, "jid": jid, "time": time.time()}
+    payload.update(obj)
+    return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def push_state(pid: str, jid: str, state: int, connection=None, **fields: Any) -> int:
+    obj = {"type": "lifecycle", "state": int(state)}
+    obj.update(fields)
+    return (connection or get_connection()).rpush(STATE_QUEUE_NAME, _envelope(pid, jid, obj))
+
+
+def push_result(pid: str, jid: str, state: int, connection=None, **fields: Any) -> int:
+    obj = {"type": "result", "state": int(state)}
+    obj.update(fields)
+    return (connection or get_connection()).rpush(RESULT_QUEUE_NAME, _envelope(pid, jid, obj))
+
+
+def report_config(pid: str, jid: str, redis_url: Optional[str] = None) -> Dict[str, Any]:
+    """
+    训练子进程内 infra.reporter 的配置（exp_plan["report"]），步级摘要与 epoch 进度走同一组队列
+    """
+    return {"pid": pid, "jid": jid, "redis_url": redis_url or REDIS_URL}
@@ -0,0 +1,192 @@
+"""
+资源池与训练子进程
+- ResourcePool：按核心编号与内存（MB）记账，任务声明的资源全部可用时才分配，分到的核心互不重叠
+- run_training：把实验计划写入 <workdir>/jobs/<jid>/exp_plan.json，以独立进程组启动 worker_app.child，
+  日志写入 <workdir>/jobs/<jid>/train.log；超时或取消时先 SIGTERM 整个进程组，宽限期后 SIGKILL
+"""
+import os
+import sys
+import json
+import time
+import signal
+import logging
+import threading
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+KILL_GRACE_SECONDS = 10.0
+
+
+def available_cores() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def physical_memory_mb() -> int:
+    try:
+        return int(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024))
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+class Allocation:
+    """
+    一次分配：cores 为绑定的核心编号，memory_mb 为内存上限（0 = 不限）
+    """
+    def __init__(self, cores: Tuple[int, ...], memory_mb: int):
+        self.cores = tuple(cores)
+        self.memory_mb = int(memory_mb)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"cores": list(self.cores), "cpus": len(self.cores), "memory_mb": self.memory_mb}
+
+    def __repr__(self) -> str:
+        return f"Allocation(cores={self.cores}, memory_mb={self.memory_mb})"
+
+
+class ResourcePool:
+    """
+    - fits(req)：节点总量能否满足（否则任务永远无法在本节点运行）
+    - allocate(req)：当前空闲资源足够时返回 Allocation，否则 None
+    - release(alloc)：归还
+    """
+    def __init__(self, cores: Optional[Sequence[int]] = None, memory_mb: int = 0):
+        self.cores = list(cores) if cores else available_cores()
+        self.memory_mb = int(memory_mb) or physical_memory_mb()
+        self._free_cores = list(self.cores)
+        self._free_memory = self.memory_mb
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cpus: int = 0, memory_mb: int = 0) -> "ResourcePool":
+        cores = available_cores()
+        if cpus:
+            if cpus > len(cores):
+                raise RuntimeError(f"worker:cpus_exceed_available cpus={cpus} available={len(cores)}")
+            cores = cores[:cpus]
+        return cls(cores, memory_mb)
+
+    def fits(self, req: Dict[str, int]) -> bool:
+        return req["cpus"] <= len(self.cores) and req["memory_mb"] <= self.memory_mb
+
+    def allocate(self, req: Dict[str, int]) -> Optional[Allocation]:
+        with self._lock:
+            if req["cpus"] > len(self._free_cores) or req["memory_mb"] > self._free_memory:
+                return None
+            cores, self._free_cores = self._free_cores[:req["cpus"]], self._free_cores[req["cpus"]:]
+            self._free_memory -= req["memory_mb"]
+            return Allocation(tuple(cores), req["memory_mb"])
+
+    def release(self, alloc: Allocation) -> None:
+        with self._lock:
+            self._free_cores = sorted(set(self._free_cores) | set(alloc.cores))
+            self._free_memory = min(self.memory_mb, self._free_memory + alloc.memory_mb)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {"cpus": len(self.cores), "memory_mb": self.memory_mb,
+                    "free_cpus": len(self._free_cores), "free_memory_mb": self._free_memory}
+
+
+def job_dir(workdir: Path, jid: str) -> Path:
+    return Path(workdir) / "jobs" / str(jid)
+
+
+def _child_env(alloc: Optional[Allocation]) -> Dict[str, str]:
+    env = dict(os.environ)
+    # 保证子进程能导入 worker_app（源码目录运行时不依赖 pip install -e）
+    root = str(Path(__file__).resolve().parent.parent)
+    env["PYTHONPATH"] = root + (os.pathsep + env["PYTHONPATH"] if env.get("PYTHONPATH") else "")
+    if alloc is not None and alloc.cores:
+        threads = str(len(alloc.cores))
+        env["WORKER_CPU_SET"] = ",".join(str(c) for c in alloc.cores)
+        env["OMP_NUM_THREADS"] = threads
+        env["MKL_NUM_THREADS"] = threads
+    if alloc is not None:
+        env["WORKER_MEMORY_LIMIT_MB"] = str(alloc.memory_mb)
+    return env
+
+
+def _terminate(proc: subprocess.Popen) -> None:
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        return
+    try:
+        proc.wait(timeout=KILL_GRACE_SECONDS)
+    except subprocess.TimeoutExpired:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        proc.wait()
+
+
+def read_tail(path: Path, limit: int) -> str:
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - limit))
+            return f.read().decode("utf-8", errors="replace")
+    except OSError:
+        return ""
+
+
+def _ignore_stop_signal() -> None:
+    # 子进程注册处理函数前忽略提前停止信号（默认动作为终止进程）
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+
+
+def run_training(exp_plan: Dict[str, Any], workdir: Path, alloc: Optional[Allocation] = None,
+                 timeout: float = 0, cancel: Optional[threading.Event] = None,
+                 stop: Optional[threading.Event] = None) -> Dict[str, Any]:
+    """
+    在子进程中执行 infra.training.run_train，阻塞直到结束
+    - cancel 置位：终止整个进程组（CANCELLED）
+    - stop 置位：向进程组发送 SIGUSR1 请求提前停止（训练在下一个优化步后结束，照常保存、评估），子进程未退出前每次轮询重发
+    返回 {"returncode", "elapsed", "timed_out", "cancelled", "stopped", "log"}
+    """
+    jid = exp_plan["experiment_id"]
+    jdir = job_dir(workdir, jid)
+    jdir.mkdir(parents=True, exist_ok=True)
+    plan_path = jdir / "exp_plan.json"
+    with open(plan_path, "w", encoding="utf-8") as f:
+        json.dump(exp_plan, f, ensure_ascii=False, indent=2)
+    log_path = jdir / "train.log"
+    start = time.monotonic()
+    timed_out = cancelled = stopped = False
+    with open(log_path, "ab") as log:
+        proc = subprocess.Popen([sys.executable, "-m", "worker_app.child", str(plan_path)], stdout=log,
+                                stderr=subprocess.STDOUT, env=_child_env(alloc), cwd=str(jdir),
+                                start_new_session=True, preexec_fn=_ignore_stop_signal)
+        logger.info(f"worker:spawned jid={jid} pid={proc.pid} alloc={alloc}")
+        while True:
+            try:
+                proc.wait(timeout=0.5)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            if timeout and time.monotonic() - start > timeout:
+                timed_out = True
+            elif cancel is not None and cancel.is_set():
+                cancelled = True
+            if timed_out or cancelled:
+                _terminate(proc)
+                break
+            if stop is not None and stop.is_set():
+                if not stopped:
+                    logger.info(f"worker:stop_requested jid={jid} pid={proc.pid}")
+                stopped = True
+                try:
+                    os.killpg(proc.pid, signal.SIGUSR1)
+                except (ProcessLookupError, PermissionError):
+                    pass
+    elapsed = time.monotonic() - start
+    logger.info(f"worker:exited jid={jid} code={proc.returncode} elapsed={elapsed:.1f}s timed_out={timed_out}")
+    return {"returncode": proc.returncode, "elapsed": elapsed, "timed_out": timed_out,
+            "cancelled": cancelled, "stopped": stopped, "log": str(log_path)}
@@ -0,0 +1,146 @@
+"""
+RQ 任务：worker_app.process_training（master 的 routes/jobs.create_job 按此路径入队）
+
+流程：
+1. 载荷 -> 实验计划（plan.build_exp_plan），校验失败直接上报 FAILED
+2. 上报 RUNNING（state 队列，含节点与分配的资源）
+3. 载荷带项目数据集引用（dataset: {fingerprint, url}）时经本地数据集缓存取得导出文件（命中则不再下载）
+4. 子进程执行 run_train（runner.run_training），训练中的步级摘要 / epoch 进度由子进程内的 infra.reporter 直接上报
+5. 结束后上报终态：COMPLETED 时结果载荷带测试集指标；FAILED 时带退出码与日志尾部
+6. 配置了 MASTER_URL 时回传遥测文件（PUT /api/projects/<pid>/jobs/<jid>/telemetry），失败只记日志
+
+既可由 agent（WorkerAgent）按资源并发调度，也可直接用 `rq worker job_queue` 串行执行（此时不绑核，只按任务声明限制内存）
+"""
+import json
+import socket
+import logging
+import threading
+import datetime
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, Optional
+from .config import NODE_ID, MASTER_URL, LOG_TAIL_BYTES
+from .plan import build_exp_plan, job_resources, job_timeout
+from .runner import Allocation, run_training, read_tail
+from .cache import get_cache
+from .reporting import push_state, push_result, RUNNING, COMPLETED, FAILED, CANCELLED
+
+logger = logging.getLogger(__name__)
+
+
+def node_id() -> str:
+    return NODE_ID or socket.gethostname()
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def _workdir() -> Path:
+    from infra import get_workdir, require_workdir
+    require_workdir()
+    return Path(get_workdir())
+
+
+def _read_metrics(experiment_dir: Path) -> Optional[Dict[str, Any]]:
+    path = experiment_dir / "metrics.json"
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            metrics = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return metrics.get("overall", metrics) if isinstance(metrics, dict) else None
+
+
+def upload_telemetry(pid: str, jid: str, experiment_dir: Path, master_url: str = MASTER_URL) -> bool:
+    path = experiment_dir / "training" / "telemetry.npz"
+    if not master_url or not path.exists():
+        return False
+    url = f"{master_url.rstrip('/')}/api/projects/{pid}/jobs/{jid}/telemetry"
+    req = urllib.request.Request(url, data=path.read_bytes(), method="PUT",
+                                 headers={"Content-Type": "application/octet-stream"})
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            resp.read()
+    except Exception as e:
+        logger.warning(f"worker:telemetry_upload_failed jid={jid} error={e}")
+        return False
+    return True
+
+
+def process_training(payload: Dict[str, Any], allocation: Optional[Allocation] = None, connection=None,
+                     cancel: Optional[threading.Event] = None, workdir: Optional[Path] = None,
+                     node: Optional[str] = None, stop: Optional[threading.Event] = None) -> Dict[str, Any]:
+    """
+    执行一个训练任务并上报生命周期，返回终态摘要（RQ 将其保存为任务结果）
+    - cancel：终止训练（CANCELLED）；stop：提前停止（正常结束训练并评估，COMPLETED 且 early_stopped = true）
+    """
+    pid, jid = str(payload.get("pid")), str(payload.get("jid"))
+    node = node or node_id()
+    workdir = Path(workdir) if workdir else _workdir()
+    dataset = payload.get("dataset") or {}
+    cache = get_cache(workdir) if dataset else None
+    try:
+        data_path = cache.path(dataset.get("fingerprint")) if dataset else None
+        if dataset and not MASTER_URL and not data_path.exists():
+            raise RuntimeError("worker:dataset_requires_master_url")
+        exp_plan = build_exp_plan(payload, data_path=data_path)
+        resources = job_resources(payload.get("config") or {})
+    except RuntimeError as e:
+        logger.error(f"worker:rejected jid={jid} error={e}")
+        push_state(pid, jid, FAILED, connection, node=node, error=str(e), finished_at=_now())
+        push_result(pid, jid, FAILED, connection, node=node, error=str(e))
+        return {"jid": jid, "state": FAILED, "error": str(e)}
+    if allocation is None and resources["memory_mb"]:
+        # 直接由 rq worker 执行：不绑核，仅限制内存
+        allocation = Allocation((), resources["memory_mb"])
+    experiment_dir = workdir / "experiments" / exp_plan["experiment_id"]
+    started_at = _now()
+    push_state(pid, jid, RUNNING, connection, node=node, started_at=started_at, progress=0,
+               resources=allocation.as_dict() if allocation else resources)
+
+    fingerprint = None
+    try:
+        if dataset:
+            try:
+                fingerprint, path = cache.ensure(dataset["fingerprint"], f"{MASTER_URL.rstrip('/')}{dataset.get('url', '')}")
+            except Exception as e:
+                error = f"worker:dataset_fetch_failed error={e}"
+                logger.error(f"{error} jid={jid}")
+                push_state(pid, jid, FAILED, connection, node=node, error=error, finished_at=_now())
+                push_result(pid, jid, FAILED, connection, node=node, error=error)
+                return {"jid": jid, "state": FAILED, "error": error}
+            exp_plan["data"]["path"] = str(path)
+        outcome = run_training(exp_plan, workdir, allocation, timeout=job_timeout(payload.get("config") or {}),
+                               cancel=cancel, stop=stop)
+    except Exception as e:
+        # 训练子进程未能启动（Popen 的 OSError、工作目录不可写等）：上报终态，主控端据此释放调度放置与去重登记
+        error = f"worker:training_launch_failed error={e}"
+        logger.exception(f"{error} jid={jid}")
+        summary = {"node": node, "error": error, "experiment": str(experiment_dir), "finished_at": _now()}
+        push_state(pid, jid, FAILED, connection, **summary)
+        push_result(pid, jid, FAILED, connection, **summary)
+        return dict(summary, jid=jid, state=FAILED)
+    finally:
+        if fingerprint:
+            cache.release(fingerprint)
+    summary: Dict[str, Any] = {"node": node, "used_time": round(outcome["elapsed"], 3),
+                               "experiment": str(experiment_dir), "finished_at": _now()}
+    if outcome["returncode"] == 0:
+        state = COMPLETED
+        summary["metrics"] = _read_metrics(experiment_dir)
+        if outcome.get("stopped"):
+            summary["early_stopped"] = True
+        push_state(pid, jid, state, connection, progress=1.0, **summary)
+    else:
+        state = CANCELLED if outcome["cancelled"] else FAILED
+        summary["returncode"] = outcome["returncode"]
+        summary["error"] = "timeout" if outcome["timed_out"] else ("cancelled" if outcome["cancelled"] else "exit")
+        summary["log_tail"] = read_tail(Path(outcome["log"]), LOG_TAIL_BYTES)
+        push_state(pid, jid, state, connection, **summary)
+    push_result(pid, jid, state, connection, **summary)
+    upload_telemetry(pid, jid, experiment_dir)
+    logger.info(f"worker:finished jid={jid} state={state} used_time={summary['used_time']}")
+    return dict(summary, jid=jid, state=state)
@@ -3,13 +3,16 @@
 """
 import os
 import logging
+import subprocess
 
+APP_VERSION = "1.0.0"
 WORKDIR_CONTAINER = os.environ.get("WORKDIR_CONTAINER", "/data")
 WORKDIR = WORKDIR_CONTAINER
 USER_FILE = os.path.join(WORKDIR, ".user")
 METADATA_DB = os.environ.get("METADATA_DB", os.path.join(WORKDIR, "metadata", "database.db"))
 MUTATIONS_TABLE = "mutations"
 SOURCES_TABLE = "sources"
+# 单点突变片段（如 A123C）：残基字母不区分大小写，写入序列时转为大写；与计算端 infra.data 的解析规则保持一致
 MUTATION_REGEX = r"^([A-Za-z])(\d+)([A-Za-z])$"
 METADATA_TABLE = os.environ.get("METADATA_TABLE", MUTATIONS_TABLE)
 METADATA_DEFAULT_PAGE_SIZE = int(os.environ.get("METADATA_DEFAULT_PAGE_SIZE", "25"))
@@ -28,6 +31,79 @@ JOB_QUEUE_NAME = os.environ.get("JOB_QUEUE_NAME", "job_queue")
 INIT_QUEUE_NAME = os.environ.get("INIT_QUEUE_NAME", "init-queue")
 STATE_QUEUE_NAME = os.environ.get("STATE_QUEUE_NAME", "state-queue")
 RESULT_QUEUE_NAME = os.environ.get("RESULT_QUEUE_NAME", "results-queue")
+TELEMETRY_MAX_BYTES = int(os.environ.get("TELEMETRY_MAX_BYTES", str(256 * 1024 * 1024)))
+CURVE_MAX_POINTS = int(os.environ.get("CURVE_MAX_POINTS", "5000"))
+
+# 调度器：节点心跳、按资源放置到各节点的任务队列（<JOB_QUEUE_NAME>:<node_id>）
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "1") not in ("0", "false", "False")
+SCHED_INTERVAL = float(os.environ.get("SCHED_INTERVAL", "1"))
+SCHED_NODE_TIMEOUT = float(os.environ.get("SCHED_NODE_TIMEOUT", "30"))
+SCHED_RESERVE_AFTER = float(os.environ.get("SCHED_RESERVE_AFTER", "300"))
+SCHED_DEFAULT_CPUS = int(os.environ.get("SCHED_DEFAULT_CPUS", "1"))
+SCHED_DEFAULT_MEMORY_MB = int(os.environ.get("SCHED_DEFAULT_MEMORY_MB", "0"))
+SCHED_METRICS_WINDOW = int(os.environ.get("SCHED_METRICS_WINDOW", "1024"))
+NODES_KEY = os.environ.get("NODES_KEY", "sched:nodes")
+SCHED_PENDING_KEY = os.environ.get("SCHED_PENDING_KEY", "sched:pending")
+SCHED_PLACED_KEY = os.environ.get("SCHED_PLACED_KEY", "sched:placed")
+
+# 任务去重：实验计划指纹（规范化配置 + 数据集指纹 + 代码版本）相同的进行中任务合并，已完成的直接返回记忆的结果
+# 代码版本：镜像构建时经 --build-arg GIT_REV 写入 JOB_CODE_VERSION；未设置时取源码目录的 git 提交号，均不可得时为 APP_VERSION
+def _code_version() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short=12", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                             capture_output=True, text=True, timeout=5)
+        if out.returncode == 0 and out.stdout.strip():
+            return out.stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return APP_VERSION
+
+
+JOB_CODE_VERSION = os.environ.get("JOB_CODE_VERSION") or _code_version()
+JOB_INFLIGHT_TTL = float(os.environ.get("JOB_INFLIGHT_TTL", str(7 * 24 * 3600)))
+JOBS_INFLIGHT_KEY = os.environ.get("JOBS_INFLIGHT_KEY", "jobs:inflight")
+# 结果记忆按代码版本分命名空间（<JOBS_MEMO_KEY>:<JOB_CODE_VERSION>:<pid>:<指纹>），每条 JOB_MEMO_TTL 秒后过期
+JOBS_MEMO_KEY = os.environ.get("JOBS_MEMO_KEY", "jobs:memo")
+JOB_MEMO_TTL = int(os.environ.get("JOB_MEMO_TTL", str(30 * 24 * 3600)))
+JOBS_FINGERPRINT_KEY = os.environ.get("JOBS_FINGERPRINT_KEY", "jobs:fingerprints")
+
+# 控制通道：取消 / 早停决策经 pub/sub 频道 CONTROL_CHANNEL 广播给 worker，并写入 <CONTROL_KEY_PREFIX>:<jid>（CONTROL_TTL 秒后过期）
+CONTROL_CHANNEL = os.environ.get("CONTROL_CHANNEL", "control")
+CONTROL_KEY_PREFIX = os.environ.get("CONTROL_KEY_PREFIX", "control:job")
+CONTROL_TTL = int(os.environ.get("CONTROL_TTL", str(7 * 24 * 3600)))
+# 超参搜索（sweep）：试验 jid -> sweep id，sweep id -> {pid, stopper}，各 sweep 的学习曲线与早停决策存于 sweep:<sid>:*
+SWEEP_TRIALS_KEY = os.environ.get("SWEEP_TRIALS_KEY", "sweep:trials")
+SWEEPS_KEY = os.environ.get("SWEEPS_KEY", "sweep:index")
+SWEEP_MAX_TRIALS = int(os.environ.get("SWEEP_MAX_TRIALS", "256"))
+
+# 队列健康监控：采样周期、消费速率窗口（采样次数），背压阈值（状态队列积压条数、最旧载荷等待秒数、内存占 maxmemory 的比例）
+MONITOR_INTERVAL = float(os.environ.get("MONITOR_INTERVAL", "5"))
+MONITOR_WINDOW = int(os.environ.get("MONITOR_WINDOW", "12"))
+QUEUE_HEALTH_KEY = os.environ.get("QUEUE_HEALTH_KEY", "queue:health")
+QUEUE_BACKLOG_THRESHOLD = int(os.environ.get("QUEUE_BACKLOG_THRESHOLD", "10000"))
+QUEUE_AGE_THRESHOLD = float(os.environ.get("QUEUE_AGE_THRESHOLD", "60"))
+QUEUE_MEMORY_THRESHOLD = float(os.environ.get("QUEUE_MEMORY_THRESHOLD", "0.8"))
+
+# 多 worker 进程部署：后台循环（保存器 / 调度 / 监控）只在选举出的主进程中运行；计数器与统计快照经 Redis 在进程间共享
+LEADER_KEY = os.environ.get("LEADER_KEY", "leader:backend")
+LEADER_TTL = float(os.environ.get("LEADER_TTL", "15"))
+STATS_KEY_PREFIX = os.environ.get("STATS_KEY_PREFIX", "stats")
+MONITOR_SAMPLE_KEY = os.environ.get("MONITOR_SAMPLE_KEY", "queue:sample")
+SCHED_STATS_KEY = os.environ.get("SCHED_STATS_KEY", "sched:stats")
+# 登录失败计数 / 封禁在 Redis 中的键前缀：<AUTH_KEY_PREFIX>:fail:<ip>（有序集合）、<AUTH_KEY_PREFIX>:ban:<ip>
+AUTH_KEY_PREFIX = os.environ.get("AUTH_KEY_PREFIX", "auth")
+
+# 路由层阻塞 I/O（文件读写、SQLite、目录扫描）在专用的有界线程池中执行：IO_WORKERS 个线程，
+# 至多 IO_QUEUE_LIMIT 个请求排队，超出时返回 503
+IO_WORKERS = int(os.environ.get("IO_WORKERS", "16"))
+IO_QUEUE_LIMIT = int(os.environ.get("IO_QUEUE_LIMIT", "256"))
+# 路由延迟直方图：桶边界（秒，逗号分隔），各进程每 LATENCY_FLUSH_INTERVAL 秒把增量合并到 Redis
+LATENCY_BUCKETS = tuple(float(b) for b in os.environ.get(
+    "LATENCY_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10").split(","))
+LATENCY_FLUSH_INTERVAL = float(os.environ.get("LATENCY_FLUSH_INTERVAL", "5"))
+# 回收站：保留 RECYCLE_RETENTION_DAYS 天，由主进程的后台任务每 RECYCLE_PURGE_INTERVAL 秒清理一次
+RECYCLE_RETENTION_DAYS = int(os.environ.get("RECYCLE_RETENTION_DAYS", "30"))
+RECYCLE_PURGE_INTERVAL = float(os.environ.get("RECYCLE_PURGE_INTERVAL", "3600"))
 
 os.makedirs(os.path.join(WORKDIR, "logs"), exist_ok=True)
 os.makedirs(os.path.join(WORKDIR, "security"), exist_ok=True)
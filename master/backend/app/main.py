@@ -12,26 +12,42 @@ from app.routes.projects import router as projects_router
 from app.routes.metadata import router as metadata_router
 from app.routes.recycle import router as recycle_router
 from app.routes.jobs import router as jobs_router
+from app.routes.nodes import router as nodes_router
+from app.routes.sweeps import router as sweeps_router
+from app.routes.metrics import router as metrics_router
 from app.utils.security import ban_manager
-from app.config import WORKDIR
+from app.config import APP_VERSION, WORKDIR, SCHEDULER_ENABLED
 
 import os
+import time
 import asyncio
 from app.services.saver import run_saver
+from app.services.scheduler import run_scheduler
+from app.services.monitor import run_monitor
+from app.services.leader import run_leader
+from app.services.recycle import run_recycle_purger
+from app.utils.executor import shutdown_io
+from app.utils.latency import get_latency, run_latency_flusher
 
 async def lifespan(app: FastAPI):
     # 应用启动时的生命周期管理函数
     # 负责在 FastAPI 应用启动和关闭时执行异步任务
-    # 此处启动后台保存服务（run_saver），并在应用关闭时优雅停止
+    # 后台保存服务（run_saver）、队列监控（run_monitor）与调度循环（run_scheduler）只在选举出的主进程中运行：
+    # 多个 worker 进程（gunicorn -w N）各自参与选举（run_leader），当选者启动这些循环，应用关闭时优雅停止并让出主进程身份
+    # 回收站清理（run_recycle_purger）同样只在主进程运行；路由延迟直方图的合并（run_latency_flusher）每个进程都运行
     stop_event = asyncio.Event()
-    task = asyncio.create_task(run_saver(stop_event))
+    loops = [run_saver, run_monitor, run_recycle_purger]
+    if SCHEDULER_ENABLED:
+        loops.append(run_scheduler)
+    tasks = [asyncio.create_task(run_leader(stop_event, loops)), asyncio.create_task(run_latency_flusher(stop_event))]
     try:
         yield
     finally:
         stop_event.set()
-        await task
+        await asyncio.gather(*tasks)
+        shutdown_io()
 
-app = FastAPI(title="ProteinX Infra Master API", version="1.0.0", lifespan=lifespan)
+app = FastAPI(title="ProteinX Infra Master API", version=APP_VERSION, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -44,17 +60,34 @@ app.add_middleware(
 class IPBanMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         ip = request.client.host if request.client else ""
-        if ip and ban_manager.is_banned(ip):
+        # 封禁状态存于 Redis（所有 worker 进程共享），查询放到线程池，避免阻塞事件循环
+        if ip and await asyncio.to_thread(ban_manager.is_banned, ip):
             return Response(status_code=404)
         return await call_next(request)
 
 app.add_middleware(IPBanMiddleware)
 
+class LatencyMiddleware(BaseHTTPMiddleware):
+    # 按路由模板记录延迟直方图（/metrics 中的 http_request_duration_seconds），最外层注册以计入封禁检查
+    async def dispatch(self, request: Request, call_next):
+        start = time.perf_counter()
+        try:
+            return await call_next(request)
+        finally:
+            route = request.scope.get("route")
+            get_latency().observe(request.method, getattr(route, "path", None) or "unmatched",
+                                  time.perf_counter() - start)
+
+app.add_middleware(LatencyMiddleware)
+
 app.include_router(auth_router)
 app.include_router(projects_router)
 app.include_router(metadata_router)
 app.include_router(recycle_router)
 app.include_router(jobs_router)
+app.include_router(nodes_router)
+app.include_router(sweeps_router)
+app.include_router(metrics_router)
 
 os.makedirs(os.path.join(WORKDIR, "logs"), exist_ok=True)
 
@@ -96,6 +96,7 @@ class DatasetInfo(BaseModel):
     table: Optional[str]
     created_at: str
     rows_count: int
+    fingerprint: Optional[str] = None
 
 class RecycleItem(BaseModel):
     id: str
@@ -27,8 +27,12 @@ def auth_register(params: RegisterParams):
         "password_hash": pwd_hash,
         "created_at": datetime.datetime.utcnow().isoformat(),
     }
-    with open(USER_FILE, "w", encoding="utf-8") as f:
-        json.dump(payload, f)
+    # 独占创建：多个 worker 进程并发注册时只有一个成功
+    try:
+        with open(USER_FILE, "x", encoding="utf-8") as f:
+            json.dump(payload, f)
+    except FileExistsError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="User already registered")
     return {"ok": True}
 
 @router.post("/token")
@@ -1,13 +1,26 @@
+import io
 import os
 import json
+import time
 import datetime
+import numpy as np
 from typing import Optional, Dict, Any, List
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Request
+from app.config import TELEMETRY_MAX_BYTES, CURVE_MAX_POINTS, SCHEDULER_ENABLED
 from app.utils.projects import projects_root, read_project_info
-from app.utils.queue import job_queue, push_init
+from app.utils.queue import job_queue, push_init, push_state, push_result
+from app.utils.curves import KINDS, BASE_COLUMNS, load_telemetry, downsample_curves
+from app.services.scheduler import get_scheduler, job_resources, TASK_NAME
+from app.services.exporter import read_dataset_info, dataset_etag
+from app.services.dedup import get_job_index, plan_fingerprint
+from app.services.control import get_controller
+from app.utils.common import new_ulid
+from app.utils.executor import run_io
 
 router = APIRouter(prefix="/api/projects", tags=["jobs"])
 
+CANCELLED = 4
+
 def _jobs_dir(pid: str) -> str:
     """
     返回指定项目的 jobs 目录路径，若项目不存在则抛出 404。同时会创建 jobs 目录（若不存在）。
@@ -28,52 +41,154 @@ def _job_paths(pid: str, jid: str) -> Dict[str, str]:
     - meta: 任务元信息JSON路径
     - log: 任务日志文件路径
     - state: 任务状态扩展JSON路径
-    - cancel: 任务取消标记文件路径
     """
     jdir = _jobs_dir(pid)
     meta = os.path.join(jdir, f"{jid}.json")
     log = os.path.join(jdir, f"{jid}.log")
     state = os.path.join(jdir, f"{jid}.state.json")
-    cancel = os.path.join(jdir, f"{jid}.cancel")
-    return {"meta": meta, "log": log, "state": state, "cancel": cancel}
+    return {"meta": meta, "log": log, "state": state}
 
-@router.post("/{pid}/jobs")
-def create_job(pid: str, body: Dict[str, Any] = Body(...)):
+def _dataset_ref(pid: str, config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
-    创建并提交一个训练任务。
-    - pid: 项目标识
-    - body: 请求体，包含可选字段：
-        - name: 任务名称，若为空则自动生成
-        - config: 训练配置字典，默认为空字典
-    - 返回: 包含新任务 id 的字典
-    - 异常: 500 若 Redis 入队失败
+    任务引用项目数据集（config.data.dataset_id 或扁平字段 dataset_id）时，解析为 worker 可下载、可缓存的引用：
+    {"did", "fingerprint", "url", "rows"}；fingerprint 为当前导出文件的 ETag（数据库变化后随之变化）
+    - 异常: 404 若数据集不存在
     """
+    data = config.get("data") if isinstance(config.get("data"), dict) else {}
+    did = data.get("dataset_id") or config.get("dataset_id")
+    if not did:
+        return None
+    did = str(did)
+    info = read_dataset_info(pid, did)
+    return {
+        "did": did,
+        "fingerprint": dataset_etag(info.get("table"), info.get("filters") or []),
+        "url": f"/api/projects/{pid}/datasets/{did}/export",
+        "rows": info.get("rows_count"),
+    }
 
-    read_project_info(pid)
-    name = str(body.get("name") or f"experiment-{pid}")
-    config = body.get("config") or {}
+def check_job_config(config: Dict[str, Any], priority: Any = 0) -> int:
+    """
+    校验训练配置的资源声明与调度优先级，返回整数优先级
+    - 异常: 400 若资源声明或优先级非法
+    """
+    try:
+        priority = int(priority or 0)
+        job_resources(config)
+    except (TypeError, ValueError, RuntimeError):
+        raise HTTPException(status_code=400, detail="资源声明或优先级非法")
+    return priority
+
+def submit_job(pid: str, name: str, config: Dict[str, Any], priority: int = 0, force: bool = False,
+               extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    去重后提交一个训练任务（create_job 与 sweep 共用）。
+    - extra: 附加到任务载荷的字段（例如 sweep 试验的 sweep id）
+    - 返回: {"id", "fingerprint", "deduplicated": null | "inflight" | "memo"[, "result"]}
+    - 异常: 404 若引用的数据集不存在；500 若 Redis 入队失败
+    """
+    dataset = _dataset_ref(pid, config)
+    fingerprint = plan_fingerprint(config, dataset["fingerprint"] if dataset else None)
     now = datetime.datetime.now(datetime.timezone.utc).isoformat()
-    jid = f"job_id{int(datetime.datetime.now(datetime.timezone.utc).timestamp())}"
-    paths = _job_paths(pid, jid)
+    jid = f"job_{new_ulid()}"
     payload = {
         "pid": pid,
         "jid": jid,
         "name": name,
         "config": config,
+        "fingerprint": fingerprint,
         "created_at": now,
         "state": 0,
         "progress": 0,
         "used_time": 0,
     }
+    if dataset:
+        payload["dataset"] = dataset
+    if extra:
+        payload.update(extra)
+    index = get_job_index()
+    try:
+        if not force:
+            hit = index.memo(pid, fingerprint)
+            if hit:
+                return {"id": hit["jid"], "fingerprint": fingerprint, "deduplicated": "memo", "result": hit}
+        existing = index.claim(pid, fingerprint, jid, force=force)
+        if existing:
+            return {"id": existing, "fingerprint": fingerprint, "deduplicated": "inflight"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="队列入队失败，请检查Redis连接与认证配置")
     try:
-        job_queue.enqueue("worker_app.process_training", payload, job_id=jid)
+        if SCHEDULER_ENABLED:
+            # 由调度器按节点资源放置到各节点队列
+            get_scheduler().submit(payload, priority=priority)
+        else:
+            job_queue.enqueue(TASK_NAME, payload, job_id=jid, job_timeout=-1)
         push_init(payload)
-        return {"id": jid}
+        return {"id": jid, "fingerprint": fingerprint, "deduplicated": None}
     except Exception as e:
+        index.release(pid, fingerprint, jid)
         raise HTTPException(status_code=500, detail="队列入队失败，请检查Redis连接与认证配置")
 
-@router.get("/{pid}/jobs")
-def list_jobs(pid: str, status: Optional[str] = None, sort: Optional[str] = "time_desc"):
+@router.post("/{pid}/jobs")
+async def create_job(pid: str, body: Dict[str, Any] = Body(...)):
+    """
+    创建并提交一个训练任务。
+    - pid: 项目标识
+    - body: 请求体，包含可选字段：
+        - name: 任务名称，若为空则自动生成
+        - config: 训练配置字典，默认为空字典；config.resources = {"cpus", "memory_mb"} 声明资源需求；
+          config.data.dataset_id 引用项目数据集（worker 按数据集指纹缓存，调度器优先放到已有该数据的节点）
+        - priority: 调度优先级（整数，越大越先调度），默认 0
+        - force: 为真时跳过去重，强制重新训练
+    - 去重：按实验计划指纹（规范化配置 + 数据集指纹 + 代码版本），相同计划的进行中任务直接返回其 id（deduplicated = "inflight"），
+      已完成的返回记忆的任务与指标（deduplicated = "memo"），均不再入队
+    - 返回: {"id": 任务 id（ULID，job_<ULID>）, "fingerprint": 计划指纹, "deduplicated": null | "inflight" | "memo"[, "result"]}
+    - 异常: 400 若资源声明或优先级非法；404 若引用的数据集不存在；500 若 Redis 入队失败
+    """
+    return await run_io(_create_job, pid, body)
+
+def _create_job(pid: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    read_project_info(pid)
+    name = str(body.get("name") or f"experiment-{pid}")
+    config = body.get("config") or {}
+    priority = check_job_config(config, body.get("priority"))
+    return submit_job(pid, name, config, priority=priority, force=bool(body.get("force")))
+
+@router.post("/{pid}/jobs/{jid}/cancel")
+async def cancel_job(pid: str, jid: str):
+    """
+    取消任务。
+    - 尚未开始执行（待调度、已放置到节点队列但未被 worker 取走，或仍在共享队列中）：直接撤出队列，
+      并向状态流与结果流写入 CANCELLED（dequeued = true）
+    - 已在执行或状态未知：经控制通道下发 cancel 决策，运行该任务的 worker 终止训练子进程并上报 CANCELLED；
+      决策同时保留一段时间，尚未开始的任务被 worker 取到时直接判为 CANCELLED（dequeued = false）
+    - 返回: {"id", "cancelled": true, "dequeued": bool}
+    - 异常: 404 若项目不存在；500 若 Redis 操作失败
+    """
+    return await run_io(request_cancel, pid, jid)
+
+def request_cancel(pid: str, jid: str) -> Dict[str, Any]:
+    """
+    取消任务（同步实现，供 cancel_job 与 sweep 提交失败时的回滚使用）
+    """
+    read_project_info(pid)
+    try:
+        if SCHEDULER_ENABLED:
+            dequeued = get_scheduler().cancel(jid)
+        else:
+            dequeued = bool(job_queue.remove(jid))
+        if dequeued:
+            event = {"pid": pid, "jid": jid, "type": "lifecycle", "state": CANCELLED,
+                     "time": time.time(), "error": "cancelled:user"}
+            push_state(event)
+            push_result(dict(event, type="result"))
+        else:
+            get_controller().publish(pid, jid, "cancel", "user")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="队列操作失败，请检查Redis连接与认证配置")
+    return {"id": jid, "cancelled": True, "dequeued": dequeued}
+
+def _list_jobs(pid: str, status: Optional[str], sort: Optional[str]) -> Dict[str, Any]:
     jdir = _jobs_dir(pid)
     info_path = os.path.join(jdir, "jobs_info.json")
     items: List[Dict[str, Any]] = []
@@ -97,8 +212,11 @@ def list_jobs(pid: str, status: Optional[str] = None, sort: Optional[str] = "tim
     items.sort(key=keyfunc, reverse=reverse)
     return {"items": items, "total": len(items)}
 
-@router.get("/{pid}/jobs/{jid}")
-def job_detail(pid: str, jid: str):
+@router.get("/{pid}/jobs")
+async def list_jobs(pid: str, status: Optional[str] = None, sort: Optional[str] = "time_desc"):
+    return await run_io(_list_jobs, pid, status, sort)
+
+def _job_detail(pid: str, jid: str) -> Dict[str, Any]:
     jdir = _jobs_dir(pid)
     info_path = os.path.join(jdir, "jobs_info.json")
     if not os.path.exists(info_path):
@@ -134,3 +252,83 @@ def job_detail(pid: str, jid: str):
         except:
             pass
     return detail
+
+@router.get("/{pid}/jobs/{jid}")
+async def job_detail(pid: str, jid: str):
+    return await run_io(_job_detail, pid, jid)
+
+def _telemetry_dir(pid: str, jid: str) -> str:
+    """
+    任务遥测目录：data/projects/<pid>/jobs/<jid>/training
+    """
+    jdir = _jobs_dir(pid)
+    if os.path.basename(jid) != jid or jid in ("", ".", ".."):
+        raise HTTPException(status_code=400, detail="Invalid job id")
+    return os.path.join(jdir, jid, "training")
+
+@router.put("/{pid}/jobs/{jid}/telemetry")
+async def upload_telemetry(pid: str, jid: str, request: Request):
+    """
+    计算端回传训练遥测文件（请求体为 infra.telemetry 产出的 telemetry.npz 原始字节）。
+    - 校验为包含 step / kind 列的 npz 后原子写入 jobs/<jid>/training/telemetry.npz
+    - 返回: {"rows": 记录条数, "columns": 列名}
+    - 异常: 413 超过 TELEMETRY_MAX_BYTES（Content-Length 或实际读取的字节数）；400 文件格式不正确
+    """
+    tdir = await run_io(_telemetry_dir, pid, jid)
+    # 先按 Content-Length 拒绝，再边读边计数：分块传输或长度不实的请求体读到上限即中止，不整体缓冲超限数据
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > TELEMETRY_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Telemetry file too large")
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        if len(body) > TELEMETRY_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="Telemetry file too large")
+    return await run_io(_store_telemetry, tdir, bytes(body))
+
+def _store_telemetry(tdir: str, body: bytes) -> Dict[str, Any]:
+    try:
+        with np.load(io.BytesIO(body)) as z:
+            columns = list(z.files)
+            rows = int(len(z["step"])) if "step" in columns and "kind" in columns else None
+    except Exception:
+        rows = None
+    if rows is None:
+        raise HTTPException(status_code=400, detail="Invalid telemetry file")
+    os.makedirs(tdir, exist_ok=True)
+    path = os.path.join(tdir, "telemetry.npz")
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(body)
+    os.replace(tmp, path)
+    return {"rows": rows, "columns": columns}
+
+@router.get("/{pid}/jobs/{jid}/curves")
+async def job_curves(pid: str, jid: str, fields: Optional[str] = None, kind: str = "step", x: str = "step", points: int = 1000):
+    """
+    返回训练曲线（LTTB 下采样）。
+    - fields: 逗号分隔的字段名（默认除 step/epoch/time/kind 外的全部字段）
+    - kind: step（逐优化步）| epoch（逐 epoch）
+    - x: 横轴列，step | epoch | time
+    - points: 每条曲线最多返回的点数（上限 CURVE_MAX_POINTS）
+    - 返回: {"jid", "kind", "x", "fields", "curves": {字段: {"x": [...], "y": [...], "total": 原始点数}}}
+    - 异常: 404 无遥测文件；400 参数不合法
+    """
+    return await run_io(_job_curves, pid, jid, fields, kind, x, points)
+
+def _job_curves(pid: str, jid: str, fields: Optional[str], kind: str, x: str, points: int) -> Dict[str, Any]:
+    if kind not in KINDS:
+        raise HTTPException(status_code=400, detail="Invalid kind")
+    if x not in ("step", "epoch", "time"):
+        raise HTTPException(status_code=400, detail="Invalid x axis")
+    columns = load_telemetry(_telemetry_dir(pid, jid))
+    if columns is None:
+        raise HTTPException(status_code=404, detail="Telemetry not found")
+    available = [c for c in columns if c not in BASE_COLUMNS]
+    names = [f.strip() for f in fields.split(",") if f.strip()] if fields else available
+    unknown = [f for f in names if f not in available]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {','.join(unknown)}")
+    points = max(3, min(int(points), CURVE_MAX_POINTS))
+    curves = downsample_curves(columns, names, kind=kind, x=x, points=points)
+    return {"jid": jid, "kind": kind, "x": x, "fields": available, "curves": curves}
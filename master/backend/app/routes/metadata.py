@@ -1,5 +1,5 @@
 """
-元数据路由（SQLite）
+元数据路由（SQLite；异步处理函数，连接的打开、查询与关闭都在 I/O 线程池的同一个线程中完成）
 """
 import json
 import sqlite3
@@ -8,6 +8,7 @@ import re
 from fastapi import APIRouter, HTTPException
 from typing import Optional, Dict, Any, List
 from app.utils.db import get_db_conn, resolve_table, build_where_clause
+from app.utils.executor import run_io
 import time
 import os
 from app.config import METADATA_DEFAULT_PAGE_SIZE, METADATA_MAX_PAGE_SIZE, METADATA_DB, MUTATIONS_TABLE, SOURCES_TABLE, MUTATION_REGEX
@@ -17,12 +18,19 @@ router = APIRouter(prefix="/api/metadata", tags=["metadata"])
 _MUTATION_PATTERN = re.compile(MUTATION_REGEX)
 _SOURCES_CACHE: Dict[str, Any] = {"fingerprint": None, "data": None}
 
-def _get_db_fingerprint() -> Optional[float]:
-    # 使用数据库文件修改时间作为轻量指纹，避免频繁全表查询
+def _get_db_fingerprint() -> Optional[tuple]:
+    # 使用数据库文件（及 WAL 文件，若存在）的修改时间与大小作为轻量指纹，避免频繁全表查询
+    # 缓存为进程内副本：多个 worker 进程各自按指纹校验，任一进程（或外部工具）写库后所有进程的缓存都会失效
     try:
-        return os.path.getmtime(METADATA_DB)
+        st = os.stat(METADATA_DB)
     except Exception:
         return None
+    try:
+        wal = os.stat(f"{METADATA_DB}-wal")
+        wal_fp = (wal.st_mtime_ns, wal.st_size)
+    except OSError:
+        wal_fp = None
+    return (st.st_mtime_ns, st.st_size, wal_fp)
 
 def _load_sources_cache(conn: sqlite3.Connection, force_refresh: bool = False) -> Dict[int, Dict[str, str]]:
     # source 表很小，缓存到内存以避免每次查询都访问数据库
@@ -71,13 +79,12 @@ def _apply_mutations_to_template(template: Optional[str], mutant: Optional[str])
         if pos < 0 or pos >= len(seq):
             logging.warning(f"metadata_query:mutation_out_of_range mutant={segment} pos={pos}")
             continue
-        if seq[pos] != original_aa:
+        if seq[pos].upper() != original_aa.upper():
             logging.warning(f"metadata_query:mutation_mismatch mutant={segment} template={seq[pos]}")
-        seq[pos] = new_aa
+        seq[pos] = new_aa.upper()
     return "".join(seq)
 
-@router.get("/tables")
-def metadata_tables():
+def _metadata_tables():
     conn = get_db_conn()
     try:
         cur = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
@@ -86,8 +93,11 @@ def metadata_tables():
     finally:
         conn.close()
 
-@router.get("/columns")
-def metadata_columns(table: Optional[str] = None):
+@router.get("/tables")
+async def metadata_tables():
+    return await run_io(_metadata_tables)
+
+def _metadata_columns(table: Optional[str]):
     conn = get_db_conn()
     try:
         real_table = resolve_table(conn, table)
@@ -116,8 +126,15 @@ def metadata_columns(table: Optional[str] = None):
     finally:
         conn.close()
 
+@router.get("/columns")
+async def metadata_columns(table: Optional[str] = None):
+    return await run_io(_metadata_columns, table)
+
 @router.get("/query")
-def metadata_query(table: Optional[str] = None, page: int = 1, per_page: int = METADATA_DEFAULT_PAGE_SIZE, pageSize: Optional[int] = None, filters: Optional[str] = None):
+async def metadata_query(table: Optional[str] = None, page: int = 1, per_page: int = METADATA_DEFAULT_PAGE_SIZE, pageSize: Optional[int] = None, filters: Optional[str] = None):
+    return await run_io(_metadata_query, table, page, per_page, pageSize, filters)
+
+def _metadata_query(table: Optional[str], page: int, per_page: int, pageSize: Optional[int], filters: Optional[str]):
     effective_page_size = pageSize if pageSize is not None else per_page
     if effective_page_size < 1:
         effective_page_size = METADATA_DEFAULT_PAGE_SIZE
@@ -157,15 +174,18 @@ def metadata_query(table: Optional[str] = None, page: int = 1, per_page: int = M
                 pk_col = row["name"]
                 break
         t6 = time.perf_counter()
-        where_sql, params = build_where_clause(filters_obj, valid_cols)
         join_sources = False
         if real_table == MUTATIONS_TABLE and filters_obj:
             for f in (filters_obj or []):
                 if f.get("column") == "source":
                     join_sources = True
                     break
-        if join_sources and where_sql:
-            where_sql = where_sql.replace('"source"', 's.source_text')
+        if join_sources:
+            # 连接 sources 表时筛选列带 m. 前缀，避免两表同名列（如 id）歧义
+            where_sql, params = build_where_clause(filters_obj, valid_cols, alias="m",
+                                                   rewrite={"source": "s.source_text"})
+        else:
+            where_sql, params = build_where_clause(filters_obj, valid_cols)
         t7 = time.perf_counter()
         logging.info(f"metadata_query:build_where_ms={int((t7 - t6)*1000)} where_empty={1 if (not where_sql or where_sql.strip()=='') else 0}")
         is_empty_query = (not filters_obj) or (where_sql.strip() == "")
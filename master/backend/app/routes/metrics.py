@@ -0,0 +1,53 @@
+"""
+监控路由：Prometheus 文本格式指标（队列健康、Redis 内存、调度、去重与控制通道计数、路由延迟直方图）
+"""
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.config import SCHEDULER_ENABLED
+from app.services.monitor import get_monitor, render_prometheus
+from app.services.scheduler import get_scheduler
+from app.services.dedup import get_job_index
+from app.services.control import get_controller
+from app.utils.latency import get_latency
+from app.utils.executor import io_counters
+
+router = APIRouter(tags=["metrics"])
+
+
+def _counters(name: str, doc: str, counters: dict) -> tuple:
+    return (name, "counter", doc, [({"event": k}, v) for k, v in sorted(counters.items())])
+
+
+def _latency() -> tuple:
+    samples = []
+    for (method, route), h in sorted(get_latency().snapshot().items()):
+        labels = {"method": method, "route": route}
+        samples.extend(("_bucket", dict(labels, le=le), n) for le, n in h["buckets"])
+        samples.append(("_sum", labels, h["sum"]))
+        samples.append(("_count", labels, h["count"]))
+    return ("http_request_duration_seconds", "histogram", "按路由模板统计的请求延迟（到响应头就绪）", samples)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Prometheus 抓取接口：返回主进程监控循环最近一次采样（尚无共享快照时即时只读采样一次，不写背压信号与快照、不含消费计数），
+    附调度器 / 去重 / 控制通道的累计计数与路由延迟直方图（所有 worker 进程合计，任一进程应答结果一致；
+    延迟直方图每 LATENCY_FLUSH_INTERVAL 秒合并一次）
+    """
+    monitor = get_monitor()
+    sample = monitor.shared() or monitor.sample(persist=False)
+    extra = [
+        _counters("dedup_events_total", "任务去重计数", get_job_index().counters.snapshot()),
+        _counters("control_events_total", "控制通道计数", get_controller().counters.snapshot()),
+        _counters("io_executor_events_total", "路由 I/O 线程池计数（rejected：过载返回 503）", io_counters().snapshot()),
+        _latency(),
+    ]
+    if SCHEDULER_ENABLED:
+        sched = get_scheduler().metrics()
+        extra.append(("scheduler_jobs", "gauge", "待调度 / 已放置任务数",
+                      [({"stage": "pending"}, sched["pending"]), ({"stage": "placed"}, sched["placed"])]))
+        extra.append(("scheduler_nodes", "gauge", "按状态统计的节点数",
+                      [({"status": k}, v) for k, v in sched["nodes"].items()]))
+        extra.append(_counters("scheduler_events_total", "调度器计数", sched["counters"]))
+    return PlainTextResponse(render_prometheus(sample, extra), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,54 @@
+"""
+节点与调度路由：节点心跳视图、待调度队列与调度指标
+"""
+from typing import List
+from fastapi import APIRouter, HTTPException
+from app.models import NodeInfo
+from app.services.dedup import get_job_index
+from app.services.scheduler import get_scheduler
+
+router = APIRouter(prefix="/api", tags=["nodes"])
+
+
+def _node_info(info: dict) -> NodeInfo:
+    return NodeInfo(
+        id=str(info.get("id")),
+        ip=str(info.get("ip") or ""),
+        hostname=str(info.get("hostname") or ""),
+        status=str(info.get("status") or "offline"),
+        resources=info.get("resources") or {},
+        last_heartbeat=str(info.get("last_heartbeat") or ""),
+    )
+
+
+@router.get("/nodes", response_model=List[NodeInfo])
+def list_nodes():
+    """
+    节点列表：按心跳时间判定 online / draining / offline，resources 含总量、空闲量与运行中的任务
+    """
+    return [_node_info(n) for n in get_scheduler().nodes()]
+
+
+@router.get("/nodes/{node_id}", response_model=NodeInfo)
+def get_node(node_id: str):
+    for n in get_scheduler().nodes():
+        if str(n.get("id")) == node_id:
+            return _node_info(n)
+    raise HTTPException(status_code=404, detail="Node not found")
+
+
+@router.get("/scheduler/pending")
+def scheduler_pending():
+    """
+    待调度任务（按当前调度顺序）：优先级、项目、资源需求、已等待秒数、是否没有节点放得下
+    """
+    return {"items": get_scheduler().pending()}
+
+
+@router.get("/scheduler/metrics")
+def scheduler_metrics():
+    """
+    调度指标：节点数、待调度 / 已放置任务数、累计计数、放置延迟与排队等待（count / mean / p50 / p95 / max，秒），
+    以及任务去重计数 dedup（memo_hits / coalesced / claimed / memoized）
+    """
+    return dict(get_scheduler().metrics(), dedup=get_job_index().counters.snapshot())
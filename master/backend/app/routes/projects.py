@@ -1,9 +1,9 @@
 """
-项目与数据集路由
+项目与数据集路由（异步处理函数，文件读写与目录扫描在 I/O 线程池中执行）
 """
 import datetime
 import os
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from typing import List, Optional, Dict, Any
 from app.models import ProjectInfo, ProjectCreate, ProjectUpdate, ProjectDeleteParams, DatasetCreate, DatasetInfo
 from app.utils.projects import (
@@ -12,11 +12,13 @@ from app.utils.projects import (
     delete_project_to_recycle
 )
 from app.utils.common import normalize_name
+from app.utils.transfer import file_response
+from app.services.exporter import export_dataset
+from app.utils.executor import run_io
 
 router = APIRouter(prefix="/api/projects", tags=["projects"])
 
-@router.get("", response_model=List[ProjectInfo])
-def list_projects():
+def _list_projects() -> List[ProjectInfo]:
     root = projects_root()
     items: List[ProjectInfo] = []
     with os.scandir(root) as it:
@@ -34,8 +36,11 @@ def list_projects():
     items = pinned + unpinned
     return items
 
-@router.post("", response_model=ProjectInfo)
-def create_project(params: ProjectCreate):
+@router.get("", response_model=List[ProjectInfo])
+async def list_projects():
+    return await run_io(_list_projects)
+
+def _create_project(params: ProjectCreate) -> ProjectInfo:
     now = datetime.datetime.utcnow().isoformat()
     base = params.name.strip().lower().replace(" ", "-")
     pid = f"{base}-{int(datetime.datetime.utcnow().timestamp())}"
@@ -63,12 +68,15 @@ def create_project(params: ProjectCreate):
     write_project_info(info)
     return info
 
+@router.post("", response_model=ProjectInfo)
+async def create_project(params: ProjectCreate):
+    return await run_io(_create_project, params)
+
 @router.get("/{pid}", response_model=ProjectInfo)
-def project_detail(pid: str):
-    return read_project_info(pid)
+async def project_detail(pid: str):
+    return await run_io(read_project_info, pid)
 
-@router.patch("/{pid}", response_model=ProjectInfo)
-def project_update(pid: str, params: ProjectUpdate):
+def _project_update(pid: str, params: ProjectUpdate) -> ProjectInfo:
     info = read_project_info(pid)
     changed = False
     if params.name is not None:
@@ -82,30 +90,41 @@ def project_update(pid: str, params: ProjectUpdate):
         write_project_info(info)
     return info
 
-@router.post("/{pid}/pin", response_model=ProjectInfo)
-def project_pin(pid: str):
+@router.patch("/{pid}", response_model=ProjectInfo)
+async def project_update(pid: str, params: ProjectUpdate):
+    return await run_io(_project_update, pid, params)
+
+def _project_pin(pid: str, pinned: bool) -> ProjectInfo:
     info = read_project_info(pid)
-    info.pinned_at = datetime.datetime.utcnow().isoformat()
+    info.pinned_at = datetime.datetime.utcnow().isoformat() if pinned else None
     info.updated_at = datetime.datetime.utcnow().isoformat()
     write_project_info(info)
     return info
 
+@router.post("/{pid}/pin", response_model=ProjectInfo)
+async def project_pin(pid: str):
+    return await run_io(_project_pin, pid, True)
+
 @router.post("/{pid}/unpin", response_model=ProjectInfo)
-def project_unpin(pid: str):
-    info = read_project_info(pid)
-    info.pinned_at = None
-    info.updated_at = datetime.datetime.utcnow().isoformat()
-    write_project_info(info)
-    return info
+async def project_unpin(pid: str):
+    return await run_io(_project_pin, pid, False)
 
 @router.delete("/{pid}")
-def project_delete(pid: str, params: ProjectDeleteParams):
-    return delete_project_to_recycle(pid, params.password)
+async def project_delete(pid: str, params: ProjectDeleteParams):
+    return await run_io(delete_project_to_recycle, pid, params.password)
 
 @router.post("/{pid}/datasets", response_model=DatasetInfo)
-def dataset_create(pid: str, params: DatasetCreate):
-    return create_dataset(pid, params.name, params.filters, params.table)
+async def dataset_create(pid: str, params: DatasetCreate):
+    return await run_io(create_dataset, pid, params.name, params.filters, params.table)
 
 @router.get("/{pid}/datasets")
-def dataset_list(pid: str, page: int = 1, per_page: int = 10):
-    return list_datasets(pid, page, per_page)
+async def dataset_list(pid: str, page: int = 1, per_page: int = 10):
+    return await run_io(list_datasets, pid, page, per_page)
+
+def _dataset_export(pid: str, did: str, request: Request):
+    path, etag = export_dataset(pid, did)
+    return file_response(request, path, etag, media_type="application/octet-stream", filename=f"{did}.npz")
+
+@router.get("/{pid}/datasets/{did}/export")
+async def dataset_export(pid: str, did: str, request: Request):
+    return await run_io(_dataset_export, pid, did, request)
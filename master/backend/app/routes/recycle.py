@@ -1,5 +1,5 @@
 """
-回收站路由
+回收站路由（异步处理函数，目录扫描 / 移动 / 删除在 I/O 线程池中执行）
 """
 from fastapi import APIRouter
 from app.utils.projects import (
@@ -7,17 +7,18 @@ from app.utils.projects import (
     restore_project_from_recycle,
     purge_recycle_item
 )
+from app.utils.executor import run_io
 
 router = APIRouter(prefix="/api/recycle", tags=["recycle"])
 
 @router.get("/projects")
-def recycle_list():
-    return list_recycle_projects()
+async def recycle_list():
+    return await run_io(list_recycle_projects)
 
 @router.post("/projects/{pid}/restore")
-def recycle_restore(pid: str):
-    return restore_project_from_recycle(pid)
+async def recycle_restore(pid: str):
+    return await run_io(restore_project_from_recycle, pid)
 
 @router.delete("/projects/{pid}")
-def recycle_delete(pid: str):
-    return purge_recycle_item(pid)
+async def recycle_delete(pid: str):
+    return await run_io(purge_recycle_item, pid)
@@ -0,0 +1,132 @@
+"""
+超参搜索（sweep）路由：一组试验整体提交，按学习曲线早停（中位数规则 / ASHA）
+"""
+import os
+import copy
+import json
+import datetime
+from typing import Any, Dict, List
+from fastapi import APIRouter, HTTPException, Body
+from app.config import SWEEP_MAX_TRIALS
+from app.utils.projects import projects_root, read_project_info
+from app.utils.common import new_ulid
+from app.routes.jobs import check_job_config, submit_job, request_cancel
+from app.services.control import get_controller, stopper_config
+
+router = APIRouter(prefix="/api/projects", tags=["sweeps"])
+
+
+def _sweep_path(pid: str, sid: str) -> str:
+    """
+    sweep 元信息路径：data/projects/<pid>/sweeps/<sid>.json
+    """
+    if os.path.basename(sid) != sid or sid in ("", ".", ".."):
+        raise HTTPException(status_code=400, detail="Invalid sweep id")
+    sdir = os.path.join(projects_root(), pid, "sweeps")
+    os.makedirs(sdir, exist_ok=True)
+    return os.path.join(sdir, f"{sid}.json")
+
+
+def _merge(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
+    out = copy.deepcopy(base)
+    for k, v in override.items():
+        if isinstance(v, dict) and isinstance(out.get(k), dict):
+            out[k] = _merge(out[k], v)
+        else:
+            out[k] = copy.deepcopy(v)
+    return out
+
+
+@router.post("/{pid}/sweeps")
+def create_sweep(pid: str, body: Dict[str, Any] = Body(...)):
+    """
+    创建超参搜索：所有试验先整体校验再一次性提交（任一试验非法则都不提交；提交中途失败则撤回已提交的试验）。
+    - body:
+        - name: 名称，默认 sweep-<pid>
+        - config: 各试验共用的训练配置
+        - trials: 试验列表，每项为覆盖到 config 上的字段（嵌套字典逐层合并，也可用点号分层键），至多 SWEEP_MAX_TRIALS 个
+        - stopper: 早停规则 {"method": "median" | "asha" | "none", "metric": "valid_loss", "mode": "min" | "max",
+          "grace_epochs", "min_trials"（median）, "min_epochs", "reduction_factor", "max_epochs"（asha）}
+        - priority / force: 同 create_job，作用于每个试验
+    - 去重：与已有任务相同计划的试验（deduplicated 非空）只记录对应 jid，不纳入早停控制；需要完整参与早停时带 force 提交
+    - 返回: {"id": sweep id（sweep_<ULID>）, "trials": [{"jid", "overrides", "deduplicated"}]}
+    - 异常: 400 若试验列表、早停规则、资源声明或优先级非法；404 若项目或引用的数据集不存在；500 若 Redis 入队失败
+    """
+    read_project_info(pid)
+    trials = body.get("trials")
+    if not isinstance(trials, list) or not trials or len(trials) > SWEEP_MAX_TRIALS \
+            or not all(isinstance(t, dict) for t in trials):
+        raise HTTPException(status_code=400, detail="试验列表非法")
+    try:
+        stopper = stopper_config(body.get("stopper"))
+    except RuntimeError:
+        raise HTTPException(status_code=400, detail="早停规则非法")
+    base = body.get("config") or {}
+    configs = [_merge(base, t) for t in trials]
+    priority = 0
+    for config in configs:
+        priority = check_job_config(config, body.get("priority"))
+    sid = f"sweep_{new_ulid()}"
+    name = str(body.get("name") or f"sweep-{pid}")
+    force = bool(body.get("force"))
+    controller = get_controller()
+    try:
+        controller.register_sweep(sid, pid, stopper)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail="队列入队失败，请检查Redis连接与认证配置")
+    submitted: List[Dict[str, Any]] = []
+    try:
+        for i, (override, config) in enumerate(zip(trials, configs)):
+            res = submit_job(pid, f"{name}-{i}", config, priority=priority, force=force, extra={"sweep": sid})
+            submitted.append({"jid": res["id"], "overrides": override, "deduplicated": res["deduplicated"]})
+            # 仅登记本 sweep 新入队的试验；合并到既有任务（inflight / memo）的试验只记录不登记，
+            # 避免早停规则误停其他任务或 sweep 的训练
+            if res["deduplicated"] is None:
+                controller.add_trial(sid, res["id"])
+    except HTTPException:
+        for trial in submitted:
+            if trial["deduplicated"] is None:
+                try:
+                    request_cancel(pid, trial["jid"])
+                except HTTPException:
+                    pass
+        raise
+    meta = {
+        "id": sid,
+        "pid": pid,
+        "name": name,
+        "config": base,
+        "stopper": stopper,
+        "trials": submitted,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    path = _sweep_path(pid, sid)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+    return {"id": sid, "trials": submitted}
+
+
+@router.get("/{pid}/sweeps/{sid}")
+def sweep_detail(pid: str, sid: str):
+    """
+    sweep 详情：元信息 + 各试验已上报的 epoch 数、指标曲线（按 epoch）、当前最优值与早停决策
+    - 异常: 404 若 sweep 不存在
+    """
+    read_project_info(pid)
+    path = _sweep_path(pid, sid)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Sweep not found")
+    with open(path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    status = get_controller().sweep_status(sid)
+    best = min if (meta.get("stopper") or {}).get("mode", "min") == "min" else max
+    for trial in meta.get("trials") or []:
+        curve = status["curves"].get(trial["jid"]) or []
+        trial["epochs"] = len(curve)
+        trial["curve"] = curve
+        trial["best"] = best(curve) if curve else None
+        trial["decision"] = status["decisions"].get(trial["jid"])
+    meta["stopped"] = len(status["decisions"])
+    return meta
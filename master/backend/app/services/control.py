@@ -0,0 +1,237 @@
+"""
+控制通道（Controller）模块
+-------------------
+职责：
+- 决策下发 publish(pid, jid, action, reason)：action 为 cancel（取消）或 stop（早停，训练在下一个优化步后结束并评估）
+  * 写入 <CONTROL_KEY_PREFIX>:<jid>（CONTROL_TTL 秒后过期），任务尚未开始的 worker 取到任务时据此直接判为 CANCELLED
+  * 同时 PUBLISH 到 CONTROL_CHANNEL，运行该任务的 worker 在一个轮询间隔内响应
+  * 任务进入终态后由 observe 删除决策键
+- 超参搜索（sweep）早停：register_sweep / add_trial 登记试验，observe 消费保存器转交的状态流载荷：
+  * type = "epoch"：记录试验在该 epoch 的指标（stopper.metric，默认 valid_loss）到 sweep:<sid>:curves，按早停规则判定
+  * type = "lifecycle" 且为终态：删除该任务的决策键
+- 早停规则（stopper.method）：
+  * median：试验完成 t 个 epoch（t >= grace_epochs）时，若其前 t 个 epoch 的最优值劣于其他试验前 t 个 epoch 运行均值的中位数
+    （至少 min_trials 个其他试验已到达 t），则早停
+  * asha：里程碑 r_k = min_epochs * reduction_factor^k（小于 max_epochs）；试验到达里程碑时，与所有已到达该里程碑的试验比较
+    该 epoch 的指标，不在前 1 / reduction_factor 内则早停（已到达的试验不足 reduction_factor 个时不判定）
+  * none：不早停
+  * mode 为 min（指标越小越好）或 max
+- 每个试验至多一次决策，决策同时记入 sweep:<sid>:decisions 供查询
+
+Redis 连接与时钟均可注入
+"""
+import json
+import time
+import logging
+import statistics
+from typing import Any, Callable, Dict, List, Optional
+from app.config import CONTROL_CHANNEL, CONTROL_KEY_PREFIX, CONTROL_TTL, SWEEP_TRIALS_KEY, SWEEPS_KEY
+from app.utils.shared import SharedCounters
+
+logger = logging.getLogger(__name__)
+
+ACTIONS = ("cancel", "stop")
+METHODS = ("none", "median", "asha")
+TERMINAL_STATES = (2, 3, 4)
+STOPPER_DEFAULTS: Dict[str, Any] = {
+    "method": "median",
+    "metric": "valid_loss",
+    "mode": "min",
+    "grace_epochs": 1,
+    "min_trials": 3,
+    "min_epochs": 1,
+    "reduction_factor": 3,
+    "max_epochs": None,
+}
+
+
+def stopper_config(cfg: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    合并默认值并校验早停配置
+    - 异常: RuntimeError("control:invalid_stopper ...")
+    """
+    out = dict(STOPPER_DEFAULTS)
+    out.update(cfg or {})
+    try:
+        out["method"] = str(out["method"]).lower()
+        out["mode"] = str(out["mode"]).lower()
+        out["metric"] = str(out["metric"])
+        for k in ("grace_epochs", "min_trials", "min_epochs", "reduction_factor"):
+            out[k] = int(out[k])
+        out["max_epochs"] = int(out["max_epochs"]) if out.get("max_epochs") is not None else None
+    except (TypeError, ValueError):
+        raise RuntimeError("control:invalid_stopper")
+    if out["method"] not in METHODS or out["mode"] not in ("min", "max"):
+        raise RuntimeError(f"control:invalid_stopper method={out['method']} mode={out['mode']}")
+    if out["grace_epochs"] < 1 or out["min_trials"] < 1 or out["min_epochs"] < 1 or out["reduction_factor"] < 2:
+        raise RuntimeError("control:invalid_stopper")
+    return out
+
+
+def _decode(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+def _curve(raw) -> List[float]:
+    """
+    {epoch: 指标} -> 按 epoch 连续排列的指标（从 0 起，遇到缺口截断）
+    """
+    points = json.loads(_decode(raw))
+    out = []
+    while str(len(out)) in points:
+        out.append(float(points[str(len(out))]))
+    return out
+
+
+def median_decision(cfg: Dict[str, Any], jid: str, curves: Dict[str, List[float]]) -> Optional[str]:
+    mine = curves.get(jid) or []
+    t = len(mine)
+    if t < cfg["grace_epochs"]:
+        return None
+    others = [sum(c[:t]) / t for j, c in curves.items() if j != jid and len(c) >= t]
+    if len(others) < cfg["min_trials"]:
+        return None
+    median = statistics.median(others)
+    best = min(mine) if cfg["mode"] == "min" else max(mine)
+    worse = best > median if cfg["mode"] == "min" else best < median
+    if worse:
+        return f"median epoch={t} best={best:.6g} median={median:.6g}"
+    return None
+
+
+def asha_decision(cfg: Dict[str, Any], jid: str, curves: Dict[str, List[float]]) -> Optional[str]:
+    mine = curves.get(jid) or []
+    t, eta = len(mine), cfg["reduction_factor"]
+    rung, milestone = 0, cfg["min_epochs"]
+    while milestone < t:
+        rung, milestone = rung + 1, milestone * eta
+    if milestone != t or (cfg["max_epochs"] is not None and t >= cfg["max_epochs"]):
+        return None
+    values = sorted(c[t - 1] for c in curves.values() if len(c) >= t)
+    if len(values) < eta:
+        return None
+    if cfg["mode"] == "max":
+        values.reverse()
+    keep = max(1, len(values) // eta)
+    cutoff = values[keep - 1]
+    value = mine[t - 1]
+    worse = value > cutoff if cfg["mode"] == "min" else value < cutoff
+    if worse:
+        return f"asha rung={rung} epoch={t} value={value:.6g} cutoff={cutoff:.6g}"
+    return None
+
+
+RULES: Dict[str, Callable[[Dict[str, Any], str, Dict[str, List[float]]], Optional[str]]] = {
+    "median": median_decision,
+    "asha": asha_decision,
+}
+
+
+class Controller:
+    """
+    - publish(pid, jid, action, reason)：下发决策并返回决策记录
+    - decision(jid)：任务当前的决策，或 None
+    - register_sweep(sid, pid, stopper) / add_trial(sid, jid)：登记 sweep 与其试验
+    - observe(payload)：消费状态流载荷，必要时下发早停决策并返回之
+    - sweep_status(sid)：各试验的学习曲线与决策
+    """
+    def __init__(self, connection, channel: str = CONTROL_CHANNEL, ttl: int = CONTROL_TTL,
+                 clock: Callable[[], float] = time.time):
+        self.connection = connection
+        self.channel = channel
+        self.ttl = int(ttl)
+        self.clock = clock
+        self.counters = SharedCounters(connection, "control", ("published", "cancel", "stop", "observed"))
+
+    @staticmethod
+    def _key(jid: str) -> str:
+        return f"{CONTROL_KEY_PREFIX}:{jid}"
+
+    # 决策
+    def publish(self, pid: str, jid: str, action: str, reason: str = "") -> Dict[str, Any]:
+        if action not in ACTIONS:
+            raise RuntimeError(f"control:invalid_action action={action}")
+        decision = {"pid": pid, "jid": jid, "action": action, "reason": reason, "time": self.clock()}
+        raw = json.dumps(decision, ensure_ascii=False)
+        pipe = self.connection.pipeline()
+        pipe.set(self._key(jid), raw, ex=self.ttl)
+        pipe.publish(self.channel, raw)
+        receivers = pipe.execute()[1]
+        self.counters.incr("published")
+        self.counters.incr(action)
+        logger.info(f"control:published jid={jid} action={action} reason={reason} receivers={receivers}")
+        return decision
+
+    def decision(self, jid: str) -> Optional[Dict[str, Any]]:
+        raw = self.connection.get(self._key(jid))
+        return json.loads(_decode(raw)) if raw is not None else None
+
+    # sweep
+    def register_sweep(self, sid: str, pid: str, stopper: Dict[str, Any]) -> None:
+        self.connection.hset(SWEEPS_KEY, sid, json.dumps({"pid": pid, "stopper": stopper_config(stopper)}))
+
+    def add_trial(self, sid: str, jid: str) -> None:
+        self.connection.hset(SWEEP_TRIALS_KEY, jid, sid)
+
+    def _sweep(self, sid: str) -> Optional[Dict[str, Any]]:
+        raw = self.connection.hget(SWEEPS_KEY, sid)
+        return json.loads(_decode(raw)) if raw is not None else None
+
+    def _curves(self, sid: str) -> Dict[str, List[float]]:
+        return {_decode(k): _curve(v) for k, v in (self.connection.hgetall(f"sweep:{sid}:curves") or {}).items()}
+
+    def observe(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        kind, jid = payload.get("type"), str(payload.get("jid"))
+        if kind == "lifecycle":
+            try:
+                terminal = int(payload.get("state")) in TERMINAL_STATES
+            except (TypeError, ValueError):
+                terminal = False
+            if terminal:
+                self.connection.delete(self._key(jid))
+            return None
+        if kind != "epoch":
+            return None
+        raw_sid = self.connection.hget(SWEEP_TRIALS_KEY, jid)
+        if raw_sid is None:
+            return None
+        sid = _decode(raw_sid)
+        sweep = self._sweep(sid)
+        if sweep is None:
+            return None
+        cfg = sweep["stopper"]
+        value = payload.get(cfg["metric"])
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value != value:
+            return None
+        self.counters.incr("observed")
+        key = f"sweep:{sid}:curves"
+        raw = self.connection.hget(key, jid)
+        points = json.loads(_decode(raw)) if raw is not None else {}
+        points[str(int(payload.get("epoch") or 0))] = float(value)
+        self.connection.hset(key, jid, json.dumps(points))
+        rule = RULES.get(cfg["method"])
+        if rule is None or self.connection.hexists(f"sweep:{sid}:decisions", jid):
+            return None
+        reason = rule(cfg, jid, self._curves(sid))
+        if reason is None:
+            return None
+        decision = self.publish(str(payload.get("pid")), jid, "stop", reason)
+        self.connection.hset(f"sweep:{sid}:decisions", jid, json.dumps(decision, ensure_ascii=False))
+        return decision
+
+    def sweep_status(self, sid: str) -> Dict[str, Any]:
+        sweep = self._sweep(sid) or {}
+        decisions = {_decode(k): json.loads(_decode(v))
+                     for k, v in (self.connection.hgetall(f"sweep:{sid}:decisions") or {}).items()}
+        return {"stopper": sweep.get("stopper"), "curves": self._curves(sid), "decisions": decisions}
+
+
+_controller: Optional[Controller] = None
+
+
+def get_controller() -> Controller:
+    global _controller
+    if _controller is None:
+        from app.utils.queue import get_redis
+        _controller = Controller(get_redis())
+    return _controller
@@ -0,0 +1,205 @@
+"""
+任务去重（JobIndex）模块
+-------------------
+职责：
+- 实验计划指纹 plan_fingerprint：规范化后的训练配置 + 数据集指纹 + 代码版本（JOB_CODE_VERSION）的 sha256
+  * 规范化与 worker_app.plan 的展开规则一致：前端扁平字段、点号分层键展开为嵌套字典，"model": "mlp" 展开为 {"name": "mlp"}
+  * 不影响训练结果的任务级字段（resources / timeout）不参与计算；引用项目数据集时以数据集指纹代替 dataset_id
+  * 整数值的浮点数按整数计（epochs: 10 与 10.0 视为相同），键排序后序列化
+- 进行中合并：JOBS_INFLIGHT_KEY（哈希，"<pid>:<指纹>" -> {"jid", "at"}），HSETNX 抢占，相同计划的后续提交直接返回已有 jid；
+  超过 JOB_INFLIGHT_TTL 秒仍未结束的条目视为失效（worker 异常退出未上报结果），可被新任务替换
+- 结果记忆：任务 COMPLETED（且未被早停）后写入 <JOBS_MEMO_KEY>:<代码版本>:<pid>:<指纹> -> {"jid", "finished_at", "metrics"}，
+  JOB_MEMO_TTL 秒后过期；代码版本变更后旧命名空间不再被读取，随过期自然清除；
+  之后相同计划的提交直接返回该任务；请求带 force 时跳过合并与记忆，强制重新训练
+- 结算 settle：保存器收到结果流中的终态载荷时调用，释放进行中条目并写入记忆；jid -> 键 记在 JOBS_FINGERPRINT_KEY
+
+Redis 连接与时钟均可注入
+"""
+import copy
+import json
+import time
+import hashlib
+import logging
+from typing import Any, Callable, Dict, Optional
+from app.config import (JOB_CODE_VERSION, JOB_INFLIGHT_TTL, JOBS_INFLIGHT_KEY, JOBS_MEMO_KEY, JOB_MEMO_TTL,
+                        JOBS_FINGERPRINT_KEY)
+from app.utils.shared import SharedCounters
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_VERSION = 1
+COMPLETED = 2
+TERMINAL_STATES = (2, 3, 4)
+# 与 worker_app.plan 保持一致
+FLAT_FIELDS = {
+    "model_type": ("model", "name"),
+    "epochs": ("train", "epochs"),
+    "batch_size": ("train", "batch_size"),
+    "learning_rate": ("train", "lr"),
+    "dataset_path": ("data", "path"),
+}
+JOB_FIELDS = ("resources", "timeout")
+
+
+def _set_path(plan: Dict[str, Any], keys, value: Any) -> None:
+    node = plan
+    for k in keys[:-1]:
+        child = node.get(k)
+        if isinstance(child, str) and k == "model":
+            child = {"name": child}
+        if not isinstance(child, dict):
+            child = {}
+        node[k] = child
+        node = child
+    node[keys[-1]] = value
+
+
+def _canonical(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def normalize_plan(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    训练配置 -> 规范化计划（不含任务级字段与数据集引用）
+    """
+    plan: Dict[str, Any] = {}
+    for key, value in (config or {}).items():
+        if key in JOB_FIELDS or key == "dataset_id":
+            continue
+        if key in FLAT_FIELDS:
+            _set_path(plan, FLAT_FIELDS[key], copy.deepcopy(value))
+        elif "." in key:
+            _set_path(plan, tuple(key.split(".")), copy.deepcopy(value))
+        elif isinstance(value, dict) and isinstance(plan.get(key), dict):
+            plan[key].update(copy.deepcopy(value))
+        else:
+            plan[key] = copy.deepcopy(value)
+    if isinstance(plan.get("model"), str):
+        plan["model"] = {"name": plan["model"]}
+    if isinstance(plan.get("data"), dict):
+        plan["data"].pop("dataset_id", None)
+    return _canonical(plan)
+
+
+def plan_fingerprint(config: Dict[str, Any], dataset: Optional[str] = None,
+                     code_version: str = JOB_CODE_VERSION) -> str:
+    doc = {"v": FINGERPRINT_VERSION, "plan": normalize_plan(config), "dataset": dataset, "code": code_version}
+    raw = json.dumps(doc, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _decode(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+class JobIndex:
+    """
+    - memo(pid, fp)：已完成的相同计划任务记录，或 None
+    - claim(pid, fp, jid, force)：登记进行中任务；已有未失效的相同计划任务时返回其 jid（不登记）
+    - release(pid, fp, jid)：撤销登记（入队失败时）
+    - settle(payload)：结果载荷进入终态时结算
+    """
+    def __init__(self, connection, inflight_ttl: float = JOB_INFLIGHT_TTL, clock: Callable[[], float] = time.time,
+                 memo_ttl: int = JOB_MEMO_TTL, code_version: str = JOB_CODE_VERSION):
+        self.connection = connection
+        self.inflight_ttl = float(inflight_ttl)
+        self.memo_ttl = max(1, int(memo_ttl))
+        self.memo_prefix = f"{JOBS_MEMO_KEY}:{code_version}"
+        self.clock = clock
+        self.counters = SharedCounters(connection, "dedup", ("memo_hits", "coalesced", "claimed", "memoized"))
+
+    @staticmethod
+    def _key(pid: str, fp: str) -> str:
+        return f"{pid}:{fp}"
+
+    @staticmethod
+    def _parse(raw) -> Optional[Dict[str, Any]]:
+        if raw is None:
+            return None
+        try:
+            return json.loads(_decode(raw))
+        except (TypeError, ValueError):
+            return None
+
+    def _load(self, key: str, field: str) -> Optional[Dict[str, Any]]:
+        return self._parse(self.connection.hget(key, field))
+
+    def memo(self, pid: str, fp: str) -> Optional[Dict[str, Any]]:
+        hit = self._parse(self.connection.get(f"{self.memo_prefix}:{self._key(pid, fp)}"))
+        if hit:
+            self.counters.incr("memo_hits")
+        return hit
+
+    def claim(self, pid: str, fp: str, jid: str, force: bool = False) -> Optional[str]:
+        key = self._key(pid, fp)
+        record = json.dumps({"jid": jid, "at": self.clock()})
+        if not force and not self.connection.hsetnx(JOBS_INFLIGHT_KEY, key, record):
+            held = self._load(JOBS_INFLIGHT_KEY, key) or {}
+            if held.get("jid") and self.clock() - float(held.get("at") or 0) <= self.inflight_ttl:
+                self.counters.incr("coalesced")
+                logger.info(f"dedup:coalesced pid={pid} fingerprint={fp[:12]} jid={held['jid']}")
+                return str(held["jid"])
+            logger.warning(f"dedup:inflight_expired pid={pid} fingerprint={fp[:12]} jid={held.get('jid')}")
+            force = True
+        pipe = self.connection.pipeline()
+        if force:
+            pipe.hset(JOBS_INFLIGHT_KEY, key, record)
+        pipe.hset(JOBS_FINGERPRINT_KEY, jid, key)
+        pipe.execute()
+        self.counters.incr("claimed")
+        return None
+
+    def _drop_inflight(self, key: str, jid: str) -> None:
+        # 仅当进行中条目仍指向该 jid 时删除（force 提交可能已替换为更新的任务）
+        held = self._load(JOBS_INFLIGHT_KEY, key) or {}
+        if held.get("jid") == jid:
+            self.connection.hdel(JOBS_INFLIGHT_KEY, key)
+
+    def release(self, pid: str, fp: str, jid: str) -> None:
+        self._drop_inflight(self._key(pid, fp), jid)
+        self.connection.hdel(JOBS_FINGERPRINT_KEY, jid)
+
+    def settle(self, payload: Dict[str, Any]) -> bool:
+        """
+        结果载荷（{"pid", "jid", "state", "metrics", ...}）为终态时结算；返回是否写入了记忆
+        """
+        try:
+            state = int(payload.get("state"))
+        except (TypeError, ValueError):
+            return False
+        if state not in TERMINAL_STATES:
+            return False
+        jid = str(payload.get("jid"))
+        raw = self.connection.hget(JOBS_FINGERPRINT_KEY, jid)
+        if raw is None:
+            return False
+        key = _decode(raw)
+        self._drop_inflight(key, jid)
+        self.connection.hdel(JOBS_FINGERPRINT_KEY, jid)
+        if state != COMPLETED or payload.get("early_stopped"):
+            # 被早停的任务未训练完整个计划，不作为该计划的结果记忆
+            return False
+        memo = {"jid": jid, "pid": payload.get("pid"), "finished_at": payload.get("finished_at") or payload.get("time"),
+                "metrics": payload.get("metrics")}
+        self.connection.set(f"{self.memo_prefix}:{key}", json.dumps(memo, ensure_ascii=False, default=str),
+                            ex=self.memo_ttl)
+        self.counters.incr("memoized")
+        logger.info(f"dedup:memoized key={key} jid={jid}")
+        return True
+
+
+_index: Optional[JobIndex] = None
+
+
+def get_job_index() -> JobIndex:
+    global _index
+    if _index is None:
+        from app.utils.queue import get_redis
+        _index = JobIndex(get_redis())
+    return _index
@@ -0,0 +1,257 @@
+"""
+数据集导出（Exporter）模块
+-------------------------
+职责：
+- 将项目数据集（create_dataset 保存的 table + filters）导出为压缩的列式文件（.npz），供 Worker 直接下载
+- Worker 无需再拿到整个 SQLite 数据库，只需下载筛选后的数据与预编码的 token 矩阵
+
+文件内容（np.savez_compressed，每个键一列）：
+- id / mut_num / source：int64 / int32 / int32 列
+- mutant / DMS_score_bin：定长字符串列（空值为空串）
+- DMS_score：float32 列（空值为 NaN）
+- source_ids / source_texts / source_templates：sources 表中被引用的行（按 id 排序）
+- sequence_text：突变后的序列文本（定长 bytes）
+- tokens：uint8 矩阵 (n, L)，布局与 compute 侧 BaseVocabProcessor.encode_batch 一致：
+  [<cls>, ids..., <pad>..., <sep>]，L = 最长序列 + 2
+- lengths：每行真实序列长度（不含首尾标记）
+- vocab：词表 token 数组（下标即 id），reader 据此判断能否直接复用 tokens
+- meta：JSON 字符串（格式版本、表名、筛选条件、指纹）
+
+缓存策略：
+- ETag 由“数据库指纹 + 表名 + 筛选条件 + 格式版本”计算得到，数据库变化后自动失效
+- 导出文件缓存在 projects/<pid>/datasets/exports/<did>.<etag>.npz，同一 ETag 只导出一次（多个 worker 进程间亦然）
+"""
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from fastapi import HTTPException
+from app.config import METADATA_DB, MUTATIONS_TABLE, SOURCES_TABLE, MUTATION_REGEX
+from app.utils.db import get_db_conn, resolve_table, build_where_clause
+from app.utils.projects import project_datasets_dir
+from app.utils.common import file_lock
+
+EXPORT_FORMAT_VERSION = 1
+EXPORT_FETCH_SIZE = int(os.environ.get("EXPORT_FETCH_SIZE", "50000"))
+
+# 与 compute/infra/const.py 中 IUPAC_VOCAB 的顺序保持一致（下标即 id）
+IUPAC_TOKENS = [
+    "<pad>", "<mask>", "<cls>", "<sep>", "<unk>",
+    "A", "B", "C", "D", "E", "F", "G", "H", "I", "K", "L", "M",
+    "N", "O", "P", "Q", "R", "S", "T", "U", "V", "W", "X", "Y", "Z",
+]
+PAD_ID = 0
+HEAD_ID = 2
+TAIL_ID = 3
+UNK_ID = 4
+
+_MUTATION_PATTERN = re.compile(MUTATION_REGEX)
+# 字符 -> id 的查表数组（按 ASCII 码索引），用于整段模板的向量化编码
+_ASCII_TO_ID = np.full(256, UNK_ID, dtype=np.uint8)
+for _i, _tok in enumerate(IUPAC_TOKENS):
+    if len(_tok) == 1:
+        _ASCII_TO_ID[ord(_tok)] = _i
+        _ASCII_TO_ID[ord(_tok.lower())] = _i
+# 同一导出任务只允许一个线程执行，避免并发请求重复导出同一文件；
+# 固定大小的分段锁池（按路径哈希取锁），锁的数量不随导出过的文件增长
+EXPORT_LOCK_STRIPES = 64
+_export_locks = tuple(threading.Lock() for _ in range(EXPORT_LOCK_STRIPES))
+
+
+def _export_lock(path: str) -> threading.Lock:
+    return _export_locks[int(hashlib.sha1(path.encode("utf-8")).hexdigest()[:8], 16) % EXPORT_LOCK_STRIPES]
+
+
+def db_fingerprint() -> Dict[str, Any]:
+    """
+    数据库文件的轻量指纹：修改时间 + 文件大小
+    """
+    try:
+        st = os.stat(METADATA_DB)
+        return {"mtime": st.st_mtime, "size": st.st_size}
+    except OSError:
+        return {"mtime": None, "size": None}
+
+
+def dataset_etag(table: Optional[str], filters: List[Dict[str, Any]]) -> str:
+    """
+    计算数据集导出文件的 ETag（强校验），与 db 指纹、表名、筛选条件、格式版本绑定
+    """
+    key = {
+        "version": EXPORT_FORMAT_VERSION,
+        "db": db_fingerprint(),
+        "table": table,
+        "filters": filters or [],
+    }
+    raw = json.dumps(key, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def read_dataset_info(pid: str, did: str) -> Dict[str, Any]:
+    ddir = project_datasets_dir(pid)
+    info_path = os.path.join(ddir, f"{did}.json")
+    if not os.path.basename(did) == did or not os.path.exists(info_path):
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    with open(info_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _encode_text(text: str) -> np.ndarray:
+    raw = np.frombuffer(text.encode("ascii", errors="replace"), dtype=np.uint8)
+    return _ASCII_TO_ID[raw]
+
+
+def _build_query(conn, table: Optional[str], filters: List[Dict[str, Any]]) -> Tuple[str, str, List[Any]]:
+    real_table = resolve_table(conn, table)
+    cur = conn.execute(f"PRAGMA table_info({real_table})")
+    valid_cols = {row["name"] for row in cur.fetchall()}
+    if real_table != MUTATIONS_TABLE:
+        raise HTTPException(status_code=400, detail=f"Export only supports table {MUTATIONS_TABLE}")
+    # 仅在按 source（来源名称）筛选时连接 sources 表；筛选列一律带 m. 前缀，避免两表同名列（如 id）歧义
+    join_sources = any(f.get("column") == "source" for f in filters or [])
+    where_sql, params = build_where_clause(filters, valid_cols, alias="m",
+                                           rewrite={"source": "s.source_text"} if join_sources else None)
+    source = f"{real_table} m JOIN {SOURCES_TABLE} s ON m.source = s.id" if join_sources else f"{real_table} m"
+    cols = "m.id, m.mutant, m.DMS_score, m.DMS_score_bin, m.mut_num, m.source"
+    sql = f"SELECT {cols} FROM {source} {where_sql} ORDER BY m.id ASC"
+    count_sql = f"SELECT COUNT(*) AS cnt FROM {source} {where_sql}"
+    return sql, count_sql, params
+
+
+def _write_export(path: str, table: Optional[str], filters: List[Dict[str, Any]], etag: str) -> None:
+    """
+    分批读取筛选结果并写出 .npz：
+    - 先 COUNT 得到行数，预分配所有列，避免 Python 列表逐行增长
+    - 模板按 source 只编码一次，突变按位点覆盖
+    """
+    conn = get_db_conn()
+    try:
+        sql, count_sql, params = _build_query(conn, table, filters)
+        n = int(conn.execute(count_sql, params).fetchone()["cnt"])
+        src_rows = conn.execute(f"SELECT id, source_text, template FROM {SOURCES_TABLE} ORDER BY id ASC").fetchall()
+        templates: Dict[int, np.ndarray] = {}
+        source_texts: Dict[int, str] = {}
+        source_templates: Dict[int, str] = {}
+        for r in src_rows:
+            source_texts[r["id"]] = r["source_text"] or ""
+            source_templates[r["id"]] = r["template"] or ""
+            templates[r["id"]] = _encode_text(r["template"] or "")
+        ids = np.zeros(n, dtype=np.int64)
+        mut_num = np.zeros(n, dtype=np.int32)
+        source = np.zeros(n, dtype=np.int32)
+        score = np.full(n, np.nan, dtype=np.float32)
+        mutants: List[str] = [""] * n
+        bins: List[str] = [""] * n
+        cur = conn.execute(sql, params)
+        i = 0
+        while True:
+            chunk = cur.fetchmany(EXPORT_FETCH_SIZE)
+            if not chunk:
+                break
+            for r in chunk:
+                ids[i] = r["id"]
+                mut_num[i] = r["mut_num"] or 0
+                source[i] = r["source"]
+                if r["DMS_score"] is not None:
+                    score[i] = r["DMS_score"]
+                mutants[i] = r["mutant"] or ""
+                bins[i] = "" if r["DMS_score_bin"] is None else str(r["DMS_score_bin"])
+                i += 1
+        n = i
+    finally:
+        conn.close()
+    used_sources = np.unique(source[:n])
+    max_len = max((len(templates.get(int(s), ())) for s in used_sources), default=0)
+    fixed_len = max_len + 2
+    tokens = np.full((n, fixed_len), PAD_ID, dtype=np.uint8)
+    tokens[:, 0] = HEAD_ID
+    tokens[:, fixed_len - 1] = TAIL_ID
+    lengths = np.zeros(n, dtype=np.int32)
+    # 同一 source 的行共享模板：一次性整块赋值
+    for s in used_sources:
+        rows = np.nonzero(source[:n] == s)[0]
+        tmpl = templates.get(int(s), np.zeros(0, dtype=np.uint8))
+        tokens[rows, 1:1 + len(tmpl)] = tmpl
+        lengths[rows] = len(tmpl)
+    for row in range(n):
+        ms = mutants[row].strip()
+        if ms == "" or ms.upper() == "WT":
+            continue
+        seq_len = lengths[row]
+        for part in ms.split(":"):
+            m = _MUTATION_PATTERN.match(part.strip())
+            if not m:
+                continue
+            _, pos_str, new_aa = m.groups()
+            pos = int(pos_str) - 1
+            if pos < 0 or pos >= seq_len:
+                continue
+            tokens[row, 1 + pos] = _ASCII_TO_ID[ord(new_aa)]
+    vocab = np.asarray(IUPAC_TOKENS)
+    # 由 token 反查序列文本：单字符 token 直接拼接为定长 bytes
+    letters = np.asarray([t.encode("ascii") if len(t) == 1 else b"" for t in IUPAC_TOKENS], dtype="S1")
+    body = letters[tokens[:, 1:fixed_len - 1]] if fixed_len > 2 else np.zeros((n, 0), dtype="S1")
+    sequence_text = body.view(f"S{max(fixed_len - 2, 1)}").reshape(n) if fixed_len > 2 else np.zeros(n, dtype="S1")
+    meta = {
+        "version": EXPORT_FORMAT_VERSION,
+        "table": MUTATIONS_TABLE,
+        "filters": filters or [],
+        "etag": etag,
+        "rows": int(n),
+        "fixed_len": int(fixed_len),
+        "pad_id": PAD_ID,
+        "head_id": HEAD_ID,
+        "tail_id": TAIL_ID,
+    }
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez_compressed(
+            f,
+            id=ids[:n],
+            mutant=np.asarray(mutants[:n], dtype=str),
+            DMS_score=score[:n],
+            DMS_score_bin=np.asarray(bins[:n], dtype=str),
+            mut_num=mut_num[:n],
+            source=source[:n],
+            source_ids=used_sources.astype(np.int32),
+            source_texts=np.asarray([source_texts.get(int(s), "") for s in used_sources], dtype=str),
+            source_templates=np.asarray([source_templates.get(int(s), "") for s in used_sources], dtype=str),
+            sequence_text=sequence_text,
+            tokens=tokens,
+            lengths=lengths,
+            vocab=vocab,
+            meta=np.asarray(json.dumps(meta, ensure_ascii=False)),
+        )
+    os.replace(tmp, path)
+    logging.info(f"dataset_export:written rows={n} fixed_len={fixed_len} bytes={os.path.getsize(path)} path={path}")
+
+
+def export_dataset(pid: str, did: str) -> Tuple[str, str]:
+    """
+    导出数据集并返回 (文件路径, ETag)
+    - 同一 ETag 的导出文件已存在时直接复用
+    - 旧 ETag 的导出文件在新文件写出后删除
+    """
+    info = read_dataset_info(pid, did)
+    filters = info.get("filters") or []
+    table = info.get("table")
+    etag = dataset_etag(table, filters)
+    edir = os.path.join(project_datasets_dir(pid), "exports")
+    os.makedirs(edir, exist_ok=True)
+    path = os.path.join(edir, f"{did}.{etag}.npz")
+    lock = _export_lock(path)
+    # 线程锁串行化本进程内的并发请求，文件锁（exports/<did>.lock）串行化多个 worker 进程对同一数据集的导出
+    with lock, file_lock(os.path.join(edir, did)):
+        if not os.path.exists(path):
+            _write_export(path, table, filters, etag)
+            for name in os.listdir(edir):
+                if name.startswith(f"{did}.") and name.endswith(".npz") and name != os.path.basename(path):
+                    try:
+                        os.remove(os.path.join(edir, name))
+                    except OSError:
+                        pass
+    return path, etag
@@ -0,0 +1,165 @@
+"""
+主进程选举（LeaderElection）模块
+-------------------
+职责：
+- 后端以多个 uvicorn / gunicorn worker 进程运行时，保存器、调度循环与队列监控只应在一个进程中运行
+  （保存器逐条消费队列，调度器的预留与延迟统计为进程内状态）
+- 选举：SET LEADER_KEY <identity> NX PX LEADER_TTL，写入成功的进程成为主进程；
+  主进程每 LEADER_TTL / 3 秒续期（WATCH 校验持有者仍为自己后 PEXPIRE），续期失败即让位
+- run_leader(stop, loops)：各 worker 进程都运行；当选后启动 loops（每个为接受停止事件的协程函数），
+  失去主进程身份或应用关闭时停止它们，关闭时主动释放锁，其他进程在下一个续期周期内接任
+- 监督：任一循环在未收到停止信号时返回或抛出异常，按指数退避（RESTART_BACKOFF_MIN ~ RESTART_BACKOFF_MAX 秒）重启；
+  连续运行超过 RESTART_BACKOFF_MAX 秒后退避复位
+- 主进程异常退出时锁在 LEADER_TTL 秒后过期，期间队列载荷留在 Redis 中，由新的主进程继续消费
+
+Redis 连接与身份标识均可注入
+"""
+import os
+import uuid
+import socket
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+from redis.exceptions import RedisError, WatchError
+from app.config import LEADER_KEY, LEADER_TTL
+
+logger = logging.getLogger(__name__)
+
+RESTART_BACKOFF_MIN = 1.0
+RESTART_BACKOFF_MAX = 60.0
+
+
+def _decode(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+class LeaderElection:
+    """
+    - acquire()：尝试成为主进程
+    - renew()：续期，返回是否仍为主进程
+    - release()：释放（仅当持有者为自己）
+    - holder()：当前持有者标识，或 None
+    """
+    def __init__(self, connection, key: str = LEADER_KEY, ttl: float = LEADER_TTL, identity: Optional[str] = None):
+        self.connection = connection
+        self.key = key
+        self.ttl_ms = max(1000, int(float(ttl) * 1000))
+        self.identity = identity or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.leading = False
+
+    def acquire(self) -> bool:
+        self.leading = bool(self.connection.set(self.key, self.identity, nx=True, px=self.ttl_ms))
+        return self.leading
+
+    def _if_holder(self, action: Callable) -> bool:
+        # 校验持有者与修改之间若锁被改写（过期后被其他进程取得），事务放弃执行
+        with self.connection.pipeline() as pipe:
+            try:
+                pipe.watch(self.key)
+                current = pipe.get(self.key)
+                if current is None or _decode(current) != self.identity:
+                    pipe.unwatch()
+                    return False
+                pipe.multi()
+                action(pipe)
+                pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    def renew(self) -> bool:
+        self.leading = self._if_holder(lambda pipe: pipe.pexpire(self.key, self.ttl_ms))
+        return self.leading
+
+    def release(self) -> None:
+        if self.leading:
+            self._if_holder(lambda pipe: pipe.delete(self.key))
+        self.leading = False
+
+    def holder(self) -> Optional[str]:
+        raw = self.connection.get(self.key)
+        return _decode(raw) if raw is not None else None
+
+
+_election: Optional[LeaderElection] = None
+
+
+def get_election() -> LeaderElection:
+    global _election
+    if _election is None:
+        from app.utils.queue import get_redis
+        _election = LeaderElection(get_redis())
+    return _election
+
+
+async def _supervise(loop: Callable[[asyncio.Event], Awaitable[None]], stop: asyncio.Event) -> None:
+    """
+    运行 loop(stop)，直到 stop 置位；中途退出（返回或异常）时退避后重启
+    """
+    name = getattr(loop, "__name__", repr(loop))
+    backoff = RESTART_BACKOFF_MIN
+    while not stop.is_set():
+        started = time.monotonic()
+        error: Optional[BaseException] = None
+        try:
+            await loop(stop)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = e
+        if stop.is_set():
+            return
+        if time.monotonic() - started > RESTART_BACKOFF_MAX:
+            backoff = RESTART_BACKOFF_MIN
+        if error is not None:
+            logger.error(f"leader:loop_failed name={name} retry_in={backoff:g} error={error!r}", exc_info=error)
+        else:
+            logger.error(f"leader:loop_exited name={name} retry_in={backoff:g}")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=backoff)
+            return
+        except asyncio.TimeoutError:
+            pass
+        logger.info(f"leader:loop_restarted name={name}")
+        backoff = min(backoff * 2, RESTART_BACKOFF_MAX)
+
+
+async def run_leader(stop: asyncio.Event, loops: List[Callable[[asyncio.Event], Awaitable[None]]]) -> None:
+    """
+    选举主循环：当选时启动 loops（各自受 _supervise 监督），失去主进程身份或 stop 置位时停止它们
+    """
+    election = get_election()
+    interval = election.ttl_ms / 3000.0
+    inner: Optional[asyncio.Event] = None
+    tasks: List[asyncio.Task] = []
+    try:
+        while not stop.is_set():
+            try:
+                leading = await asyncio.to_thread(election.renew if election.leading else election.acquire)
+            except RedisError as e:
+                logger.error(f"leader:election_failed identity={election.identity} error={e}")
+                leading = False
+                election.leading = False
+            if leading and inner is None:
+                logger.info(f"leader:elected identity={election.identity}")
+                inner = asyncio.Event()
+                tasks = [asyncio.create_task(_supervise(loop, inner)) for loop in loops]
+            elif not leading and inner is not None:
+                logger.warning(f"leader:lost identity={election.identity}")
+                inner.set()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                inner, tasks = None, []
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        if inner is not None:
+            inner.set()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await asyncio.to_thread(election.release)
+        except RedisError:
+            pass
+        logger.info(f"leader:stopped identity={election.identity}")
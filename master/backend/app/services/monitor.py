@@ -0,0 +1,258 @@
+"""
+队列健康监控（QueueMonitor）模块
+-------------------
+职责：
+- 周期采样（每 MONITOR_INTERVAL 秒，由 lifespan 中的 run_monitor 驱动）：
+  * init / state / results 三个列表与 RQ 任务队列的长度
+  * 各列表最旧载荷的等待时间：生产者 RPUSH 追加到表尾，表头（LINDEX 0）即最旧的载荷，按载荷 time（或 created_at）计算
+  * 保存器消费速率：保存器每取出一条载荷调用 drained(queue)，按最近 MONITOR_WINDOW 次采样之间的计数差求每秒条数
+  * Redis 内存：INFO memory / stats 中的 used_memory、maxmemory、maxmemory_policy、evicted_keys
+    （Redis 配置了 maxmemory 与淘汰策略，保存器积压时队列数据可能被静默淘汰；INFO 不可用时这些指标缺省）
+- 背压信号：状态队列积压超过 QUEUE_BACKLOG_THRESHOLD 条、最旧载荷等待超过 QUEUE_AGE_THRESHOLD 秒
+  或内存占用超过 maxmemory 的 QUEUE_MEMORY_THRESHOLD 时判为背压，
+  写入 QUEUE_HEALTH_KEY（{"time", "backpressure", "reasons", "state_backlog", "memory_ratio"}，3 个采样周期后过期）；
+  计算端的 infra.reporter 在每次 flush 的同一个 pipeline 中读取，背压期间合并步级摘要
+- render_prometheus(sample)：Prometheus 文本格式（/metrics）
+- 多进程：监控循环与保存器一样只在主进程中运行，每次采样同时写入快照 MONITOR_SAMPLE_KEY，任一进程的 /metrics 读取该快照
+  （快照缺失时 sample(persist=False) 只读采样，不写背压信号与快照）
+
+Redis 连接与时钟均可注入
+"""
+import json
+import math
+import time
+import numbers
+import asyncio
+import datetime
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+from app.config import (INIT_QUEUE_NAME, STATE_QUEUE_NAME, RESULT_QUEUE_NAME, JOB_QUEUE_NAME, MONITOR_INTERVAL,
+                        MONITOR_WINDOW, QUEUE_HEALTH_KEY, QUEUE_BACKLOG_THRESHOLD, QUEUE_AGE_THRESHOLD,
+                        QUEUE_MEMORY_THRESHOLD, MONITOR_SAMPLE_KEY)
+from app.utils.shared import put_snapshot, get_snapshot
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "proteinx"
+
+
+def _decode(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+def payload_time(raw) -> Optional[float]:
+    """
+    载荷的入队时间戳：time（计算端上报）或 created_at（ISO 时间，init 载荷）
+    """
+    try:
+        obj = json.loads(_decode(raw))
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(obj, dict):
+        return None
+    ts = obj.get("time")
+    if isinstance(ts, (int, float)) and not isinstance(ts, bool):
+        return float(ts)
+    created = obj.get("created_at")
+    if isinstance(created, str):
+        try:
+            return datetime.datetime.fromisoformat(created).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
+class QueueMonitor:
+    """
+    - drained(queue, n)：保存器消费计数
+    - sample(persist)：采样一次并更新背压信号，返回采样结果（persist=False 时只读）
+    - last：最近一次采样
+    """
+    def __init__(self, connection, queues: Optional[List[str]] = None, job_queue: str = JOB_QUEUE_NAME,
+                 window: int = MONITOR_WINDOW, interval: float = MONITOR_INTERVAL,
+                 clock: Callable[[], float] = time.time):
+        self.connection = connection
+        self.queues = list(queues or [INIT_QUEUE_NAME, STATE_QUEUE_NAME, RESULT_QUEUE_NAME])
+        self.job_queue = job_queue
+        self.interval = float(interval)
+        self.clock = clock
+        self._drained: Dict[str, int] = {q: 0 for q in self.queues}
+        self._history: deque = deque(maxlen=max(2, int(window)))
+        self._lock = threading.Lock()
+        self.last: Optional[Dict[str, Any]] = None
+
+    def drained(self, queue: str, n: int = 1) -> None:
+        with self._lock:
+            self._drained[queue] = self._drained.get(queue, 0) + int(n)
+
+    def _redis_info(self) -> Dict[str, Any]:
+        try:
+            memory = self.connection.info("memory")
+            stats = self.connection.info("stats")
+        except Exception:
+            return {}
+        return {
+            "used_memory": int(memory.get("used_memory") or 0),
+            "maxmemory": int(memory.get("maxmemory") or 0),
+            "maxmemory_policy": str(memory.get("maxmemory_policy") or ""),
+            "evicted_keys": int(stats.get("evicted_keys") or 0),
+        }
+
+    def _rates(self, now: float, drained: Dict[str, int]) -> Dict[str, float]:
+        self._history.append((now, drained))
+        then, old = self._history[0]
+        span = now - then
+        if span <= 0:
+            return {q: 0.0 for q in drained}
+        return {q: (n - old.get(q, 0)) / span for q, n in drained.items()}
+
+    def sample(self, persist: bool = True) -> Dict[str, Any]:
+        """
+        - persist=False：只读采样（非主进程在尚无共享快照时使用），不写背压信号与快照、不更新 last 与速率窗口，
+          也不报告消费计数（只在运行保存器的主进程中累计）
+        """
+        now = self.clock()
+        pipe = self.connection.pipeline(transaction=False)
+        for q in self.queues:
+            pipe.llen(q)
+            pipe.lindex(q, 0)
+        pipe.llen(f"rq:queue:{self.job_queue}")
+        replies = pipe.execute()
+        queues: Dict[str, Dict[str, Any]] = {}
+        for i, q in enumerate(self.queues):
+            length, head = int(replies[2 * i] or 0), replies[2 * i + 1]
+            ts = payload_time(head) if head is not None else None
+            queues[q] = {"length": length, "oldest_age": max(0.0, now - ts) if ts is not None else (0.0 if length == 0 else None)}
+        if persist:
+            with self._lock:
+                drained = dict(self._drained)
+            rates = self._rates(now, drained)
+            for q in self.queues:
+                queues[q]["drained"] = drained.get(q, 0)
+                queues[q]["drain_rate"] = rates.get(q, 0.0)
+        redis = self._redis_info()
+        state = queues.get(STATE_QUEUE_NAME) or {"length": 0, "oldest_age": None}
+        ratio = redis["used_memory"] / redis["maxmemory"] if redis.get("maxmemory") else None
+        reasons = []
+        if state["length"] > QUEUE_BACKLOG_THRESHOLD:
+            reasons.append("backlog")
+        if state["oldest_age"] is not None and state["oldest_age"] > QUEUE_AGE_THRESHOLD:
+            reasons.append("age")
+        if ratio is not None and ratio > QUEUE_MEMORY_THRESHOLD:
+            reasons.append("memory")
+        health = {"time": now, "backpressure": bool(reasons), "reasons": reasons,
+                  "state_backlog": state["length"], "memory_ratio": ratio}
+        if not persist:
+            return {"time": now, "queues": queues, "job_queue": {"name": self.job_queue, "length": int(replies[-1] or 0)},
+                    "redis": redis, "health": health}
+        ttl = max(1, int(3 * self.interval))
+        self.connection.set(QUEUE_HEALTH_KEY, json.dumps(health), ex=ttl)
+        if reasons and not (self.last or {}).get("health", {}).get("backpressure"):
+            logger.warning(f"monitor:backpressure_on reasons={','.join(reasons)} state_backlog={state['length']} "
+                           f"memory_ratio={ratio}")
+        elif not reasons and (self.last or {}).get("health", {}).get("backpressure"):
+            logger.info(f"monitor:backpressure_off state_backlog={state['length']}")
+        self.last = {"time": now, "queues": queues, "job_queue": {"name": self.job_queue, "length": int(replies[-1] or 0)},
+                     "redis": redis, "health": health}
+        put_snapshot(self.connection, MONITOR_SAMPLE_KEY, self.last, ttl=ttl)
+        return self.last
+
+    def shared(self) -> Optional[Dict[str, Any]]:
+        """
+        主进程最近一次采样的快照（消费计数只在运行保存器的主进程中累计，其他进程据此报告）
+        """
+        return get_snapshot(self.connection, MONITOR_SAMPLE_KEY)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _value(value: Any) -> str:
+    # 整数（计数器、字节数）按整数原样输出，浮点数用 repr 保留全部有效位；NaN / ±Inf 按 Prometheus 文本格式书写
+    if isinstance(value, (bytes, str)):
+        text = value.decode("utf-8") if isinstance(value, bytes) else value
+        try:
+            value = int(text)
+        except ValueError:
+            value = float(text)
+    if isinstance(value, numbers.Integral):
+        return str(int(value))
+    value = float(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+def _labels(**labels: Any) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def render_prometheus(sample: Dict[str, Any], extra: Optional[List[tuple]] = None) -> str:
+    """
+    采样结果 -> Prometheus 文本格式（0.0.4）
+    - extra: 追加的指标 [(名称, 类型, 说明, [(标签字典, 值), ...])]；
+      histogram 等带后缀的样本写作 (后缀, 标签字典, 值)，如 ("_bucket", {"le": "0.1"}, 3)
+    """
+    families: List[tuple] = []
+    queues = sample.get("queues") or {}
+    families.append(("queue_length", "gauge", "Redis 队列长度",
+                     [({"queue": q}, v["length"]) for q, v in queues.items()]
+                     + [({"queue": sample["job_queue"]["name"]}, sample["job_queue"]["length"])]))
+    families.append(("queue_oldest_age_seconds", "gauge", "队列中最旧载荷的等待时间",
+                     [({"queue": q}, v["oldest_age"]) for q, v in queues.items() if v["oldest_age"] is not None]))
+    families.append(("saver_drained_total", "counter", "保存器已消费的载荷数",
+                     [({"queue": q}, v["drained"]) for q, v in queues.items() if "drained" in v]))
+    families.append(("saver_drain_rate", "gauge", "保存器消费速率（条/秒，最近采样窗口）",
+                     [({"queue": q}, v["drain_rate"]) for q, v in queues.items() if "drain_rate" in v]))
+    redis = sample.get("redis") or {}
+    if redis:
+        families.append(("redis_used_memory_bytes", "gauge", "Redis 已用内存", [({}, redis["used_memory"])]))
+        families.append(("redis_maxmemory_bytes", "gauge", "Redis maxmemory（0 表示不限）",
+                         [({"policy": redis["maxmemory_policy"]}, redis["maxmemory"])]))
+        families.append(("redis_evicted_keys_total", "counter", "Redis 因内存上限淘汰的键数", [({}, redis["evicted_keys"])]))
+    health = sample.get("health") or {}
+    families.append(("queue_backpressure", "gauge", "是否处于背压（1 为是）", [({}, 1 if health.get("backpressure") else 0)]))
+    families.append(("monitor_sample_timestamp_seconds", "gauge", "最近一次采样时间", [({}, sample.get("time") or 0)]))
+    families.extend(extra or [])
+    lines = []
+    for name, kind, doc, samples in families:
+        lines.append(f"# HELP {PREFIX}_{name} {doc}")
+        lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+        for sample_ in samples:
+            suffix, labels, value = sample_ if len(sample_) == 3 else ("",) + tuple(sample_)
+            lines.append(f"{PREFIX}_{name}{suffix}{_labels(**labels)} {_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+_monitor: Optional[QueueMonitor] = None
+
+
+def get_monitor() -> QueueMonitor:
+    global _monitor
+    if _monitor is None:
+        from app.utils.queue import get_redis
+        _monitor = QueueMonitor(get_redis())
+    return _monitor
+
+
+async def run_monitor(stop: asyncio.Event) -> None:
+    """
+    监控主循环：每 MONITOR_INTERVAL 秒在线程池中采样一次
+    """
+    monitor = get_monitor()
+    while not stop.is_set():
+        try:
+            await asyncio.to_thread(monitor.sample)
+        except Exception as e:
+            logger.error(f"monitor:sample_failed error={e}")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=MONITOR_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
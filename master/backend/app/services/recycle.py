@@ -0,0 +1,29 @@
+"""
+回收站清理（后台任务）
+-------------------
+- run_recycle_purger：启动后立即清理一次，之后每 RECYCLE_PURGE_INTERVAL 秒清理一次，
+  永久删除保留期（RECYCLE_RETENTION_DAYS 天）之前移入回收站的项目（utils.projects.purge_expired_recycle）
+- 与保存器 / 调度循环一样只在主进程中运行（services.leader），多个 worker 进程不会重复清理
+"""
+import asyncio
+import logging
+from app.config import RECYCLE_RETENTION_DAYS, RECYCLE_PURGE_INTERVAL
+from app.utils.projects import purge_expired_recycle
+from app.utils.executor import run_io
+
+logger = logging.getLogger(__name__)
+
+
+async def run_recycle_purger(stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        try:
+            purged = await run_io(purge_expired_recycle, RECYCLE_RETENTION_DAYS)
+            if purged:
+                logger.info(f"recycle:purged count={len(purged)} ids={','.join(purged)} "
+                            f"retention_days={RECYCLE_RETENTION_DAYS}")
+        except Exception as e:
+            logger.error(f"recycle:purge_failed error={e}")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=RECYCLE_PURGE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
@@ -2,35 +2,71 @@
 保存器（Saver）模块
 -------------------
 职责：
-- 在后端服务生命周期中启动一个异步后台任务，每秒从 Redis 中的三个队列取数并落盘：
+- 在后端服务生命周期中启动后台任务，从 Redis 中的三个队列取数并落盘：
   - INIT_QUEUE_NAME：初始化任务信息流（每个新任务入队一次）
   - STATE_QUEUE_NAME：训练中的状态流（进度、指标等，可能多次入队）
   - RESULTS_QUEUE_NAME：训练完成后的结果流（一次或少量次数）
 
 数据组织：
 - 项目级目录：data/projects/<pid>/jobs/
-  - jobs_info.json：数组，保存多个任务的初始化信息（来自 init-queue）
+  - jobs_info.json：数组，保存多个任务的初始化信息（来自 init-queue，按 jid 去重）
 - 任务级目录：data/projects/<pid>/jobs/<jid>/
   - state.json：数组，按时间追加 state 载荷
   - result.json：数组，按时间追加 result 载荷
+- 结果流中的终态载荷同时交给任务去重索引结算（app.services.dedup：释放进行中条目，COMPLETED 写入结果记忆）
+- 每取出一条载荷计入队列监控（app.services.monitor）的消费计数，用于计算消费速率
+- 状态流中的 epoch 记录与生命周期载荷同时交给控制器（app.services.control：sweep 早停判定、清理终态任务的控制决策）
+
+可靠投递（至少一次 + 重投去重）：
+- 每个队列一个消费协程：BLMOVE 把队首载荷原子地移入本实例的处理中列表 saver:processing:<实例>:<队列>，
+  再以非阻塞 LMOVE 凑满至多 SAVER_BATCH 条；同一文件的载荷合并为一次读改写
+- 落盘持久化（临时文件 fsync + os.replace）后才确认：LTRIM 从处理中列表移除本批；落盘前崩溃的载荷仍在处理中列表
+- 重投：启动时先处理本实例遗留的处理中列表（SAVER_ID 固定时即为重启前未确认的载荷）；
+  各实例每 SAVER_HEARTBEAT 秒把心跳写入 SAVER_INSTANCES_KEY，心跳超过 SAVER_INSTANCE_TIMEOUT 秒的实例视为已崩溃，
+  由任一存活实例抢到 saver:reclaim:<实例> 锁后接管其处理中列表；重投的载荷追加前检查文件中是否已有相同载荷（崩溃发生在落盘后、确认前）
+- 多实例：各实例从同一组列表竞争取数，可水平扩展写入吞吐；同一文件的读改写由文件锁（fcntl.flock）串行化，
+  单实例内同一任务的载荷按入队顺序落盘，多实例之间不保证（载荷自带 time）
+- 非 JSON、缺少 pid / jid 或其含路径分隔符的载荷写入死信列表 SAVER_DEAD_LETTER_KEY（保留最近 SAVER_DEAD_LETTER_MAX 条）后确认，不再落盘
 
 实现要点：
-- 使用 Redis 异步客户端（redis.asyncio），通过 BRPOP(keys, timeout=1) 以 1 秒节奏阻塞获取队列数据
-- 文件写入采用原子写（临时文件 + os.replace），防止部分写入导致 JSON 损坏
-- 后台任务绑定在单进程的 FastAPI lifespan 内，优雅停机时设置停止事件并收尾
+- 使用 Redis 异步客户端（redis.asyncio），BLMOVE 以 SAVER_POLL_TIMEOUT 秒为超时阻塞获取，便于及时响应停止事件
+- 文件读写在线程池中执行，不阻塞事件循环
+- 后台任务绑定在 FastAPI lifespan 内，优雅停机时设置停止事件，处理完当前批次后退出
 """
 import os
 import json
+import time
+import socket
 import asyncio
-from typing import Dict, Any, List
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
 from redis.asyncio import Redis
+from app.config import REDIS_URL, INIT_QUEUE_NAME, STATE_QUEUE_NAME, RESULT_QUEUE_NAME
 from app.utils.projects import projects_root
+from app.utils.common import file_lock
+from app.services.dedup import get_job_index
+from app.services.control import get_controller
+from app.services.monitor import get_monitor
+
+logger = logging.getLogger(__name__)
 
-REDIS_URL = os.environ.get("REDIS_URL", "redis://redis-queue:6379/0")
-INIT_QUEUE_NAME = os.environ.get("INIT_QUEUE_NAME", "init_queue")
-STATE_QUEUE_NAME = os.environ.get("STATE_QUEUE_NAME", "state_queue")
-RESULTS_QUEUE_NAME = os.environ.get("RESULTS_QUEUE_NAME", "results_queue")
+# 与 app.utils.queue 的生产者使用相同的队列名
+RESULTS_QUEUE_NAME = os.environ.get("RESULTS_QUEUE_NAME", RESULT_QUEUE_NAME)
 SAVER_POLL_TIMEOUT = int(os.environ.get("SAVER_POLL_TIMEOUT", "1"))
+SAVER_BATCH = int(os.environ.get("SAVER_BATCH", "100"))
+SAVER_ID = os.environ.get("SAVER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+SAVER_HEARTBEAT = float(os.environ.get("SAVER_HEARTBEAT", "5"))
+SAVER_INSTANCE_TIMEOUT = float(os.environ.get("SAVER_INSTANCE_TIMEOUT", "30"))
+SAVER_INSTANCES_KEY = os.environ.get("SAVER_INSTANCES_KEY", "saver:instances")
+SAVER_DEAD_LETTER_KEY = os.environ.get("SAVER_DEAD_LETTER_KEY", "saver:dead")
+SAVER_DEAD_LETTER_MAX = int(os.environ.get("SAVER_DEAD_LETTER_MAX", "1000"))
+QUEUES = (INIT_QUEUE_NAME, STATE_QUEUE_NAME, RESULTS_QUEUE_NAME)
+
+
+def processing_key(instance: str, queue: str) -> str:
+    return f"saver:processing:{instance}:{queue}"
+
 
 def _jobs_dir(pid: str) -> str:
     """
@@ -47,12 +83,14 @@ def _jobs_dir(pid: str) -> str:
 def _write_json_atomic(path: str, obj: Any) -> None:
     """
     原子写 JSON：
-    - 先写到同目录的临时文件 path.tmp
-    - 再用 os.replace 覆盖目标文件，保证写入的原子性
+    - 先写到同目录的临时文件 path.tmp 并 fsync
+    - 再用 os.replace 覆盖目标文件，保证写入的原子性与持久性
     """
     tmp = f"{path}.tmp"
     with open(tmp, "w", encoding="utf-8") as f:
         json.dump(obj, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
     os.replace(tmp, path)
 
 def _job_dir(pid: str, jid: str) -> str:
@@ -64,72 +102,241 @@ def _job_dir(pid: str, jid: str) -> str:
     os.makedirs(jsub, exist_ok=True)
     return jsub
 
-def _append_json_array(path: str, obj: Dict[str, Any]) -> None:
-    """
-    将对象追加到指定 JSON 数组文件：
-    - 文件不存在则创建空数组
-    - 文件存在则读取为数组并在末尾追加
-    - 使用原子写回盘
-    """
-    arr: List[Dict[str, Any]] = []
+def _read_json_array(path: str) -> List[Dict[str, Any]]:
     if os.path.exists(path):
         try:
             with open(path, "r", encoding="utf-8") as f:
                 data = json.load(f)
                 if isinstance(data, list):
-                    arr = data
+                    return data
         except:
-            arr = []
-    arr.append(obj)
-    _write_json_atomic(path, arr)
+            pass
+    return []
 
+def _append_json_array(path: str, objs: List[Dict[str, Any]], redelivered: bool = False, key: Optional[str] = None) -> int:
+    """
+    将对象追加到指定 JSON 数组文件（文件锁内读改写，原子写回盘），返回实际追加的条数：
+    - 文件不存在则创建空数组
+    - key：按该字段去重（数组中已有相同值的对象不再追加）
+    - redelivered：重投的载荷，数组中已有完全相同的对象时跳过
+    """
+    with file_lock(path):
+        arr = _read_json_array(path)
+        seen = {str(i.get(key)) for i in arr if isinstance(i, dict)} if key else None
+        added = 0
+        for obj in objs:
+            if seen is not None:
+                if str(obj.get(key)) in seen:
+                    continue
+                seen.add(str(obj.get(key)))
+            elif redelivered and obj in arr:
+                continue
+            arr.append(obj)
+            added += 1
+        if added or not os.path.exists(path):
+            _write_json_atomic(path, arr)
+        return added
 
-async def run_saver(stop: asyncio.Event) -> None:
+def _ensure_json_array(path: str) -> None:
+    with file_lock(path):
+        if not os.path.exists(path):
+            _write_json_atomic(path, [])
+
+def _valid_id(value: Any) -> Optional[str]:
+    if not isinstance(value, str) or not value or value in (".", "..") or os.path.basename(value) != value:
+        return None
+    return value
+
+def parse_payload(raw: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
     """
-    后台保存器主循环：
-    - 每次 BRPOP 同时监听 init/state/results 三个队列，timeout=1 保证每秒节奏
-    - 根据队列类型进行不同的落盘策略：
-      * init-queue：jobs_info.json 追加、创建任务子目录并预建空的 state.json/result.json
-      * state-queue：将载荷追加到任务子目录的 state.json
-      * results-queue：将载荷追加到任务子目录的 result.json
-    - 停止条件：收到 stop 事件（由 FastAPI lifespan 在停机时触发）
+    解析并校验载荷，返回 (载荷, None) 或 (None, 拒绝原因)
     """
-    redis = Redis.from_url(REDIS_URL, decode_responses=True)
     try:
+        payload = json.loads(raw)
+    except (TypeError, ValueError):
+        return None, "invalid_json"
+    if not isinstance(payload, dict):
+        return None, "not_object"
+    if _valid_id(payload.get("pid")) is None:
+        return None, "invalid_pid"
+    if _valid_id(payload.get("jid")) is None:
+        return None, "invalid_jid"
+    return payload, None
+
+def write_batch(queue: str, payloads: List[Dict[str, Any]], redelivered: bool = False) -> int:
+    """
+    把一批载荷按目标文件分组落盘，返回实际追加的条数
+    """
+    groups: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+    for payload in payloads:
+        pid, jid = payload["pid"], payload["jid"]
+        if queue == INIT_QUEUE_NAME:
+            jsub = _job_dir(pid, jid)
+            _ensure_json_array(os.path.join(jsub, "state.json"))
+            _ensure_json_array(os.path.join(jsub, "result.json"))
+            path = os.path.join(_jobs_dir(pid), "jobs_info.json")
+        elif queue == STATE_QUEUE_NAME:
+            path = os.path.join(_job_dir(pid, jid), "state.json")
+        else:
+            path = os.path.join(_job_dir(pid, jid), "result.json")
+        groups.setdefault(path, []).append(payload)
+    key = "jid" if queue == INIT_QUEUE_NAME else None
+    return sum(_append_json_array(path, objs, redelivered=redelivered, key=key) for path, objs in groups.items())
+
+
+class Saver:
+    """
+    - run(stop)：启动各队列的消费协程与心跳 / 接管协程，直到 stop 置位
+    - recover(instance)：处理某实例处理中列表里的全部载荷（重投）
+    redis 可注入（例如 fakeredis.FakeAsyncRedis(decode_responses=True)）
+    """
+    def __init__(self, redis: Redis, instance: str = SAVER_ID, batch: int = SAVER_BATCH,
+                 poll_timeout: float = SAVER_POLL_TIMEOUT, queues=QUEUES):
+        self.redis = redis
+        self.instance = instance
+        self.batch = max(1, int(batch))
+        self.poll_timeout = poll_timeout
+        self.queues = tuple(queues)
+        self.counters = {"saved": 0, "redelivered": 0, "dead": 0, "reclaimed": 0}
+
+    async def _dead_letter(self, queue: str, raw: str, reason: str) -> None:
+        self.counters["dead"] += 1
+        logger.error(f"saver:dead_letter queue={queue} reason={reason} raw={raw[:200]}")
+        entry = json.dumps({"queue": queue, "reason": reason, "raw": raw, "time": time.time()}, ensure_ascii=False)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.rpush(SAVER_DEAD_LETTER_KEY, entry)
+        pipe.ltrim(SAVER_DEAD_LETTER_KEY, -SAVER_DEAD_LETTER_MAX, -1)
+        await pipe.execute()
+
+    async def _after_write(self, queue: str, payload: Dict[str, Any]) -> None:
+        jid = payload["jid"]
+        if queue == STATE_QUEUE_NAME and payload.get("type") in ("epoch", "lifecycle"):
+            try:
+                await asyncio.to_thread(get_controller().observe, payload)
+            except Exception as e:
+                logger.error(f"saver:observe_failed jid={jid} error={e}")
+        elif queue == RESULTS_QUEUE_NAME:
+            try:
+                await asyncio.to_thread(get_job_index().settle, payload)
+            except Exception as e:
+                logger.error(f"saver:settle_failed jid={jid} error={e}")
+
+    async def _handle(self, queue: str, raws: List[str], redelivered: bool = False) -> None:
+        """
+        落盘一批载荷并执行后续钩子；调用方在返回后才确认
+        """
+        payloads = []
+        for raw in raws:
+            payload, reason = parse_payload(raw)
+            if payload is None:
+                await self._dead_letter(queue, raw, reason)
+            else:
+                payloads.append(payload)
+        monitor = get_monitor()
+        monitor.drained(queue, len(raws))
+        if not payloads:
+            return
+        added = await asyncio.to_thread(write_batch, queue, payloads, redelivered)
+        self.counters["saved"] += added
+        if redelivered:
+            self.counters["redelivered"] += len(payloads)
+            logger.warning(f"saver:redelivered queue={queue} count={len(payloads)} written={added}")
+        for payload in payloads:
+            await self._after_write(queue, payload)
+
+    async def _take(self, queue: str, processing: str) -> List[str]:
+        raw = await self.redis.blmove(queue, processing, self.poll_timeout, "LEFT", "RIGHT")
+        if raw is None:
+            return []
+        raws = [raw]
+        while len(raws) < self.batch:
+            raw = await self.redis.lmove(queue, processing, "LEFT", "RIGHT")
+            if raw is None:
+                break
+            raws.append(raw)
+        return raws
+
+    async def _redeliver(self, queue: str, processing: str) -> int:
+        count = 0
+        while True:
+            raws = await self.redis.lrange(processing, 0, self.batch - 1)
+            if not raws:
+                return count
+            await self._handle(queue, raws, redelivered=True)
+            await self.redis.ltrim(processing, len(raws), -1)
+            count += len(raws)
+
+    async def recover(self, instance: str) -> int:
+        return sum([await self._redeliver(q, processing_key(instance, q)) for q in self.queues])
+
+    async def _consume(self, queue: str, stop: asyncio.Event) -> None:
+        processing = processing_key(self.instance, queue)
+        failed = False
         while not stop.is_set():
-            item = await redis.brpop([INIT_QUEUE_NAME, STATE_QUEUE_NAME, RESULTS_QUEUE_NAME], timeout=SAVER_POLL_TIMEOUT)
-            if not item:
-                continue
-            key, value = item
             try:
-                payload = json.loads(value)
-            except:
+                if failed:
+                    # 上一批未确认：先重投处理中列表，确认时按位置裁剪才不会误删新取出的载荷
+                    await self._redeliver(queue, processing)
+                    failed = False
+                raws = await self._take(queue, processing)
+                if not raws:
+                    continue
+                await self._handle(queue, raws)
+                # 确认：落盘完成后从处理中列表移除本批
+                await self.redis.ltrim(processing, len(raws), -1)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 未确认的载荷留在处理中列表，重启或被接管时重投
+                logger.error(f"saver:batch_failed queue={queue} error={e}")
+                failed = True
+                await asyncio.sleep(self.poll_timeout)
+
+    async def _reclaim(self) -> None:
+        now = time.time()
+        for instance, ts in (await self.redis.hgetall(SAVER_INSTANCES_KEY)).items():
+            if instance == self.instance or now - float(ts) <= SAVER_INSTANCE_TIMEOUT:
                 continue
-            pid = str(payload.get("pid"))
-            jid = str(payload.get("jid"))
-            if not pid or not jid:
+            lock = f"saver:reclaim:{instance}"
+            if not await self.redis.set(lock, self.instance, nx=True, ex=max(60, int(SAVER_INSTANCE_TIMEOUT))):
                 continue
-            if key == INIT_QUEUE_NAME:
-                jdir = _jobs_dir(pid)
-                info_path = os.path.join(jdir, "jobs_info.json")
-                _append_json_array(info_path, payload)
-                jsub = _job_dir(pid, jid)
-                state_path = os.path.join(jsub, "state.json")
-                result_path = os.path.join(jsub, "result.json")
-                if not os.path.exists(state_path):
-                    _write_json_atomic(state_path, [])
-                if not os.path.exists(result_path):
-                    _write_json_atomic(result_path, [])
-            elif key == STATE_QUEUE_NAME:
-                jsub = _job_dir(pid, jid)
-                state_path = os.path.join(jsub, "state.json")
-                _append_json_array(state_path, payload)
-            else:
-                jsub = _job_dir(pid, jid)
-                result_path = os.path.join(jsub, "result.json")
-                _append_json_array(result_path, payload)
-            # 让出事件循环，避免长时间占用
-            await asyncio.sleep(0)
+            try:
+                count = await self.recover(instance)
+                await self.redis.hdel(SAVER_INSTANCES_KEY, instance)
+                self.counters["reclaimed"] += count
+                logger.warning(f"saver:reclaimed instance={instance} count={count}")
+            finally:
+                await self.redis.delete(lock)
+
+    async def _heartbeat(self, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            try:
+                await self.redis.hset(SAVER_INSTANCES_KEY, self.instance, time.time())
+                await self._reclaim()
+            except Exception as e:
+                logger.error(f"saver:heartbeat_failed error={e}")
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=SAVER_HEARTBEAT)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self, stop: asyncio.Event) -> None:
+        await self.redis.hset(SAVER_INSTANCES_KEY, self.instance, time.time())
+        recovered = await self.recover(self.instance)
+        logger.info(f"saver:started instance={self.instance} queues={','.join(self.queues)} recovered={recovered}")
+        await asyncio.gather(self._heartbeat(stop), *(self._consume(q, stop) for q in self.queues))
+        # 正常退出时处理中列表已清空，注销实例
+        await self.redis.hdel(SAVER_INSTANCES_KEY, self.instance)
+        logger.info(f"saver:stopped instance={self.instance} counters={self.counters}")
+
+
+async def run_saver(stop: asyncio.Event) -> None:
+    """
+    后台保存器主循环：启动 Saver 直到收到 stop 事件（由 FastAPI lifespan 在停机时触发）
+    """
+    redis = Redis.from_url(REDIS_URL, decode_responses=True)
+    try:
+        await Saver(redis).run(stop)
     finally:
         # 优雅关闭 Redis 连接
         await redis.close()
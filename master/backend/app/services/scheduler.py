@@ -0,0 +1,454 @@
+"""
+调度器（Scheduler）模块
+-------------------
+职责：
+- 节点池：worker 定期把心跳写入 Redis 哈希 NODES_KEY（field = node_id），超过 SCHED_NODE_TIMEOUT 秒未更新视为离线
+- 待调度任务：create_job 把任务提交到 SCHED_PENDING_KEY（哈希，jid -> 任务），不再直接进入共享 job_queue
+- 调度循环（每 SCHED_INTERVAL 秒执行一次 schedule_once）：
+  * 排序：优先级高者先；同优先级按项目当前占用的 CPU 数（公平份额）少者先，同一项目内按提交时间
+  * 放置：在空闲资源满足需求的节点中，优先选已缓存该任务数据集（心跳 resources.datasets 含其指纹）的节点，
+    其次选剩余资源最少者（best fit，CPU 与内存按节点总量归一化后相加），
+    入队到该节点的 RQ 队列 <JOB_QUEUE_NAME>:<node_id>，并记入放置台账 SCHED_PLACED_KEY；
+    同一轮内数据集被放到某节点后，后续引用同一数据集的任务也优先该节点（只下载一次）
+  * 回填：靠前的任务放不下时继续尝试后面较小的任务；最靠前的阻塞任务等待超过 SCHED_RESERVE_AFTER 秒后，
+    为其预留一个节点（后续任务不再放到该节点），避免大任务被小任务长期饿死
+- 台账维护：心跳中的 jobs（运行中 jid -> 开始时间戳）与 done（最近结束的 jid）用于确认任务已开始 / 已结束；
+  已放置但尚未开始的任务从节点空闲资源中扣除；节点离线时未开始的任务退回待调度，已开始的任务判为 FAILED
+- 指标：放置延迟（提交 -> 入队到节点）、排队等待（提交 -> worker 开始执行）、调度轮耗时
+- 多进程：调度循环只在选举出的主进程中运行（services.leader），提交 / 撤回可在任一 worker 进程中执行；
+  放置时在同一事务中删除待调度条目并写入台账，条目已被并发撤回的任务不会入队；
+  计数经 Redis 共享，延迟统计每轮写入快照 SCHED_STATS_KEY 供其他进程查询
+
+心跳格式（worker_app.agent 写入）：
+  {"id", "ip", "hostname", "status": "online" | "draining", "last_heartbeat": ISO 时间, "ts": 时间戳,
+   "resources": {"cpus", "memory_mb", "free_cpus", "free_memory_mb", "jobs": {jid: 开始时间戳}, "done": [jid, ...],
+                 "datasets": [已缓存的数据集指纹, ...]}}
+
+Redis 连接与时钟均可注入（fakeredis + 进程内模拟 worker 即可驱动完整的调度流程）
+"""
+import json
+import time
+import heapq
+import asyncio
+import logging
+import threading
+from collections import deque, defaultdict
+from typing import Any, Callable, Dict, List, Optional, Set
+from rq import Queue
+from app.config import (JOB_QUEUE_NAME, STATE_QUEUE_NAME, RESULT_QUEUE_NAME, SCHED_INTERVAL, SCHED_NODE_TIMEOUT,
+                        SCHED_RESERVE_AFTER, SCHED_DEFAULT_CPUS, SCHED_DEFAULT_MEMORY_MB, SCHED_METRICS_WINDOW,
+                        NODES_KEY, SCHED_PENDING_KEY, SCHED_PLACED_KEY, SCHED_STATS_KEY)
+from app.utils.shared import SharedCounters, put_snapshot, get_snapshot
+
+logger = logging.getLogger(__name__)
+
+TASK_NAME = "worker_app.process_training"
+FAILED = 3
+# 待调度条目的字段（放置台账在此基础上增加 node / placed_at / started_at）
+ENTRY_FIELDS = ("jid", "pid", "priority", "resources", "submitted_at", "dataset", "payload")
+
+
+def node_queue_name(node_id: str, queue_name: str = JOB_QUEUE_NAME) -> str:
+    return f"{queue_name}:{node_id}"
+
+
+def job_resources(config: Dict[str, Any]) -> Dict[str, int]:
+    """
+    任务声明的资源需求（与 worker 端 plan.job_resources 一致），缺省取 SCHED_DEFAULT_*
+    """
+    res = (config or {}).get("resources") or {}
+    try:
+        cpus = int(res.get("cpus") or SCHED_DEFAULT_CPUS)
+        memory_mb = int(res.get("memory_mb") or SCHED_DEFAULT_MEMORY_MB)
+    except (TypeError, ValueError):
+        raise RuntimeError("scheduler:invalid_resources")
+    if cpus < 1 or memory_mb < 0:
+        raise RuntimeError(f"scheduler:invalid_resources cpus={cpus} memory_mb={memory_mb}")
+    return {"cpus": cpus, "memory_mb": memory_mb}
+
+
+def _summary(values) -> Dict[str, Any]:
+    data = sorted(values)
+    n = len(data)
+    if n == 0:
+        return {"count": 0, "mean": None, "p50": None, "p95": None, "max": None}
+    return {"count": n, "mean": sum(data) / n, "p50": data[(n - 1) // 2],
+            "p95": data[min(n - 1, int(0.95 * (n - 1) + 0.5))], "max": data[-1]}
+
+
+def _decode(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class _NodeView:
+    """
+    一轮调度内的节点视图：心跳上报的空闲资源减去已放置但尚未开始的任务
+    """
+    def __init__(self, info: Dict[str, Any]):
+        res = info.get("resources") or {}
+        self.id = str(info.get("id"))
+        self.placeable = info.get("status", "online") == "online"
+        self.cpus = int(res.get("cpus") or 0)
+        self.memory_mb = int(res.get("memory_mb") or 0)
+        self.free_cpus = int(res.get("free_cpus", self.cpus))
+        self.free_memory_mb = int(res.get("free_memory_mb", self.memory_mb))
+        self.jobs: Dict[str, float] = {str(k): float(v) for k, v in (res.get("jobs") or {}).items()}
+        self.done: Set[str] = {str(j) for j in res.get("done") or []}
+        self.datasets: Set[str] = {str(d) for d in res.get("datasets") or []}
+        self._queued: Optional[Set[str]] = None
+
+    def fits_total(self, req: Dict[str, int]) -> bool:
+        return req["cpus"] <= self.cpus and req["memory_mb"] <= self.memory_mb
+
+    def fits(self, req: Dict[str, int]) -> bool:
+        return req["cpus"] <= self.free_cpus and req["memory_mb"] <= self.free_memory_mb
+
+    def take(self, req: Dict[str, int]) -> None:
+        self.free_cpus -= req["cpus"]
+        self.free_memory_mb -= req["memory_mb"]
+
+    def leftover(self, req: Dict[str, int]) -> float:
+        cpu = (self.free_cpus - req["cpus"]) / max(1, self.cpus)
+        mem = (self.free_memory_mb - req["memory_mb"]) / max(1, self.memory_mb)
+        return cpu + mem
+
+
+class Scheduler:
+    """
+    - submit(payload, priority)：提交任务到待调度集合
+    - cancel(jid)：撤回尚未开始执行的任务（待调度，或已放置到节点队列但未被取走）
+    - schedule_once()：执行一轮调度，返回本轮的放置列表 [{"jid", "node", "resources"}]
+    - nodes() / pending() / metrics()：节点列表、排序后的待调度队列、调度指标
+    """
+    def __init__(self, connection, queue_name: str = JOB_QUEUE_NAME, node_timeout: float = SCHED_NODE_TIMEOUT,
+                 reserve_after: float = SCHED_RESERVE_AFTER, metrics_window: int = SCHED_METRICS_WINDOW,
+                 clock: Callable[[], float] = time.time):
+        self.connection = connection
+        self.queue_name = queue_name
+        self.node_timeout = float(node_timeout)
+        self.reserve_after = float(reserve_after)
+        self.clock = clock
+        self.placement_latency: deque = deque(maxlen=max(1, int(metrics_window)))
+        self.queue_wait: deque = deque(maxlen=max(1, int(metrics_window)))
+        self.counters = SharedCounters(connection, "scheduler", ("submitted", "placed", "data_local", "started",
+                                                                 "finished", "requeued", "lost"))
+        self.last_pass_ms = 0.0
+        self._reservation: Optional[Dict[str, str]] = None
+        self._lock = threading.Lock()
+
+    # 存取
+    def _load(self, key: str) -> Dict[str, Dict[str, Any]]:
+        out = {}
+        for field, value in (self.connection.hgetall(key) or {}).items():
+            try:
+                out[_decode(field)] = json.loads(value)
+            except (TypeError, ValueError):
+                continue
+        return out
+
+    def _load_one(self, key: str, field: str) -> Optional[Dict[str, Any]]:
+        raw = self.connection.hget(key, field)
+        try:
+            return json.loads(raw) if raw is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    def _dump(self, obj: Dict[str, Any]) -> str:
+        return json.dumps(obj, ensure_ascii=False, default=str)
+
+    # 提交 / 撤回
+    def submit(self, payload: Dict[str, Any], priority: int = 0) -> Dict[str, Any]:
+        jid = str(payload["jid"])
+        entry = {
+            "jid": jid,
+            "pid": str(payload.get("pid")),
+            "priority": int(priority),
+            "resources": job_resources(payload.get("config") or {}),
+            "submitted_at": self.clock(),
+            "dataset": (payload.get("dataset") or {}).get("fingerprint"),
+            "payload": payload,
+        }
+        self.connection.hset(SCHED_PENDING_KEY, jid, self._dump(entry))
+        self.counters.incr("submitted")
+        logger.info(f"scheduler:submitted jid={jid} priority={entry['priority']} resources={entry['resources']}")
+        return entry
+
+    def cancel(self, jid: str) -> bool:
+        """
+        撤回待调度或已放置但尚未被 worker 取走的任务；返回是否撤回成功（否则任务已在节点上开始执行）
+        """
+        with self._lock:
+            if self.connection.hdel(SCHED_PENDING_KEY, jid):
+                logger.info(f"scheduler:cancelled jid={jid} stage=pending")
+                return True
+            entry = self._load_one(SCHED_PLACED_KEY, jid)
+            if entry is None or entry.get("started_at") is not None:
+                return False
+            queue = Queue(node_queue_name(entry["node"], self.queue_name), connection=self.connection)
+            if not queue.remove(jid):
+                return False
+            self.connection.hdel(SCHED_PLACED_KEY, jid)
+            logger.info(f"scheduler:cancelled jid={jid} stage=placed node={entry['node']}")
+            return True
+
+    # 节点
+    def _status(self, info: Dict[str, Any], now: float) -> str:
+        if now - float(info.get("ts") or 0) > self.node_timeout:
+            return "offline"
+        return info.get("status") or "online"
+
+    def nodes(self) -> List[Dict[str, Any]]:
+        now = self.clock()
+        out = []
+        for node_id, info in sorted(self._load(NODES_KEY).items()):
+            info = dict(info, id=info.get("id") or node_id)
+            info["status"] = self._status(info, now)
+            out.append(info)
+        return out
+
+    def _views(self, now: float) -> Dict[str, _NodeView]:
+        views = {}
+        for node_id, info in self._load(NODES_KEY).items():
+            status = self._status(info, now)
+            if status == "offline":
+                continue
+            view = _NodeView(dict(info, id=info.get("id") or node_id, status=status))
+            views[view.id] = view
+        return views
+
+    def _queued(self, view: _NodeView) -> Set[str]:
+        if view._queued is None:
+            view._queued = set(Queue(node_queue_name(view.id, self.queue_name), connection=self.connection).get_job_ids())
+        return view._queued
+
+    # 台账维护
+    def _fail_lost(self, entry: Dict[str, Any]) -> None:
+        payload = {"pid": entry["pid"], "jid": entry["jid"], "type": "lifecycle", "state": FAILED,
+                   "time": self.clock(), "node": entry["node"], "error": "scheduler:node_lost"}
+        raw = self._dump(payload)
+        self.connection.rpush(STATE_QUEUE_NAME, raw)
+        self.connection.rpush(RESULT_QUEUE_NAME, self._dump(dict(payload, type="result")))
+
+    def _reconcile(self, placed: Dict[str, Dict[str, Any]], views: Dict[str, _NodeView], now: float) -> None:
+        """
+        按心跳确认已放置任务的状态，并把尚未开始的任务从节点空闲资源中扣除
+        """
+        for jid, entry in list(placed.items()):
+            view = views.get(entry["node"])
+            if view is None:
+                # 节点离线：未开始的任务撤出节点队列并退回待调度；已开始的任务判为失败
+                if entry.get("started_at") is None:
+                    Queue(node_queue_name(entry["node"], self.queue_name), connection=self.connection).remove(jid)
+                    pending = {k: entry.get(k) for k in ENTRY_FIELDS}
+                    self.connection.hset(SCHED_PENDING_KEY, jid, self._dump(pending))
+                    self.counters.incr("requeued")
+                    logger.warning(f"scheduler:requeued jid={jid} node={entry['node']} reason=node_offline")
+                else:
+                    self._fail_lost(entry)
+                    self.counters.incr("lost")
+                    logger.error(f"scheduler:lost jid={jid} node={entry['node']}")
+                self.connection.hdel(SCHED_PLACED_KEY, jid)
+                del placed[jid]
+                continue
+            if jid in view.jobs:
+                if entry.get("started_at") is None:
+                    entry["started_at"] = view.jobs[jid]
+                    self.queue_wait.append(max(0.0, entry["started_at"] - entry["submitted_at"]))
+                    self.counters.incr("started")
+                    self.connection.hset(SCHED_PLACED_KEY, jid, self._dump(entry))
+                continue
+            finished = jid in view.done or entry.get("started_at") is not None
+            if not finished and now - entry["placed_at"] > self.node_timeout and jid not in self._queued(view):
+                # 已被取走却从未出现在心跳中（执行极快且 done 窗口已滚动，或 worker 取走后崩溃）
+                finished = True
+            if finished:
+                self.counters.incr("finished")
+                self.connection.hdel(SCHED_PLACED_KEY, jid)
+                del placed[jid]
+                continue
+            view.take(entry["resources"])
+
+    # 放置
+    def _best_fit(self, entry: Dict[str, Any], views: Dict[str, _NodeView], excluded: Set[str]) -> Optional[_NodeView]:
+        req, dataset = entry["resources"], entry.get("dataset")
+        best, best_score = None, None
+        for view in views.values():
+            if not view.placeable or view.id in excluded or not view.fits(req):
+                continue
+            score = (0 if dataset and dataset in view.datasets else 1, view.leftover(req), view.id)
+            if best_score is None or score < best_score:
+                best, best_score = view, score
+        return best
+
+    def _reserve(self, entry: Dict[str, Any], views: Dict[str, _NodeView]) -> Optional[str]:
+        """
+        为长时间阻塞的队首任务预留节点：沿用上一轮的预留，否则取总量放得下且空闲 CPU 最多的节点
+        """
+        req = entry["resources"]
+        held = self._reservation
+        if held and held["jid"] == entry["jid"]:
+            view = views.get(held["node"])
+            if view is not None and view.placeable and view.fits_total(req):
+                return view.id
+        candidates = [v for v in views.values() if v.placeable and v.fits_total(req)]
+        if not candidates:
+            return None
+        node = max(candidates, key=lambda v: (v.free_cpus, v.free_memory_mb, v.id)).id
+        self._reservation = {"jid": entry["jid"], "node": node}
+        logger.info(f"scheduler:reserved jid={entry['jid']} node={node}")
+        return node
+
+    def _place(self, entry: Dict[str, Any], view: _NodeView, now: float) -> Optional[Dict[str, Any]]:
+        jid = entry["jid"]
+        record = {k: entry.get(k) for k in ENTRY_FIELDS}
+        record.update(node=view.id, placed_at=now, started_at=None)
+        # 先在同一事务中把任务从待调度移入放置台账：撤回可能在其他 worker 进程中并发执行，
+        # 待调度条目已被删除（HDEL 返回 0）说明任务已被撤回，不再入队
+        pipe = self.connection.pipeline()
+        pipe.hdel(SCHED_PENDING_KEY, jid)
+        pipe.hset(SCHED_PLACED_KEY, jid, self._dump(record))
+        if not pipe.execute()[0]:
+            self.connection.hdel(SCHED_PLACED_KEY, jid)
+            logger.info(f"scheduler:skipped jid={jid} reason=cancelled")
+            return None
+        Queue(node_queue_name(view.id, self.queue_name), connection=self.connection).enqueue(
+            TASK_NAME, entry["payload"], job_id=jid, job_timeout=-1)
+        view.take(entry["resources"])
+        self.placement_latency.append(max(0.0, now - entry["submitted_at"]))
+        self.counters.incr("placed")
+        dataset = entry.get("dataset")
+        if dataset:
+            if dataset in view.datasets:
+                self.counters.incr("data_local")
+            view.datasets.add(dataset)
+        if self._reservation and self._reservation["jid"] == jid:
+            self._reservation = None
+        logger.info(f"scheduler:placed jid={jid} node={view.id} resources={entry['resources']} dataset={dataset}")
+        return {"jid": jid, "node": view.id, "resources": entry["resources"]}
+
+    def _ranked(self, pending: Dict[str, Dict[str, Any]], usage: Dict[str, int]):
+        """
+        逐个产出待调度任务：优先级降序；同优先级内每次取当前占用最少的项目的最早任务
+        （调用方放置成功后更新 usage，实现动态公平份额）
+        """
+        groups: Dict[int, Dict[str, List[Dict[str, Any]]]] = defaultdict(lambda: defaultdict(list))
+        for entry in pending.values():
+            groups[int(entry.get("priority") or 0)][entry["pid"]].append(entry)
+        for priority in sorted(groups, reverse=True):
+            projects = groups[priority]
+            for jobs in projects.values():
+                jobs.sort(key=lambda e: (e["submitted_at"], e["jid"]))
+            index = {pid: 0 for pid in projects}
+            heap = [(usage[pid], jobs[0]["submitted_at"], pid) for pid, jobs in projects.items()]
+            heapq.heapify(heap)
+            while heap:
+                _, _, pid = heapq.heappop(heap)
+                jobs = projects[pid]
+                entry = jobs[index[pid]]
+                index[pid] += 1
+                yield entry
+                if index[pid] < len(jobs):
+                    heapq.heappush(heap, (usage[pid], jobs[index[pid]]["submitted_at"], pid))
+
+    def schedule_once(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            start = time.perf_counter()
+            now = self.clock()
+            views = self._views(now)
+            placed = self._load(SCHED_PLACED_KEY)
+            self._reconcile(placed, views, now)
+            usage: Dict[str, int] = defaultdict(int)
+            for entry in placed.values():
+                usage[entry["pid"]] += entry["resources"]["cpus"]
+            pending = self._load(SCHED_PENDING_KEY)
+            placements = []
+            reserved: Set[str] = set()
+            head_blocked = False
+            for entry in self._ranked(pending, usage):
+                view = self._best_fit(entry, views, reserved)
+                if view is not None:
+                    placement = self._place(entry, view, now)
+                    if placement is not None:
+                        placements.append(placement)
+                        usage[entry["pid"]] += entry["resources"]["cpus"]
+                    continue
+                if not head_blocked:
+                    # 只为排序最靠前的阻塞任务预留；其余阻塞任务仅跳过（回填）
+                    head_blocked = True
+                    if now - entry["submitted_at"] >= self.reserve_after:
+                        node = self._reserve(entry, views)
+                        if node:
+                            reserved.add(node)
+            if not head_blocked:
+                self._reservation = None
+            self.last_pass_ms = (time.perf_counter() - start) * 1000.0
+            put_snapshot(self.connection, SCHED_STATS_KEY, self._stats(), ttl=max(60.0, 10 * SCHED_INTERVAL))
+            return placements
+
+    # 查询
+    def pending(self) -> List[Dict[str, Any]]:
+        """
+        按当前调度顺序列出待调度任务（不含载荷），unschedulable 表示没有任何在线节点的总量能满足需求
+        """
+        now = self.clock()
+        views = self._views(now)
+        usage: Dict[str, int] = defaultdict(int)
+        for entry in self._load(SCHED_PLACED_KEY).values():
+            usage[entry["pid"]] += entry["resources"]["cpus"]
+        out = []
+        for entry in self._ranked(self._load(SCHED_PENDING_KEY), usage):
+            item = {k: entry.get(k) for k in ("jid", "pid", "priority", "resources", "submitted_at", "dataset")}
+            item["waited"] = now - entry["submitted_at"]
+            item["unschedulable"] = not any(v.fits_total(entry["resources"]) for v in views.values())
+            out.append(item)
+        return out
+
+    def _stats(self) -> Dict[str, Any]:
+        return {
+            "placement_latency_seconds": _summary(self.placement_latency),
+            "queue_wait_seconds": _summary(self.queue_wait),
+            "last_pass_ms": self.last_pass_ms,
+            "reservation": self._reservation,
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        调度指标：计数为所有进程的累计值；延迟统计只在运行调度循环的主进程中维护，其他进程读取其最近一轮写入的快照
+        """
+        nodes = self.nodes()
+        out = {
+            "nodes": {s: sum(1 for n in nodes if n["status"] == s) for s in ("online", "draining", "offline")},
+            "pending": int(self.connection.hlen(SCHED_PENDING_KEY)),
+            "placed": int(self.connection.hlen(SCHED_PLACED_KEY)),
+            "counters": self.counters.snapshot(),
+        }
+        out.update(get_snapshot(self.connection, SCHED_STATS_KEY) or self._stats())
+        return out
+
+
+_scheduler: Optional[Scheduler] = None
+
+
+def get_scheduler() -> Scheduler:
+    global _scheduler
+    if _scheduler is None:
+        from app.utils.queue import get_redis
+        _scheduler = Scheduler(get_redis())
+    return _scheduler
+
+
+async def run_scheduler(stop: asyncio.Event) -> None:
+    """
+    调度主循环：每 SCHED_INTERVAL 秒在线程池中执行一轮 schedule_once（Redis 同步客户端，不阻塞事件循环）
+    """
+    scheduler = get_scheduler()
+    while not stop.is_set():
+        try:
+            await asyncio.to_thread(scheduler.schedule_once)
+        except Exception as e:
+            logger.error(f"scheduler:pass_failed error={e}")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=SCHED_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
@@ -1,6 +1,11 @@
 """
 通用工具函数
 """
+import os
+import time
+import fcntl
+import threading
+import contextlib
 import unicodedata
 
 def normalize_name(s: str) -> str:
@@ -8,3 +13,35 @@ def normalize_name(s: str) -> str:
     s = s.strip()
     s = " ".join(s.split())
     return s
+
+_CROCKFORD = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_ulid_lock = threading.Lock()
+_ulid_last = [0, 0]
+
+def new_ulid() -> str:
+    """
+    生成 ULID（26 位 Crockford Base32：48 位毫秒时间戳 + 80 位随机数）
+    - 按字典序即按时间序；同一毫秒内在上一个随机数上加一，保证进程内单调且不重复
+    """
+    ms = int(time.time() * 1000)
+    with _ulid_lock:
+        if ms <= _ulid_last[0]:
+            ms = _ulid_last[0]
+            rand = (_ulid_last[1] + 1) & ((1 << 80) - 1)
+        else:
+            rand = int.from_bytes(os.urandom(10), "big")
+        _ulid_last[0], _ulid_last[1] = ms, rand
+    value = (ms << 80) | rand
+    return "".join(_CROCKFORD[(value >> (5 * i)) & 31] for i in range(25, -1, -1))
+
+@contextlib.contextmanager
+def file_lock(path: str):
+    """
+    文件级互斥（path.lock 上的 flock）：跨线程与跨进程（多个 worker 进程、多个保存器实例）串行化对同一文件的读改写
+    """
+    with open(f"{path}.lock", "a") as lock:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,125 @@
+"""
+训练曲线工具：读取任务遥测文件（列式 npz）并用 LTTB 下采样，供前端绘制 loss / lr / 耗时等曲线
+
+遥测文件由计算端 infra.telemetry 产出，回传后位于 data/projects/<pid>/jobs/<jid>/training/：
+- telemetry.npz：合并后的全部记录（每列一个数组：step, epoch, time, kind, 以及各字段）
+- telemetry/part-<n>.npz：训练进行中已刷盘的分片（共享存储或增量回传时存在）
+kind：0 = 优化步记录，1 = epoch 记录；缺失的字段为 NaN
+"""
+import os
+import glob
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# 与计算端 infra/telemetry.py 的 BASE_COLUMNS / KIND_STEP / KIND_EPOCH / _dedupe 为同一约定的两份副本
+# （两端分别部署，主控端不安装 infra），修改时需同步修改
+BASE_COLUMNS = ("step", "epoch", "time", "kind")
+KINDS = {"step": 0, "epoch": 1}
+_CACHE_SIZE = 16
+_cache: "OrderedDict[str, Tuple[tuple, Dict[str, np.ndarray]]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets 下采样，返回保留点的下标（含首尾点）
+    - 首尾之外的点均分为 threshold-2 个桶，每桶选与「上一个已选点、下一桶均值点」构成三角形面积最大的点
+    - 点数不超过 threshold 时原样返回全部下标
+    """
+    n = len(x)
+    if threshold >= n or n <= 2:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1])
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    edges = (np.floor(np.arange(threshold - 1) * ((n - 2) / (threshold - 2))) + 1).astype(np.int64)
+    edges[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # 下一桶均值点（最后一个桶以末点代替）
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        cx = x[nlo:nhi].mean()
+        cy = y[nlo:nhi].mean()
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - cx) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (cy - ay))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def _signature(directory: str) -> tuple:
+    files = [os.path.join(directory, "telemetry.npz")] + sorted(glob.glob(os.path.join(directory, "telemetry", "part-*.npz")))
+    sig = []
+    for p in files:
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        sig.append((p, st.st_mtime_ns, st.st_size))
+    return tuple(sig)
+
+
+def _dedupe(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    # 按 (kind, step) 保留最后写入的记录（续训时步号可能重复），并按 (kind, step) 排序；与 infra.telemetry._dedupe 相同
+    n = len(columns["step"])
+    if n == 0:
+        return columns
+    order = np.lexsort((-np.arange(n), columns["step"], columns["kind"]))
+    k = columns["kind"][order]
+    s = columns["step"][order]
+    keep = np.ones(n, dtype=bool)
+    keep[1:] = (k[1:] != k[:-1]) | (s[1:] != s[:-1])
+    index = order[keep]
+    return {name: col[index] for name, col in columns.items()}
+
+
+def load_telemetry(directory: str) -> Optional[Dict[str, np.ndarray]]:
+    """
+    读取遥测目录（telemetry.npz + 分片），按文件修改时间与大小缓存；不存在时返回 None
+    """
+    sig = _signature(directory)
+    if not sig:
+        return None
+    with _cache_lock:
+        hit = _cache.get(directory)
+        if hit and hit[0] == sig:
+            _cache.move_to_end(directory)
+            return hit[1]
+    chunks: List[Dict[str, np.ndarray]] = []
+    for path, _, _ in sig:
+        with np.load(path) as z:
+            chunks.append({k: z[k] for k in z.files})
+    names = list(BASE_COLUMNS)
+    for c in chunks:
+        names.extend(k for k in c if k not in names)
+    columns = {}
+    for name in names:
+        columns[name] = np.concatenate([c[name] if name in c else np.full(len(c["step"]), np.nan) for c in chunks]).astype(np.float64)
+    columns = _dedupe(columns)
+    with _cache_lock:
+        _cache[directory] = (sig, columns)
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return columns
+
+
+def downsample_curves(columns: Dict[str, np.ndarray], fields: List[str], kind: str = "step", x: str = "step",
+                      points: int = 1000) -> Dict[str, Dict[str, list]]:
+    """
+    为每个字段生成下采样曲线 {字段: {"x": [...], "y": [...], "total": 原始点数}}；NaN 点先剔除
+    """
+    mask = columns["kind"] == KINDS[kind]
+    xs = columns[x][mask]
+    curves = {}
+    for name in fields:
+        ys = columns[name][mask]
+        valid = np.isfinite(ys) & np.isfinite(xs)
+        cx, cy = xs[valid], ys[valid]
+        index = lttb(cx, cy, points)
+        curves[name] = {"x": cx[index].tolist(), "y": cy[index].tolist(), "total": int(len(cx))}
+    return curves
@@ -5,7 +5,7 @@ import os
 import sqlite3
 import json
 from fastapi import HTTPException
-from typing import Optional
+from typing import Dict, Optional
 from app.config import METADATA_DB, MUTATIONS_TABLE
 
 def ensure_metadata_db_exists():
@@ -33,7 +33,13 @@ def resolve_table(conn: sqlite3.Connection, table: Optional[str]) -> str:
         return "data_table"
     raise HTTPException(status_code=400, detail="Ambiguous table: please specify table or set METADATA_TABLE")
 
-def build_where_clause(filters: Optional[list], valid_columns: Optional[set] = None) -> (str, list):
+def build_where_clause(filters: Optional[list], valid_columns: Optional[set] = None, alias: Optional[str] = None,
+                       rewrite: Optional[Dict[str, str]] = None) -> (str, list):
+    """
+    筛选条件 -> WHERE 子句与参数
+    - alias：列名前缀的表别名（多表连接时避免同名列歧义，如 m."id"）
+    - rewrite：列名 -> SQL 表达式（如 {"source": "s.source_text"}），优先于 alias
+    """
     if not filters:
         return "", []
     allowed_ops = {"=", "like", ">", "<", ">=", "<=", "!=", "<>"}
@@ -47,11 +53,12 @@ def build_where_clause(filters: Optional[list], valid_columns: Optional[set] = N
             continue
         if valid_columns and col not in valid_columns:
             continue
+        expr = (rewrite or {}).get(col) or (f'{alias}."{col}"' if alias else f'"{col}"')
         if op == "like":
-            clauses.append(f'"{col}" LIKE ?')
+            clauses.append(f"{expr} LIKE ?")
             params.append(f"%{val}%")
         else:
-            clauses.append(f'"{col}" {op} ?')
+            clauses.append(f"{expr} {op} ?")
             params.append(val)
     if not clauses:
         return "", []
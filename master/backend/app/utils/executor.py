@@ -0,0 +1,70 @@
+"""
+路由层的阻塞 I/O 执行器
+- 异步路由把文件读写、目录扫描、shutil、SQLite 等阻塞调用交给 run_io，在专用线程池（IO_WORKERS 个线程）中执行，
+  不占用 Starlette 的默认线程池，也不阻塞事件循环
+- 有界：执行中与排队的调用合计超过 IO_WORKERS + IO_QUEUE_LIMIT 时直接返回 503，过载时快速失败而不是无限堆积
+"""
+import asyncio
+import functools
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+from fastapi import HTTPException
+from app.config import IO_WORKERS, IO_QUEUE_LIMIT
+from app.utils.shared import SharedCounters
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+_inflight = [0]
+_counters: Optional[SharedCounters] = None
+
+
+def io_counters() -> SharedCounters:
+    """
+    执行器计数（所有 worker 进程合计）：rejected（因过载返回 503 的调用数）
+    """
+    global _counters
+    if _counters is None:
+        from app.utils.queue import get_redis
+        _counters = SharedCounters(get_redis(), "io", ("rejected",))
+    return _counters
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, IO_WORKERS), thread_name_prefix="io")
+        return _executor
+
+
+async def run_io(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    在 I/O 线程池中执行 func(*args, **kwargs) 并等待结果（函数内抛出的 HTTPException 原样传出）
+    - 异常: 503 若线程池已满载且排队数达到上限
+    """
+    with _lock:
+        full = _inflight[0] >= max(1, IO_WORKERS) + IO_QUEUE_LIMIT
+        if not full:
+            _inflight[0] += 1
+    if full:
+        io_counters().incr("rejected")
+        raise HTTPException(status_code=503, detail="服务繁忙，请稍后重试")
+    try:
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, func, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(get_io_executor(), call)
+    finally:
+        with _lock:
+            _inflight[0] -= 1
+
+
+def shutdown_io() -> None:
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,134 @@
+"""
+路由延迟直方图
+- LatencyMiddleware（main.py）对每个请求调用 observe(method, route, seconds)：route 为路由模板（如 /api/projects/{pid}），
+  未匹配到路由的请求记为 unmatched，标签基数受控；耗时为从进入中间件到响应头就绪
+- 各 worker 进程先在本地累积增量，run_latency_flusher 每 LATENCY_FLUSH_INTERVAL 秒以一个 pipeline 合并到
+  Redis 哈希 <STATS_KEY_PREFIX>:http（字段 "<method> <route>|le=<桶上界>"、"|count"、"|sum"），/metrics 读到的是所有进程的合计
+- Redis 不可用时增量保留到下一次合并，/metrics 退回本进程的累计值
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from redis.exceptions import RedisError
+from app.config import LATENCY_BUCKETS, LATENCY_FLUSH_INTERVAL, STATS_KEY_PREFIX
+
+logger = logging.getLogger(__name__)
+
+Series = Tuple[str, str]
+
+
+def _decode(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+class LatencyHistogram:
+    """
+    - observe(method, route, seconds)：记录一次请求耗时
+    - flush()：把本地增量合并到 Redis，返回合并的序列数
+    - snapshot()：{(method, route): {"buckets": [(上界, 累计数), ...], "count", "sum"}}（上界含 +Inf）
+    """
+    def __init__(self, connection, buckets=LATENCY_BUCKETS, key: str = f"{STATS_KEY_PREFIX}:http"):
+        self.connection = connection
+        self.bounds: List[float] = sorted(float(b) for b in buckets)
+        self.labels = [f"{b:g}" for b in self.bounds] + ["+Inf"]
+        self.key = key
+        self._pending: Dict[Series, List[float]] = {}
+        self._totals: Dict[Series, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def _row(self) -> List[float]:
+        # 各桶（非累计）计数 + count + sum
+        return [0] * (len(self.labels) + 1) + [0.0]
+
+    def observe(self, method: str, route: str, seconds: float) -> None:
+        i = 0
+        while i < len(self.bounds) and seconds > self.bounds[i]:
+            i += 1
+        series = (method, route)
+        with self._lock:
+            for table in (self._pending, self._totals):
+                row = table.get(series)
+                if row is None:
+                    row = table[series] = self._row()
+                row[i] += 1
+                row[-2] += 1
+                row[-1] += seconds
+
+    def flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        pipe = self.connection.pipeline(transaction=False)
+        for (method, route), row in pending.items():
+            prefix = f"{method} {route}|"
+            for label, n in zip(self.labels, row):
+                if n:
+                    pipe.hincrby(self.key, f"{prefix}le={label}", int(n))
+            pipe.hincrby(self.key, f"{prefix}count", int(row[-2]))
+            pipe.hincrbyfloat(self.key, f"{prefix}sum", float(row[-1]))
+        try:
+            pipe.execute()
+        except RedisError as e:
+            # 合并失败：增量放回，下一次再合并
+            with self._lock:
+                for series, row in pending.items():
+                    merged = self._pending.setdefault(series, self._row())
+                    for i, n in enumerate(row):
+                        merged[i] += n
+            logger.warning(f"latency:flush_failed series={len(pending)} error={e}")
+            return 0
+        return len(pending)
+
+    def _cumulative(self, row: List[float]) -> Dict[str, Any]:
+        buckets, acc = [], 0
+        for label, n in zip(self.labels, row):
+            acc += int(n)
+            buckets.append((label, acc))
+        return {"buckets": buckets, "count": int(row[-2]), "sum": float(row[-1])}
+
+    def snapshot(self) -> Dict[Series, Dict[str, Any]]:
+        try:
+            stored = self.connection.hgetall(self.key) or {}
+        except RedisError:
+            with self._lock:
+                return {series: self._cumulative(row) for series, row in self._totals.items()}
+        index = {label: i for i, label in enumerate(self.labels)}
+        rows: Dict[Series, List[float]] = defaultdict(self._row)
+        for field, value in stored.items():
+            name, _, stat = _decode(field).rpartition("|")
+            method, _, route = name.partition(" ")
+            row = rows[(method, route)]
+            if stat == "count":
+                row[-2] = int(value)
+            elif stat == "sum":
+                row[-1] = float(value)
+            elif stat.startswith("le=") and stat[3:] in index:
+                row[index[stat[3:]]] = int(value)
+        return {series: self._cumulative(row) for series, row in rows.items()}
+
+
+_histogram: Optional[LatencyHistogram] = None
+
+
+def get_latency() -> LatencyHistogram:
+    global _histogram
+    if _histogram is None:
+        from app.utils.queue import get_redis
+        _histogram = LatencyHistogram(get_redis())
+    return _histogram
+
+
+async def run_latency_flusher(stop: asyncio.Event) -> None:
+    """
+    每个 worker 进程都运行：每 LATENCY_FLUSH_INTERVAL 秒把本地增量合并到 Redis，停止时再合并一次
+    """
+    histogram = get_latency()
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=LATENCY_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        await asyncio.to_thread(histogram.flush)
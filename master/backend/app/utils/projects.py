@@ -52,15 +52,18 @@ def create_dataset(pid: str, name: str, filters: List[Dict[str, Any]], table: Op
         real_table = resolve_table(conn, table)
         cur = conn.execute(f"PRAGMA table_info({real_table})")
         valid_cols = {row["name"] for row in cur.fetchall()}
-        where_sql, where_params = build_where_clause(filters, valid_cols)
         join_sources = False
         if real_table == MUTATIONS_TABLE and filters:
             for f in (filters or []):
                 if f.get("column") == "source":
                     join_sources = True
                     break
-        if join_sources and where_sql:
-            where_sql = where_sql.replace('"source"', 's.source_text')
+        if join_sources:
+            # 连接 sources 表时筛选列带 m. 前缀，避免两表同名列（如 id）歧义
+            where_sql, where_params = build_where_clause(filters, valid_cols, alias="m",
+                                                         rewrite={"source": "s.source_text"})
+        else:
+            where_sql, where_params = build_where_clause(filters, valid_cols)
         if real_table == MUTATIONS_TABLE and join_sources:
             count_sql = f"SELECT COUNT(*) as cnt FROM {real_table} m JOIN {SOURCES_TABLE} s ON m.source = s.id {where_sql}"
         else:
@@ -69,6 +72,8 @@ def create_dataset(pid: str, name: str, filters: List[Dict[str, Any]], table: Op
         rows_count = cur.fetchone()["cnt"]
     finally:
         conn.close()
+    # 数据集指纹（数据库指纹 + 表名 + 筛选条件），即导出文件的 ETag，worker 侧数据集缓存以此为键
+    from app.services.exporter import dataset_etag
     now = datetime.datetime.utcnow().isoformat()
     did = f"ds-{int(datetime.datetime.utcnow().timestamp())}"
     info = DatasetInfo(
@@ -78,6 +83,7 @@ def create_dataset(pid: str, name: str, filters: List[Dict[str, Any]], table: Op
         table=real_table,
         created_at=now,
         rows_count=rows_count,
+        fingerprint=dataset_etag(real_table, filters or []),
     )
     info_path = os.path.join(ddir, f"{did}.json")
     with open(info_path, "w", encoding="utf-8") as f:
@@ -139,14 +145,13 @@ def delete_project_to_recycle(pid: str, password: str):
     return {"ok": True, "id": pid}
 
 def list_recycle_projects():
+    # 过期条目的清理由后台任务 purge_expired_recycle 负责，列表接口只读
     root = recycle_root()
     items: List[dict] = []
-    now = datetime.datetime.utcnow()
-    purge_before = now - datetime.timedelta(days=30)
     from app.models import RecycleItem
     with os.scandir(root) as it:
         for entry in it:
-            if not entry.is_dir():
+            if not entry.is_dir() or entry.name.startswith("."):
                 continue
             pdir = os.path.join(root, entry.name)
             meta_path = os.path.join(pdir, ".deleted.json")
@@ -154,10 +159,6 @@ def list_recycle_projects():
                 if os.path.exists(meta_path):
                     with open(meta_path, "r", encoding="utf-8") as f:
                         meta = json.load(f)
-                    deleted_at = datetime.datetime.fromisoformat(meta.get("deleted_at"))
-                    if deleted_at < purge_before:
-                        shutil.rmtree(pdir)
-                        continue
                     items.append(RecycleItem(**meta).dict())
                 else:
                     info_path = os.path.join(pdir, "info.json")
@@ -171,6 +172,40 @@ def list_recycle_projects():
     items.sort(key=lambda x: x["deleted_at"], reverse=True)
     return {"items": items}
 
+def purge_expired_recycle(retention_days: int) -> List[str]:
+    """
+    永久删除回收站中删除时间早于 retention_days 天的条目（以 .deleted.json 的 deleted_at 为准），返回被清理的 pid
+    - 先改名为 .purging-<pid>-<时间戳> 再删除：与并发的还原互斥（只有一方的 rename 能成功），删除中途失败也不会留下残缺条目
+    """
+    root = recycle_root()
+    purge_before = datetime.datetime.utcnow() - datetime.timedelta(days=retention_days)
+    purged: List[str] = []
+    with os.scandir(root) as it:
+        entries = [e.name for e in it if e.is_dir()]
+    for name in entries:
+        pdir = os.path.join(root, name)
+        if name.startswith(".purging-"):
+            # 上次清理中途中断的残留
+            shutil.rmtree(pdir, ignore_errors=True)
+            continue
+        if name.startswith("."):
+            continue
+        try:
+            with open(os.path.join(pdir, ".deleted.json"), "r", encoding="utf-8") as f:
+                deleted_at = datetime.datetime.fromisoformat(json.load(f).get("deleted_at"))
+        except (OSError, ValueError, TypeError, AttributeError):
+            continue
+        if deleted_at >= purge_before:
+            continue
+        tomb = os.path.join(root, f".purging-{name}-{int(datetime.datetime.utcnow().timestamp())}")
+        try:
+            os.rename(pdir, tomb)
+        except OSError:
+            continue
+        shutil.rmtree(tomb, ignore_errors=True)
+        purged.append(name)
+    return purged
+
 def restore_project_from_recycle(pid: str):
     rroot = recycle_root()
     proot = projects_root()
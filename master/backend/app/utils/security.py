@@ -1,5 +1,5 @@
 """
-安全与加密工具：密码哈希与简易 JWT（HS256）
+安全与加密工具：密码哈希、简易 JWT（HS256）与登录失败封禁
 """
 import os
 import binascii
@@ -8,9 +8,13 @@ import hmac
 import json
 import base64
 import datetime
+import logging
+import uuid
 from typing import Dict, Any
 import threading
-from app.config import AUTH_FAIL_THRESHOLD, AUTH_FAIL_WINDOW_MINUTES, AUTH_BAN_MINUTES, AUTH_BAN_LOG, AUTH_BAN_STATE
+from redis.exceptions import RedisError
+from app.config import (AUTH_FAIL_THRESHOLD, AUTH_FAIL_WINDOW_MINUTES, AUTH_BAN_MINUTES, AUTH_BAN_LOG, AUTH_BAN_STATE,
+                        AUTH_KEY_PREFIX)
 
 def hash_password(password: str, salt_hex: str | None = None) -> tuple[str, str]:
     if salt_hex is None:
@@ -70,60 +74,122 @@ def create_refresh_token(sub: str, days: int, secret: str) -> str:
     return jwt_encode(payload, secret)
 
 class BanManager:
-    def __init__(self, threshold: int, window_minutes: int, ban_minutes: int, log_path: str, state_path: str):
+    """
+    登录失败计数与 IP 封禁（所有 worker 进程共享）
+    - Redis：失败时间记入有序集合 <AUTH_KEY_PREFIX>:fail:<ip>（窗口外的成员按分数裁剪，键随窗口过期），
+      窗口内失败达到阈值后写入 <AUTH_KEY_PREFIX>:ban:<ip>（值为解封时间戳，随封禁时长过期）；
+      任一进程记录的失败与封禁对所有进程立即生效
+    - Redis 不可用时退回进程内记录（单进程部署的原行为），封禁写入 state_path 以便重启后恢复
+    """
+    def __init__(self, threshold: int, window_minutes: int, ban_minutes: int, log_path: str, state_path: str,
+                 connection=None, key_prefix: str = AUTH_KEY_PREFIX):
         self.threshold = threshold
         self.window_seconds = window_minutes * 60
         self.ban_seconds = ban_minutes * 60
         self.log_path = log_path
         self.state_path = state_path
+        self.connection = connection
+        self.key_prefix = key_prefix
         self.lock = threading.Lock()
         self.failures: Dict[str, list[int]] = {}
         self.banned: Dict[str, int] = {}
+        self.degraded = False
         self._load_state()
 
     def _now(self) -> int:
         return int(datetime.datetime.utcnow().timestamp())
 
+    def _redis(self):
+        if self.connection is not None:
+            return self.connection
+        from app.utils.queue import get_redis
+        return get_redis()
+
+    def _fallback(self, op: str, e: Exception) -> None:
+        if not self.degraded:
+            logging.warning(f"auth_ban:redis_unavailable op={op} error={e} fallback=local")
+        self.degraded = True
+
+    def _recovered(self) -> None:
+        if self.degraded:
+            logging.info("auth_ban:redis_recovered")
+        self.degraded = False
+
+    def _log_ban(self, ip: str):
+        try:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(f"{datetime.datetime.utcnow().isoformat()} BAN {ip} for {self.ban_seconds}s\n")
+        except:
+            pass
+
     def prune(self):
         now = self._now()
         with self.lock:
-            for ip, until in list(self.banned.items()):
-                if until <= now:
-                    del self.banned[ip]
-            self._save_state()
+            expired = [ip for ip, until in self.banned.items() if until <= now]
+            for ip in expired:
+                del self.banned[ip]
+            if expired:
+                self._save_state()
             for ip, times in list(self.failures.items()):
                 self.failures[ip] = [t for t in times if now - t <= self.window_seconds]
                 if not self.failures[ip]:
                     del self.failures[ip]
 
     def is_banned(self, ip: str) -> bool:
+        try:
+            banned = bool(self._redis().exists(f"{self.key_prefix}:ban:{ip}"))
+            self._recovered()
+        except RedisError as e:
+            self._fallback("is_banned", e)
+            banned = False
+        if banned:
+            return True
         self.prune()
         with self.lock:
             until = self.banned.get(ip)
-            if until and until > self._now():
-                return True
-            return False
+            return bool(until and until > self._now())
 
     def record_failure(self, ip: str):
         now = self._now()
+        try:
+            self._record_shared(ip, now)
+            self._recovered()
+            return
+        except RedisError as e:
+            self._fallback("record_failure", e)
         with self.lock:
             arr = self.failures.get(ip, [])
             arr.append(now)
             self.failures[ip] = [t for t in arr if now - t <= self.window_seconds]
             if len(self.failures[ip]) >= self.threshold:
                 self.banned[ip] = now + self.ban_seconds
-                try:
-                    os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
-                    with open(self.log_path, "a", encoding="utf-8") as f:
-                        f.write(f"{datetime.datetime.utcnow().isoformat()} BAN {ip} for {self.ban_seconds}s\n")
-                except:
-                    pass
+                self._log_ban(ip)
                 self._save_state()
 
+    def _record_shared(self, ip: str, now: int):
+        conn = self._redis()
+        key = f"{self.key_prefix}:fail:{ip}"
+        pipe = conn.pipeline()
+        pipe.zremrangebyscore(key, 0, now - self.window_seconds - 1)
+        pipe.zadd(key, {uuid.uuid4().hex: now})
+        pipe.zcard(key)
+        pipe.expire(key, max(1, self.window_seconds))
+        count = pipe.execute()[2]
+        # NX：多个进程同时越过阈值时只记一次封禁
+        if count >= self.threshold and conn.set(f"{self.key_prefix}:ban:{ip}", now + self.ban_seconds,
+                                                ex=max(1, self.ban_seconds), nx=True):
+            self._log_ban(ip)
+
     def reset(self, ip: str):
+        try:
+            self._redis().delete(f"{self.key_prefix}:fail:{ip}")
+            self._recovered()
+        except RedisError as e:
+            self._fallback("reset", e)
         with self.lock:
-            self.failures.pop(ip, None)
-            self._save_state()
+            if self.failures.pop(ip, None) is not None:
+                self._save_state()
 
     def _load_state(self):
         try:
@@ -140,8 +206,10 @@ class BanManager:
     def _save_state(self):
         try:
             os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
-            with open(self.state_path, "w", encoding="utf-8") as f:
+            tmp = f"{self.state_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
                 json.dump({"banned": self.banned}, f)
+            os.replace(tmp, self.state_path)
         except:
             pass
 
@@ -0,0 +1,71 @@
+"""
+多进程共享状态：后端以多个 uvicorn / gunicorn worker 进程运行时，进程内的计数与统计经 Redis 共享
+- SharedCounters：计数器存于 Redis 哈希 <STATS_KEY_PREFIX>:<name>（HINCRBY），任一进程读到的都是所有进程的累计值；
+  Redis 不可用时退回进程内计数
+- put_snapshot / get_snapshot：只在主进程（见 services.leader）中维护的统计（延迟窗口、最近一次采样等）
+  以 JSON 快照写入 Redis，其他进程的查询路由读取快照
+"""
+import json
+import logging
+import threading
+from typing import Any, Dict, Iterable, Optional
+from redis.exceptions import RedisError
+from app.config import STATS_KEY_PREFIX
+
+logger = logging.getLogger(__name__)
+
+
+def _decode(value) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+class SharedCounters:
+    """
+    - incr(field, n)：计数加 n
+    - snapshot()：{field: 累计值}（声明的字段缺省为 0）
+    """
+    def __init__(self, connection, name: str, fields: Iterable[str] = ()):
+        self.connection = connection
+        self.key = f"{STATS_KEY_PREFIX}:{name}"
+        self.local: Dict[str, int] = {f: 0 for f in fields}
+        self._lock = threading.Lock()
+
+    def incr(self, field: str, n: int = 1) -> None:
+        with self._lock:
+            self.local[field] = self.local.get(field, 0) + int(n)
+        try:
+            self.connection.hincrby(self.key, field, int(n))
+        except RedisError as e:
+            logger.debug(f"shared:incr_failed key={self.key} field={field} error={e}")
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            out = dict(self.local)
+        try:
+            stored = self.connection.hgetall(self.key) or {}
+        except RedisError:
+            return out
+        out = {f: 0 for f in out}
+        for field, value in stored.items():
+            try:
+                out[_decode(field)] = int(value)
+            except (TypeError, ValueError):
+                continue
+        return out
+
+
+def put_snapshot(connection, key: str, obj: Dict[str, Any], ttl: Optional[float] = None) -> None:
+    connection.set(key, json.dumps(obj, ensure_ascii=False, default=str), ex=max(1, int(ttl)) if ttl else None)
+
+
+def get_snapshot(connection, key: str) -> Optional[Dict[str, Any]]:
+    try:
+        raw = connection.get(key)
+    except RedisError:
+        return None
+    if raw is None:
+        return None
+    try:
+        return json.loads(_decode(raw))
+    except (TypeError, ValueError):
+        return None
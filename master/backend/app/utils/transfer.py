@@ -0,0 +1,92 @@
+"""
+文件传输工具：支持 ETag 缓存校验与 HTTP Range（断点续传）的文件响应
+"""
+import os
+import re
+from typing import Optional, Tuple, Iterator
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+CHUNK_SIZE = 1024 * 1024
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = [t.strip() for t in header.split(",")]
+    return f'"{etag}"' in tags or f'W/"{etag}"' in tags
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单区间 Range 头，返回闭区间 (start, end)；无法满足时返回 None
+    - bytes=a-b / bytes=a- / bytes=-n
+    - 多区间请求不支持，按无法满足处理
+    """
+    m = _RANGE_PATTERN.match(header.strip())
+    if not m:
+        return None
+    start_s, end_s = m.groups()
+    if start_s == "" and end_s == "":
+        return None
+    if start_s == "":
+        length = int(end_s)
+        if length <= 0:
+            return None
+        start = max(size - length, 0)
+        end = size - 1
+    else:
+        start = int(start_s)
+        end = int(end_s) if end_s else size - 1
+        end = min(end, size - 1)
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+def _iter_file(path: str, start: int, end: int) -> Iterator[bytes]:
+    remaining = end - start + 1
+    with open(path, "rb") as f:
+        f.seek(start)
+        while remaining > 0:
+            data = f.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+def file_response(request: Request, path: str, etag: str, media_type: str = "application/octet-stream", filename: Optional[str] = None) -> Response:
+    """
+    返回支持缓存与断点续传的文件响应：
+    - If-None-Match 命中 ETag：304
+    - Range（且 If-Range 为空或与 ETag 一致）：206 + Content-Range
+    - Range 无法满足：416
+    - 其余：200 全量流式返回
+    """
+    size = os.path.getsize(path)
+    headers = {
+        "ETag": f'"{etag}"',
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=0, must-revalidate",
+    }
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or _etag_matches(if_range, etag)):
+        rng = _parse_range(range_header, size)
+        if rng is None:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        start, end = rng
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(_iter_file(path, start, end), status_code=206, media_type=media_type, headers=headers)
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(_iter_file(path, 0, size - 1), status_code=200, media_type=media_type, headers=headers)
@@ -0,0 +1,14 @@
+"""
+gunicorn 配置：多个 uvicorn worker 进程（默认每个 CPU 核一个，WEB_CONCURRENCY 可覆盖），CPU 密集的路由（数据集导出编码、
+曲线降采样等）可用满所有核心
+- 进程间共享的状态均在 Redis 或工作目录中（封禁、计数、调度台账）；保存器 / 调度 / 监控循环经选举只在一个进程中运行
+"""
+import os
+import multiprocessing
+
+bind = os.environ.get("BACKEND_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY") or multiprocessing.cpu_count())
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.environ.get("BACKEND_TIMEOUT", "120"))
+graceful_timeout = int(os.environ.get("BACKEND_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
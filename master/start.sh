@@ -6,7 +6,7 @@ if [ -n "$BACKEND_CMD" ]; then
   sh -c "$BACKEND_CMD" &
 else
   echo "BACKEND_CMD not set, starting default uvicorn backend"
-  uvicorn backend.app.main:app --host 0.0.0.0 --port 8000 &
+  uvicorn backend.app.main:app --host 0.0.0.0 --port 8000 --workers "${WEB_CONCURRENCY:-$(nproc)}" &
 fi
 
 exec nginx -g "daemon off;"